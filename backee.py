@@ -1,7 +1,14 @@
 #!/usr/bin/env python3
+import os
 import argparse
 import socket
 import logging
+import datetime
+import dataclasses
+
+import yaml
+
+from typing import List, Optional, Tuple
 
 from backee.parser.config_parser import parse_config
 from backee.logger.loggers import (
@@ -9,7 +16,11 @@ from backee.logger.loggers import (
     setup_config_loggers,
     setup_uncaught_exceptions_logger,
 )
-from backee.backup.backup import backup
+from backee.backup.backup import backup, create_transmitter
+from backee.backup import daemon, file_index, orchestrator, restore, tune
+from backee.model.config import Config
+from backee.model.items import BackupItem
+from backee.model.servers import BackupServer, SshBackupServer
 
 
 log = logging.getLogger(__name__)
@@ -22,13 +33,57 @@ def main():
 
     args = _get_args()
 
-    config = parse_config(args.config)
+    config_paths = _get_config_paths(args.config)
+    if len(config_paths) > 1:
+        if args.command not in (None, "backup"):
+            raise ValueError(f"{args.command} accepts only one config")
+        _backup_configs(config_paths, args)
+        return
+
+    config = parse_config(config_paths[0])
+
+    if args.command == "daemon":
+        _get_lock(f"backee-{config.name}")
+        daemon.Daemon(
+            config_paths[0], args.socket or daemon.get_socket_path(config.name)
+        ).serve()
+        return
+
+    if args.command == "find":
+        _find(config, args.path, args.server, args.item)
+        return
+    if args.command == "diff":
+        _diff(config, args.snapshot_a, args.snapshot_b, args.server, args.item)
+        return
+    if args.command == "restore":
+        _restore(config, args)
+        return
+    if args.command == "tune":
+        _tune(config, args)
+        return
+    if args.command == "trigger":
+        print(
+            daemon.send_command(
+                " ".join(["run"] + args.schedule),
+                args.socket or daemon.get_socket_path(config.name),
+            )
+        )
+        return
 
     setup_config_loggers(config.loggers)
 
-    _get_lock("backee")
+    # independent configs run concurrently, conflicts on servers are
+    # detected by leases of item directories
+    _get_lock(f"backee-{config.name}")
 
-    backup(config.name, config.backup_items, config.backup_servers)
+    backup(
+        config.name,
+        config.backup_items,
+        config.backup_servers,
+        workers=config.workers,
+        items_per_server=config.items_per_server,
+        window_end=config.window_end,
+    )
 
 
 def _get_args():
@@ -39,14 +94,244 @@ def _get_args():
     parser.add_argument(
         "-c",
         "--config",
+        action="append",
+        default=None,
+        type=str,
+        help="path to config file or directory of *.yml configs, can be repeated "
+        f"to back up several configs in one process (default: {config_default_path})",
+    )
+
+    subparsers = parser.add_subparsers(dest="command", metavar="command")
+    backup_parser = subparsers.add_parser("backup", help="back up all items (default)")
+    backup_parser.add_argument(
+        "--jobs",
         action="store",
-        default=config_default_path,
+        default=4,
+        type=int,
+        help="configs backed up at once, if there are several (default: 4)",
+    )
+    backup_parser.add_argument(
+        "--per-server",
+        action="store",
+        default=2,
+        type=int,
+        help="configs using the same host at once, if there are several (default: 2)",
+    )
+
+    find_parser = subparsers.add_parser(
+        "find", help="find snapshots containing a path using local indexes"
+    )
+    find_parser.add_argument("path", help="path of a backed up file or directory")
+    _add_index_arguments(find_parser)
+
+    diff_parser = subparsers.add_parser(
+        "diff", help="show changes between two snapshots using local indexes"
+    )
+    diff_parser.add_argument("snapshot_a", help="name of the older snapshot")
+    diff_parser.add_argument("snapshot_b", help="name of the newer snapshot")
+    _add_index_arguments(diff_parser)
+
+    restore_parser = subparsers.add_parser(
+        "restore", help="restore a snapshot using parallel streams"
+    )
+    restore_parser.add_argument("snapshot", help="name of the snapshot to restore")
+    restore_parser.add_argument("target", help="directory to restore into")
+    restore_parser.add_argument(
+        "-p",
+        "--path",
+        action="append",
+        default=[],
         type=str,
-        help=f"path to config file (default: {config_default_path})",
+        help="restore only this path, can be repeated (default: everything)",
     )
+    restore_parser.add_argument(
+        "--streams",
+        action="store",
+        default=4,
+        type=int,
+        help="number of parallel streams (default: 4)",
+    )
+    _add_index_arguments(restore_parser)
+
+    tune_parser = subparsers.add_parser(
+        "tune", help="measure transport alternatives and suggest the fastest"
+    )
+    tune_parser.add_argument(
+        "--size",
+        action="store",
+        default=64,
+        type=int,
+        help="MiB of item files to upload with every alternative (default: 64)",
+    )
+    _add_index_arguments(tune_parser)
+
+    daemon_parser = subparsers.add_parser(
+        "daemon",
+        help="run backups scheduled in the config, SIGHUP reloads the config",
+    )
+    _add_socket_argument(daemon_parser)
+
+    trigger_parser = subparsers.add_parser(
+        "trigger", help="ask the running daemon to start a schedule now"
+    )
+    trigger_parser.add_argument(
+        "schedule",
+        nargs="*",
+        help="name of the schedule (default: back up everything)",
+    )
+    _add_socket_argument(trigger_parser)
+
     return parser.parse_args()
 
 
+def _get_config_paths(paths: Optional[List[str]]) -> Tuple[str]:
+    """
+    Return config files of {paths}, directories are replaced by their configs.
+    """
+    result = []
+    for path in paths or ("backee/config.yml",):
+        if not os.path.isdir(path):
+            result.append(path)
+            continue
+        configs = sorted(
+            os.path.join(path, x)
+            for x in os.listdir(path)
+            if x.endswith((".yml", ".yaml"))
+        )
+        if not configs:
+            raise OSError(f"no configs in {path}")
+        result.extend(configs)
+    return tuple(result)
+
+
+def _backup_configs(config_paths: Tuple[str], args: argparse.Namespace) -> None:
+    configs = tuple(parse_config(x) for x in config_paths)
+    results = orchestrator.Orchestrator(
+        jobs=getattr(args, "jobs", 4),
+        per_server=getattr(args, "per_server", 2),
+        lock=lambda name: _get_lock(f"backee-{name}"),
+    ).run(configs)
+
+    failed = [x.name for x in results if x.error is not None]
+    if failed:
+        raise SystemExit(
+            f"{len(failed)} of {len(results)} configs failed: " + ", ".join(failed)
+        )
+
+
+def _add_socket_argument(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--socket",
+        action="store",
+        default=None,
+        type=str,
+        help="path to daemon control socket "
+        "(default: backee-<config name>.sock in $XDG_RUNTIME_DIR)",
+    )
+
+
+def _add_index_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "-s",
+        "--server",
+        action="store",
+        default=None,
+        type=str,
+        help="server name (default: all servers for find, first server otherwise)",
+    )
+    parser.add_argument(
+        "-i",
+        "--item",
+        action="store",
+        default="files",
+        type=str,
+        help="backup item name (default: files)",
+    )
+
+
+def _find(config: Config, path: str, server_name: str, item_name: str) -> None:
+    for server in config.backup_servers:
+        if server_name is not None and server.name != server_name:
+            continue
+
+        mirror_dir = file_index.get_mirror_dir(config.name, server.name, item_name)
+        for first, last, entry in file_index.find_versions(mirror_dir, path):
+            print(
+                f"{server.name}\t{first}..{last}\t{entry.size}\t"
+                f"{datetime.datetime.fromtimestamp(entry.mtime).isoformat()}"
+                + (f"\t{entry.hash}" if entry.hash else "")
+            )
+
+
+def _diff(
+    config: Config, snapshot_a: str, snapshot_b: str, server_name: str, item_name: str
+) -> None:
+    server = _get_server(config, server_name)
+    mirror_dir = file_index.get_mirror_dir(config.name, server.name, item_name)
+    with file_index.FileIndex(
+        file_index.get_mirror_path(mirror_dir, snapshot_a)
+    ) as index_a, file_index.FileIndex(
+        file_index.get_mirror_path(mirror_dir, snapshot_b)
+    ) as index_b:
+        for change, old, new in file_index.diff_indexes(index_a, index_b):
+            print(f"{change} {(new or old).path}")
+
+
+def _restore(config: Config, args: argparse.Namespace) -> None:
+    server = _get_server(config, args.server)
+    restore.restore(
+        transmitter=create_transmitter(server),
+        server=server,
+        mirror_dir=file_index.get_mirror_dir(config.name, server.name, args.item),
+        item_name=args.item,
+        backup_name=args.snapshot,
+        target_dir=args.target,
+        paths=tuple(args.path),
+        streams=args.streams,
+    )
+
+
+def _tune(config: Config, args: argparse.Namespace) -> None:
+    server = _get_server(config, args.server)
+    if not isinstance(server, SshBackupServer):
+        raise ValueError(f"only ssh servers can be tuned, {server.name} is not")
+
+    suggested, results = tune.tune(
+        transmitter=create_transmitter(server),
+        server=server,
+        item=_get_item(config, args.item),
+        sample_size=args.size * 2**20,
+    )
+
+    for profile, throughput in results:
+        print(
+            f"{tune.describe_profile(profile)}\t"
+            + ("failed" if throughput is None else f"{throughput / 2**20:.1f} MiB/s")
+        )
+    print(f"\nsuggested transport for {server.name}:")
+    values = {k: v for k, v in dataclasses.asdict(suggested).items() if v is not None}
+    print(yaml.safe_dump({"transport": values}, sort_keys=False), end="")
+
+
+def _get_item(config: Config, item_name: str) -> BackupItem:
+    for item in config.backup_items:
+        if item.name == item_name:
+            return item
+
+    raise KeyError(f"Unknown item: '{item_name}'")
+
+
+def _get_server(config: Config, server_name: str) -> BackupServer:
+    if server_name is None:
+        return config.backup_servers[0]
+
+    for server in config.backup_servers:
+        if server.name == server_name:
+            return server
+
+    raise KeyError(f"Unknown server: '{server_name}'")
+
+
 def _get_lock(process_name: str):
     """
     A technique that is handy on a Linux system is using domain sockets.
@@ -54,19 +339,22 @@ def _get_lock(process_name: str):
     It is atomic and avoids the problem of having lock files
     lying around if your process gets sent a SIGKILL.
     """
-    # Without holding a reference to our socket somewhere it gets garbage
-    # collected when the function exits
-    _get_lock._lock_socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    # Without holding a reference to our sockets somewhere they get garbage
+    # collected when the function exits, several configs hold several locks
+    if not hasattr(_get_lock, "_lock_sockets"):
+        _get_lock._lock_sockets = []
+    lock_socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
 
     try:
         # The null byte (\0) means the socket is created
         # in the abstract namespace instead of being created
         # on the file system itself.
-        _get_lock._lock_socket.bind("\0" + process_name)
+        lock_socket.bind("\0" + process_name)
+        _get_lock._lock_sockets.append(lock_socket)
         log.debug("lock acquired")
     except socket.error as socker_error:
         raise OSError(
-            "Only one instance of the script is allowed to run"
+            f"Only one instance of the script is allowed to run: {process_name}"
         ) from socker_error
 
 
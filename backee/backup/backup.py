@@ -1,55 +1,531 @@
 import os
+import hashlib
+import stat
+import time
 import logging
-from datetime import datetime, date
+import threading
+from contextlib import ExitStack
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, date, time as time_of_day
 
-from typing import Tuple, List, Optional
+from typing import Callable, Dict, Tuple, List, Optional
 
 from dateutil.relativedelta import relativedelta
-
-from backee.model.items import BackupItem, FilesBackupItem
-from backee.model.servers import BackupServer, SshBackupServer
+from paramiko import SSHClient
+
+from backee.model.items import BackupItem, FilesBackupItem, MysqlBackupItem
+from backee.model.backup_task import BackupTask
+from backee.model.servers import (
+    BackupServer,
+    SshBackupServer,
+    SftpBackupServer,
+    LocalBackupServer,
+    RepositoryBackupServer,
+    S3BackupServer,
+)
 from backee.backup.transmitter import Transmitter, SshTransmitter
+from backee.backup.sftp_transmitter import SftpTransmitter
+from backee.backup.local_transmitter import LocalTransmitter
+from backee.backup.repository_transmitter import RepositoryTransmitter
+from backee.backup.s3_transmitter import S3Transmitter
+from backee.backup.constants import TEMP_DIR_SUFFIX
 from backee.model.rotation_strategy import RotationStrategy
+from backee.model.thread_filter import get_worker_name
+from backee.backup import (
+    compression,
+    database_dump,
+    deadline,
+    durations,
+    file_index,
+    filters,
+    lease,
+)
 
 log = logging.getLogger(__name__)
 
-
-def backup(name: str, items: Tuple[BackupItem], servers: Tuple[BackupServer]) -> None:
+# assumed throughput of links without recorded transfers, bytes per second
+DEFAULT_THROUGHPUT = 10 * 1024 * 1024
+# seconds between attempts to take servers used by other runs
+LOCK_POLL_INTERVAL = 1
+
+
+def backup(
+    name: str,
+    items: Tuple[BackupItem],
+    servers: Tuple[BackupServer],
+    get_transmitter: Callable[[BackupServer], Transmitter] = None,
+    workers: Optional[int] = None,
+    items_per_server: int = 1,
+    window_end: Optional[time_of_day] = None,
+    get_server_lock: Optional[Callable[[BackupServer], threading.Lock]] = None,
+) -> None:
     """
-    Start backup process.
+    Start backup process. Transmitters are created by {get_transmitter},
+    which lets the daemon reuse connections, new ones by default.
+    Locks returned by {get_server_lock} are held from the first transfer
+    to a server until its snapshots are finished, so concurrent runs do
+    not use the server at once, while this run uses other servers.
+
+    Every item is backed up to every server by {workers} threads, enough
+    to keep all servers busy by default, and at most {items_per_server}
+    backups run on a server at once. Backups with higher priority and then
+    the longest expected ones start first, so a long backup does not start
+    last and delay the whole run.
+
+    Databases are dumped once and the dumps are sent to every server.
+    Servers replicating another server get its snapshots from it.
+    Once a snapshot is complete, its index, rotation and verification run
+    in the background, one at a time per server, and the worker starts the
+    next transfer. Results are reported in the order the backups started.
+
+    Backups have to finish by the next {window_end}. Backups not expected
+    to finish by then are deferred, unless no item has a higher priority.
+    Transfers to ssh servers still running at the deadline are stopped
+    and resumed by the next run.
     """
     _check_items(items)
+    workers = workers or max(len(servers), 1) * items_per_server
+    if workers <= 0 or items_per_server <= 0:
+        raise ValueError("number of workers and items per server must be positive")
+
+    deadline_time = None
+    if window_end is not None:
+        deadline_time = deadline.get_deadline(window_end, datetime.now())
+        log.info("backups have to finish by %s", deadline_time)
+        deadline_time = deadline_time.timestamp()
+
+    with filters.session() as run:
+        # items staged and bound by the caller keep their dumps and run
+        items = filters.bind(database_dump.stage(items), run)
+        transmitters = {
+            x.name: (get_transmitter or create_transmitter)(x) for x in servers
+        }
+        tasks = _plan_tasks(name, items, servers, transmitters)
+        expected = _get_expected_makespan(tasks, workers, items_per_server)
+        log.info("%i backups expected to finish in %.0fs", len(tasks), expected)
+
+        finishing: List[Tuple[BackupTask, Future]] = []
+        started = time.monotonic()
+        # background tasks are done, when executors exit
+        with ExitStack() as stack:
+            background = {
+                x.name: stack.enter_context(
+                    ThreadPoolExecutor(
+                        max_workers=1, thread_name_prefix=get_worker_name(x.name)
+                    )
+                )
+                for x in servers
+            }
+
+            def run(task: BackupTask) -> bool:
+                finish = __run_task(
+                    name,
+                    task,
+                    transmitters[task.server.name],
+                    deadline_time,
+                    tuple(
+                        (x, transmitters[x.name])
+                        for x in get_replicas(task.server, servers)
+                    ),
+                )
+                if finish is None:
+                    return False
+                future = background[task.server.name].submit(
+                    __run_as, threading.current_thread().name, finish
+                )
+                finishing.append((task, future))
+                return True
+
+            try_lock = unlock = None
+            if get_server_lock is not None:
+
+                def try_lock(server: BackupServer) -> bool:
+                    return get_server_lock(server).acquire(blocking=False)
+
+                def unlock(server: BackupServer) -> None:
+                    # after background tasks of the server submitted before
+                    background[server.name].submit(get_server_lock(server).release)
+
+            deferred = _run_tasks(
+                tasks,
+                workers,
+                items_per_server,
+                run,
+                deadline_time,
+                try_lock=try_lock,
+                unlock=unlock,
+            )
+        _report_finished(tasks, finishing)
+
+    if deferred:
+        log.warning(
+            "%s was partially backed up in %.0fs, %i backups deferred: %s",
+            name,
+            time.monotonic() - started,
+            len(deferred),
+            ", ".join(f"{x.item.name} to {x.server.name}" for x in deferred),
+        )
+        return
+    log.info(
+        "%s was successfully backed up in %.0fs, expected %.0fs",
+        name,
+        time.monotonic() - started,
+        expected,
+    )
+
+
+def is_replica(server: BackupServer) -> bool:
+    return isinstance(server, SshBackupServer) and server.replicate_from is not None
 
+
+def get_replicas(
+    server: BackupServer, servers: Tuple[BackupServer]
+) -> Tuple[SshBackupServer]:
+    """
+    Return servers of {servers} replicating snapshots of {server}.
+    """
+    return tuple(
+        x
+        for x in servers
+        if isinstance(x, SshBackupServer) and x.replicate_from == server.name
+    )
+
+
+def _plan_tasks(
+    name: str,
+    items: Tuple[BackupItem],
+    servers: Tuple[BackupServer],
+    transmitters: Dict[str, Transmitter],
+) -> List[BackupTask]:
+    """
+    Return backups of {items} to {servers} in the order they should start,
+    by priority and then longest expected duration first.
+    """
+    tasks = []
     for server in servers:
-        __backup_to_server(items, server)
+        if is_replica(server):
+            # replicas get snapshots from their primary server
+            continue
+        for item in items:
+            if not isinstance(item, FilesBackupItem):
+                log.info("unsupported backup item: %s", item.name)
+                continue
+            if not isinstance(server, SshBackupServer):
+                databases = filters.get_filters(item).databases
+                if databases:
+                    log.warning(
+                        "sqlite snapshots are sent to ssh servers only, "
+                        "%i databases are copied to %s as they are",
+                        len(databases),
+                        server.name,
+                    )
+            expected = durations.load_duration(name, server.name, item.name)
+            if expected is None:
+                expected = _estimate_duration(transmitters[server.name], server, item)
+            log.debug(
+                "%s to %s expected to take %.0fs", item.name, server.name, expected
+            )
+            tasks.append(BackupTask(server=server, item=item, expected=expected))
 
-    log.info("%s was successfully backed up", name)
+    return sorted(tasks, key=lambda x: (-x.item.priority, -x.expected))
 
 
-def __backup_to_server(items: Tuple[BackupItem], server: BackupServer) -> None:
-    log.debug("backup to %s", server.name)
+def _estimate_duration(
+    transmitter: Transmitter, server: BackupServer, item: FilesBackupItem
+) -> float:
+    """
+    Estimate duration of the first backup of {item} to {server} by a dry run
+    against the current snapshot, or by size of the sources if there is none.
+    """
+    links_dir_path = os.path.join(server.location, item.name, "current")
+    size = None
+    try:
+        if transmitter.is_remote_dir_exist(links_dir_path):
+            size = transmitter.get_transfer_file_size(
+                links_dir_path=links_dir_path, item=item, remote_path=links_dir_path
+            )
+    except OSError:
+        log.debug("cannot estimate transfer to %s", server.name, exc_info=True)
+    if size is None:
+        size = sum(
+            st.st_size
+            for _, st in filters.get_filters(item).get_sources()
+            if stat.S_ISREG(st.st_mode)
+        )
+
+    throughput = None
+    if isinstance(server, SshBackupServer):
+        throughput = compression.load_link_throughput(server.hostname)
+    return size / (throughput or DEFAULT_THROUGHPUT)
 
-    transmitter = __create_transmitter(server)
 
-    for item in items:
-        if isinstance(item, FilesBackupItem):
-            __backup_files_to_server(transmitter, server, item)
+def _get_expected_makespan(
+    tasks: List[BackupTask], workers: int, items_per_server: int
+) -> float:
+    """
+    Simulate `_run_tasks` with expected durations of {tasks}.
+    """
+    pending = list(tasks)
+    # (expected end, server name) of running tasks
+    running: List[Tuple[float, str]] = []
+    now = 0.0
+    while pending or running:
+        while len(running) < workers:
+            task = __pop_startable(pending, [x for _, x in running], items_per_server)
+            if task is None:
+                break
+            running.append((now + task.expected, task.server.name))
+        now, server_name = min(running)
+        running.remove((now, server_name))
+    return now
+
+
+def _run_tasks(
+    tasks: List[BackupTask],
+    workers: int,
+    items_per_server: int,
+    run: Callable[[BackupTask], bool],
+    deadline_time: Optional[float] = None,
+    clock: Callable[[], float] = time.time,
+    try_lock: Optional[Callable[[BackupServer], bool]] = None,
+    unlock: Optional[Callable[[BackupServer], None]] = None,
+) -> List[BackupTask]:
+    """
+    Run {tasks} by {workers} threads in the given order, skipping tasks
+    of servers running {items_per_server} tasks already. No task starts
+    after one failed and the first error is raised.
+
+    Servers are taken by {try_lock} before their first task, tasks of servers
+    taken by other runs wait, and {unlock} is called once a server has no
+    tasks left. Other runs are not waited for while holding a busy server.
+
+    Tasks are deferred, when {deadline_time} has passed, or when they are not
+    expected to finish by then and other tasks have a higher priority.
+    {run} returns False for tasks stopped at the deadline.
+
+    Returns:
+      deferred and stopped tasks.
+    """
+    pending = list(tasks)
+    top_priority = max((x.item.priority for x in tasks), default=0)
+    running: List[str] = []
+    deferred: List[BackupTask] = []
+    errors = []
+    changed = threading.Condition()
+    locked: Dict[str, BackupServer] = {}
+
+    def can_start(server: BackupServer) -> bool:
+        if try_lock is None or server.name in locked:
+            return True
+        if not try_lock(server):
+            return False
+        locked[server.name] = server
+        return True
+
+    def release_idle(server_name: str) -> None:
+        # called with the condition held
+        if server_name not in locked or server_name in running:
+            return
+        if any(x.server.name == server_name for x in pending):
+            return
+        unlock(locked.pop(server_name))
+
+    def is_deferred(task: BackupTask) -> bool:
+        if deadline_time is None:
+            return False
+        now = clock()
+        if now >= deadline_time:
+            log.warning("%s to %s started too late", task.item.name, task.server.name)
+            return True
+        if task.item.priority < top_priority and now + task.expected > deadline_time:
+            log.warning(
+                "%s to %s deferred, expected to take %.0fs, but %.0fs left",
+                task.item.name,
+                task.server.name,
+                task.expected,
+                deadline_time - now,
+            )
+            return True
+        return False
+
+    def next_task() -> Optional[BackupTask]:
+        with changed:
+            while pending and not errors:
+                task = __pop_startable(pending, running, items_per_server, can_start)
+                if task is None:
+                    # servers are released by other runs without notifying
+                    changed.wait(None if try_lock is None else LOCK_POLL_INTERVAL)
+                elif is_deferred(task):
+                    deferred.append(task)
+                    release_idle(task.server.name)
+                else:
+                    running.append(task.server.name)
+                    return task
+            return None
+
+    def work() -> None:
+        while True:
+            task = next_task()
+            if task is None:
+                return
+            try:
+                if not run(task):
+                    with changed:
+                        deferred.append(task)
+            except BaseException as e:
+                with changed:
+                    errors.append(e)
+            finally:
+                with changed:
+                    running.remove(task.server.name)
+                    release_idle(task.server.name)
+                    changed.notify_all()
+
+    # log records of workers are attributed to the caller
+    threads = [
+        threading.Thread(target=work, name=threading.current_thread().name)
+        for _ in range(min(workers, len(tasks)))
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # servers of tasks not started after an error
+    for server in tuple(locked.values()):
+        unlock(server)
+    if errors:
+        raise errors[0]
+    return deferred
+
+
+def _report_finished(
+    tasks: List[BackupTask], finishing: List[Tuple[BackupTask, Future]]
+) -> None:
+    """
+    Log results of {finishing} backups in the order of {tasks}.
+
+    Raises:
+      Exception: the first error of the backups.
+    """
+    order = {id(x): i for i, x in enumerate(tasks)}
+    errors = []
+    for task, future in sorted(finishing, key=lambda x: order[id(x[0])]):
+        try:
+            verified = future.result()
+        except Exception as e:
+            log.error("%s to %s failed: %s", task.item.name, task.server.name, e)
+            errors.append(e)
+            continue
+        if verified:
+            log.info("%s to %s finished", task.item.name, task.server.name)
         else:
-            log.info("unsupported backup item: %s", item.name)
+            log.warning(
+                "%s to %s items differ from original items",
+                task.item.name,
+                task.server.name,
+            )
+    if errors:
+        raise errors[0]
+
 
-    log.debug("backup to %s finished", server.name)
+def __run_as(thread_name: str, func: Callable[[], bool]) -> bool:
+    # log records of background tasks are attributed to the caller
+    threading.current_thread().name = thread_name
+    return func()
 
 
-def __create_transmitter(server: BackupServer) -> Transmitter:
+def __pop_startable(
+    pending: List[BackupTask],
+    running: List[str],
+    items_per_server: int,
+    can_start: Callable[[BackupServer], bool] = lambda _: True,
+) -> Optional[BackupTask]:
+    for i, task in enumerate(pending):
+        if running.count(task.server.name) < items_per_server and can_start(
+            task.server
+        ):
+            return pending.pop(i)
+    return None
+
+
+def __run_task(
+    name: str,
+    task: BackupTask,
+    transmitter: Transmitter,
+    deadline_time: Optional[float],
+    replicas: Tuple[Tuple[SshBackupServer, SshTransmitter]],
+) -> Optional[Callable[[], bool]]:
+    """
+    Transfer snapshot of {task} and return function finishing it,
+    or None if the transfer was stopped at the deadline.
+    """
+    started = time.monotonic()
+    try:
+        finish = __backup_files_to_server(
+            name, transmitter, task.server, task.item, deadline_time, replicas
+        )
+    except deadline.DeadlineExceeded:
+        log.warning(
+            "%s to %s stopped at the deadline, the next run resumes it",
+            task.item.name,
+            task.server.name,
+        )
+        return None
+    elapsed = time.monotonic() - started
+    durations.record_duration(name, task.server.name, task.item.name, elapsed)
+    log.info(
+        "%s transferred to %s in %.0fs, expected %.0fs",
+        task.item.name,
+        task.server.name,
+        elapsed,
+        task.expected,
+    )
+    return finish
+
+
+def create_transmitter(
+    server: BackupServer,
+    keepalive: int = 0,
+    control_dir: Optional[str] = None,
+    ssh_client: Optional[SSHClient] = None,
+) -> Transmitter:
+    """
+    Create transmitter for {server}. SSH connections send keepalives every
+    {keepalive} seconds and rsync shares master connections in {control_dir}
+    if they are set. Commands of ssh servers run by {ssh_client} if it is given.
+    """
     if isinstance(server, SshBackupServer):
-        return SshTransmitter(server)
+        return SshTransmitter(
+            server,
+            ssh_client=ssh_client,
+            keepalive=keepalive,
+            control_dir=control_dir,
+        )
+    if isinstance(server, SftpBackupServer):
+        return SftpTransmitter(server, keepalive=keepalive)
+    if isinstance(server, LocalBackupServer):
+        return LocalTransmitter(server)
+    if isinstance(server, RepositoryBackupServer):
+        return RepositoryTransmitter(server)
+    if isinstance(server, S3BackupServer):
+        return S3Transmitter(server)
 
     raise TypeError(f"unsupported server {server}")
 
 
 def __backup_files_to_server(
-    transmitter: SshTransmitter, server: SshBackupServer, item: FilesBackupItem
-) -> None:
+    name: str,
+    transmitter: SshTransmitter,
+    server: SshBackupServer,
+    item: FilesBackupItem,
+    deadline_time: Optional[float] = None,
+    replicas: Tuple[Tuple[SshBackupServer, SshTransmitter]] = (),
+) -> Callable[[], bool]:
+    """
+    Transfer and promote snapshot of {item}. The lease of the item directory
+    is held until the returned function finishes the snapshot and copies it
+    to {replicas}.
+    """
     log.debug("backup %s", item.name)
 
     server_root_dir_path = os.path.join(server.location, item.name, "")
@@ -58,43 +534,263 @@ def __backup_files_to_server(
     backup_dir_name = date_time_prefix + datetime.strftime(
         datetime.now(), date_time_format
     )
+    root_existed = transmitter.is_remote_dir_exist(server_root_dir_path)
+    if not root_existed:
+        transmitter.create_dir(server_root_dir_path)
+
+    # temporary directories and rotation are only touched by the lease owner
+    with ExitStack() as stack:
+        item_lease = stack.enter_context(lease.Lease(transmitter, server_root_dir_path))
+        backup_dir_path = __transfer_files_locked(
+            transmitter,
+            item,
+            server_root_dir_path,
+            backup_dir_name,
+            root_existed,
+            deadline_time,
+            item_lease,
+        )
+        held_lease = stack.pop_all()
+
+    def finish() -> bool:
+        with held_lease:
+            # old snapshots are rotated by the lease owner only
+            item_lease.check()
+            verified = __finish_files_locked(
+                name,
+                transmitter,
+                server,
+                item,
+                server_root_dir_path,
+                backup_dir_path,
+                date_time_format,
+                date_time_prefix,
+            )
+            # the source uplink is used once, replicas get the snapshot from here
+            for replica, replica_transmitter in replicas:
+                __replicate_files(
+                    name,
+                    transmitter,
+                    replica,
+                    replica_transmitter,
+                    item,
+                    backup_dir_path,
+                    date_time_format,
+                    date_time_prefix,
+                )
+            return verified
+
+    return finish
+
+
+def __transfer_files_locked(
+    transmitter: SshTransmitter,
+    item: FilesBackupItem,
+    server_root_dir_path: str,
+    backup_dir_name: str,
+    root_existed: bool,
+    deadline_time: Optional[float],
+    item_lease: lease.Lease,
+) -> str:
+    """
+    Transfer {item} into a temporary directory and promote it to the current
+    snapshot, returns path of the snapshot. Snapshot is not promoted, if
+    {item_lease} was lost meanwhile.
+    """
     backup_dir_path = os.path.join(server_root_dir_path, backup_dir_name, "")
-    temp_dir_suffix = "-incomplete"
+    temp_dir_suffix = TEMP_DIR_SUFFIX
+    if isinstance(transmitter, SshTransmitter):
+        # only rsync resumes stopped transfers, see `_find_checkpoint`
+        temp_dir_suffix = _get_temp_dir_suffix(item)
     temp_dir_name = backup_dir_name + temp_dir_suffix
     temp_dir_path = os.path.join(server_root_dir_path, temp_dir_name, "")
     links_dir_path = os.path.join(server_root_dir_path, "current")
 
-    if not transmitter.is_remote_dir_exist(server_root_dir_path):
-        transmitter.create_dir(server_root_dir_path)
-    else:
+    if root_existed:
         transmitter.remove_remote_dir_if_exists(backup_dir_path)
-        transmitter.remove_remote_dir_if_exists(temp_dir_path)
+        checkpoint = None
+        if isinstance(transmitter, SshTransmitter):
+            checkpoint = _find_checkpoint(
+                transmitter, server_root_dir_path, temp_dir_suffix
+            )
 
-        transmitter.check_temp_dirs(server_root_dir_path, temp_dir_suffix)
+        if checkpoint is None:
+            transmitter.remove_remote_dir_if_exists(temp_dir_path)
+            transmitter.check_temp_dirs(server_root_dir_path, TEMP_DIR_SUFFIX)
+        elif os.path.normpath(checkpoint) != os.path.normpath(temp_dir_path):
+            # files transferred before are skipped by rsync
+            log.info("resume backup stopped in %s", checkpoint)
+            transmitter.rename_dir(checkpoint, temp_dir_path)
 
         transmitter.check_links_dir(
-            server_root_dir_path, links_dir_path, temp_dir_suffix
+            server_root_dir_path, links_dir_path, TEMP_DIR_SUFFIX
         )
 
     _check_remote_disk_space(
         transmitter, links_dir_path, item, temp_dir_path, server_root_dir_path
     )
 
-    transmitter.transmit(links_dir_path, item, temp_dir_path)
+    if isinstance(transmitter, SshTransmitter):
+        transmitter.transmit(
+            links_dir_path,
+            item,
+            temp_dir_path,
+            deadline=deadline_time,
+            on_lost=item_lease.on_lost,
+        )
+    else:
+        transmitter.transmit(links_dir_path, item, temp_dir_path)
 
+    item_lease.check()
     transmitter.rename_dir(temp_dir_path, backup_dir_path)
 
     transmitter.recreate_links_dir(backup_dir_path, links_dir_path)
+    return backup_dir_path
+
+
+def __finish_files_locked(
+    name: str,
+    transmitter: SshTransmitter,
+    server: SshBackupServer,
+    item: FilesBackupItem,
+    server_root_dir_path: str,
+    backup_dir_path: str,
+    date_time_format: str,
+    date_time_prefix: str,
+) -> bool:
+    """
+    Index the promoted snapshot, remove old snapshots and verify the current one.
+
+    Returns:
+      bool: True if the snapshot matches the original items.
+    """
+    __index_and_rotate(
+        name,
+        transmitter,
+        server,
+        item,
+        server_root_dir_path,
+        backup_dir_path,
+        date_time_format,
+        date_time_prefix,
+    )
+    links_dir_path = os.path.join(server_root_dir_path, "current")
+    return transmitter.verify_backup(item, links_dir_path)
+
+
+def __index_and_rotate(
+    name: str,
+    transmitter: SshTransmitter,
+    server: SshBackupServer,
+    item: FilesBackupItem,
+    server_root_dir_path: str,
+    backup_dir_path: str,
+    date_time_format: str,
+    date_time_prefix: str,
+) -> None:
+    mirror_dir = file_index.get_mirror_dir(name, server.name, item.name)
+    _create_index(transmitter, backup_dir_path, mirror_dir)
 
     rs = _get_rotation_strategy(server.rotation_strategy, item.rotation_strategy)
-    _remove_old_backups(
+    removed = _remove_old_backups(
         transmitter, server_root_dir_path, rs, date_time_format, date_time_prefix
     )
+    if removed:
+        transmitter.remove_remote_dirs(
+            tuple(file_index.get_remote_index_path(x) for x in removed)
+        )
+        file_index.prune_mirror(mirror_dir, removed)
 
-    if transmitter.verify_backup(item, links_dir_path):
-        log.debug("%s backup finished", item.name)
-    else:
-        log.warning("%s backup items differ from original items", item.name)
+
+def __replicate_files(
+    name: str,
+    transmitter: SshTransmitter,
+    replica: SshBackupServer,
+    replica_transmitter: SshTransmitter,
+    item: FilesBackupItem,
+    backup_dir_path: str,
+    date_time_format: str,
+    date_time_prefix: str,
+) -> None:
+    """
+    Copy snapshot {backup_dir_path} of {item} to {replica}, where it gets
+    the same name and is rotated by the strategy of {replica}.
+    """
+    server_root_dir_path = os.path.join(replica.location, item.name, "")
+    backup_dir_name = os.path.basename(backup_dir_path.rstrip("/"))
+    replica_dir_path = os.path.join(server_root_dir_path, backup_dir_name, "")
+    temp_dir_path = os.path.join(
+        server_root_dir_path, backup_dir_name + TEMP_DIR_SUFFIX, ""
+    )
+    links_dir_path = os.path.join(server_root_dir_path, "current")
+
+    root_existed = replica_transmitter.is_remote_dir_exist(server_root_dir_path)
+    if not root_existed:
+        replica_transmitter.create_dir(server_root_dir_path)
+
+    with lease.Lease(replica_transmitter, server_root_dir_path) as replica_lease:
+        if root_existed:
+            replica_transmitter.remove_remote_dir_if_exists(replica_dir_path)
+            replica_transmitter.check_links_dir(
+                server_root_dir_path, links_dir_path, TEMP_DIR_SUFFIX
+            )
+
+        log.info("replicate %s to %s", backup_dir_name, replica.name)
+        # temporary directory of a failed replication is resumed
+        transmitter.replicate(
+            backup_dir_path,
+            replica,
+            temp_dir_path,
+            links_dir_path
+            if replica_transmitter.is_remote_dir_exist(links_dir_path)
+            else None,
+        )
+        replica_lease.check()
+        replica_transmitter.rename_dir(temp_dir_path, replica_dir_path)
+        replica_transmitter.recreate_links_dir(replica_dir_path, links_dir_path)
+
+        __index_and_rotate(
+            name,
+            replica_transmitter,
+            replica,
+            item,
+            server_root_dir_path,
+            replica_dir_path,
+            date_time_format,
+            date_time_prefix,
+        )
+
+
+def _get_temp_dir_suffix(item: FilesBackupItem) -> str:
+    """
+    Return suffix of the temporary directory {item} is transmitted to, which
+    identifies the configuration of {item} the directory was filled with.
+    """
+    task = hashlib.sha256(repr(item).encode("utf-8")).hexdigest()[:12]
+    return f"-{task}{TEMP_DIR_SUFFIX}"
+
+
+def _find_checkpoint(
+    transmitter: SshTransmitter, server_root_dir_path: str, temp_dir_suffix: str
+) -> Optional[str]:
+    """
+    Return the latest temporary directory with {temp_dir_suffix} left by
+    a stopped backup, or None. Other temporary directories are removed,
+    they may hold files the current task no longer includes.
+    """
+    temp_dirs = [
+        x
+        for x in transmitter.get_backup_names_sorted(server_root_dir_path)
+        if x.rstrip("/").endswith(TEMP_DIR_SUFFIX)
+    ]
+    checkpoints = [x for x in temp_dirs if x.rstrip("/").endswith(temp_dir_suffix)]
+    checkpoint = checkpoints[-1] if checkpoints else None
+
+    stale = tuple(x for x in temp_dirs if x != checkpoint)
+    if stale:
+        log.info("remove temporary directories of other backups %s", stale)
+        transmitter.remove_remote_dirs(stale)
+    return checkpoint
 
 
 def _check_remote_disk_space(
@@ -118,13 +814,36 @@ def _check_remote_disk_space(
         )
 
 
+def _create_index(
+    transmitter: SshTransmitter, backup_dir_path: str, mirror_dir: str
+) -> None:
+    """
+    Create index of the backup and mirror it locally.
+
+    Index is not required for backup to be complete, so errors are only logged.
+    """
+    index_path = file_index.get_remote_index_path(backup_dir_path)
+    try:
+        transmitter.create_index(backup_dir_path, index_path)
+        file_index.mirror_index(
+            transmitter,
+            index_path,
+            file_index.get_mirror_path(mirror_dir, backup_dir_path),
+        )
+    except OSError:
+        log.warning("cannot create index for %s", backup_dir_path, exc_info=True)
+
+
 def _remove_old_backups(
     transmitter: SshTransmitter,
     server_root_dir_path: str,
     rotation_strategy: RotationStrategy,
     date_time_format: str,
     date_time_prefix: str,
-) -> None:
+) -> Tuple[str]:
+    """
+    Remove backups that are not kept by rotation strategy and return removed ones.
+    """
     log.debug("looking for outdated backups")
 
     backups = transmitter.get_backup_names_sorted(server_root_dir_path)
@@ -185,12 +904,14 @@ def _remove_old_backups(
 
     if len(to_delete) == 0:
         log.debug("no old backups")
-        return
+        return ()
 
     log.debug("removing old backup(s) %s", to_delete)
 
     transmitter.remove_remote_dirs(to_delete)
 
+    return to_delete
+
 
 def __is_in_timeframe(
     backup_date: date, now: date, last_eligible_date_time: date
@@ -249,5 +970,5 @@ def _get_rotation_strategy(
 
 def _check_items(items: Tuple[BackupItem]):
     for item in items:
-        if not isinstance(item, FilesBackupItem):
+        if not isinstance(item, (FilesBackupItem, MysqlBackupItem)):
             log.error("unsupported backup item: %s", item.name)
@@ -0,0 +1,147 @@
+import datetime
+import threading
+import subprocess
+
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+from backee.model.bandwidth import BandwidthWindow
+from backee.model.servers import SshBackupServer
+
+
+# seconds between checks whether running transfers have to change their limit
+POLL_INTERVAL = 5
+# smaller relative changes of the limit do not restart running transfers,
+# as restart scans the files again
+MIN_LIMIT_CHANGE = 0.2
+
+__limiters: Dict[str, "BandwidthLimiter"] = {}
+__limiters_lock = threading.Lock()
+
+
+def get_scheduled_limit(
+    schedule: Tuple[BandwidthWindow], now: datetime.datetime
+) -> Optional[int]:
+    """
+    Return limit of the first window of {schedule} containing {now},
+    or None if the bandwidth is not limited.
+    """
+    time = now.time()
+    for window in schedule:
+        if window.start < window.end:
+            if window.start <= time < window.end and now.weekday() in window.days:
+                return window.limit
+        elif time >= window.start:
+            if now.weekday() in window.days:
+                return window.limit
+        elif time < window.end:
+            # window started the day before
+            if (now.weekday() - 1) % 7 in window.days:
+                return window.limit
+    return None
+
+
+class BandwidthLimiter(object):
+    """
+    Split scheduled bandwidth limit equally among concurrent transfers.
+    """
+
+    def __init__(
+        self,
+        schedule: Tuple[BandwidthWindow],
+        clock: Callable[[], datetime.datetime] = datetime.datetime.now,
+    ):
+        self.__schedule = schedule
+        self.__clock = clock
+        self.__transfers = 0
+        self.__changed = threading.Condition()
+
+    @contextmanager
+    def transfer(self) -> Iterator[None]:
+        """
+        Count transfer running within the context.
+        """
+        with self.__changed:
+            self.__transfers += 1
+            self.__changed.notify_all()
+        try:
+            yield
+        finally:
+            with self.__changed:
+                self.__transfers -= 1
+                self.__changed.notify_all()
+
+    def get_limit(self) -> Optional[int]:
+        """
+        Return bytes per second available to one transfer or None if unlimited.
+        """
+        limit = get_scheduled_limit(self.__schedule, self.__clock())
+        if limit is None:
+            return None
+        return max(1, limit // max(1, self.__transfers))
+
+    def wait_for_change(
+        self,
+        limit: Optional[int],
+        timeout: float,
+        finished: Optional[threading.Event] = None,
+    ) -> bool:
+        """
+        Wait up to {timeout} seconds for the limit of one transfer to differ from {limit}
+        by more than MIN_LIMIT_CHANGE, or for {finished} to be set by `finish`.
+        Transfers starting or finishing are noticed immediately, schedule changes
+        on timeout.
+
+        Returns:
+          bool: True if the limit changed.
+        """
+        with self.__changed:
+            if not self.__is_changed(limit) and (
+                finished is None or not finished.is_set()
+            ):
+                self.__changed.wait(timeout)
+            return self.__is_changed(limit)
+
+    def watch(
+        self,
+        proc: subprocess.Popen,
+        limit: Optional[int],
+        changed: threading.Event,
+        finished: threading.Event,
+        poll_interval: float = POLL_INTERVAL,
+    ) -> None:
+        """
+        Terminate {proc} and set {changed} as soon as the limit differs from {limit}.
+        Return when {proc} finishes or {finished} is set by `finish`.
+        """
+        # polling would reap the process and lose its resource usage
+        while proc.returncode is None and not finished.is_set():
+            if self.wait_for_change(limit, poll_interval, finished):
+                changed.set()
+                proc.terminate()
+                return
+
+    def finish(self, finished: threading.Event) -> None:
+        """
+        Set {finished} and wake up the watcher of the finished transfer.
+        """
+        with self.__changed:
+            finished.set()
+            self.__changed.notify_all()
+
+    def __is_changed(self, limit: Optional[int]) -> bool:
+        current = self.get_limit()
+        if current is None or limit is None:
+            return current != limit
+        return abs(current - limit) > limit * MIN_LIMIT_CHANGE
+
+
+def get_limiter(server: SshBackupServer) -> BandwidthLimiter:
+    """
+    Return limiter shared by all transfers to the host of {server}. Schedule
+    of the first server configured for the host applies.
+    """
+    with __limiters_lock:
+        if server.hostname not in __limiters:
+            __limiters[server.hostname] = BandwidthLimiter(server.bandwidth_schedule)
+        return __limiters[server.hostname]
@@ -0,0 +1,38 @@
+import os
+import json
+
+from typing import List
+
+
+def get_cache_dir(*names: str) -> str:
+    """
+    Return path of {names} in the local cache directory, where state kept
+    between runs is stored.
+    """
+    cache_dir = os.environ.get(
+        "XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")
+    )
+    return os.path.join(cache_dir, "backee", *names)
+
+
+def read_history(path: str) -> List[float]:
+    """
+    Return values recorded in history file {path}, missing or broken file
+    is an empty history.
+    """
+    try:
+        with open(path) as f:
+            return [float(x) for x in json.load(f)]
+    except (OSError, TypeError, ValueError):
+        return []
+
+
+def record_history(path: str, value: float, length: int) -> None:
+    """
+    Append {value} to history file {path}, only the last {length} values are kept.
+    """
+    history = read_history(path) + [value]
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "w") as f:
+        json.dump(history[-length:], f)
+    os.replace(path + ".tmp", path)
@@ -0,0 +1,79 @@
+import hashlib
+
+from typing import BinaryIO, Iterator
+
+
+class Chunker(object):
+    """
+    Content-defined chunker.
+
+    Every byte is mapped to a pseudo random bit with `bytes.translate`
+    and a chunk ends where the last bits form a fixed pattern. Boundaries
+    depend only on a few preceding bytes, so inserting data into a file
+    moves only the chunks around the insertion, and both mapping and pattern
+    search run in C instead of a per-byte Python loop of a rolling hash.
+    """
+
+    def __init__(self, min_size: int, avg_size: int, max_size: int):
+        if not 0 < min_size < avg_size < max_size:
+            raise ValueError(
+                f"chunk sizes must be 0 < min < avg < max, "
+                f"got {min_size}, {avg_size}, {max_size}"
+            )
+
+        self.__min_size = min_size
+        self.__max_size = max_size
+        # boundary is expected every 2^bits bytes after the minimal chunk size
+        bits = max((avg_size - min_size).bit_length() - 1, 1)
+
+        random = self.__random_bits(256 + bits)
+        self.__table = bytes(b"01"[x] for x in random[:256])
+        self.__pattern = bytes(b"01"[x] for x in random[256:])
+        self.__window = max(avg_size - min_size, len(self.__pattern))
+
+    def chunks(self, fileobj: BinaryIO, read_size: int = 1 << 20) -> Iterator[bytes]:
+        buf = bytearray()
+        eof = False
+        while True:
+            while not eof and len(buf) < self.__max_size:
+                data = fileobj.read(max(read_size, self.__max_size - len(buf)))
+                if not data:
+                    eof = True
+                buf += data
+
+            if not buf:
+                return
+
+            cut = self.__find_cut(buf)
+            yield bytes(buf[:cut])
+            del buf[:cut]
+
+    def __find_cut(self, buf: bytearray) -> int:
+        end = min(len(buf), self.__max_size)
+        if end <= self.__min_size:
+            return end
+
+        pattern_size = len(self.__pattern)
+        # pattern has to end at or after the minimal chunk size
+        start = max(self.__min_size - pattern_size, 0)
+        while start + pattern_size <= end:
+            stop = min(start + self.__window + pattern_size, end)
+            found = buf[start:stop].translate(self.__table).find(self.__pattern)
+            if found >= 0:
+                return start + found + pattern_size
+            if stop == end:
+                break
+            start = stop - pattern_size + 1
+
+        return end
+
+    def __random_bits(self, count: int) -> bytes:
+        """
+        Deterministic pseudo random bits, chunk boundaries must not change between runs.
+        """
+        data = b""
+        counter = 0
+        while len(data) < count:
+            data += hashlib.sha256(b"backee chunker %i" % counter).digest()
+            counter += 1
+        return bytes(x & 1 for x in data[:count])
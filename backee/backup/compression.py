@@ -0,0 +1,190 @@
+import os
+import stat
+import time
+import zlib
+import itertools
+import logging
+import dataclasses
+
+from typing import Dict, List, Optional, Tuple
+
+from backee.model.items import FilesBackupItem
+from backee.model.transport_profile import TransportProfile
+from backee.backup import cache, filters
+
+
+log = logging.getLogger(__name__)
+
+# sample is considered incompressible if compressed size is above this ratio
+INCOMPRESSIBLE_RATIO = 0.95
+SAMPLES_PER_SUFFIX = 3
+MAX_SAMPLED_FILES = 256
+# source entries looked at for samples, trees with few sampled suffixes are not read whole
+MAX_VISITED_ENTRIES = 10000
+# rsync compresses with zlib by default
+COMPRESSION_LEVELS = (1, 3, 6, 9)
+# smaller transfers are dominated by file list exchange and say little about the link
+MIN_RECORDED_TRANSFER = 8 * 1024 * 1024
+HISTORY_LENGTH = 10
+
+
+def plan_compression(
+    item: FilesBackupItem,
+    profile: TransportProfile,
+    link_throughput: Optional[float],
+) -> Tuple[TransportProfile, Tuple[str]]:
+    """
+    Adapt compression of {profile} to contents of {item}.
+
+    Suffixes of sampled files that do not compress are added to the skip list
+    if detection is enabled. Compression level is picked by comparing
+    {link_throughput} in bytes per second with compression speed of the samples.
+
+    Returns:
+      (adapted profile, suffixes of files sent without compression)
+    """
+    if not profile.compression:
+        return profile, ()
+
+    policy = item.compression
+    skip_compress = tuple(dict.fromkeys(x.lower() for x in policy.skip_compress))
+    pick_level = (
+        policy.auto_level
+        and profile.compression_level is None
+        and link_throughput is not None
+    )
+    if not policy.detect_incompressible and not pick_level:
+        return profile, skip_compress
+
+    samples = __sample_files(item, set(skip_compress), policy.sample_size)
+
+    if policy.detect_incompressible:
+        detected = tuple(
+            sorted(
+                suffix
+                for suffix, data in samples.items()
+                if suffix
+                and all(__get_ratio(x, 1) >= INCOMPRESSIBLE_RATIO for x in data)
+            )
+        )
+        if detected:
+            log.info("skip compressing incompressible suffixes: %s", detected)
+            skip_compress += detected
+            for suffix in detected:
+                del samples[suffix]
+
+    sample = b"".join(x for data in samples.values() for x in data)
+    if pick_level and sample:
+        level = pick_compression_level(link_throughput, measure_compression(sample))
+        log.info(
+            "link throughput %.1f MiB/s, compression level %s",
+            link_throughput / 1024 / 1024,
+            level,
+        )
+        profile = dataclasses.replace(
+            profile, compression=level is not None, compression_level=level
+        )
+
+    return profile, skip_compress
+
+
+def measure_compression(
+    sample: bytes, levels: Tuple[int] = COMPRESSION_LEVELS
+) -> Tuple[Tuple[int, float, float]]:
+    """
+    Compress {sample} with every level of {levels}.
+
+    Returns:
+      ((level, input bytes per second, compressed size ratio), ...)
+    """
+    result = []
+    for level in levels:
+        started = time.perf_counter()
+        ratio = __get_ratio(sample, level)
+        elapsed = max(time.perf_counter() - started, 1e-6)
+        result.append((level, len(sample) / elapsed, ratio))
+    return tuple(result)
+
+
+def pick_compression_level(
+    link_throughput: float, measurements: Tuple[Tuple[int, float, float]]
+) -> Optional[int]:
+    """
+    Pick level, which sends data the fastest. Compressed transfer is limited
+    either by compression speed or by the link carrying compressed data.
+
+    Returns:
+      compression level or None if sending uncompressed data is the fastest.
+    """
+    best_level, best_throughput = None, link_throughput
+    for level, speed, ratio in measurements:
+        throughput = min(speed, link_throughput / max(ratio, 0.01))
+        if throughput > best_throughput:
+            best_level, best_throughput = level, throughput
+    return best_level
+
+
+def get_history_path(hostname: str) -> str:
+    return cache.get_cache_dir("throughput", hostname)
+
+
+def load_link_throughput(hostname: str) -> Optional[float]:
+    """
+    Return the best link throughput to {hostname} recorded recently,
+    transfers limited by compression or disks underestimate the link.
+    """
+    history = cache.read_history(get_history_path(hostname))
+    return max(history) if history else None
+
+
+def record_link_throughput(hostname: str, size: int, elapsed: float) -> None:
+    """
+    Record {size} bytes sent to {hostname} in {elapsed} seconds.
+    """
+    if size < MIN_RECORDED_TRANSFER or elapsed <= 0:
+        return
+
+    cache.record_history(get_history_path(hostname), size / elapsed, HISTORY_LENGTH)
+
+
+def __get_ratio(data: bytes, level: int) -> float:
+    return len(zlib.compress(data, level)) / max(len(data), 1)
+
+
+def __sample_files(
+    item: FilesBackupItem, skip_compress: set, sample_size: int
+) -> Dict[str, List[bytes]]:
+    """
+    Read up to {sample_size} bytes from the middle of a few files
+    of every suffix not in {skip_compress}.
+
+    Returns:
+      {suffix: [sample, ...]}
+    """
+    samples = {}
+    sampled = 0
+    # the scan is shared with the transfers of the run
+    sources = filters.get_filters(item).iter_sources()
+    for path, st in itertools.islice(sources, MAX_VISITED_ENTRIES):
+        if sampled >= MAX_SAMPLED_FILES:
+            break
+        if not stat.S_ISREG(st.st_mode) or st.st_size == 0:
+            continue
+
+        suffix = os.path.splitext(path)[1][1:].lower()
+        if suffix in skip_compress:
+            continue
+        suffix_samples = samples.setdefault(suffix, [])
+        if len(suffix_samples) >= SAMPLES_PER_SUFFIX:
+            continue
+
+        try:
+            with open(path, "rb") as f:
+                f.seek(max(0, (st.st_size - sample_size) // 2))
+                suffix_samples.append(f.read(sample_size))
+        except OSError:
+            log.debug("cannot sample %s", path, exc_info=True)
+            continue
+        sampled += 1
+
+    return {k: v for k, v in samples.items() if v}
@@ -0,0 +1,72 @@
+import threading
+
+from typing import Dict, Tuple
+
+from paramiko import SSHClient, AutoAddPolicy
+
+from backee.model.servers import (
+    BackupServer,
+    SshBackupServer,
+    SftpBackupServer,
+    S3BackupServer,
+)
+
+
+class SharedSSHClient(SSHClient):
+    """
+    SSH client shared by transmitters of servers with the same host and user,
+    it connects once and commands run concurrently on separate channels.
+    """
+
+    def __init__(self, keepalive: int = 0):
+        super().__init__()
+        self.load_system_host_keys()
+        self.set_missing_host_key_policy(AutoAddPolicy())
+        self.__keepalive = keepalive
+        self.__lock = threading.Lock()
+
+    def connect(self, *args, **kwargs) -> None:
+        with self.__lock:
+            transport = self.get_transport()
+            if transport is not None and transport.is_active():
+                return
+            super().connect(*args, **kwargs)
+            if self.__keepalive:
+                self.get_transport().set_keepalive(self.__keepalive)
+
+
+class ConnectionPool(object):
+    """
+    SSH clients shared by all configs running in the process.
+    """
+
+    def __init__(self, keepalive: int = 0):
+        self.__keepalive = keepalive
+        self.__clients: Dict[Tuple, SharedSSHClient] = {}
+        self.__lock = threading.Lock()
+
+    def get_client(self, server: SshBackupServer) -> SharedSSHClient:
+        key = (server.hostname, server.port, server.username, server.key_path)
+        with self.__lock:
+            if key not in self.__clients:
+                self.__clients[key] = SharedSSHClient(self.__keepalive)
+            return self.__clients[key]
+
+    def close(self) -> None:
+        with self.__lock:
+            for client in self.__clients.values():
+                client.close()
+            self.__clients.clear()
+
+
+def get_host(server: BackupServer) -> str:
+    """
+    Return name of the machine or service storing backups of {server},
+    which concurrency limits apply to.
+    """
+    if isinstance(server, (SshBackupServer, SftpBackupServer)):
+        return server.hostname
+    if isinstance(server, S3BackupServer):
+        return f"{server.endpoint}/{server.bucket}"
+    # local and repository servers share the disk of their location
+    return server.location
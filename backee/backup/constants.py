@@ -4,3 +4,6 @@
 RSYNC_STATUS_SUCCESS = 0
 # source item vanished before rsync was able to copy it over
 RSYNC_STATUS_SOURCE_VANISHED = 24
+
+# suffix of the directory a backup is transmitted to before it is complete
+TEMP_DIR_SUFFIX = "-incomplete"
@@ -0,0 +1,366 @@
+import os
+import signal
+import socket
+import logging
+import datetime
+import tempfile
+import threading
+import socketserver
+
+from typing import Callable, Dict, List, Optional, Tuple
+
+from backee.model.config import Config
+from backee.model.items import BackupItem
+from backee.model.schedule import Schedule
+from backee.model.servers import BackupServer
+from backee.parser.config_parser import parse_config
+from backee.logger.loggers import setup_config_loggers
+from backee.backup import backup, database_dump, filters, scheduler
+from backee.backup.transmitter import Transmitter
+
+
+log = logging.getLogger(__name__)
+
+# seconds between keepalives of idle ssh connections
+KEEPALIVE_INTERVAL = 30
+# longest sleep of the scheduler, so clock changes are noticed
+MAX_SLEEP = 60
+# name of the run triggered without a schedule, it backs up everything
+MANUAL_RUN = "manual"
+
+
+def get_socket_path(config_name: str) -> str:
+    """
+    Return default path of the control socket of daemon running {config_name}.
+    """
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR", tempfile.gettempdir())
+    return os.path.join(runtime_dir, f"backee-{config_name.replace('/', '_')}.sock")
+
+
+def send_command(command: str, socket_path: str) -> str:
+    """
+    Send {command} to the daemon listening on {socket_path} and return its reply.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        sock.sendall(command.encode() + b"\n")
+        sock.shutdown(socket.SHUT_WR)
+        with sock.makefile("rb") as f:
+            return f.read().decode().rstrip("\n")
+
+
+class Daemon(object):
+    """
+    Run backups scheduled by cron expressions of the config. Runs of different
+    schedules overlap, but only one run at a time uses a server.
+
+    Control socket accepts one command per connection:
+      run [schedule]  start a schedule now, everything is backed up without it
+      status          list running and next runs
+      reload          reload the config like SIGHUP
+    """
+
+    def __init__(
+        self,
+        config_path: str,
+        socket_path: str,
+        run_backup: Callable[..., None] = backup.backup,
+        clock: Callable[[], datetime.datetime] = datetime.datetime.now,
+    ):
+        self.__config_path = config_path
+        self.__socket_path = socket_path
+        self.__run_backup = run_backup
+        self.__clock = clock
+        self.__config: Optional[Config] = None
+        self.__loggers: Tuple[logging.Handler] = ()
+        self.__next_runs: Dict[str, datetime.datetime] = {}
+
+        self.__lock = threading.Lock()
+        self.__wake = threading.Event()
+        self.__reload_requested = threading.Event()
+        self.__stopped = threading.Event()
+        self.__runs: Dict[str, threading.Thread] = {}
+        self.__server_locks: Dict[str, threading.Lock] = {}
+        self.__transmitters: Dict[str, Tuple[str, Transmitter]] = {}
+        self.__control_dir = tempfile.TemporaryDirectory(prefix="backee-ssh-")
+        self.__control_server: Optional[socketserver.UnixStreamServer] = None
+
+        self.reload()
+
+    def serve(self) -> None:
+        """
+        Schedule runs until `stop` is called or SIGTERM is received.
+        Running backups are finished before returning.
+        """
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGHUP, lambda *_: self.request_reload())
+            signal.signal(signal.SIGTERM, lambda *_: self.stop())
+
+        self.__start_control_server()
+        log.info("daemon started, control socket %s", self.__socket_path)
+        try:
+            while not self.__stopped.is_set():
+                if self.__reload_requested.is_set():
+                    self.__reload_requested.clear()
+                    self.reload()
+                self.__start_due_runs()
+                self.__wake.wait(self.__get_sleep())
+                self.__wake.clear()
+        finally:
+            self.__control_server.shutdown()
+            self.__control_server.server_close()
+            os.remove(self.__socket_path)
+            for run in list(self.__runs.values()):
+                run.join()
+            self.__control_dir.cleanup()
+        log.info("daemon stopped")
+
+    def stop(self) -> None:
+        self.__stopped.set()
+        self.__wake.set()
+
+    def request_reload(self) -> None:
+        """
+        Reload the config by the scheduler, so signal handlers do not block.
+        """
+        self.__reload_requested.set()
+        self.__wake.set()
+
+    def reload(self) -> None:
+        """
+        Parse the config and replace its loggers and schedules. Runs in progress
+        finish with the old config. Invalid configs are logged and ignored,
+        unless no config was loaded yet.
+        """
+        try:
+            config = parse_config(self.__config_path)
+        except Exception:
+            if self.__config is None:
+                raise
+            log.exception(
+                "cannot reload %s, keeping current config", self.__config_path
+            )
+            return
+
+        root_logger = logging.getLogger()
+        for handler in self.__loggers:
+            root_logger.removeHandler(handler)
+        setup_config_loggers(config.loggers)
+        self.__loggers = config.loggers
+
+        now = self.__clock()
+        with self.__lock:
+            previous = (
+                {x.name: x for x in self.__config.schedules} if self.__config else {}
+            )
+            self.__config = config
+            next_runs = {}
+            for schedule in config.schedules:
+                if schedule.name in previous and previous[schedule.name] == schedule:
+                    next_runs[schedule.name] = self.__next_runs[schedule.name]
+                else:
+                    next_runs[schedule.name] = scheduler.get_next_run(
+                        schedule.cron, now
+                    )
+            self.__next_runs = next_runs
+        log.info("config %s loaded, %i schedules", self.__config_path, len(next_runs))
+
+    def trigger(self, schedule_name: Optional[str] = None) -> bool:
+        """
+        Start run of {schedule_name} or of everything if it is None.
+
+        Returns:
+          bool: False if the run is in progress already.
+
+        Raises:
+          KeyError: if there is no such schedule.
+        """
+        with self.__lock:
+            if schedule_name is None:
+                return self.__start_run(MANUAL_RUN, (), ())
+            for schedule in self.__config.schedules:
+                if schedule.name == schedule_name:
+                    return self.__start_run(
+                        schedule.name, schedule.items, schedule.servers
+                    )
+        raise KeyError(f"Unknown schedule: '{schedule_name}'")
+
+    def get_status(self) -> List[str]:
+        """
+        Return lines describing running and next runs.
+        """
+        with self.__lock:
+            lines = [f"running\t{x}" for x in sorted(self.__runs)]
+            lines += [
+                f"next\t{name}\t{next_run.isoformat(timespec='minutes')}"
+                for name, next_run in sorted(
+                    self.__next_runs.items(), key=lambda x: x[1]
+                )
+            ]
+        return lines
+
+    def handle_command(self, command: str) -> str:
+        """
+        Execute control socket {command} and return the reply.
+
+        Raises:
+          ValueError: if the command is unknown.
+          KeyError: if there is no such schedule.
+        """
+        action, _, argument = command.strip().partition(" ")
+        argument = argument.strip()
+        if action == "run":
+            name = argument or None
+            if self.trigger(name):
+                return f"started {name or MANUAL_RUN}"
+            return f"already running {name or MANUAL_RUN}"
+        if action == "status" and not argument:
+            return "\n".join(self.get_status())
+        if action == "reload" and not argument:
+            self.request_reload()
+            return "reloading"
+        raise ValueError(f"unknown command: '{command.strip()}'")
+
+    def __start_due_runs(self) -> None:
+        now = self.__clock()
+        with self.__lock:
+            for schedule in self.__config.schedules:
+                if self.__next_runs[schedule.name] > now:
+                    continue
+                self.__next_runs[schedule.name] = scheduler.get_next_run(
+                    schedule.cron, now
+                )
+                if not self.__start_run(
+                    schedule.name, schedule.items, schedule.servers
+                ):
+                    log.warning("%s is still running, skipping its run", schedule.name)
+
+    def __get_sleep(self) -> float:
+        with self.__lock:
+            if not self.__next_runs:
+                return MAX_SLEEP
+            next_run = min(self.__next_runs.values())
+        return min(MAX_SLEEP, max(0, (next_run - self.__clock()).total_seconds()))
+
+    def __start_run(
+        self, name: str, item_names: Tuple[str], server_names: Tuple[str]
+    ) -> bool:
+        # called with the lock held
+        if name in self.__runs:
+            return False
+
+        config = self.__config
+        items = tuple(
+            x
+            for x in config.backup_items or ()
+            if not item_names or x.name in item_names
+        )
+        servers = tuple(
+            x
+            for x in config.backup_servers
+            if not server_names or x.name in server_names
+        )
+        run = threading.Thread(
+            target=self.__run, args=(name, config, items, servers), name=name
+        )
+        self.__runs[name] = run
+        run.start()
+        return True
+
+    def __run(
+        self,
+        name: str,
+        config: Config,
+        items: Tuple[BackupItem],
+        servers: Tuple[BackupServer],
+    ) -> None:
+        log.info("%s run started", name)
+        try:
+            # databases are dumped and sources scanned once for all servers
+            with filters.session() as run:
+                items = filters.bind(database_dump.stage(items), run)
+                names = {x.name for x in servers}
+                selected = []
+                for server in servers:
+                    if backup.is_replica(server):
+                        if server.replicate_from not in names:
+                            log.warning(
+                                "%s is a replica of %s, which is not selected by %s",
+                                server.name,
+                                server.replicate_from,
+                                name,
+                            )
+                        continue
+                    selected.append(server)
+                    selected.extend(
+                        x
+                        for x in backup.get_replicas(server, config.backup_servers)
+                        if x not in selected
+                    )
+                # servers used by other runs are waited for, while others are used
+                try:
+                    self.__run_backup(
+                        config.name,
+                        items,
+                        tuple(selected),
+                        get_transmitter=self.__get_transmitter,
+                        workers=config.workers,
+                        items_per_server=config.items_per_server,
+                        window_end=config.window_end,
+                        get_server_lock=lambda x: self.__get_server_lock(x.name),
+                    )
+                except Exception:
+                    log.exception("%s run failed", name)
+                    # connections may be broken
+                    with self.__lock:
+                        for server in selected:
+                            self.__transmitters.pop(server.name, None)
+        finally:
+            with self.__lock:
+                del self.__runs[name]
+            log.info("%s run finished", name)
+
+    def __get_server_lock(self, server_name: str) -> threading.Lock:
+        with self.__lock:
+            return self.__server_locks.setdefault(server_name, threading.Lock())
+
+    def __get_transmitter(self, server: BackupServer) -> Transmitter:
+        """
+        Return transmitter kept since a previous run of {server}, so its
+        connections are reused, unless the server config changed.
+        """
+        key = repr(server)
+        with self.__lock:
+            cached = self.__transmitters.get(server.name)
+            if cached is not None and cached[0] == key:
+                return cached[1]
+            transmitter = backup.create_transmitter(
+                server,
+                keepalive=KEEPALIVE_INTERVAL,
+                control_dir=self.__control_dir.name,
+            )
+            self.__transmitters[server.name] = (key, transmitter)
+            return transmitter
+
+    def __start_control_server(self) -> None:
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                command = self.rfile.readline().decode()
+                try:
+                    reply = daemon.handle_command(command)
+                except (KeyError, ValueError) as e:
+                    reply = f"error: {e.args[0]}"
+                self.wfile.write(reply.encode() + b"\n")
+
+        if os.path.exists(self.__socket_path):
+            # left by a daemon, which was killed, the process lock is held already
+            os.remove(self.__socket_path)
+        self.__control_server = socketserver.ThreadingUnixStreamServer(
+            self.__socket_path, Handler
+        )
+        os.chmod(self.__socket_path, 0o600)
+        threading.Thread(
+            target=self.__control_server.serve_forever, name="control", daemon=True
+        ).start()
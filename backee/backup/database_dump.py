@@ -0,0 +1,268 @@
+import os
+import shutil
+import filecmp
+import hashlib
+import logging
+import tempfile
+import threading
+import subprocess
+import urllib.parse
+
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+from backee.model.items import BackupItem, DumpsBackupItem, MysqlBackupItem
+from backee.model.db_connectors import DockerConnector, RemoteConnector
+from backee.backup import cache, process
+
+
+log = logging.getLogger(__name__)
+
+DUMP_SUFFIX = ".sql.gz"
+# file listing dumped sections in the order they are loaded
+RESTORE_ORDER = "restore-order"
+# comments of mysqldump output starting sections, which are written to
+# separate files named by the prefix and the table, view or database
+SECTION_MARKERS = (
+    (b"-- Table structure for table `", "table-"),
+    (b"-- Temporary view structure for view `", "view-placeholder-"),
+    (b"-- Final view structure for view `", "view-"),
+    (b"-- Dumping events for database '", "events-"),
+    (b"-- Dumping routines for database '", "routines-"),
+)
+
+# overlapping runs dumping the same database wait for each other
+__dump_locks: Dict[str, threading.Lock] = {}
+__dump_locks_lock = threading.Lock()
+
+
+def get_staging_dir(item: MysqlBackupItem) -> str:
+    """
+    Return local directory, where dump of {item} is spooled and sent from
+    to every server.
+    """
+    key = repr((item.connector, item.database)).encode()
+    return cache.get_cache_dir("dumps", hashlib.sha256(key).hexdigest()[:16])
+
+
+def get_dump_command(item: MysqlBackupItem) -> List[str]:
+    """
+    Return mysqldump command writing consistent dump of {item} to stdout,
+    the password is passed in MYSQL_PWD environment variable.
+    """
+    options = [
+        "--single-transaction",
+        "--quick",
+        "--routines",
+        "--events",
+        # rows sorted and no date, so unchanged tables dump the same bytes
+        "--order-by-primary",
+        "--skip-dump-date",
+        f"--user={item.username}",
+        f"--port={item.connector.port}",
+    ]
+    if isinstance(item.connector, DockerConnector):
+        return [
+            process.find_executable("docker"),
+            "exec",
+            "--env",
+            "MYSQL_PWD",
+            item.connector.container,
+            "mysqldump",
+            "--protocol=tcp",
+            *options,
+            item.database,
+        ]
+
+    hostname = (
+        item.connector.hostname
+        if isinstance(item.connector, RemoteConnector)
+        else "127.0.0.1"
+    )
+    return [
+        process.find_executable("mysqldump"),
+        f"--host={hostname}",
+        "--protocol=tcp",
+        *options,
+        item.database,
+    ]
+
+
+def stage(items: Tuple[BackupItem]) -> Tuple[BackupItem]:
+    """
+    Replace database items of {items} by a single item of their dumps taken
+    now, which are sent to every server of the run. Every run stages its
+    items once. Databases, which cannot be dumped, are skipped.
+    """
+    databases = [x for x in items if isinstance(x, MysqlBackupItem)]
+    if not databases:
+        return items
+
+    dumps = tuple(x for x in (__get_dump(x) for x in databases) if x is not None)
+    others = tuple(x for x in items if not isinstance(x, MysqlBackupItem))
+    if not dumps:
+        return others
+
+    rotation_strategy = next(
+        (x.rotation_strategy for x in databases if x.rotation_strategy is not None),
+        None,
+    )
+    return others + (
+        DumpsBackupItem(
+            rotation_strategy=rotation_strategy,
+            includes=dumps,
+            excludes=(),
+            sqlite_snapshots=False,
+        ),
+    )
+
+
+def dump(item: MysqlBackupItem, path: str) -> None:
+    """
+    Stream dump of {item} into directory {path}, one compressed file per
+    table, which is replaced only by a complete dump. Files of unchanged
+    tables are kept as they are, so rsync hard links them to the previous
+    snapshot. `restore-order` lists the files in the order they are loaded.
+
+    Raises:
+      OSError: if mysqldump or gzip failed.
+    """
+    incoming = path + ".incoming"
+    shutil.rmtree(incoming, ignore_errors=True)
+    os.makedirs(incoming)
+    env = dict(os.environ, MYSQL_PWD=item.password)
+    names = []
+    try:
+        with tempfile.TemporaryFile() as stderr, subprocess.Popen(
+            get_dump_command(item), stdout=subprocess.PIPE, stderr=stderr, env=env
+        ) as proc:
+            try:
+                __split_dump(proc.stdout, incoming, names)
+            except BaseException:
+                proc.kill()
+                raise
+            exit_code = proc.wait()
+            if exit_code != 0:
+                stderr.seek(0)
+                raise OSError(
+                    f"cannot dump {item.database}, exit code {exit_code}: "
+                    + stderr.read().decode(errors="replace").strip()
+                )
+        with open(os.path.join(incoming, RESTORE_ORDER), "w") as f:
+            f.writelines(x + "\n" for x in names)
+        __merge(incoming, path)
+    finally:
+        shutil.rmtree(incoming, ignore_errors=True)
+
+
+def __split_dump(dump_file: BinaryIO, directory: str, names: List[str]) -> None:
+    """
+    Write sections of mysqldump output {dump_file} into separate files
+    in {directory}, their names are appended to {names}.
+    """
+    section = None
+    try:
+        for line in dump_file:
+            name = __get_section_name(line)
+            if section is None or (name is not None and name not in names):
+                if section is not None:
+                    __close_section(section)
+                name = name or "header"
+                names.append(name)
+                section = __open_section(os.path.join(directory, name + DUMP_SUFFIX))
+            section.stdin.write(line)
+    finally:
+        if section is not None:
+            __close_section(section)
+
+
+def __get_section_name(line: bytes) -> Optional[str]:
+    """
+    Return file name of the section started by {line} of mysqldump output,
+    or None if {line} does not start a section.
+    """
+    if not line.startswith((b"-- ", b"/*!40103 SET TIME_ZONE=@OLD_TIME_ZONE")):
+        return None
+    for marker, prefix in SECTION_MARKERS:
+        if line.startswith(marker):
+            name = line[len(marker) :].rstrip().rstrip(b"`'")
+            return prefix + urllib.parse.quote_from_bytes(name, safe="")
+    if line.startswith(b"/*!40103 SET TIME_ZONE=@OLD_TIME_ZONE"):
+        return "footer"
+    return None
+
+
+def __open_section(path: str) -> subprocess.Popen:
+    with open(path, "wb") as f:
+        # --rsyncable restarts compression at content defined points, so
+        # a changed row changes only a block around it, -n omits timestamps
+        return subprocess.Popen(
+            [process.find_executable("gzip"), "--rsyncable", "-n", "-c"],
+            stdin=subprocess.PIPE,
+            stdout=f,
+        )
+
+
+def __close_section(section: subprocess.Popen) -> None:
+    section.stdin.close()
+    exit_code = section.wait()
+    if exit_code != 0:
+        raise OSError(f"cannot compress dump, gzip exit code {exit_code}")
+
+
+def __merge(incoming: str, path: str) -> None:
+    """
+    Move files of {incoming} directory into {path}, files with the same
+    content are not replaced, files not in {incoming} are removed.
+    """
+    os.makedirs(path, exist_ok=True)
+    names = set(os.listdir(incoming))
+    for name in names:
+        source = os.path.join(incoming, name)
+        target = os.path.join(path, name)
+        if os.path.isfile(target) and filecmp.cmp(source, target, shallow=False):
+            continue
+        os.replace(source, target)
+    for name in os.listdir(path):
+        if name not in names:
+            os.remove(os.path.join(path, name))
+
+
+def __get_dump(item: MysqlBackupItem) -> Optional[str]:
+    """
+    Return directory with dump of {item} taken now, or None if it cannot be dumped.
+    """
+    staging_dir = get_staging_dir(item)
+    with __get_dump_lock(staging_dir):
+        log.info("dump database %s", item.database)
+        try:
+            __remove_stale(staging_dir, item.database)
+            dump(item, os.path.join(staging_dir, item.database))
+            return staging_dir
+        except OSError:
+            log.exception("cannot dump database %s", item.database)
+            return None
+
+
+def __get_dump_lock(staging_dir: str) -> threading.Lock:
+    """
+    Return lock of dumps written to {staging_dir}, dumps of other databases
+    are not waiting for it.
+    """
+    with __dump_locks_lock:
+        return __dump_locks.setdefault(staging_dir, threading.Lock())
+
+
+def __remove_stale(staging_dir: str, database: str) -> None:
+    """
+    Remove files of {staging_dir} other than the dump of {database}.
+    """
+    if not os.path.isdir(staging_dir):
+        return
+    for name in os.listdir(staging_dir):
+        if name == database:
+            continue
+        path = os.path.join(staging_dir, name)
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
@@ -0,0 +1,30 @@
+import datetime
+import threading
+import subprocess
+
+
+class DeadlineExceeded(TimeoutError):
+    """
+    Transfer was stopped at the end of the backup window.
+    """
+
+
+def get_deadline(
+    window_end: datetime.time, now: datetime.datetime
+) -> datetime.datetime:
+    """
+    Return the first {window_end} later than {now}.
+    """
+    deadline = datetime.datetime.combine(now.date(), window_end, now.tzinfo)
+    if deadline <= now:
+        deadline += datetime.timedelta(days=1)
+    return deadline
+
+
+def expire(proc: subprocess.Popen, expired: threading.Event) -> None:
+    """
+    Terminate {proc} at the deadline and set {expired}, unless it finished.
+    """
+    if proc.returncode is None:
+        expired.set()
+        proc.terminate()
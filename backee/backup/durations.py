@@ -0,0 +1,33 @@
+from typing import Optional
+
+from backee.backup import cache
+
+
+# recent runs averaged into the expected duration
+HISTORY_LENGTH = 5
+
+
+def get_history_path(config_name: str, server_name: str, item_name: str) -> str:
+    return cache.get_cache_dir("durations", config_name, server_name, item_name)
+
+
+def load_duration(
+    config_name: str, server_name: str, item_name: str
+) -> Optional[float]:
+    """
+    Return mean duration in seconds of recent backups of {item_name}
+    to {server_name}, or None if it was never backed up.
+    """
+    history = cache.read_history(get_history_path(config_name, server_name, item_name))
+    return sum(history) / len(history) if history else None
+
+
+def record_duration(
+    config_name: str, server_name: str, item_name: str, elapsed: float
+) -> None:
+    """
+    Record backup of {item_name} to {server_name} taking {elapsed} seconds.
+    """
+    cache.record_history(
+        get_history_path(config_name, server_name, item_name), elapsed, HISTORY_LENGTH
+    )
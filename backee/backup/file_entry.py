@@ -0,0 +1,63 @@
+import os
+import stat
+
+from typing import Any, Dict, Optional
+
+
+def create_entry(path: str, st: os.stat_result) -> Dict[str, Any]:
+    """
+    Create metadata entry of {path} stored in snapshots that are not plain
+    directory trees.
+    """
+    if stat.S_ISDIR(st.st_mode):
+        entry_type = "d"
+    elif stat.S_ISLNK(st.st_mode):
+        entry_type = "l"
+    else:
+        entry_type = "f"
+
+    return {
+        "path": path.lstrip("/"),
+        "type": entry_type,
+        "mode": st.st_mode,
+        "uid": st.st_uid,
+        "gid": st.st_gid,
+        "mtime_ns": st.st_mtime_ns,
+        "size": st.st_size,
+    }
+
+
+def find_unchanged(
+    entries: Dict[str, Dict[str, Any]], path: str, st: os.stat_result
+) -> Optional[Dict[str, Any]]:
+    """
+    Return entry of {path} from {entries} if its metadata is the same as {st}.
+    """
+    entry = entries.get(path.lstrip("/"))
+    if entry is None:
+        return None
+
+    same = (
+        entry["size"] == st.st_size
+        and entry["mtime_ns"] == st.st_mtime_ns
+        and entry["mode"] == st.st_mode
+        and (entry["uid"], entry["gid"]) == (st.st_uid, st.st_gid)
+    )
+    return entry if same else None
+
+
+def apply_metadata(target: str, entry: Dict[str, Any], can_chown: bool) -> None:
+    """
+    Set owner, mode and modification time of restored {target} from {entry}.
+    """
+    is_link = entry["type"] == "l"
+    if can_chown:
+        os.chown(target, entry["uid"], entry["gid"], follow_symlinks=False)
+    if not is_link:
+        os.chmod(target, stat.S_IMODE(entry["mode"]))
+    if not is_link or os.utime in os.supports_follow_symlinks:
+        os.utime(
+            target,
+            ns=(entry["mtime_ns"], entry["mtime_ns"]),
+            follow_symlinks=False,
+        )
@@ -0,0 +1,302 @@
+import os
+import mmap
+import zlib
+import logging
+
+from typing import Iterable, Iterator, Optional, Tuple
+
+from backee.model.file_index import FileIndexEntry
+from backee.backup import cache
+
+
+log = logging.getLogger(__name__)
+
+# remote index is stored gzipped beside the snapshot directory
+REMOTE_INDEX_SUFFIX = ".index.gz"
+# local mirror is stored uncompressed, so it can be memory-mapped
+LOCAL_INDEX_SUFFIX = ".index"
+
+# index record is "path\tsize\tmtime\tinode\thash\ttype\tmode\ttarget\0",
+# records are sorted by path, mode is octal and symlink target is hex encoded.
+# Indexes written before types were added have files only and end by hash.
+RECORD_SEPARATOR = b"\0"
+FIELD_SEPARATOR = b"\t"
+ENTRY_TYPES = (b"f", b"d", b"l")
+
+
+def get_remote_index_path(backup_dir_path: str) -> str:
+    return backup_dir_path.rstrip("/") + REMOTE_INDEX_SUFFIX
+
+
+def get_mirror_dir(config_name: str, server_name: str, item_name: str) -> str:
+    """
+    Return local directory, where indexes of {item_name} snapshots
+    stored on {server_name} are mirrored.
+    """
+    return cache.get_cache_dir("indexes", config_name, server_name, item_name)
+
+
+def get_mirror_path(mirror_dir: str, backup_name: str) -> str:
+    return os.path.join(
+        mirror_dir, os.path.basename(backup_name.rstrip("/")) + LOCAL_INDEX_SUFFIX
+    )
+
+
+def get_mirrored_backup_names(mirror_dir: str) -> Tuple[str]:
+    """
+    Return names of all backups with a local index mirror sorted from oldest to newest.
+    """
+    if not os.path.isdir(mirror_dir):
+        return ()
+
+    return tuple(
+        sorted(
+            x[: -len(LOCAL_INDEX_SUFFIX)]
+            for x in os.listdir(mirror_dir)
+            if x.endswith(LOCAL_INDEX_SUFFIX)
+        )
+    )
+
+
+def mirror_index(transmitter, remote_index_path: str, local_index_path: str) -> None:
+    """
+    Download remote index and store it uncompressed in the local mirror.
+    """
+    log.debug("mirror %s to %s", remote_index_path, local_index_path)
+    os.makedirs(os.path.dirname(local_index_path), exist_ok=True)
+
+    decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+    temp_path = local_index_path + ".tmp"
+    with open(temp_path, mode="wb") as f:
+        for chunk in transmitter.read_remote_file(remote_index_path):
+            f.write(decompressor.decompress(chunk))
+        f.write(decompressor.flush())
+
+    os.replace(temp_path, local_index_path)
+
+
+def prune_mirror(mirror_dir: str, removed_backups: Iterable[str]) -> None:
+    """
+    Remove local mirrors of indexes that belong to removed backups.
+    """
+    for backup_name in removed_backups:
+        path = get_mirror_path(mirror_dir, backup_name)
+        if os.path.exists(path):
+            log.debug("remove index mirror %s", path)
+            os.remove(path)
+
+
+def write_index(entries: Iterable[FileIndexEntry], fileobj) -> None:
+    """
+    Write entries in index format, sorting them by path.
+    """
+    records = sorted(__format_record(x) for x in entries)
+    for record in records:
+        fileobj.write(record)
+
+
+def parse_record(record: bytes) -> FileIndexEntry:
+    path, size, mtime, inode, file_hash, entry_type, mode, target = __split_record(
+        record
+    )
+    return FileIndexEntry(
+        path=os.fsdecode(path),
+        size=int(size),
+        mtime=float(mtime),
+        inode=int(inode),
+        hash=file_hash.decode("ascii") if file_hash else None,
+        type=entry_type.decode("ascii"),
+        mode=int(mode, 8),
+        target=os.fsdecode(bytes.fromhex(target.decode("ascii"))) if target else None,
+    )
+
+
+def __split_record(record: bytes) -> Tuple[bytes, ...]:
+    # path goes first and may contain field separator itself
+    fields = record.rsplit(FIELD_SEPARATOR, 7)
+    if (
+        len(fields) == 8
+        and fields[5] in ENTRY_TYPES
+        and fields[6].isdigit()
+        and all(x in b"0123456789abcdef" for x in fields[7])
+    ):
+        return tuple(fields)
+    return (*record.rsplit(FIELD_SEPARATOR, 4), b"f", b"644", b"")
+
+
+def __format_record(entry: FileIndexEntry) -> bytes:
+    return (
+        FIELD_SEPARATOR.join(
+            (
+                os.fsencode(entry.path),
+                str(entry.size).encode("ascii"),
+                repr(entry.mtime).encode("ascii"),
+                str(entry.inode).encode("ascii"),
+                entry.hash.encode("ascii") if entry.hash else b"",
+                entry.type.encode("ascii"),
+                format(entry.mode, "o").encode("ascii"),
+                os.fsencode(entry.target).hex().encode("ascii")
+                if entry.target
+                else b"",
+            )
+        )
+        + RECORD_SEPARATOR
+    )
+
+
+class FileIndex(object):
+    """
+    Read-only memory-mapped view of a local index mirror.
+    """
+
+    def __init__(self, path: str):
+        self.__file = open(path, mode="rb")
+        size = os.fstat(self.__file.fileno()).st_size
+        # empty files cannot be mapped
+        self.__mm = (
+            mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        )
+
+    def __enter__(self) -> "FileIndex":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if isinstance(self.__mm, mmap.mmap):
+            self.__mm.close()
+        self.__file.close()
+
+    def __iter__(self) -> Iterator[FileIndexEntry]:
+        return self.__iter_from_offset(0)
+
+    def lookup(self, path: str) -> Optional[FileIndexEntry]:
+        """
+        Find entry for exact path using binary search over the mapped index.
+        """
+        key = os.fsencode(path.lstrip("/"))
+        offset = self.__bisect(key)
+        if offset >= len(self.__mm):
+            return None
+
+        entry = parse_record(self.__read_record(offset)[0])
+        return entry if os.fsencode(entry.path) == key else None
+
+    def iter_prefix(self, path: str) -> Iterator[FileIndexEntry]:
+        """
+        Iterate over entry with exact path and all entries below it.
+        """
+        key = os.fsencode(path.strip("/"))
+        if not key:
+            yield from self
+            return
+
+        entry = self.lookup(os.fsdecode(key))
+        if entry is not None:
+            yield entry
+
+        # siblings like `a-old` and `a.txt` sort between `a` and `a/`
+        dir_key = key + b"/"
+        for entry in self.__iter_from_offset(self.__bisect(dir_key)):
+            if not os.fsencode(entry.path).startswith(dir_key):
+                break
+            yield entry
+
+    def __iter_from_offset(self, offset: int) -> Iterator[FileIndexEntry]:
+        while offset < len(self.__mm):
+            record, offset = self.__read_record(offset)
+            yield parse_record(record)
+
+    def __read_record(self, offset: int) -> Tuple[bytes, int]:
+        end = self.__mm.find(RECORD_SEPARATOR, offset)
+        if end < 0:
+            end = len(self.__mm)
+        return self.__mm[offset:end], end + 1
+
+    def __record_start(self, position: int) -> int:
+        """
+        Return offset of the first record, that starts at or after {position}.
+        """
+        if position == 0:
+            return 0
+        separator = self.__mm.find(RECORD_SEPARATOR, position - 1)
+        return len(self.__mm) if separator < 0 else separator + 1
+
+    def __bisect(self, key: bytes) -> int:
+        """
+        Return offset of the first record with path not less than {key}.
+        """
+        lo, hi = 0, len(self.__mm)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = self.__record_start(mid)
+            if start >= hi:
+                hi = mid
+                continue
+
+            record, next_start = self.__read_record(start)
+            path = os.fsencode(parse_record(record).path)
+            if path < key:
+                lo = next_start
+            else:
+                hi = start
+
+        return lo
+
+
+def diff_indexes(
+    old: Iterable[FileIndexEntry], new: Iterable[FileIndexEntry]
+) -> Iterator[Tuple[str, Optional[FileIndexEntry], Optional[FileIndexEntry]]]:
+    """
+    Merge-join two sorted indexes and yield (change, old entry, new entry) tuples,
+    where change is one of "+" (added), "-" (removed) or "M" (modified).
+    """
+    old_iter, new_iter = iter(old), iter(new)
+    old_entry, new_entry = next(old_iter, None), next(new_iter, None)
+    while old_entry is not None or new_entry is not None:
+        old_key = os.fsencode(old_entry.path) if old_entry is not None else None
+        new_key = os.fsencode(new_entry.path) if new_entry is not None else None
+
+        if new_key is None or (old_key is not None and old_key < new_key):
+            yield "-", old_entry, None
+            old_entry = next(old_iter, None)
+        elif old_key is None or new_key < old_key:
+            yield "+", None, new_entry
+            new_entry = next(new_iter, None)
+        else:
+            if __is_modified(old_entry, new_entry):
+                yield "M", old_entry, new_entry
+            old_entry, new_entry = next(old_iter, None), next(new_iter, None)
+
+
+def __is_modified(old: FileIndexEntry, new: FileIndexEntry) -> bool:
+    # unchanged files are hard linked between snapshots and share inode
+    if old.inode == new.inode:
+        return False
+    if old.type != new.type or old.target != new.target:
+        return True
+    if old.hash and new.hash:
+        return old.hash != new.hash
+    return old.size != new.size or old.mtime != new.mtime
+
+
+def find_versions(mirror_dir: str, path: str) -> Tuple[Tuple[str, str, FileIndexEntry]]:
+    """
+    Look up {path} in all mirrored indexes and return distinct versions
+    as (first backup name, last backup name, entry) tuples.
+    """
+    versions = []
+    for backup_name in get_mirrored_backup_names(mirror_dir):
+        with FileIndex(get_mirror_path(mirror_dir, backup_name)) as index:
+            entry = index.lookup(path)
+
+        if entry is None:
+            continue
+
+        if versions and not __is_modified(versions[-1][2], entry):
+            versions[-1] = (versions[-1][0], backup_name, entry)
+        else:
+            versions.append((backup_name, backup_name, entry))
+
+    return tuple(versions)
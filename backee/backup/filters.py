@@ -0,0 +1,268 @@
+import os
+import stat
+import uuid
+import dataclasses
+import logging
+import tempfile
+import threading
+
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from backee.model.items import BackupItem, FilesBackupItem
+from backee.backup import packing, sqlite_snapshot
+from backee.backup.source import (
+    WILDCARD_CHECK,
+    escape_wildcards,
+    expand_paths,
+    walk_sources,
+)
+
+
+log = logging.getLogger(__name__)
+
+__filters: Dict[Tuple[Tuple[str], Tuple[str], str, Optional[str]], "ItemFilters"] = {}
+__filters_lock = threading.Lock()
+
+
+class ItemFilters(object):
+    """
+    Includes and excludes of a files item compiled into null separated
+    rsync files-from and filter files.
+    """
+
+    def __init__(self, item: FilesBackupItem):
+        self.__item = item
+        self.__large_files = {}
+        self.__packs = None
+        self.__snapshots = None
+        self.__sources = None
+        self.__scanned_from = None
+        self.__lock = threading.RLock()
+        scans = {}
+        self.includes = expand_paths(item.includes, scans, "file backup item")
+        self.excludes = tuple(
+            x
+            for x in item.excludes
+            if WILDCARD_CHECK.search(x) is not None
+            or expand_paths((x,), scans, "excludes item")
+        )
+        # only matched files are checked, databases inside included directories
+        # would need every file to be read
+        self.databases = (
+            tuple(x for x in self.includes if sqlite_snapshot.is_database(x))
+            if item.sqlite_snapshots
+            else ()
+        )
+
+        self.__temp_dir = tempfile.TemporaryDirectory(prefix="backee-filters-")
+        self.files_from = os.path.join(self.__temp_dir.name, "files-from")
+        self.filter = os.path.join(self.__temp_dir.name, "filter")
+        with open(self.files_from, "wb") as f:
+            f.writelines(os.fsencode(x) + b"\0" for x in self.includes)
+        with open(self.filter, "wb") as f:
+            f.writelines(b"- " + os.fsencode(x) + b"\0" for x in self.excludes)
+
+    def get_rsync_options(self) -> List[str]:
+        """
+        Return options replacing includes and excludes on the command line,
+        sources are relative to `/`, which has to be the source argument.
+        Items bound to a run send entries of the shared scan, so rsync does
+        not walk sources again for every server.
+        """
+        if self.__item.run is None:
+            return [
+                "--recursive",
+                "--from0",
+                f"--files-from={self.files_from}",
+                f"--filter=merge {self.filter}",
+            ]
+        with self.__lock:
+            if self.__scanned_from is None:
+                self.__scanned_from = os.path.join(self.__temp_dir.name, "scanned")
+                with open(self.__scanned_from, "wb") as f:
+                    f.writelines(os.fsencode(x) + b"\0" for x, _ in self.get_sources())
+        return [
+            "--from0",
+            f"--files-from={self.__scanned_from}",
+            f"--filter=merge {self.filter}",
+        ]
+
+    def get_sources(self) -> Tuple[Tuple[str, os.stat_result]]:
+        """
+        Walk sources once per run, so transfers to every server and the
+        scans below share one pass over the source disks. Sources of items
+        not bound to a run are walked again on every call.
+
+        Returns:
+          (path, stat) of every source entry in the order of `walk_sources`.
+        """
+        if self.__item.run is None:
+            return tuple(walk_sources(self.__item, self.includes))
+        with self.__lock:
+            if self.__sources is None:
+                self.__sources = tuple(walk_sources(self.__item, self.includes))
+                log.debug("%i source entries scanned", len(self.__sources))
+            return self.__sources
+
+    def iter_sources(self) -> Iterator[Tuple[str, os.stat_result]]:
+        """
+        Iterate over the scan of the run like `get_sources`, sources of items
+        not bound to a run are walked lazily, so callers may stop early.
+        """
+        if self.__item.run is None:
+            return walk_sources(self.__item, self.includes)
+        return iter(self.get_sources())
+
+    def get_large_files(self, min_size: int) -> Optional[Tuple[str, str]]:
+        """
+        Scan sources once per {min_size} for regular files of at least {min_size} bytes.
+
+        Returns:
+          (files-from file listing large files, filter file excluding them)
+          or None if there are no large files. Snapshotted databases are not listed.
+        """
+        snapshots = self.get_sqlite_snapshots()
+        snapshotted = set() if snapshots is None else set(snapshots[3])
+        with self.__lock:
+            if min_size not in self.__large_files:
+                self.__large_files[min_size] = self.__write_large_files(
+                    min_size, snapshotted
+                )
+            return self.__large_files[min_size]
+
+    def __write_large_files(
+        self, min_size: int, skipped: set
+    ) -> Optional[Tuple[str, str]]:
+        large_files = [
+            path
+            for path, st in self.get_sources()
+            if stat.S_ISREG(st.st_mode)
+            and st.st_size >= min_size
+            and path not in skipped
+        ]
+        log.debug("%i files of at least %i bytes", len(large_files), min_size)
+        if not large_files:
+            return None
+
+        files_from = os.path.join(self.__temp_dir.name, f"large-files-{min_size}")
+        large_filter = os.path.join(self.__temp_dir.name, f"large-filter-{min_size}")
+        with open(files_from, "wb") as f:
+            f.writelines(os.fsencode(x) + b"\0" for x in large_files)
+        with open(large_filter, "wb") as f:
+            f.writelines(
+                b"- " + os.fsencode(escape_pattern(x)) + b"\0" for x in large_files
+            )
+        return files_from, large_filter
+
+    def get_packs(self) -> Optional[Tuple[str, str, str]]:
+        """
+        Pack small-file directories once per run, see `packing.pack`.
+        """
+        with self.__lock:
+            if self.__packs is None:
+                self.__packs = (packing.pack(self.__item),)
+            return self.__packs[0]
+
+    def get_sqlite_snapshots(self) -> Optional[Tuple[str, str, str, Tuple[str]]]:
+        """
+        Take consistent copies of matched SQLite databases once per run.
+
+        Returns:
+          (staging tree with the copies, null separated list of copies relative
+          to the tree, filter file excluding the databases and their side files,
+          snapshotted databases) or None if there is nothing to snapshot.
+        """
+        with self.__lock:
+            if self.__snapshots is None:
+                self.__snapshots = (self.__write_sqlite_snapshots(),)
+            return self.__snapshots[0]
+
+    def __write_sqlite_snapshots(
+        self,
+    ) -> Optional[Tuple[str, str, str, Tuple[str]]]:
+        if not self.databases:
+            return None
+        tree = os.path.join(sqlite_snapshot.get_staging_dir(self.__item), "tree")
+        databases = sqlite_snapshot.snapshot_databases(self.databases, tree)
+        if not databases:
+            return None
+
+        files_from = os.path.join(self.__temp_dir.name, "sqlite-files")
+        sqlite_filter = os.path.join(self.__temp_dir.name, "sqlite-filter")
+        with open(files_from, "wb") as f:
+            f.writelines(os.fsencode(x.lstrip("/")) + b"\0" for x in databases)
+        with open(sqlite_filter, "wb") as f:
+            f.writelines(
+                b"- " + os.fsencode(escape_pattern(x + suffix)) + b"\0"
+                for x in databases
+                for suffix in ("",) + sqlite_snapshot.SIDE_FILE_SUFFIXES
+            )
+        return tree, files_from, sqlite_filter, databases
+
+    def cleanup(self) -> None:
+        self.__temp_dir.cleanup()
+
+
+def get_filters(item: FilesBackupItem) -> ItemFilters:
+    """
+    Return filters of {item}, which are compiled and validated once per run.
+    """
+    key = (
+        tuple(item.includes),
+        tuple(item.excludes),
+        repr((item.packing, item.sqlite_snapshots)),
+        item.run,
+    )
+    with __filters_lock:
+        if key not in __filters:
+            __filters[key] = ItemFilters(item)
+        return __filters[key]
+
+
+@contextmanager
+def session() -> Iterator[str]:
+    """
+    Start a run and return its name, filters of items bound to the run
+    are removed when the context exits. Overlapping runs never share them.
+    """
+    run = uuid.uuid4().hex
+    try:
+        yield run
+    finally:
+        with __filters_lock:
+            for key in [x for x in __filters if x[-1] == run]:
+                __filters.pop(key).cleanup()
+
+
+def bind(items: Tuple[BackupItem], run: str) -> Tuple[BackupItem]:
+    """
+    Return {items} with files items bound to {run}, unless they are bound
+    to a run already, e.g. to the run of a daemon schedule calling backup.
+    """
+    return tuple(
+        dataclasses.replace(x, run=run)
+        if isinstance(x, FilesBackupItem) and x.run is None
+        else x
+        for x in items
+    )
+
+
+def clear_filters() -> None:
+    """
+    Remove all compiled filters, so the next run sees changes on disk.
+    """
+    with __filters_lock:
+        for filters in __filters.values():
+            filters.cleanup()
+        __filters.clear()
+
+
+def escape_pattern(path: str) -> str:
+    """
+    Escape {path} to be matched literally by an rsync filter rule. Backslashes
+    only escape in patterns with wildcards, others are compared as they are.
+    """
+    if WILDCARD_CHECK.search(path) is None:
+        return path
+    return escape_wildcards(path)
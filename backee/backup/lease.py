@@ -0,0 +1,185 @@
+import os
+import time
+import uuid
+import socket
+import logging
+import datetime
+import threading
+
+from typing import Callable, List, Optional, Tuple
+
+from backee.model.thread_filter import get_worker_name
+from backee.backup.transmitter import Transmitter
+
+
+log = logging.getLogger(__name__)
+
+# lock file in the item directory on the server
+LOCK_NAME = ".backee-lock"
+# seconds a lease is valid without being renewed, crashed runs block no longer
+LEASE_TTL = 10 * 60
+# attempts to take over an expired lease, which another run may take first
+ACQUIRE_ATTEMPTS = 3
+
+
+def get_owner() -> str:
+    """
+    Return name identifying this process on any machine.
+    """
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class Lease(object):
+    """
+    Lock of an item directory on the server, which is renewed while held
+    and expires otherwise. Runs from other processes or machines writing
+    to the same directory fail instead of waiting, and a run that lost
+    its lease stops writing.
+    """
+
+    def __init__(
+        self,
+        transmitter: Transmitter,
+        item_root: str,
+        ttl: int = LEASE_TTL,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.__transmitter = transmitter
+        self.__item_root = item_root
+        self.__path = os.path.join(item_root, LOCK_NAME)
+        self.__ttl = ttl
+        self.__clock = clock
+        self.__owner = get_owner()
+        self.__content: Optional[str] = None
+        self.__released = threading.Event()
+        self.__renewal: Optional[threading.Thread] = None
+        self.__lost = False
+        self.__callbacks: List[Callable[[], None]] = []
+        self.__callbacks_lock = threading.Lock()
+
+    def __enter__(self) -> "Lease":
+        self.acquire()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.release()
+
+    def acquire(self) -> None:
+        """
+        Take the lease, an expired one of another owner is taken over.
+
+        Raises:
+          OSError: if another owner holds the lease.
+        """
+        for _ in range(ACQUIRE_ATTEMPTS):
+            content = self.__get_content()
+            # reading back protects against servers without atomic creation
+            if self.__transmitter.create_lock(self.__path, content) and (
+                self.__transmitter.read_lock(self.__path) == content
+            ):
+                self.__content = content
+                self.__lost = False
+                self.__released.clear()
+                self.__renewal = threading.Thread(
+                    target=self.__renew, name=get_worker_name("lease"), daemon=True
+                )
+                self.__renewal.start()
+                log.debug("lease of %s acquired", self.__item_root)
+                return
+
+            current = self.__transmitter.read_lock(self.__path)
+            if current is None:
+                continue
+            owner, expires = parse_lock(current)
+            if expires > self.__clock():
+                raise OSError(
+                    f"{self.__item_root} is locked by {owner} until "
+                    f"{datetime.datetime.fromtimestamp(expires).isoformat()}"
+                )
+            log.warning("lease of %s held by %s expired", self.__item_root, owner)
+            # another run taking it over at once may have replaced it already
+            self.__transmitter.remove_lock(self.__path, current)
+
+        raise OSError(f"cannot lock {self.__item_root}")
+
+    def release(self) -> None:
+        """
+        Stop renewing the lease and remove it, unless another owner took it over.
+        """
+        if self.__content is None:
+            return
+        self.__released.set()
+        self.__renewal.join()
+        if self.__transmitter.remove_lock(self.__path, self.__content):
+            log.debug("lease of %s released", self.__item_root)
+        self.__content = None
+
+    def check(self) -> None:
+        """
+        Raises:
+          OSError: if the lease was lost, so the directory must not be written.
+        """
+        if self.__lost:
+            raise OSError(f"lease of {self.__item_root} was lost")
+
+    def on_lost(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """
+        Call {callback} when the lease is lost, at once if it is lost already.
+
+        Returns:
+          function unregistering {callback}.
+        """
+        with self.__callbacks_lock:
+            if not self.__lost:
+                self.__callbacks.append(callback)
+                return lambda: self.__remove_callback(callback)
+        callback()
+        return lambda: None
+
+    def __remove_callback(self, callback: Callable[[], None]) -> None:
+        with self.__callbacks_lock:
+            if callback in self.__callbacks:
+                self.__callbacks.remove(callback)
+
+    def __renew(self) -> None:
+        while not self.__released.wait(self.__ttl / 3):
+            content = self.__get_content()
+            try:
+                # replaced only if it is still ours, so a lease taken over is kept
+                renewed = self.__transmitter.renew_lock(
+                    self.__path, self.__content, content
+                )
+            except OSError:
+                log.warning("cannot renew lease of %s", self.__item_root, exc_info=True)
+                _, expires = parse_lock(self.__content)
+                if expires > self.__clock():
+                    continue
+                renewed = False
+
+            if not renewed:
+                log.error("lease of %s was lost", self.__item_root)
+                self.__lose()
+                return
+            self.__content = content
+
+    def __lose(self) -> None:
+        with self.__callbacks_lock:
+            self.__lost = True
+            callbacks, self.__callbacks = self.__callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def __get_content(self) -> str:
+        return f"{self.__owner} {int(self.__clock() + self.__ttl)}"
+
+
+def parse_lock(content: str) -> Tuple[str, float]:
+    """
+    Return owner and expiry time of lock {content}. Partially written locks
+    have expired, so they can be taken over.
+    """
+    owner, _, expires = content.strip().rpartition(" ")
+    try:
+        return owner, float(expires)
+    except ValueError:
+        return content.strip(), 0
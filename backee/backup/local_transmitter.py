@@ -0,0 +1,460 @@
+import os
+import gzip
+import stat
+import errno
+import shutil
+import hashlib
+import logging
+import uuid
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Optional, Tuple
+
+from backee.model.servers import LocalBackupServer
+from backee.model.items import FilesBackupItem
+from backee.model.file_index import FileIndexEntry
+from backee.model.thread_filter import get_worker_name
+from backee.backup.transmitter import Transmitter
+from backee.backup import file_index, filters
+from backee.backup.source import walk_sources
+
+
+log = logging.getLogger(__name__)
+
+
+class LocalTransmitter(Transmitter):
+    """
+    Transmitter for local disks and network mounts.
+
+    Snapshots have the same layout as the ones created by rsync over SSH,
+    but files are copied in-kernel with `copy_file_range`, and files unchanged
+    since the previous snapshot are hard linked to it.
+    """
+
+    def __init__(self, server: LocalBackupServer):
+        self.__server = server
+        self.__can_chown = os.geteuid() == 0
+
+    def is_remote_dir_exist(self, path: str) -> bool:
+        log.debug("check existence of %s", path)
+        return os.path.isdir(path)
+
+    def create_dir(self, path: str) -> None:
+        log.debug("create directory: %s", path)
+        os.makedirs(path, exist_ok=True)
+
+    def remove_remote_dir_if_exists(self, path: str) -> None:
+        if self.is_remote_dir_exist(path):
+            self.remove_remote_dirs((path,))
+
+    def remove_remote_dirs(self, dirs_paths: Tuple[str]) -> None:
+        log.debug("remove directories %s", dirs_paths)
+        for path in dirs_paths:
+            if os.path.isdir(path) and not os.path.islink(path):
+                shutil.rmtree(path)
+            elif os.path.lexists(path):
+                os.remove(path)
+
+    def check_temp_dirs(self, backup_dir_path: str, temp_dir_suffix: str) -> None:
+        log.debug("checking for temp dirs in %s", backup_dir_path)
+
+        if any(x.endswith(temp_dir_suffix) for x in self.__list_dirs(backup_dir_path)):
+            log.error("some temp dirs are in %s", backup_dir_path)
+
+    def check_links_dir(
+        self,
+        server_root_dir_path: str,
+        links_dir_path: str,
+        temp_dir_suffix: str,
+    ) -> None:
+        """
+        Check if links directory exists and recreate if not.
+        Last backup will be used to link to.
+        """
+        log.debug("check links directory")
+
+        if self.is_remote_dir_exist(links_dir_path):
+            log.debug("links directory exists")
+            return
+
+        log.debug("links directory not found, create a new one")
+
+        backups = [
+            x
+            for x in self.__list_dirs(server_root_dir_path)
+            if not x.endswith(temp_dir_suffix)
+        ]
+        if not backups:
+            log.debug("backup dir for re-linking is not found")
+            return
+
+        log.debug("found last backup dir: %s", backups[-1])
+        self.recreate_links_dir(backups[-1], links_dir_path)
+
+    def recreate_links_dir(self, last_backup_dir: str, links_dir_path: str) -> None:
+        log.debug("re-link %s to %s", last_backup_dir, links_dir_path)
+        if os.path.lexists(links_dir_path):
+            os.remove(links_dir_path)
+        os.symlink(last_backup_dir.rstrip("/"), links_dir_path)
+
+    def rename_dir(self, prev_name: str, new_name: str) -> None:
+        log.debug("rename %s to %s", prev_name, new_name)
+        os.rename(prev_name.rstrip("/"), new_name.rstrip("/"))
+
+    def get_backup_names_sorted(self, server_root_dir_path: str) -> Tuple[str]:
+        return self.__list_dirs(server_root_dir_path)
+
+    def get_disk_space_available(self, remote_path: str) -> int:
+        """
+        Return available disk space in bytes.
+        """
+        return shutil.disk_usage(remote_path).free
+
+    def get_transfer_file_size(
+        self, links_dir_path: str, item: FilesBackupItem, remote_path: str
+    ) -> int:
+        """
+        Get size of items in bytes that need to be copied.
+        """
+        return sum(
+            st.st_size
+            for path, st in filters.get_filters(item).get_sources()
+            if stat.S_ISREG(st.st_mode)
+            and self.__find_unchanged(links_dir_path, path, st) is None
+        )
+
+    def transmit(
+        self, links_dir_path: str, item: FilesBackupItem, remote_path: str
+    ) -> None:
+        """
+        Transmit {item} to {remote_path}
+        """
+        os.makedirs(remote_path, exist_ok=True)
+
+        dirs = []
+        with ThreadPoolExecutor(
+            max_workers=self.__server.workers,
+            thread_name_prefix=get_worker_name("local_copy"),
+        ) as executor:
+            futures = []
+            for path, st in filters.get_filters(item).get_sources():
+                target = self.__get_target_path(remote_path, path)
+                if stat.S_ISDIR(st.st_mode):
+                    os.makedirs(target, exist_ok=True)
+                    dirs.append((target, st))
+                elif stat.S_ISLNK(st.st_mode):
+                    os.symlink(os.readlink(path), target)
+                    self.__copy_metadata(target, st)
+                elif stat.S_ISREG(st.st_mode):
+                    unchanged = self.__find_unchanged(links_dir_path, path, st)
+                    futures.append(
+                        executor.submit(
+                            self.__transmit_file, path, st, target, unchanged
+                        )
+                    )
+                else:
+                    log.debug("skipping special file %s", path)
+
+            for future in futures:
+                future.result()
+
+        # contents change directory mtime, so it is set last and deepest first
+        for target, st in reversed(dirs):
+            self.__copy_metadata(target, st)
+
+    def verify_backup(self, item: FilesBackupItem, remote_path: str) -> bool:
+        """
+        Verify if any items are different from the ones in backup
+        """
+        log.debug("verifying if any files are different in the backup")
+
+        for path, st in walk_sources(item):
+            if stat.S_ISDIR(st.st_mode):
+                continue
+            if self.__find_unchanged(remote_path, path, st) is None:
+                log.debug("%s is different", path)
+                return False
+
+        return True
+
+    def create_index(self, backup_dir_path: str, index_path: str) -> None:
+        """
+        Create sorted and compressed index of all files in the backup
+        and store it as {index_path} beside the backup directory.
+        """
+        log.debug("create index %s", index_path)
+
+        temp_index_path = index_path + ".tmp"
+        with gzip.open(temp_index_path, mode="wb") as f:
+            file_index.write_index(self.__get_index_entries(backup_dir_path), f)
+        os.replace(temp_index_path, index_path)
+
+    def read_remote_file(
+        self, path: str, chunk_size: int = 64 * 1024
+    ) -> Iterator[bytes]:
+        """
+        Read file in binary chunks.
+        """
+        with open(path, mode="rb") as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    def create_lock(self, path: str, content: str) -> bool:
+        """
+        Create lock file {path} with {content} unless it exists.
+
+        Returns:
+          bool: True if the lock was created.
+        """
+        # link fails if the lock exists and the lock is never seen half written
+        temp_path = f"{path}.{uuid.uuid4().hex}"
+        with open(temp_path, mode="w", encoding="utf-8") as f:
+            f.write(content)
+        try:
+            os.link(temp_path, path)
+            return True
+        except FileExistsError:
+            return False
+        finally:
+            os.remove(temp_path)
+
+    def read_lock(self, path: str) -> Optional[str]:
+        """
+        Return content of lock file {path} or None if it does not exist.
+        """
+        try:
+            with open(path, mode="r", encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def renew_lock(self, path: str, previous: str, content: str) -> bool:
+        """
+        Replace lock file {path} with {content} if it still has {previous}.
+        The new lock is written aside and linked in only after the old one
+        was removed by `remove_lock`, so a lock of another run is never replaced.
+
+        Returns:
+          bool: True if the lock was renewed.
+        """
+        temp_path = f"{path}.{uuid.uuid4().hex}"
+        with open(temp_path, mode="w", encoding="utf-8") as f:
+            f.write(content)
+        try:
+            if not self.remove_lock(path, previous):
+                return False
+            try:
+                os.link(temp_path, path)
+            except FileExistsError:
+                # another run took the lock while it was missing
+                return False
+            return True
+        finally:
+            os.remove(temp_path)
+
+    def remove_lock(self, path: str, content: str) -> bool:
+        """
+        Remove lock file {path} if it still has {content}. The lock is moved
+        aside first, so a lock created by another run meanwhile is kept.
+
+        Returns:
+          bool: True if the lock was removed.
+        """
+        temp_path = f"{path}.{uuid.uuid4().hex}"
+        try:
+            os.rename(path, temp_path)
+        except FileNotFoundError:
+            return False
+        try:
+            with open(temp_path, mode="r", encoding="utf-8") as f:
+                if f.read() == content:
+                    return True
+            # lock of another owner is put back, unless a new one exists already
+            try:
+                os.link(temp_path, path)
+            except FileExistsError:
+                pass
+            return False
+        finally:
+            os.remove(temp_path)
+
+    def restore(self, remote_path: str, files_from: str, target_dir: str) -> int:
+        """
+        Restore files listed in {files_from} from {remote_path} to {target_dir}.
+
+        Returns:
+          int: number of bytes copied.
+        """
+        with open(files_from, mode="rb") as f:
+            paths = [os.fsdecode(x) for x in f.read().split(b"\0") if x]
+
+        copied = 0
+        linked = {}
+        for path in paths:
+            source = os.path.join(remote_path, path)
+            target = os.path.join(target_dir, path)
+            st = os.lstat(source)
+            if stat.S_ISDIR(st.st_mode):
+                # metadata of directories is restored after their contents
+                os.makedirs(target, exist_ok=True)
+                continue
+            if os.path.lexists(target):
+                target_st = os.lstat(target)
+                if (
+                    target_st.st_size == st.st_size
+                    and target_st.st_mtime_ns == st.st_mtime_ns
+                ):
+                    continue
+                os.remove(target)
+
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if stat.S_ISLNK(st.st_mode):
+                os.symlink(os.readlink(source), target)
+                self.__copy_metadata(target, st)
+                continue
+            if st.st_nlink > 1 and st.st_ino in linked:
+                os.link(linked[st.st_ino], target)
+                continue
+
+            self.__copy_file(source, st, target)
+            linked[st.st_ino] = target
+            copied += st.st_size
+
+        return copied
+
+    def __transmit_file(
+        self, path: str, st: os.stat_result, target: str, unchanged: Optional[str]
+    ) -> None:
+        if unchanged is not None:
+            try:
+                os.link(unchanged, target)
+                return
+            except OSError as e:
+                # too many links to the file in previous snapshots
+                if e.errno != errno.EMLINK:
+                    raise
+
+        try:
+            self.__copy_file(path, st, target)
+        except FileNotFoundError:
+            log.warning(
+                "source item vanished before it was copied over: %s",
+                path,
+            )
+
+    def __copy_file(self, path: str, st: os.stat_result, target: str) -> None:
+        with open(path, mode="rb") as src, open(target, mode="wb") as dst:
+            self.__copy_file_data(src.fileno(), dst.fileno())
+        self.__copy_metadata(target, st)
+
+    def __copy_file_data(self, src_fd: int, dst_fd: int) -> None:
+        """
+        Copy file contents in kernel, falling back to userspace copy
+        if file systems do not support it.
+        """
+        copied = 0
+        if hasattr(os, "copy_file_range"):
+            try:
+                while True:
+                    count = os.copy_file_range(src_fd, dst_fd, 1 << 30)
+                    if count == 0:
+                        return
+                    copied += count
+            except OSError as e:
+                if copied or e.errno not in (
+                    errno.EXDEV,
+                    errno.ENOSYS,
+                    errno.EINVAL,
+                    errno.EOPNOTSUPP,
+                ):
+                    raise
+
+        while True:
+            chunk = os.read(src_fd, 1 << 20)
+            if not chunk:
+                return
+            os.write(dst_fd, chunk)
+
+    def __copy_metadata(self, target: str, st: os.stat_result) -> None:
+        is_link = stat.S_ISLNK(st.st_mode)
+        if self.__can_chown:
+            os.chown(target, st.st_uid, st.st_gid, follow_symlinks=False)
+        if not is_link:
+            os.chmod(target, stat.S_IMODE(st.st_mode))
+        if not is_link or os.utime in os.supports_follow_symlinks:
+            os.utime(
+                target,
+                ns=(st.st_atime_ns, st.st_mtime_ns),
+                follow_symlinks=False,
+            )
+
+    def __find_unchanged(
+        self, links_dir_path: str, path: str, st: os.stat_result
+    ) -> Optional[str]:
+        """
+        Return path of the same file in {links_dir_path} if it has not changed.
+        """
+        previous = self.__get_target_path(links_dir_path, path)
+        try:
+            previous_st = os.lstat(previous)
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+
+        same = (
+            previous_st.st_size == st.st_size
+            and previous_st.st_mtime_ns == st.st_mtime_ns
+            and previous_st.st_mode == st.st_mode
+            and (
+                not self.__can_chown
+                or (previous_st.st_uid, previous_st.st_gid) == (st.st_uid, st.st_gid)
+            )
+        )
+        return previous if same else None
+
+    def __get_target_path(self, remote_path: str, path: str) -> str:
+        # keep full source path inside the backup like `rsync --relative` does
+        return os.path.join(remote_path, path.lstrip("/"))
+
+    def __list_dirs(self, path: str) -> Tuple[str]:
+        with os.scandir(path) as it:
+            return tuple(sorted(x.path for x in it if x.is_dir(follow_symlinks=False)))
+
+    def __get_index_entries(self, backup_dir_path: str) -> Iterator[FileIndexEntry]:
+        for root, dirs, files in os.walk(backup_dir_path):
+            # symlinks to directories are listed with directories
+            for name in dirs + files:
+                path = os.path.join(root, name)
+                st = os.lstat(path)
+                is_file = stat.S_ISREG(st.st_mode)
+                if stat.S_ISDIR(st.st_mode):
+                    entry_type = "d"
+                elif stat.S_ISLNK(st.st_mode):
+                    entry_type = "l"
+                elif is_file:
+                    entry_type = "f"
+                else:
+                    continue
+                yield FileIndexEntry(
+                    path=os.path.relpath(path, backup_dir_path),
+                    size=st.st_size if is_file else 0,
+                    mtime=st.st_mtime,
+                    inode=st.st_ino,
+                    hash=(
+                        self.__hash_file(path)
+                        if is_file and self.__server.index_hashes
+                        else None
+                    ),
+                    type=entry_type,
+                    mode=stat.S_IMODE(st.st_mode),
+                    target=os.readlink(path) if entry_type == "l" else None,
+                )
+
+    def __hash_file(self, path: str) -> str:
+        sha256 = hashlib.sha256()
+        with open(path, mode="rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                sha256.update(chunk)
+        return sha256.hexdigest()
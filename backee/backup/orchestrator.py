@@ -0,0 +1,133 @@
+import time
+import logging
+import tempfile
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
+
+from backee.model.config import Config
+from backee.model.config_result import ConfigResult
+from backee.model.servers import BackupServer, SshBackupServer
+from backee.model.thread_filter import ThreadFilter
+from backee.logger.loggers import setup_config_loggers
+from backee.backup import backup, connections, database_dump, filters
+from backee.backup.transmitter import Transmitter
+
+
+log = logging.getLogger(__name__)
+
+# seconds between keepalives of pooled ssh connections
+KEEPALIVE_INTERVAL = 30
+
+
+class Orchestrator(object):
+    """
+    Back up several configs in one process. Configs run concurrently up to
+    {jobs} at a time, at most {per_server} of them use the same host at once
+    and ssh connections are shared by configs using the same host.
+    """
+
+    def __init__(
+        self,
+        jobs: int = 4,
+        per_server: int = 2,
+        run_backup: Callable[..., None] = backup.backup,
+        lock: Optional[Callable[[str], None]] = None,
+    ):
+        if jobs <= 0 or per_server <= 0:
+            raise ValueError("concurrency limits must be positive")
+        self.__jobs = jobs
+        self.__per_server = per_server
+        self.__run_backup = run_backup
+        self.__lock_config = lock
+        self.__lock = threading.Lock()
+        self.__host_slots: Dict[str, threading.Semaphore] = {}
+
+    def run(self, configs: Tuple[Config]) -> Tuple[ConfigResult]:
+        """
+        Back up {configs} and return their results in the same order.
+        """
+        names = [x.name for x in configs]
+        for name in names:
+            if names.count(name) > 1:
+                raise ValueError(f"config names must be unique: '{name}'")
+
+        # config loggers only get messages of their config
+        for config in configs:
+            for handler in config.loggers:
+                handler.addFilter(ThreadFilter(config.name))
+            setup_config_loggers(config.loggers)
+
+        pool = connections.ConnectionPool(KEEPALIVE_INTERVAL)
+        with tempfile.TemporaryDirectory(prefix="backee-ssh-") as control_dir:
+
+            def get_transmitter(server: BackupServer) -> Transmitter:
+                ssh_client = None
+                if isinstance(server, SshBackupServer):
+                    ssh_client = pool.get_client(server)
+                return backup.create_transmitter(
+                    server,
+                    keepalive=KEEPALIVE_INTERVAL,
+                    control_dir=control_dir,
+                    ssh_client=ssh_client,
+                )
+
+            try:
+                with ThreadPoolExecutor(max_workers=self.__jobs) as executor:
+                    results = tuple(
+                        executor.map(lambda x: self.__run(x, get_transmitter), configs)
+                    )
+            finally:
+                pool.close()
+
+        for result in results:
+            if result.error is None:
+                log.info("%s: backed up in %.0fs", result.name, result.elapsed)
+            else:
+                log.error(
+                    "%s: failed after %.0fs: %s",
+                    result.name,
+                    result.elapsed,
+                    result.error,
+                )
+        return results
+
+    def __run(
+        self, config: Config, get_transmitter: Callable[[BackupServer], Transmitter]
+    ) -> ConfigResult:
+        thread = threading.current_thread()
+        thread_name, thread.name = thread.name, config.name
+        started = time.monotonic()
+        try:
+            if self.__lock_config is not None:
+                self.__lock_config(config.name)
+            # databases are dumped and sources scanned once for all servers
+            with filters.session() as run:
+                items = filters.bind(
+                    database_dump.stage(config.backup_items or ()), run
+                )
+                # hosts used by other configs are waited for, while others are used
+                self.__run_backup(
+                    config.name,
+                    items,
+                    config.backup_servers,
+                    get_transmitter=get_transmitter,
+                    workers=config.workers,
+                    items_per_server=config.items_per_server,
+                    window_end=config.window_end,
+                    get_server_lock=self.__get_host_slot,
+                )
+        except Exception as e:
+            log.exception("%s backup failed", config.name)
+            return ConfigResult(config.name, time.monotonic() - started, str(e))
+        finally:
+            thread.name = thread_name
+        return ConfigResult(config.name, time.monotonic() - started)
+
+    def __get_host_slot(self, server: BackupServer) -> threading.Semaphore:
+        host = connections.get_host(server)
+        with self.__lock:
+            if host not in self.__host_slots:
+                self.__host_slots[host] = threading.Semaphore(self.__per_server)
+            return self.__host_slots[host]
@@ -0,0 +1,199 @@
+import os
+import stat
+import time
+import shutil
+import struct
+import hashlib
+import logging
+import zipfile
+import dataclasses
+
+from typing import Iterable, List, Optional, Tuple
+
+from backee.model.items import FilesBackupItem
+from backee.backup.source import escape_wildcards, expand_paths, walk_sources
+from backee.backup import cache
+
+
+log = logging.getLogger(__name__)
+
+# archive replacing files of a packed directory
+PACK_NAME = ".backee-pack.zip"
+MIN_PACKED_FILES = 2
+# zip extended timestamp extra field with modification time only
+EXTENDED_TIMESTAMP = 0x5455
+# zip cannot store earlier dates
+MIN_ZIP_TIME = 315532800
+
+
+def get_staging_dir(item: FilesBackupItem) -> str:
+    """
+    Return local directory, where archives of {item} are kept between runs,
+    so unchanged archives stay the same and are hard linked on the server.
+    """
+    key = repr((item.includes, item.excludes, item.packing)).encode()
+    return cache.get_cache_dir("packs", hashlib.sha256(key).hexdigest()[:16])
+
+
+def pack(item: FilesBackupItem) -> Optional[Tuple[str, str, str]]:
+    """
+    Pack every directory in packing paths of {item}, whose files are all
+    smaller than the limit, into a single archive mirrored in the staging directory.
+
+    Returns:
+      (staging tree to send the archives from, null separated list of archives
+      relative to the tree, rsync filter excluding packed files)
+      or None if nothing was packed.
+    """
+    policy = item.packing
+    includes = expand_paths(item.includes, {}, "file backup item")
+    paths = []
+    for path in policy.paths:
+        path = os.path.abspath(path)
+        if any(path == x or path.startswith(x.rstrip("/") + "/") for x in includes):
+            paths.append(path)
+        else:
+            log.warning("packing path is not backed up: %s", path)
+    if not paths:
+        return None
+
+    staging_dir = get_staging_dir(item)
+    tree = os.path.join(staging_dir, "tree")
+    packed = []
+    # directories being walked with their small files, None if not packable
+    stack: List[Tuple[str, Optional[list]]] = []
+
+    def finish(directory: str, files: Optional[list]) -> None:
+        if files is not None and len(files) >= MIN_PACKED_FILES:
+            archive = os.path.join(tree + directory, PACK_NAME)
+            __write_archive(directory, files, archive)
+            packed.append(directory)
+
+    for path, st in walk_sources(dataclasses.replace(item, includes=tuple(paths))):
+        while stack and not path.startswith(stack[-1][0].rstrip("/") + "/"):
+            finish(*stack.pop())
+
+        if stat.S_ISDIR(st.st_mode):
+            # parents of packing paths are sent as they are
+            packable = any(path == x or path.startswith(x + "/") for x in paths)
+            stack.append((path, [] if packable else None))
+        elif stack and stack[-1][1] is not None:
+            if stat.S_ISREG(st.st_mode) and st.st_size < policy.max_file_size:
+                stack[-1][1].append((path, st))
+            else:
+                stack[-1] = (stack[-1][0], None)
+    while stack:
+        finish(*stack.pop())
+
+    __remove_stale(tree, set(packed))
+    log.info("%i directories packed", len(packed))
+    if not packed:
+        return None
+
+    archives = os.path.join(staging_dir, "archives")
+    pack_filter = os.path.join(staging_dir, "filter")
+    with open(archives, "wb") as f:
+        f.writelines(
+            os.fsencode(os.path.join(x.lstrip("/"), PACK_NAME)) + b"\0" for x in packed
+        )
+    with open(pack_filter, "wb") as f:
+        for directory in packed:
+            pattern = os.fsencode(escape_wildcards(directory))
+            # subdirectories are sent as they are, only files are packed
+            f.write(b"+ " + pattern + b"/*/\0- " + pattern + b"/*\0")
+    return tree, archives, pack_filter
+
+
+def unpack_archives(archives: Iterable[str]) -> int:
+    """
+    Extract {archives} in place and remove them, archives which do not
+    exist were unpacked already.
+
+    Returns:
+      int: number of extracted archives.
+    """
+    unpacked = 0
+    for archive in archives:
+        if not os.path.exists(archive):
+            continue
+        directory = os.path.dirname(archive)
+        dir_stat = os.stat(directory)
+        with zipfile.ZipFile(archive) as z:
+            for info in z.infolist():
+                path = os.path.join(directory, os.path.basename(info.filename))
+                with z.open(info) as src, open(path, "wb") as dst:
+                    shutil.copyfileobj(src, dst)
+                os.chmod(path, stat.S_IMODE(info.external_attr >> 16))
+                mtime = __get_mtime(info)
+                os.utime(path, (mtime, mtime))
+        os.remove(archive)
+        os.utime(directory, ns=(dir_stat.st_atime_ns, dir_stat.st_mtime_ns))
+        unpacked += 1
+    return unpacked
+
+
+def __write_archive(
+    directory: str, files: List[Tuple[str, os.stat_result]], archive: str
+) -> None:
+    """
+    Write {files} into uncompressed {archive}, unless it already contains
+    the same versions. Archive modification time is the latest change of the
+    files and the directory, so unchanged archives look the same to rsync.
+    """
+    signature = hashlib.sha256()
+    for path, st in files:
+        signature.update(
+            f"{os.path.basename(path)}\0{st.st_size}\0{st.st_mtime_ns}"
+            f"\0{st.st_mode}\0".encode("utf-8", "surrogateescape")
+        )
+    comment = signature.hexdigest().encode()
+    mtime_ns = max(
+        [os.stat(directory).st_ctime_ns] + [st.st_ctime_ns for _, st in files]
+    )
+
+    try:
+        with zipfile.ZipFile(archive) as z:
+            if z.comment == comment:
+                os.utime(archive, ns=(mtime_ns, mtime_ns))
+                return
+    except (OSError, zipfile.BadZipFile):
+        pass
+
+    os.makedirs(os.path.dirname(archive), exist_ok=True)
+    temp_archive = archive + ".tmp"
+    with zipfile.ZipFile(temp_archive, "w", zipfile.ZIP_STORED) as z:
+        z.comment = comment
+        for path, st in files:
+            mtime = max(int(st.st_mtime), MIN_ZIP_TIME)
+            info = zipfile.ZipInfo(
+                os.path.basename(path), date_time=time.localtime(mtime)[:6]
+            )
+            info.external_attr = (st.st_mode & 0xFFFF) << 16
+            info.extra = struct.pack("<HHBl", EXTENDED_TIMESTAMP, 5, 1, mtime)
+            with open(path, "rb") as f:
+                z.writestr(info, f.read())
+    os.utime(temp_archive, ns=(mtime_ns, mtime_ns))
+    os.replace(temp_archive, archive)
+
+
+def __get_mtime(info: zipfile.ZipInfo) -> float:
+    extra = info.extra
+    while len(extra) >= 4:
+        tag, size = struct.unpack("<HH", extra[:4])
+        if tag == EXTENDED_TIMESTAMP and size >= 5 and extra[4] & 1:
+            return struct.unpack("<l", extra[5:9])[0]
+        extra = extra[4 + size :]
+    return time.mktime(info.date_time + (0, 0, -1))
+
+
+def __remove_stale(tree: str, packed: set) -> None:
+    """
+    Remove archives of directories, which are not packed anymore.
+    """
+    for directory, _, files in os.walk(tree, topdown=False):
+        source_dir = directory[len(tree) :] or "/"
+        for name in files:
+            if name != PACK_NAME or source_dir not in packed:
+                os.remove(os.path.join(directory, name))
+        if directory != tree and not os.listdir(directory):
+            os.rmdir(directory)
@@ -0,0 +1,158 @@
+import os
+import time
+import shutil
+import functools
+import logging
+import threading
+import subprocess
+
+from collections import deque
+from typing import Callable, Deque, Optional, Sequence, Union
+
+from backee.model.process_result import ProcessResult
+from backee.model.thread_filter import get_worker_name
+
+
+log = logging.getLogger(__name__)
+
+# lines of stdout and stderr kept for error reporting
+TAIL_LINES = 200
+
+
+def run(
+    command: Union[str, Sequence[str]],
+    on_line: Optional[Callable[[str], Optional[bool]]] = None,
+    timeout: Optional[float] = None,
+    on_start: Optional[Callable[[subprocess.Popen], None]] = None,
+) -> ProcessResult:
+    """
+    Run {command}, string commands are run by shell. Argument vectors are
+    spawned directly, which saves a shell and quoting of arguments.
+
+    stdout lines without line endings are passed to {on_line} as soon as they
+    are read, the process is terminated if it returns True. stderr is drained
+    concurrently, so a child writing many errors never blocks on a full pipe.
+    Only the last TAIL_LINES lines of each stream are kept.
+
+    {on_start} is called with the started process, e.g. to terminate it later.
+
+    Raises:
+      TimeoutError: if the process did not finish within {timeout} seconds.
+    """
+    stdout = deque(maxlen=TAIL_LINES)
+    stderr = deque(maxlen=TAIL_LINES)
+    stopped = False
+    timed_out = threading.Event()
+
+    started = time.monotonic()
+    with subprocess.Popen(
+        command,
+        shell=isinstance(command, str),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        bufsize=1,
+        universal_newlines=True,
+    ) as proc:
+        stderr_reader = threading.Thread(
+            target=__drain,
+            args=(proc.stderr, stderr),
+            name=get_worker_name("stderr"),
+            daemon=True,
+        )
+        stderr_reader.start()
+        timer = None
+        if timeout is not None:
+            timer = threading.Timer(timeout, __kill, args=(proc, timed_out))
+            timer.daemon = True
+            timer.start()
+        if on_start is not None:
+            on_start(proc)
+
+        try:
+            for line in proc.stdout:
+                line = line.rstrip("\r\n")
+                stdout.append(line)
+                if not stopped and on_line is not None and on_line(line):
+                    stopped = True
+                    proc.terminate()
+            exit_code, rusage = __wait(proc)
+        finally:
+            if timer is not None:
+                timer.cancel()
+        stderr_reader.join()
+
+    result = ProcessResult(
+        exit_code=exit_code,
+        stdout=tuple(stdout),
+        stderr=tuple(stderr),
+        elapsed=time.monotonic() - started,
+        stopped=stopped,
+    )
+    if rusage is not None:
+        result.user_time = rusage.ru_utime
+        result.system_time = rusage.ru_stime
+        # kilobytes on Linux
+        result.max_rss = rusage.ru_maxrss * 1024
+        log.debug(
+            "exit code %i in %.1fs, cpu user %.1fs system %.1fs, max rss %i KiB",
+            exit_code,
+            result.elapsed,
+            result.user_time,
+            result.system_time,
+            rusage.ru_maxrss,
+        )
+
+    if timed_out.is_set():
+        raise TimeoutError(f"process did not finish in {timeout}s: {command}")
+    return result
+
+
+@functools.lru_cache(maxsize=None)
+def find_executable(name: str) -> str:
+    """
+    Return absolute path of {name} found in PATH, looked up once per process.
+
+    Raises:
+      OSError: if {name} is not found.
+    """
+    path = shutil.which(name)
+    if path is None:
+        raise OSError(f"{name} is not installed, but required")
+    return path
+
+
+def __drain(stream, lines: Deque[str]) -> None:
+    for line in stream:
+        lines.append(line.rstrip("\r\n"))
+
+
+def __kill(proc: subprocess.Popen, timed_out: threading.Event) -> None:
+    timed_out.set()
+    proc.kill()
+
+
+def __wait(proc: subprocess.Popen):
+    """
+    Wait for {proc} and collect its resource usage, which Popen discards.
+
+    Returns:
+      (exit code, resource usage or None)
+    """
+    try:
+        _, status, rusage = os.wait4(proc.pid, 0)
+    except ChildProcessError:
+        # already reaped by Popen
+        return proc.wait(), None
+    proc.returncode = __get_exit_code(status)
+    return proc.returncode, rusage
+
+
+def __get_exit_code(status: int) -> int:
+    """
+    Return exit code of wait {status}, negative signal number like Popen
+    if the process was killed by a signal.
+    """
+    # os.waitstatus_to_exitcode needs Python 3.9
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
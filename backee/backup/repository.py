@@ -0,0 +1,248 @@
+import os
+import json
+import zlib
+import uuid
+import fcntl
+import hashlib
+import logging
+import threading
+
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+
+log = logging.getLogger(__name__)
+
+PACKS_DIR_NAME = "packs"
+PACK_SUFFIX = ".pack"
+PACK_INDEX_SUFFIX = ".idx"
+# file locked by processes using the repository
+LOCK_FILE_NAME = "lock"
+# changed by every garbage collection, so other processes reload indexes
+GENERATION_FILE_NAME = "generation"
+
+# first byte of every chunk record in a pack
+CHUNK_RAW = b"r"
+CHUNK_ZLIB = b"z"
+
+
+class Repository(object):
+    """
+    Content addressed chunk storage.
+
+    Chunks are compressed and appended to pack files. Every finished pack
+    gets an index file with offsets of its chunks, indexes of all packs
+    are loaded into memory to find out if a chunk is already stored.
+
+    Chunks are stored and referenced while holding a shared lock of the
+    repository and garbage is collected under an exclusive one, so it never
+    removes chunks of a snapshot, whose tree is not written yet.
+    """
+
+    def __init__(self, path: str, pack_size: int, compression_level: int):
+        self.__packs_path = os.path.join(path, PACKS_DIR_NAME)
+        self.__lock_path = os.path.join(path, LOCK_FILE_NAME)
+        self.__generation_path = os.path.join(path, GENERATION_FILE_NAME)
+        self.__pack_size = pack_size
+        self.__compression_level = compression_level
+
+        self.__lock = threading.RLock()
+        # chunk id -> (pack id, offset, length)
+        self.__chunks: Dict[str, Tuple[str, int, int]] = {}
+        # chunks of the pack that is being written
+        self.__pack_chunks: Dict[str, Tuple[int, int]] = {}
+        self.__pack_id = None
+        self.__pack_file = None
+        self.__generation: Optional[str] = None
+
+        os.makedirs(self.__packs_path, exist_ok=True)
+        with self.__lock:
+            self.__load_indexes()
+
+    @contextmanager
+    def locked(self, exclusive: bool = False) -> Iterator[None]:
+        """
+        Hold lock of the repository shared by all processes and threads,
+        exclusive one only for garbage collection. Indexes are reloaded
+        if garbage was collected by another process, and before garbage
+        collection to see packs written by other processes.
+        """
+        with open(self.__lock_path, mode="a") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                with self.__lock:
+                    if exclusive or self.__read_generation() != self.__generation:
+                        self.__load_indexes()
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    @staticmethod
+    def get_chunk_id(data: bytes) -> str:
+        return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+    def store_chunk(self, data: bytes) -> Tuple[str, bool]:
+        """
+        Store chunk unless it is already stored.
+
+        Returns:
+          (chunk id, True if chunk was written) tuple.
+        """
+        chunk_id = self.get_chunk_id(data)
+        if chunk_id in self.__chunks:
+            return chunk_id, False
+
+        # compress outside of the lock, zlib releases GIL
+        compressed = zlib.compress(data, self.__compression_level)
+        record = (
+            CHUNK_ZLIB + compressed if len(compressed) < len(data) else CHUNK_RAW + data
+        )
+
+        with self.__lock:
+            if chunk_id in self.__chunks:
+                return chunk_id, False
+
+            if self.__pack_file is None:
+                self.__open_pack()
+
+            offset = self.__pack_file.tell()
+            self.__pack_file.write(record)
+            self.__pack_chunks[chunk_id] = (offset, len(record))
+            self.__chunks[chunk_id] = (self.__pack_id, offset, len(record))
+
+            if offset + len(record) >= self.__pack_size:
+                self.__close_pack()
+
+        return chunk_id, True
+
+    def read_chunk(self, chunk_id: str) -> bytes:
+        pack_id, offset, length = self.__chunks[chunk_id]
+        with open(self.__get_pack_path(pack_id), mode="rb") as f:
+            f.seek(offset)
+            record = f.read(length)
+
+        data = zlib.decompress(record[1:]) if record[:1] == CHUNK_ZLIB else record[1:]
+        if self.get_chunk_id(data) != chunk_id:
+            raise OSError(f"chunk {chunk_id} is corrupted")
+        return data
+
+    def flush(self) -> None:
+        """
+        Finish current pack, so all stored chunks are persisted.
+        """
+        with self.__lock:
+            if self.__pack_file is not None:
+                self.__close_pack()
+
+    def collect_garbage(self, used_chunks: Set[str], min_used_ratio: float) -> None:
+        """
+        Remove packs without used chunks and repack packs where used chunks
+        take less than {min_used_ratio} of the pack. Has to be called holding
+        exclusive lock, after {used_chunks} are read under it.
+        """
+        with self.__lock:
+            self.__collect_garbage(used_chunks, min_used_ratio)
+            self.__generation = uuid.uuid4().hex
+            with open(self.__generation_path + ".tmp", mode="w") as f:
+                f.write(self.__generation)
+            os.replace(self.__generation_path + ".tmp", self.__generation_path)
+
+    def __collect_garbage(self, used_chunks: Set[str], min_used_ratio: float) -> None:
+        self.flush()
+        self.__remove_unfinished_packs()
+
+        packs: Dict[str, List[str]] = {}
+        for chunk_id, (pack_id, _, _) in self.__chunks.items():
+            packs.setdefault(pack_id, []).append(chunk_id)
+
+        for pack_id, chunk_ids in packs.items():
+            used = [x for x in chunk_ids if x in used_chunks]
+            used_size = sum(self.__chunks[x][2] for x in used)
+            total_size = sum(self.__chunks[x][2] for x in chunk_ids)
+            if used and used_size >= total_size * min_used_ratio:
+                continue
+
+            log.debug(
+                "%s pack %s with %i of %i bytes used",
+                "repack" if used else "remove",
+                pack_id,
+                used_size,
+                total_size,
+            )
+            for chunk_id in used:
+                data = self.read_chunk(chunk_id)
+                del self.__chunks[chunk_id]
+                self.store_chunk(data)
+            self.flush()
+
+            for chunk_id in chunk_ids:
+                if self.__chunks.get(chunk_id, (None,))[0] == pack_id:
+                    del self.__chunks[chunk_id]
+            # index goes first, pack without index is ignored
+            os.remove(self.__get_pack_path(pack_id) + PACK_INDEX_SUFFIX)
+            os.remove(self.__get_pack_path(pack_id))
+
+    def __open_pack(self) -> None:
+        self.__pack_id = uuid.uuid4().hex
+        path = self.__get_pack_path(self.__pack_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.__pack_file = open(path, mode="wb")
+        self.__pack_chunks = {}
+
+    def __close_pack(self) -> None:
+        self.__pack_file.flush()
+        os.fsync(self.__pack_file.fileno())
+        self.__pack_file.close()
+
+        index_path = self.__get_pack_path(self.__pack_id) + PACK_INDEX_SUFFIX
+        with open(index_path + ".tmp", mode="w") as f:
+            json.dump(self.__pack_chunks, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(index_path + ".tmp", index_path)
+
+        self.__pack_file = None
+        self.__pack_id = None
+        self.__pack_chunks = {}
+
+    def __read_generation(self) -> Optional[str]:
+        try:
+            with open(self.__generation_path, mode="r") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def __remove_unfinished_packs(self) -> None:
+        """
+        Remove packs without index, which are left by crashed runs. Packs
+        being written by other processes have no index yet either, so they
+        are removed only under exclusive lock.
+        """
+        for root, _, files in os.walk(self.__packs_path):
+            for name in files:
+                path = os.path.join(root, name)
+                if name.endswith(PACK_SUFFIX) and not os.path.exists(
+                    path + PACK_INDEX_SUFFIX
+                ):
+                    log.warning("removing unfinished pack %s", path)
+                    os.remove(path)
+
+    def __load_indexes(self) -> None:
+        self.__generation = self.__read_generation()
+        self.__chunks = {
+            chunk_id: (self.__pack_id, offset, length)
+            for chunk_id, (offset, length) in self.__pack_chunks.items()
+        }
+        for root, _, files in os.walk(self.__packs_path):
+            for name in files:
+                path = os.path.join(root, name)
+                if not name.endswith(PACK_INDEX_SUFFIX):
+                    continue
+
+                pack_id = name[: -len(PACK_SUFFIX + PACK_INDEX_SUFFIX)]
+                with open(path, mode="r") as f:
+                    for chunk_id, (offset, length) in json.load(f).items():
+                        self.__chunks[chunk_id] = (pack_id, offset, length)
+
+    def __get_pack_path(self, pack_id: str) -> str:
+        return os.path.join(self.__packs_path, pack_id[:2], pack_id + PACK_SUFFIX)
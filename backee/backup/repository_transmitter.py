@@ -0,0 +1,276 @@
+import os
+import glob
+import gzip
+import json
+import stat
+import logging
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from backee.model.servers import RepositoryBackupServer
+from backee.model.items import FilesBackupItem
+from backee.model.file_index import FileIndexEntry
+from backee.model.thread_filter import get_worker_name
+from backee.backup.local_transmitter import LocalTransmitter
+from backee.backup.repository import Repository
+from backee.backup.chunker import Chunker
+from backee.backup.source import walk_sources
+from backee.backup import file_entry, file_index, filters
+
+
+log = logging.getLogger(__name__)
+
+REPOSITORY_DIR_NAME = ".repository"
+TREE_FILE_NAME = "tree.gz"
+# packs where less of the data is still used are repacked after rotation
+MIN_USED_PACK_RATIO = 0.5
+
+
+class RepositoryTransmitter(LocalTransmitter):
+    """
+    Transmitter for deduplicating repository.
+
+    Files are split into content-defined chunks, that are stored once
+    in the repository shared by all items of the server. Snapshot directory
+    only contains a tree of file metadata and chunk references, so storage
+    grows with changed bytes instead of changed files.
+    """
+
+    def __init__(self, server: RepositoryBackupServer):
+        super().__init__(server)
+        self.__server = server
+        self.__chunker = Chunker(
+            min_size=server.min_chunk_size,
+            avg_size=server.avg_chunk_size,
+            max_size=server.max_chunk_size,
+        )
+        self.__repository = None
+        self.__repository_lock = threading.Lock()
+        self.__can_chown = os.geteuid() == 0
+
+    def remove_remote_dirs(self, dirs_paths: Tuple[str]) -> None:
+        super().remove_remote_dirs(dirs_paths)
+
+        if any(not x.endswith(file_index.REMOTE_INDEX_SUFFIX) for x in dirs_paths):
+            self.__collect_garbage()
+
+    def get_transfer_file_size(
+        self, links_dir_path: str, item: FilesBackupItem, remote_path: str
+    ) -> int:
+        """
+        Get size of changed files, chunks already in the repository
+        make actually stored size smaller.
+        """
+        previous = self.__load_tree(links_dir_path)
+        return sum(
+            st.st_size
+            for path, st in filters.get_filters(item).get_sources()
+            if stat.S_ISREG(st.st_mode)
+            and file_entry.find_unchanged(previous, path, st) is None
+        )
+
+    def transmit(
+        self, links_dir_path: str, item: FilesBackupItem, remote_path: str
+    ) -> None:
+        """
+        Store chunks of {item} files and write tree of the snapshot to {remote_path}
+        """
+        repository = self.__get_repository()
+        # garbage is not collected until the tree references stored chunks
+        with repository.locked():
+            previous = self.__load_tree(links_dir_path)
+            stats = {"read": 0, "stored": 0}
+            stats_lock = threading.Lock()
+
+            tree = []
+            with ThreadPoolExecutor(
+                max_workers=self.__server.workers,
+                thread_name_prefix=get_worker_name("chunker"),
+            ) as executor:
+                futures = []
+                for path, st in filters.get_filters(item).get_sources():
+                    entry = file_entry.create_entry(path, st)
+                    if stat.S_ISREG(st.st_mode):
+                        unchanged = file_entry.find_unchanged(previous, path, st)
+                        if unchanged is not None:
+                            entry["chunks"] = unchanged["chunks"]
+                        else:
+                            futures.append(
+                                (
+                                    entry,
+                                    executor.submit(
+                                        self.__store_file, path, stats, stats_lock
+                                    ),
+                                )
+                            )
+                    elif stat.S_ISLNK(st.st_mode):
+                        entry["target"] = os.readlink(path)
+                    elif not stat.S_ISDIR(st.st_mode):
+                        log.debug("skipping special file %s", path)
+                        continue
+                    tree.append(entry)
+
+                for entry, future in futures:
+                    entry["chunks"] = future.result()
+
+            # files that vanished before they were read have no chunks
+            tree = [x for x in tree if x["type"] != "f" or x["chunks"] is not None]
+
+            repository.flush()
+
+            os.makedirs(remote_path, exist_ok=True)
+            self.__write_tree(remote_path, tree)
+
+        log.debug(
+            "%i bytes read, %i bytes of new chunks stored",
+            stats["read"],
+            stats["stored"],
+        )
+
+    def verify_backup(self, item: FilesBackupItem, remote_path: str) -> bool:
+        """
+        Verify if any items are different from the ones in backup
+        """
+        log.debug("verifying if any files are different in the backup")
+
+        tree = self.__load_tree(remote_path)
+        for path, st in walk_sources(item):
+            if stat.S_ISDIR(st.st_mode):
+                continue
+            if file_entry.find_unchanged(tree, path, st) is None:
+                log.debug("%s is different", path)
+                return False
+
+        return True
+
+    def create_index(self, backup_dir_path: str, index_path: str) -> None:
+        """
+        Create sorted and compressed index of all files in the backup
+        and store it as {index_path} beside the backup directory.
+        """
+        log.debug("create index %s", index_path)
+
+        temp_index_path = index_path + ".tmp"
+        with gzip.open(temp_index_path, mode="wb") as f:
+            file_index.write_index(self.__get_index_entries(backup_dir_path), f)
+        os.replace(temp_index_path, index_path)
+
+    def restore(self, remote_path: str, files_from: str, target_dir: str) -> int:
+        """
+        Restore files listed in {files_from} from {remote_path} to {target_dir}.
+
+        Returns:
+          int: number of bytes restored.
+        """
+        repository = self.__get_repository()
+        tree = self.__load_tree(remote_path)
+        with open(files_from, mode="rb") as f:
+            paths = [os.fsdecode(x) for x in f.read().split(b"\0") if x]
+
+        restored = 0
+        with repository.locked():
+            for path in paths:
+                entry = tree[path]
+                target = os.path.join(target_dir, path)
+                if entry["type"] == "d":
+                    # metadata of directories is restored after their contents
+                    os.makedirs(target, exist_ok=True)
+                    continue
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                if os.path.lexists(target):
+                    os.remove(target)
+
+                if entry["type"] == "l":
+                    os.symlink(entry["target"], target)
+                else:
+                    with open(target, mode="wb") as f:
+                        for chunk_id in entry["chunks"]:
+                            f.write(repository.read_chunk(chunk_id))
+                    restored += entry["size"]
+                file_entry.apply_metadata(target, entry, self.__can_chown)
+
+        return restored
+
+    def __get_repository(self) -> Repository:
+        with self.__repository_lock:
+            if self.__repository is None:
+                self.__repository = Repository(
+                    path=os.path.join(self.__server.location, REPOSITORY_DIR_NAME),
+                    pack_size=self.__server.pack_size,
+                    compression_level=self.__server.compression_level,
+                )
+            return self.__repository
+
+    def __store_file(
+        self, path: str, stats: Dict[str, int], stats_lock: threading.Lock
+    ) -> Optional[List[str]]:
+        repository = self.__get_repository()
+        chunks = []
+        read = stored = 0
+        try:
+            with open(path, mode="rb") as f:
+                for data in self.__chunker.chunks(f):
+                    chunk_id, is_new = repository.store_chunk(data)
+                    chunks.append(chunk_id)
+                    read += len(data)
+                    stored += len(data) if is_new else 0
+        except FileNotFoundError:
+            log.warning("source item vanished before it was stored: %s", path)
+            return None
+
+        with stats_lock:
+            stats["read"] += read
+            stats["stored"] += stored
+        return chunks
+
+    def __collect_garbage(self) -> None:
+        """
+        Remove chunks that are not used by any snapshot of any item.
+        """
+        repository = self.__get_repository()
+        with repository.locked(exclusive=True):
+            used_chunks = set()
+            pattern = os.path.join(glob.escape(self.__server.location), "*", "*")
+            for snapshot in glob.glob(os.path.join(pattern, TREE_FILE_NAME)):
+                for entry in self.__read_tree(snapshot):
+                    used_chunks.update(entry.get("chunks", ()))
+
+            repository.collect_garbage(used_chunks, MIN_USED_PACK_RATIO)
+
+    def __load_tree(self, snapshot_path: str) -> Dict[str, Dict[str, Any]]:
+        tree_path = os.path.join(snapshot_path, TREE_FILE_NAME)
+        if not os.path.exists(tree_path):
+            return {}
+        return {x["path"]: x for x in self.__read_tree(tree_path)}
+
+    def __read_tree(self, tree_path: str) -> Iterator[Dict[str, Any]]:
+        with gzip.open(tree_path, mode="rt", encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
+
+    def __write_tree(self, snapshot_path: str, tree: List[Dict[str, Any]]) -> None:
+        tree_path = os.path.join(snapshot_path, TREE_FILE_NAME)
+        with gzip.open(tree_path + ".tmp", mode="wt", encoding="utf-8") as f:
+            for entry in tree:
+                f.write(json.dumps(entry, ensure_ascii=False))
+                f.write("\n")
+        os.replace(tree_path + ".tmp", tree_path)
+
+    def __get_index_entries(self, backup_dir_path: str) -> Iterator[FileIndexEntry]:
+        for entry in self.__load_tree(backup_dir_path).values():
+            is_file = entry["type"] == "f"
+            # the same chunks mean the same contents, like hard link in other targets
+            contents = "".join(entry["chunks"]) if is_file else entry["path"]
+            contents_id = Repository.get_chunk_id(contents.encode())
+            yield FileIndexEntry(
+                path=entry["path"],
+                size=entry["size"] if is_file else 0,
+                mtime=entry["mtime_ns"] / 1e9,
+                inode=int(contents_id[:15], 16),
+                hash=None,
+                type=entry["type"],
+                mode=stat.S_IMODE(entry["mode"]),
+                target=entry.get("target"),
+            )
@@ -0,0 +1,256 @@
+import os
+import time
+import heapq
+import shutil
+import logging
+import itertools
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from backee.model.file_index import FileIndexEntry
+from backee.model.servers import BackupServer
+from backee.model.thread_filter import get_worker_name
+from backee.backup import file_index, packing
+
+
+log = logging.getLogger(__name__)
+
+STATE_DIR_NAME = ".backee-restore"
+# how many units each stream gets on average, more units balance streams better
+UNITS_PER_STREAM = 4
+
+
+def restore(
+    transmitter,
+    server: BackupServer,
+    mirror_dir: str,
+    item_name: str,
+    backup_name: str,
+    target_dir: str,
+    paths: Tuple[str],
+    streams: int,
+) -> None:
+    """
+    Restore {paths} (everything if empty) of {backup_name} into {target_dir}
+    using {streams} parallel transfers.
+
+    Interrupted restore is resumed by running the same command again:
+    streams that finished are skipped and unfinished ones continue
+    from partially transferred files. Modes and times of directories
+    are restored once all their contents are in place.
+    """
+    remote_path = os.path.join(server.location, item_name, backup_name, "")
+    state_dir = os.path.join(target_dir, STATE_DIR_NAME, backup_name)
+    os.makedirs(state_dir, exist_ok=True)
+
+    local_index_path = file_index.get_mirror_path(mirror_dir, backup_name)
+    if not os.path.exists(local_index_path):
+        file_index.mirror_index(
+            transmitter,
+            file_index.get_remote_index_path(remote_path),
+            local_index_path,
+        )
+
+    lists = __load_stream_lists(state_dir)
+    if not lists:
+        with file_index.FileIndex(local_index_path) as index:
+            entries = __select_entries(index, paths)
+        lists = __save_stream_lists(state_dir, split_streams(entries, streams))
+
+    log.info("restore %s from %s in %i streams", backup_name, server.name, len(lists))
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(
+        max_workers=len(lists) or 1, thread_name_prefix=get_worker_name("restore")
+    ) as executor:
+        results = list(
+            executor.map(
+                lambda x: __restore_stream(transmitter, remote_path, target_dir, *x),
+                lists,
+            )
+        )
+    elapsed = time.monotonic() - started
+
+    for stream_id, transferred, stream_elapsed in results:
+        if stream_elapsed is None:
+            log.info("stream %i finished in a previous run", stream_id)
+        else:
+            log.info(
+                "stream %i transferred %i bytes in %.1f s (%s)",
+                stream_id,
+                transferred,
+                stream_elapsed,
+                format_throughput(transferred, stream_elapsed),
+            )
+    total = sum(x[1] for x in results)
+    log.info(
+        "restored %s to %s: %i bytes in %.1f s (%s)",
+        backup_name,
+        target_dir,
+        total,
+        elapsed,
+        format_throughput(total, elapsed),
+    )
+
+    unpacked = packing.unpack_archives(
+        os.path.join(target_dir, x)
+        for x in __read_stream_lists(lists)
+        if os.path.basename(x) == packing.PACK_NAME
+    )
+    if unpacked:
+        log.info("unpacked %i directories of small files", unpacked)
+
+    with file_index.FileIndex(local_index_path) as index:
+        dirs = [x for x in __select_entries(index, paths) if x.type == "d"]
+    __restore_dir_metadata(target_dir, dirs)
+
+    shutil.rmtree(state_dir)
+    if not os.listdir(os.path.dirname(state_dir)):
+        os.rmdir(os.path.dirname(state_dir))
+
+
+def split_streams(
+    entries: Iterable[FileIndexEntry], streams: int
+) -> Tuple[Tuple[FileIndexEntry]]:
+    """
+    Split entries into at most {streams} groups of similar total size.
+
+    Directories that are too big for a single unit of work are split into
+    their subdirectories, files hard linked to each other stay in the same group,
+    so they are restored as hard links.
+    """
+    entries = sorted(entries, key=lambda x: os.fsencode(x.path))
+    if not entries:
+        return ()
+
+    total_size = sum(x.size for x in entries)
+    unit_size = max(total_size // (streams * UNITS_PER_STREAM), 1)
+    units = __merge_hard_links(__split_units(entries, unit_size, 0))
+
+    bins = [(0, i, []) for i in range(min(streams, len(units)))]
+    for unit in sorted(units, key=lambda x: sum(e.size for e in x), reverse=True):
+        size, i, unit_entries = heapq.heappop(bins)
+        unit_entries.extend(unit)
+        heapq.heappush(bins, (size + sum(e.size for e in unit), i, unit_entries))
+
+    return tuple(tuple(x[2]) for x in sorted(bins, key=lambda x: x[1]))
+
+
+def format_throughput(size: int, elapsed: float) -> str:
+    return f"{size / max(elapsed, 0.001) / 2**20:.1f} MiB/s"
+
+
+def __split_units(
+    entries: List[FileIndexEntry], unit_size: int, depth: int
+) -> List[List[FileIndexEntry]]:
+    units = []
+    # directory at {depth} itself goes before its contents
+    for name, group in itertools.groupby(
+        entries, key=lambda x: (x.path.split("/")[depth:] or [""])[0]
+    ):
+        group = list(group)
+        is_dir = len(group) > 1 or group[0].path.count("/") > depth
+        if is_dir and sum(x.size for x in group) > unit_size:
+            units.extend(__split_units(group, unit_size, depth + 1))
+        else:
+            units.append(group)
+    return units
+
+
+def __merge_hard_links(
+    units: List[List[FileIndexEntry]],
+) -> List[List[FileIndexEntry]]:
+    parents = list(range(len(units)))
+
+    def find(i: int) -> int:
+        while parents[i] != i:
+            parents[i] = parents[parents[i]]
+            i = parents[i]
+        return i
+
+    inode_units = {}
+    for i, unit in enumerate(units):
+        for entry in unit:
+            if entry.inode in inode_units:
+                parents[find(i)] = find(inode_units[entry.inode])
+            else:
+                inode_units[entry.inode] = i
+
+    merged = {}
+    for i, unit in enumerate(units):
+        merged.setdefault(find(i), []).extend(unit)
+    return list(merged.values())
+
+
+def __select_entries(
+    index: file_index.FileIndex, paths: Tuple[str]
+) -> Iterable[FileIndexEntry]:
+    if not paths:
+        return list(index)
+
+    entries = {}
+    for path in paths:
+        entries.update((x.path, x) for x in index.iter_prefix(path))
+    return list(entries.values())
+
+
+def __restore_dir_metadata(target_dir: str, dirs: List[FileIndexEntry]) -> None:
+    """
+    Set modes and times of restored {dirs}, which were changed while their
+    contents were restored. Subdirectories go first, so they are reachable.
+    """
+    for entry in sorted(dirs, key=lambda x: os.fsencode(x.path), reverse=True):
+        target = os.path.join(target_dir, entry.path)
+        os.makedirs(target, exist_ok=True)
+        os.chmod(target, entry.mode)
+        os.utime(target, (entry.mtime, entry.mtime))
+
+
+def __stream_list_path(state_dir: str, stream_id: int) -> str:
+    return os.path.join(state_dir, f"stream-{stream_id}.list")
+
+
+def __save_stream_lists(
+    state_dir: str, streams: Tuple[Tuple[FileIndexEntry]]
+) -> Tuple[Tuple[int, str]]:
+    lists = []
+    for stream_id, entries in enumerate(streams):
+        path = __stream_list_path(state_dir, stream_id)
+        with open(path + ".tmp", mode="wb") as f:
+            f.writelines(os.fsencode(x.path) + b"\0" for x in entries)
+        os.replace(path + ".tmp", path)
+        lists.append((stream_id, path))
+    return tuple(lists)
+
+
+def __load_stream_lists(state_dir: str) -> Tuple[Tuple[int, str]]:
+    lists = []
+    stream_id = 0
+    while os.path.exists(__stream_list_path(state_dir, stream_id)):
+        lists.append((stream_id, __stream_list_path(state_dir, stream_id)))
+        stream_id += 1
+    return tuple(lists)
+
+
+def __read_stream_lists(lists: Tuple[Tuple[int, str]]) -> Iterator[str]:
+    for _, path in lists:
+        with open(path, mode="rb") as f:
+            yield from (os.fsdecode(x) for x in f.read().split(b"\0") if x)
+
+
+def __restore_stream(
+    transmitter, remote_path: str, target_dir: str, stream_id: int, files_from: str
+) -> Tuple[int, int, Optional[float]]:
+    done_path = files_from + ".done"
+    if os.path.exists(done_path):
+        return stream_id, 0, None
+
+    started = time.monotonic()
+    transferred = transmitter.restore(remote_path, files_from, target_dir)
+    elapsed = time.monotonic() - started
+
+    with open(done_path, mode="w"):
+        pass
+
+    return stream_id, transferred, elapsed
@@ -0,0 +1,333 @@
+import hmac
+import base64
+import hashlib
+import logging
+import datetime
+
+from urllib.parse import quote
+from xml.etree import ElementTree
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+log = logging.getLogger(__name__)
+
+UNSIGNED_PAYLOAD = "UNSIGNED-PAYLOAD"
+# maximal number of keys in one delete request
+DELETE_BATCH_SIZE = 1000
+
+
+class S3Client(object):
+    """
+    Minimal client for S3-compatible object storage with path-style addressing
+    and AWS Signature Version 4.
+    """
+
+    def __init__(
+        self,
+        endpoint: str,
+        bucket: str,
+        region: str,
+        access_key: str,
+        secret_key: str,
+        max_connections: int = 10,
+    ):
+        self.__endpoint = endpoint.rstrip("/")
+        self.__bucket = bucket
+        self.__region = region
+        self.__access_key = access_key
+        self.__secret_key = secret_key
+
+        self.__session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=max_connections, max_retries=3
+        )
+        self.__session.mount("http://", adapter)
+        self.__session.mount("https://", adapter)
+
+    def head_object(self, key: str) -> Optional[Dict[str, str]]:
+        response = self.__request("HEAD", key, ok_statuses=(200, 404))
+        return None if response.status_code == 404 else dict(response.headers)
+
+    def get_object(self, key: str, chunk_size: int = 1 << 20) -> Iterator[bytes]:
+        """
+        Read object in binary chunks, FileNotFoundError is raised if it does not exist.
+        """
+        response = self.__request("GET", key, stream=True)
+        with response:
+            yield from response.iter_content(chunk_size=chunk_size)
+
+    def put_object(self, key: str, data: bytes) -> str:
+        response = self.__request("PUT", key, data=data)
+        return response.headers.get("ETag", "").strip('"')
+
+    def create_object(self, key: str, data: bytes) -> bool:
+        """
+        Put object unless it exists, which is decided by the storage atomically.
+
+        Returns:
+          bool: True if the object was created.
+        """
+        response = self.__request(
+            "PUT",
+            key,
+            data=data,
+            headers={"If-None-Match": "*"},
+            # 409 is returned when a concurrent conditional put wins
+            ok_statuses=(200, 409, 412),
+        )
+        return response.status_code == 200
+
+    def replace_object(self, key: str, data: bytes, if_match: str) -> bool:
+        """
+        Put object if its ETag is {if_match}, which is decided by the storage.
+
+        Returns:
+          bool: True if the object was replaced.
+        """
+        response = self.__request(
+            "PUT",
+            key,
+            data=data,
+            headers={"If-Match": if_match},
+            # 409 is returned when a concurrent conditional put wins
+            ok_statuses=(200, 404, 409, 412),
+        )
+        return response.status_code == 200
+
+    def delete_object(self, key: str, if_match: str) -> bool:
+        """
+        Delete object if its ETag is {if_match}, which is decided by the storage.
+
+        Returns:
+          bool: True if the object was deleted.
+        """
+        response = self.__request(
+            "DELETE",
+            key,
+            headers={"If-Match": if_match},
+            ok_statuses=(200, 204, 404, 412),
+        )
+        return response.status_code in (200, 204)
+
+    def copy_object(self, source_key: str, key: str) -> None:
+        self.__request(
+            "PUT",
+            key,
+            headers={
+                "x-amz-copy-source": quote(f"/{self.__bucket}/{source_key}", safe="/~")
+            },
+        )
+
+    def create_multipart_upload(self, key: str) -> str:
+        response = self.__request("POST", key, params={"uploads": ""})
+        return self.__find_text(ElementTree.fromstring(response.content), "UploadId")
+
+    def upload_part(
+        self, key: str, upload_id: str, part_number: int, data: bytes
+    ) -> str:
+        response = self.__request(
+            "PUT",
+            key,
+            params={"partNumber": str(part_number), "uploadId": upload_id},
+            data=data,
+        )
+        return response.headers["ETag"].strip('"')
+
+    def complete_multipart_upload(
+        self, key: str, upload_id: str, parts: List[Tuple[int, str]]
+    ) -> None:
+        body = (
+            "<CompleteMultipartUpload>"
+            + "".join(
+                f'<Part><PartNumber>{number}</PartNumber><ETag>"{etag}"</ETag></Part>'
+                for number, etag in sorted(parts)
+            )
+            + "</CompleteMultipartUpload>"
+        ).encode("utf-8")
+        response = self.__request(
+            "POST", key, params={"uploadId": upload_id}, data=body
+        )
+        # error can be returned with 200 status after upload is processed
+        if b"<Error>" in response.content:
+            raise OSError(f"cannot complete upload of {key}: {response.text}")
+
+    def abort_multipart_upload(self, key: str, upload_id: str) -> None:
+        self.__request(
+            "DELETE", key, params={"uploadId": upload_id}, ok_statuses=(204, 404)
+        )
+
+    def list_objects(
+        self, prefix: str, delimiter: Optional[str] = None
+    ) -> Iterator[Tuple[str, int]]:
+        """
+        List objects with {prefix}, if delimiter is set common prefixes are listed
+        as well with size -1.
+
+        Yields:
+          (key, size) tuples.
+        """
+        params = {"list-type": "2", "prefix": prefix}
+        if delimiter is not None:
+            params["delimiter"] = delimiter
+
+        while True:
+            response = self.__request("GET", "", params=params)
+            root = ElementTree.fromstring(response.content)
+            for element in root:
+                tag = self.__local_name(element.tag)
+                if tag == "Contents":
+                    yield (
+                        self.__find_text(element, "Key"),
+                        int(self.__find_text(element, "Size")),
+                    )
+                elif tag == "CommonPrefixes":
+                    yield self.__find_text(element, "Prefix"), -1
+
+            token = self.__find_text(root, "NextContinuationToken")
+            if self.__find_text(root, "IsTruncated") != "true" or not token:
+                return
+            params["continuation-token"] = token
+
+    def delete_objects(self, keys: List[str]) -> None:
+        """
+        Delete objects with as few requests as possible.
+        """
+        for i in range(0, len(keys), DELETE_BATCH_SIZE):
+            batch = keys[i : i + DELETE_BATCH_SIZE]
+            body = (
+                "<Delete><Quiet>true</Quiet>"
+                + "".join(
+                    f"<Object><Key>{self.__escape(x)}</Key></Object>" for x in batch
+                )
+                + "</Delete>"
+            ).encode("utf-8")
+            response = self.__request(
+                "POST",
+                "",
+                params={"delete": ""},
+                data=body,
+                headers={
+                    "Content-MD5": base64.b64encode(hashlib.md5(body).digest()).decode()
+                },
+            )
+            if b"<Error>" in response.content:
+                raise OSError(f"cannot delete objects: {response.text}")
+
+    def __request(
+        self,
+        method: str,
+        key: str,
+        params: Optional[Dict[str, str]] = None,
+        data: Optional[bytes] = None,
+        headers: Optional[Dict[str, str]] = None,
+        stream: bool = False,
+        ok_statuses: Tuple[int] = (200, 204),
+    ) -> requests.Response:
+        path = f"/{self.__bucket}" + (f"/{quote(key, safe='/~')}" if key else "")
+        headers = dict(headers or {})
+        headers["host"] = self.__endpoint.split("://", 1)[-1]
+        headers = sign_request(
+            method=method,
+            path=path,
+            params=params or {},
+            headers=headers,
+            payload_hash=UNSIGNED_PAYLOAD,
+            access_key=self.__access_key,
+            secret_key=self.__secret_key,
+            region=self.__region,
+            now=datetime.datetime.utcnow(),
+        )
+        query = canonical_query(params or {})
+        url = self.__endpoint + path + (f"?{query}" if query else "")
+
+        response = self.__session.request(
+            method, url, data=data, headers=headers, stream=stream
+        )
+        if response.status_code not in ok_statuses:
+            error = FileNotFoundError if response.status_code == 404 else OSError
+            raise error(
+                f"{method} {path} failed with {response.status_code}: {response.text}"
+            )
+        return response
+
+    def __escape(self, text: str) -> str:
+        return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+    def __local_name(self, tag: str) -> str:
+        return tag.rsplit("}", 1)[-1]
+
+    def __find_text(self, element: ElementTree.Element, name: str) -> Optional[str]:
+        for child in element:
+            if self.__local_name(child.tag) == name:
+                return child.text
+        return None
+
+
+def canonical_query(params: Dict[str, str]) -> str:
+    return "&".join(
+        f"{quote(k, safe='-_.~')}={quote(v, safe='-_.~')}"
+        for k, v in sorted(params.items())
+    )
+
+
+def sign_request(
+    method: str,
+    path: str,
+    params: Dict[str, str],
+    headers: Dict[str, str],
+    payload_hash: str,
+    access_key: str,
+    secret_key: str,
+    region: str,
+    now: datetime.datetime,
+    service: str = "s3",
+) -> Dict[str, str]:
+    """
+    Return {headers} with AWS Signature Version 4 authorization added.
+    """
+    amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+    date = now.strftime("%Y%m%d")
+    headers = dict(headers)
+    headers["x-amz-date"] = amz_date
+    headers["x-amz-content-sha256"] = payload_hash
+
+    canonical_headers = sorted(
+        (k.lower(), " ".join(v.split())) for k, v in headers.items()
+    )
+    signed_headers = ";".join(k for k, _ in canonical_headers)
+    canonical_request = "\n".join(
+        (
+            method,
+            path,
+            canonical_query(params),
+            "".join(f"{k}:{v}\n" for k, v in canonical_headers),
+            signed_headers,
+            payload_hash,
+        )
+    )
+
+    scope = f"{date}/{region}/{service}/aws4_request"
+    string_to_sign = "\n".join(
+        (
+            "AWS4-HMAC-SHA256",
+            amz_date,
+            scope,
+            hashlib.sha256(canonical_request.encode("utf-8")).hexdigest(),
+        )
+    )
+
+    key = ("AWS4" + secret_key).encode("utf-8")
+    for part in (date, region, service, "aws4_request"):
+        key = hmac.new(key, part.encode("utf-8"), hashlib.sha256).digest()
+    signature = hmac.new(
+        key, string_to_sign.encode("utf-8"), hashlib.sha256
+    ).hexdigest()
+
+    headers["Authorization"] = (
+        f"AWS4-HMAC-SHA256 Credential={access_key}/{scope}, "
+        f"SignedHeaders={signed_headers}, Signature={signature}"
+    )
+    return headers
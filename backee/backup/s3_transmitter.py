@@ -0,0 +1,572 @@
+import io
+import os
+import sys
+import gzip
+import json
+import stat
+import hashlib
+import logging
+import threading
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from backee.model.servers import S3BackupServer
+from backee.model.items import FilesBackupItem
+from backee.model.file_index import FileIndexEntry
+from backee.model.thread_filter import get_worker_name
+from backee.backup.transmitter import Transmitter
+from backee.backup.s3_client import S3Client
+from backee.backup.source import walk_sources
+from backee.backup.constants import TEMP_DIR_SUFFIX
+from backee.backup import file_entry, file_index, filters
+
+
+log = logging.getLogger(__name__)
+
+FILES_PREFIX = "files/"
+MANIFEST_NAME = "manifest.gz"
+TEMP_MANIFEST_NAME = MANIFEST_NAME + TEMP_DIR_SUFFIX
+# marks removed snapshot whose objects are still referenced by newer ones
+RETIRED_NAME = "retired"
+MAX_PARTS = 10000
+
+
+class S3Transmitter(Transmitter):
+    """
+    Transmitter for S3-compatible object storage.
+
+    Every snapshot is a key prefix with an object per file and a manifest
+    with metadata of all items. Files unchanged since the previous snapshot
+    are not uploaded again, their manifest entries refer to the object of
+    the snapshot they were uploaded by, and large files are uploaded in parts
+    by concurrent workers. Removed snapshot keeps objects that are still
+    referenced, and is marked retired until none of them are.
+
+    Objects cannot be renamed, so temporary and final paths of a snapshot
+    share the prefix, and the snapshot is complete once its manifest is.
+    """
+
+    def __init__(self, server: S3BackupServer, client: S3Client = None):
+        self.__server = server
+        self.__can_chown = os.geteuid() == 0
+
+        if client is None:
+            self.__client = S3Client(
+                endpoint=server.endpoint,
+                bucket=server.bucket,
+                region=server.region,
+                access_key=server.access_key,
+                secret_key=server.secret_key,
+                max_connections=server.concurrency,
+            )
+        else:
+            self.__client = client
+
+    def is_remote_dir_exist(self, path: str) -> bool:
+        log.debug("check existence of %s", path)
+        key = self.__get_key(path)
+        if self.__client.head_object(key) is not None:
+            return True
+        return (
+            next(self.__client.list_objects(key + "/", delimiter="/"), None) is not None
+        )
+
+    def create_dir(self, path: str) -> None:
+        # prefixes exist as long as there are objects in them
+        pass
+
+    def remove_remote_dir_if_exists(self, path: str) -> None:
+        self.remove_remote_dirs((path,))
+
+    def remove_remote_dirs(self, dirs_paths: Tuple[str]) -> None:
+        """
+        Remove objects of {dirs_paths}, except the ones other snapshots refer to.
+        Retired snapshots of the same items are cleaned up as well.
+        """
+        log.debug("remove directories %s", dirs_paths)
+        removed = {self.__get_key(x) for x in dirs_paths}
+        objects = {x: self.__list_keys(x) for x in removed}
+        roots = {
+            os.path.dirname(prefix)
+            for prefix, keys in objects.items()
+            if any(x.startswith(f"{prefix}/{FILES_PREFIX}") for x in keys)
+        }
+
+        referenced = set()
+        for root in roots:
+            root_referenced, retired = self.__get_references(root, removed)
+            referenced.update(root_referenced)
+            objects.update((x, self.__list_keys(x)) for x in retired)
+
+        keys = []
+        markers = []
+        for prefix, prefix_keys in sorted(objects.items()):
+            marker = f"{prefix}/{RETIRED_NAME}"
+            kept = sum(1 for x in prefix_keys if x in referenced)
+            if kept == 0:
+                keys.extend(x for x in prefix_keys if x != marker)
+                markers.extend(x for x in prefix_keys if x == marker)
+                continue
+
+            log.debug("%i objects of %s are still referenced", kept, prefix)
+            if marker not in prefix_keys:
+                self.__client.put_object(marker, b"")
+            keys.extend(x for x in prefix_keys if x not in referenced and x != marker)
+        # snapshot stays retired until its objects are gone
+        self.__client.delete_objects(keys + markers)
+
+    def check_temp_dirs(self, backup_dir_path: str, temp_dir_suffix: str) -> None:
+        log.debug("checking for temp dirs in %s", backup_dir_path)
+
+        backups = self.get_backup_names_sorted(backup_dir_path)
+        if any(x.endswith(temp_dir_suffix) for x in backups):
+            log.error("some temp dirs are in %s", backup_dir_path)
+
+    def check_links_dir(
+        self,
+        server_root_dir_path: str,
+        links_dir_path: str,
+        temp_dir_suffix: str,
+    ) -> None:
+        """
+        Check if links object exists and recreate if not.
+        Last backup will be used to link to.
+        """
+        log.debug("check links directory")
+
+        if self.__client.head_object(self.__get_key(links_dir_path)) is not None:
+            log.debug("links directory exists")
+            return
+
+        log.debug("links directory not found, create a new one")
+
+        backups = [
+            x
+            for x in self.get_backup_names_sorted(server_root_dir_path)
+            if not x.endswith(temp_dir_suffix)
+        ]
+        if not backups:
+            log.debug("backup dir for re-linking is not found")
+            return
+
+        log.debug("found last backup dir: %s", backups[-1])
+        self.recreate_links_dir(backups[-1], links_dir_path)
+
+    def recreate_links_dir(self, last_backup_dir: str, links_dir_path: str) -> None:
+        """
+        Links are objects with the name of the backup they point to.
+        """
+        log.debug("re-link %s to %s", last_backup_dir, links_dir_path)
+        name = os.path.basename(self.__get_key(last_backup_dir))
+        self.__client.put_object(self.__get_key(links_dir_path), name.encode())
+
+    def rename_dir(self, prev_name: str, new_name: str) -> None:
+        """
+        Mark the snapshot complete by finalizing its manifest.
+        """
+        log.debug("rename %s to %s", prev_name, new_name)
+        prefix = self.__get_key(prev_name)
+        if prefix != self.__get_key(new_name):
+            raise ValueError(f"cannot rename {prev_name} to {new_name}")
+
+        self.__client.copy_object(
+            f"{prefix}/{TEMP_MANIFEST_NAME}", f"{prefix}/{MANIFEST_NAME}"
+        )
+        self.__client.delete_objects([f"{prefix}/{TEMP_MANIFEST_NAME}"])
+
+    def get_backup_names_sorted(self, server_root_dir_path: str) -> Tuple[str]:
+        """
+        Return backups, the ones without manifest get temporary suffix.
+        """
+        root = self.__get_key(server_root_dir_path)
+        backups = []
+        for prefix, size in self.__client.list_objects(root + "/", delimiter="/"):
+            if size >= 0:
+                continue
+            key = prefix.rstrip("/")
+            path = os.path.join(server_root_dir_path, os.path.basename(key))
+            if self.__client.head_object(f"{key}/{MANIFEST_NAME}") is None:
+                if self.__client.head_object(f"{key}/{RETIRED_NAME}") is not None:
+                    continue
+                path += TEMP_DIR_SUFFIX
+            backups.append(path)
+        return tuple(sorted(backups))
+
+    def get_disk_space_available(self, remote_path: str) -> int:
+        """
+        Object storage does not report available space, so it is unlimited.
+        """
+        return sys.maxsize
+
+    def get_transfer_file_size(
+        self, links_dir_path: str, item: FilesBackupItem, remote_path: str
+    ) -> int:
+        """
+        Get size of items in bytes that need to be uploaded.
+        """
+        previous = self.__load_manifest(self.__resolve_snapshot(links_dir_path))
+        return sum(
+            st.st_size
+            for path, st in filters.get_filters(item).get_sources()
+            if stat.S_ISREG(st.st_mode)
+            and file_entry.find_unchanged(previous, path, st) is None
+        )
+
+    def transmit(
+        self, links_dir_path: str, item: FilesBackupItem, remote_path: str
+    ) -> None:
+        """
+        Transmit {item} to {remote_path}
+        """
+        prefix = self.__get_key(remote_path)
+        previous = self.__load_manifest(self.__resolve_snapshot(links_dir_path))
+        # two parts per worker are in memory, one uploading and one read ahead
+        buffers = threading.BoundedSemaphore(2 * self.__server.concurrency)
+
+        manifest = []
+        transfers = []
+        referenced = 0
+        with ThreadPoolExecutor(
+            max_workers=self.__server.concurrency,
+            thread_name_prefix=get_worker_name("s3_upload"),
+        ) as executor:
+            for path, st in filters.get_filters(item).get_sources():
+                entry = file_entry.create_entry(path, st)
+                if stat.S_ISREG(st.st_mode):
+                    unchanged = file_entry.find_unchanged(previous, path, st)
+                    if unchanged is not None:
+                        entry["since"] = unchanged["since"]
+                        referenced += 1
+                    else:
+                        entry["since"] = os.path.basename(prefix)
+                        key = f"{prefix}/{FILES_PREFIX}{entry['path']}"
+                        future = self.__upload_file(
+                            executor, buffers, path, st.st_size, key
+                        )
+                        transfers.append((entry, future))
+                elif stat.S_ISLNK(st.st_mode):
+                    entry["target"] = os.readlink(path)
+                elif not stat.S_ISDIR(st.st_mode):
+                    log.debug("skipping special file %s", path)
+                    continue
+                manifest.append(entry)
+
+            uploaded = 0
+            vanished = set()
+            for entry, future in transfers:
+                size = future.result()
+                if size is None:
+                    vanished.add(entry["path"])
+                else:
+                    uploaded += size
+
+        manifest = [x for x in manifest if x["path"] not in vanished]
+        self.__write_manifest(f"{prefix}/{TEMP_MANIFEST_NAME}", manifest)
+
+        log.debug(
+            "%i bytes uploaded, %i unchanged objects referenced", uploaded, referenced
+        )
+
+    def verify_backup(self, item: FilesBackupItem, remote_path: str) -> bool:
+        """
+        Verify if any items are different from the ones in backup
+        """
+        log.debug("verifying if any files are different in the backup")
+
+        prefix = self.__resolve_snapshot(remote_path)
+        manifest = self.__load_manifest(prefix)
+        root = os.path.dirname(prefix)
+        sizes = {}
+        for since in {x["since"] for x in manifest.values() if x["type"] == "f"}:
+            sizes.update(self.__client.list_objects(f"{root}/{since}/{FILES_PREFIX}"))
+
+        for path, st in walk_sources(item):
+            if stat.S_ISDIR(st.st_mode):
+                continue
+            entry = file_entry.find_unchanged(manifest, path, st)
+            if entry is None or (
+                entry["type"] == "f"
+                and sizes.get(self.__get_object_key(root, entry)) != entry["size"]
+            ):
+                log.debug("%s is different", path)
+                return False
+
+        return True
+
+    def create_index(self, backup_dir_path: str, index_path: str) -> None:
+        """
+        Create sorted and compressed index of all files in the backup
+        and store it as {index_path} beside the backup directory.
+        """
+        log.debug("create index %s", index_path)
+
+        manifest = self.__load_manifest(self.__get_key(backup_dir_path))
+        data = io.BytesIO()
+        with gzip.GzipFile(fileobj=data, mode="wb") as f:
+            file_index.write_index(self.__get_index_entries(manifest), f)
+        self.__client.put_object(self.__get_key(index_path), data.getvalue())
+
+    def read_remote_file(
+        self, path: str, chunk_size: int = 64 * 1024
+    ) -> Iterator[bytes]:
+        """
+        Read object in binary chunks.
+        """
+        yield from self.__client.get_object(self.__get_key(path), chunk_size)
+
+    def create_lock(self, path: str, content: str) -> bool:
+        """
+        Create lock object {path} with {content} unless it exists.
+
+        Returns:
+          bool: True if the lock was created.
+        """
+        return self.__client.create_object(self.__get_key(path), content.encode())
+
+    def read_lock(self, path: str) -> Optional[str]:
+        """
+        Return content of lock object {path} or None if it does not exist.
+        """
+        try:
+            return b"".join(self.__client.get_object(self.__get_key(path))).decode()
+        except FileNotFoundError:
+            return None
+
+    def renew_lock(self, path: str, previous: str, content: str) -> bool:
+        """
+        Replace lock object {path} with {content} if it still has {previous},
+        the put is conditional on the version read.
+
+        Returns:
+          bool: True if the lock was renewed.
+        """
+        key = self.__get_key(path)
+        headers = self.__client.head_object(key)
+        if headers is None or self.read_lock(path) != previous:
+            return False
+        return self.__client.replace_object(
+            key, content.encode(), if_match=headers["ETag"]
+        )
+
+    def remove_lock(self, path: str, content: str) -> bool:
+        """
+        Remove lock object {path} if it still has {content}, the delete is
+        conditional on the version read, so a newer lock is kept.
+
+        Returns:
+          bool: True if the lock was removed.
+        """
+        key = self.__get_key(path)
+        headers = self.__client.head_object(key)
+        if headers is None or self.read_lock(path) != content:
+            return False
+        return self.__client.delete_object(key, if_match=headers["ETag"])
+
+    def restore(self, remote_path: str, files_from: str, target_dir: str) -> int:
+        """
+        Restore files listed in {files_from} from {remote_path} to {target_dir}.
+
+        Returns:
+          int: number of bytes downloaded.
+        """
+        prefix = self.__get_key(remote_path)
+        manifest = self.__load_manifest(prefix)
+        with open(files_from, mode="rb") as f:
+            paths = [os.fsdecode(x) for x in f.read().split(b"\0") if x]
+
+        downloaded = 0
+        for path in paths:
+            entry = manifest[path]
+            target = os.path.join(target_dir, path)
+            if entry["type"] == "d":
+                # metadata of directories is restored after their contents
+                os.makedirs(target, exist_ok=True)
+                continue
+            if os.path.lexists(target):
+                target_st = os.lstat(target)
+                # restored by a previous run, metadata is set after the contents
+                if (
+                    target_st.st_size == entry["size"]
+                    and target_st.st_mtime_ns == entry["mtime_ns"]
+                ):
+                    continue
+                os.remove(target)
+
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if entry["type"] == "l":
+                os.symlink(entry["target"], target)
+            else:
+                with open(target, mode="wb") as f:
+                    for chunk in self.__client.get_object(
+                        self.__get_object_key(os.path.dirname(prefix), entry)
+                    ):
+                        f.write(chunk)
+                downloaded += entry["size"]
+            file_entry.apply_metadata(target, entry, self.__can_chown)
+
+        return downloaded
+
+    def __upload_file(
+        self,
+        executor: ThreadPoolExecutor,
+        buffers: threading.BoundedSemaphore,
+        path: str,
+        size: int,
+        key: str,
+    ) -> Future:
+        """
+        Read file and submit its upload to {executor}.
+
+        Returns:
+          Future with the number of uploaded bytes, or None if file vanished.
+        """
+        try:
+            f = open(path, mode="rb")
+        except FileNotFoundError:
+            log.warning("source item vanished before it was uploaded: %s", path)
+            future = Future()
+            future.set_result(None)
+            return future
+
+        with f:
+            if size <= self.__server.part_size:
+                buffers.acquire()
+                future = executor.submit(self.__put_object, key, f.read())
+                future.add_done_callback(lambda _: buffers.release())
+                return future
+
+            # parts are limited in number, so huge files get larger parts
+            part_size = max(self.__server.part_size, -(-size // MAX_PARTS))
+            upload_id = self.__client.create_multipart_upload(key)
+            parts = []
+            try:
+                while True:
+                    buffers.acquire()
+                    data = f.read(part_size)
+                    if not data:
+                        buffers.release()
+                        break
+                    part = executor.submit(
+                        self.__client.upload_part, key, upload_id, len(parts) + 1, data
+                    )
+                    part.add_done_callback(lambda _: buffers.release())
+                    parts.append((part, len(data)))
+            except BaseException:
+                self.__client.abort_multipart_upload(key, upload_id)
+                raise
+
+        # parts were submitted first, so they are running or done
+        # by the time a worker picks this up
+        return executor.submit(self.__complete_upload, key, upload_id, parts)
+
+    def __put_object(self, key: str, data: bytes) -> int:
+        self.__client.put_object(key, data)
+        return len(data)
+
+    def __complete_upload(
+        self, key: str, upload_id: str, parts: List[Tuple[Future, int]]
+    ) -> int:
+        try:
+            etags = [(i + 1, part.result()) for i, (part, _) in enumerate(parts)]
+            self.__client.complete_multipart_upload(key, upload_id, etags)
+        except BaseException:
+            self.__client.abort_multipart_upload(key, upload_id)
+            raise
+        return sum(size for _, size in parts)
+
+    def __resolve_snapshot(self, path: str) -> str:
+        """
+        Return prefix of the snapshot {path} is or links to.
+        """
+        key = self.__get_key(path)
+        try:
+            name = b"".join(self.__client.get_object(key)).decode()
+        except FileNotFoundError:
+            return key
+        return f"{os.path.dirname(key)}/{name}"
+
+    def __get_object_key(self, root: str, entry: Dict[str, Any]) -> str:
+        """
+        Return key of the object of file {entry}, that is stored in the snapshot
+        of {root} it was uploaded by.
+        """
+        return f"{root}/{entry['since']}/{FILES_PREFIX}{entry['path']}"
+
+    def __list_keys(self, prefix: str) -> List[str]:
+        return [
+            x
+            for x, _ in self.__client.list_objects(prefix)
+            if x == prefix or x.startswith(prefix + "/")
+        ]
+
+    def __get_references(
+        self, root: str, removed: Set[str]
+    ) -> Tuple[Set[str], List[str]]:
+        """
+        Return keys of objects referenced by snapshots in {root} that are not
+        {removed}, and prefixes of retired snapshots.
+        """
+        referenced = set()
+        retired = []
+        for prefix, size in self.__client.list_objects(root + "/", delimiter="/"):
+            prefix = prefix.rstrip("/")
+            if size >= 0 or prefix in removed:
+                continue
+
+            manifest = self.__load_manifest(prefix)
+            if (
+                not manifest
+                and self.__client.head_object(f"{prefix}/{RETIRED_NAME}") is not None
+            ):
+                retired.append(prefix)
+            referenced.update(
+                self.__get_object_key(root, x)
+                for x in manifest.values()
+                if x["type"] == "f"
+            )
+        return referenced, retired
+
+    def __get_key(self, path: str) -> str:
+        key = path.strip("/")
+        if key.endswith(TEMP_DIR_SUFFIX):
+            key = key[: -len(TEMP_DIR_SUFFIX)]
+        return key
+
+    def __load_manifest(self, prefix: str) -> Dict[str, Dict[str, Any]]:
+        try:
+            data = b"".join(self.__client.get_object(f"{prefix}/{MANIFEST_NAME}"))
+        except FileNotFoundError:
+            return {}
+
+        lines = gzip.decompress(data).decode("utf-8").splitlines()
+        return {x["path"]: x for x in map(json.loads, lines)}
+
+    def __write_manifest(self, key: str, manifest: List[Dict[str, Any]]) -> None:
+        data = io.BytesIO()
+        with gzip.GzipFile(fileobj=data, mode="wb") as f:
+            for entry in manifest:
+                f.write(json.dumps(entry, ensure_ascii=False).encode("utf-8"))
+                f.write(b"\n")
+        self.__client.put_object(key, data.getvalue())
+
+    def __get_index_entries(
+        self, manifest: Dict[str, Dict[str, Any]]
+    ) -> Iterator[FileIndexEntry]:
+        for entry in manifest.values():
+            is_file = entry["type"] == "f"
+            # objects copied from the same upload are like hard links in other targets
+            contents_id = hashlib.blake2b(
+                f"{entry['since'] if is_file else ''}/{entry['path']}".encode(),
+                digest_size=8,
+            ).hexdigest()
+            yield FileIndexEntry(
+                path=entry["path"],
+                size=entry["size"] if is_file else 0,
+                mtime=entry["mtime_ns"] / 1e9,
+                inode=int(contents_id[:15], 16),
+                hash=None,
+                type=entry["type"],
+                mode=stat.S_IMODE(entry["mode"]),
+                target=entry.get("target"),
+            )
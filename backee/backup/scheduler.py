@@ -0,0 +1,44 @@
+import datetime
+
+from backee.model.schedule import CronExpression
+
+
+# cron expressions like 0 0 30 2 * never match
+MAX_SEARCH_DAYS = 5 * 366
+
+
+def is_day_matched(cron: CronExpression, day: datetime.date) -> bool:
+    """
+    Check whether {day} matches day of month and day of week fields of {cron}.
+    """
+    if day.month not in cron.months:
+        return False
+    day_matched = day.day in cron.days
+    weekday_matched = day.weekday() in cron.weekdays
+    if cron.days_restricted and cron.weekdays_restricted:
+        return day_matched or weekday_matched
+    return day_matched and weekday_matched
+
+
+def get_next_run(cron: CronExpression, after: datetime.datetime) -> datetime.datetime:
+    """
+    Return the first minute matching {cron}, which is later than {after}.
+
+    Raises:
+      ValueError: if {cron} does not match any day.
+    """
+    start = after.replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+    day = start.date()
+    for _ in range(MAX_SEARCH_DAYS):
+        if is_day_matched(cron, day):
+            first = start.time() if day == start.date() else datetime.time()
+            for hour in sorted(x for x in cron.hours if x >= first.hour):
+                for minute in sorted(cron.minutes):
+                    if hour == first.hour and minute < first.minute:
+                        continue
+                    return datetime.datetime.combine(
+                        day, datetime.time(hour, minute), after.tzinfo
+                    )
+        day += datetime.timedelta(days=1)
+
+    raise ValueError(f"cron expression never matches: '{cron.expression}'")
@@ -0,0 +1,602 @@
+import io
+import os
+import sys
+import gzip
+import stat
+import queue
+import hashlib
+import logging
+import uuid
+import contextlib
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, Optional, Tuple
+
+from paramiko import SSHClient, SFTPClient, SFTPAttributes, AutoAddPolicy
+from paramiko.sftp import CMD_EXTENDED, CMD_EXTENDED_REPLY
+from paramiko.sftp_client import int64
+
+from backee.model.servers import SftpBackupServer
+from backee.model.items import FilesBackupItem
+from backee.model.file_index import FileIndexEntry
+from backee.model.thread_filter import get_worker_name
+from backee.backup.transmitter import Transmitter
+from backee.backup.source import walk_sources
+from backee.backup import file_index, filters
+
+
+log = logging.getLogger(__name__)
+
+HARDLINK_EXTENSION = "hardlink@openssh.com"
+COPY_DATA_EXTENSION = "copy-data"
+STATVFS_EXTENSION = "statvfs@openssh.com"
+# size of local reads, SFTP write requests are split by paramiko
+READ_SIZE = 1024 * 1024
+
+
+class SftpTransmitter(Transmitter):
+    """
+    Transmitter for hosts that only allow SFTP.
+
+    Nothing is executed remotely, so neither rsync nor sudo is required.
+    Files are uploaded by several SFTP sessions on separate connections,
+    each with a large window and pipelined writes, so throughput is not
+    limited by waiting for every write to be acknowledged. Files unchanged
+    since the previous backup are hard linked to it, or copied
+    by the server if it does not support hard links.
+    """
+
+    def __init__(self, server: SftpBackupServer, keepalive: int = 0):
+        self.__server = server
+        self.__keepalive = keepalive
+        # idle (ssh, sftp) pairs, connections are opened on demand
+        self.__sessions = queue.LifoQueue()
+        self.__unsupported_extensions = set()
+
+    def is_remote_dir_exist(self, path: str) -> bool:
+        log.debug("check existence of %s", path)
+        with self.__session() as sftp:
+            attributes = self.__stat(sftp, path)
+        return attributes is not None and stat.S_ISDIR(attributes.st_mode)
+
+    def create_dir(self, path: str) -> None:
+        log.debug("create directory: %s", path)
+        with self.__session() as sftp:
+            self.__makedirs(sftp, path)
+
+    def remove_remote_dir_if_exists(self, path: str) -> None:
+        self.remove_remote_dirs((path,))
+
+    def remove_remote_dirs(self, dirs_paths: Tuple[str]) -> None:
+        log.debug("remove directories %s", dirs_paths)
+        with self.__session() as sftp:
+            for path in dirs_paths:
+                self.__remove(sftp, path.rstrip("/"))
+
+    def check_temp_dirs(self, backup_dir_path: str, temp_dir_suffix: str) -> None:
+        log.debug("checking for temp dirs in %s", backup_dir_path)
+
+        backups = self.get_backup_names_sorted(backup_dir_path)
+        if any(x.endswith(temp_dir_suffix) for x in backups):
+            log.error("some temp dirs are in %s", backup_dir_path)
+
+    def check_links_dir(
+        self,
+        server_root_dir_path: str,
+        links_dir_path: str,
+        temp_dir_suffix: str,
+    ) -> None:
+        """
+        Check if links directory exists and recreate if not.
+        Last backup will be used to link to.
+        """
+        log.debug("check links directory")
+
+        if self.is_remote_dir_exist(links_dir_path):
+            log.debug("links directory exists")
+            return
+
+        log.debug("links directory not found, create a new one")
+
+        backups = [
+            x
+            for x in self.get_backup_names_sorted(server_root_dir_path)
+            if not x.endswith(temp_dir_suffix)
+        ]
+        if not backups:
+            log.debug("backup dir for re-linking is not found")
+            return
+
+        log.debug("found last backup dir: %s", backups[-1])
+        self.recreate_links_dir(backups[-1], links_dir_path)
+
+    def recreate_links_dir(self, last_backup_dir: str, links_dir_path: str) -> None:
+        log.debug("re-link %s to %s", last_backup_dir, links_dir_path)
+        with self.__session() as sftp:
+            if self.__stat(sftp, links_dir_path, follow_symlinks=False) is not None:
+                sftp.remove(links_dir_path)
+            sftp.symlink(last_backup_dir.rstrip("/"), links_dir_path)
+
+    def rename_dir(self, prev_name: str, new_name: str) -> None:
+        log.debug("rename %s to %s", prev_name, new_name)
+        with self.__session() as sftp:
+            sftp.rename(prev_name.rstrip("/"), new_name.rstrip("/"))
+
+    def get_backup_names_sorted(self, server_root_dir_path: str) -> Tuple[str]:
+        with self.__session() as sftp:
+            return tuple(
+                sorted(
+                    os.path.join(server_root_dir_path, x.filename)
+                    for x in sftp.listdir_attr(server_root_dir_path)
+                    if stat.S_ISDIR(x.st_mode)
+                )
+            )
+
+    def get_disk_space_available(self, remote_path: str) -> int:
+        """
+        Return available disk space in bytes, or unlimited space
+        if the server cannot report it.
+        """
+        with self.__session() as sftp:
+            try:
+                response, message = sftp._request(
+                    CMD_EXTENDED, STATVFS_EXTENSION, remote_path
+                )
+            except IOError:
+                log.warning("%s cannot report available space", self.__server.name)
+                return sys.maxsize
+
+        if response != CMD_EXTENDED_REPLY:
+            raise OSError(f"unexpected response to {STATVFS_EXTENSION}")
+        # bsize, frsize, blocks, bfree, bavail
+        values = [message.get_int64() for _ in range(5)]
+        return values[1] * values[4]
+
+    def get_transfer_file_size(
+        self, links_dir_path: str, item: FilesBackupItem, remote_path: str
+    ) -> int:
+        """
+        Get size of items in bytes that need to be uploaded.
+        """
+        previous = self.__list_tree(links_dir_path)
+        return sum(
+            st.st_size
+            for path, st in filters.get_filters(item).get_sources()
+            if stat.S_ISREG(st.st_mode)
+            and not self.__is_unchanged(previous.get(path.lstrip("/")), st)
+        )
+
+    def transmit(
+        self, links_dir_path: str, item: FilesBackupItem, remote_path: str
+    ) -> None:
+        """
+        Transmit {item} to {remote_path}
+        """
+        previous = self.__list_tree(links_dir_path)
+
+        dirs = []
+        with self.__session() as sftp, ThreadPoolExecutor(
+            max_workers=self.__server.channels,
+            thread_name_prefix=get_worker_name("sftp_upload"),
+        ) as executor:
+            self.__makedirs(sftp, remote_path)
+
+            futures = []
+            for path, st in filters.get_filters(item).get_sources():
+                relative_path = path.lstrip("/")
+                target = os.path.join(remote_path, relative_path)
+                if stat.S_ISDIR(st.st_mode):
+                    if self.__stat(sftp, target) is None:
+                        sftp.mkdir(target)
+                    dirs.append((target, st))
+                elif stat.S_ISLNK(st.st_mode):
+                    sftp.symlink(os.readlink(path), target)
+                elif stat.S_ISREG(st.st_mode):
+                    unchanged = self.__is_unchanged(previous.get(relative_path), st)
+                    futures.append(
+                        executor.submit(
+                            self.__transmit_file,
+                            path,
+                            st,
+                            target,
+                            os.path.join(links_dir_path, relative_path)
+                            if unchanged
+                            else None,
+                        )
+                    )
+                else:
+                    log.debug("skipping special file %s", path)
+
+            for future in futures:
+                future.result()
+
+            # contents change directory mtime, so it is set last and deepest first
+            for target, st in reversed(dirs):
+                self.__copy_metadata(sftp, target, st)
+
+    def verify_backup(self, item: FilesBackupItem, remote_path: str) -> bool:
+        """
+        Verify if any items are different from the ones in backup
+        """
+        log.debug("verifying if any files are different in the backup")
+
+        tree = self.__list_tree(remote_path)
+        for path, st in walk_sources(item):
+            if stat.S_ISDIR(st.st_mode):
+                continue
+            attributes = tree.get(path.lstrip("/"))
+            # symbolic links times cannot be set over SFTP
+            if stat.S_ISLNK(st.st_mode):
+                same = attributes is not None and stat.S_ISLNK(attributes.st_mode)
+            else:
+                same = self.__is_unchanged(attributes, st)
+            if not same:
+                log.debug("%s is different", path)
+                return False
+
+        return True
+
+    def create_index(self, backup_dir_path: str, index_path: str) -> None:
+        """
+        Create sorted and compressed index of all files in the backup
+        and store it as {index_path} beside the backup directory.
+        """
+        log.debug("create index %s", index_path)
+
+        data = io.BytesIO()
+        with gzip.GzipFile(fileobj=data, mode="wb") as f:
+            file_index.write_index(self.__get_index_entries(backup_dir_path), f)
+
+        temp_index_path = index_path + ".tmp"
+        with self.__session() as sftp:
+            with sftp.open(temp_index_path, mode="wb") as f:
+                f.set_pipelined(True)
+                f.write(data.getvalue())
+            if self.__stat(sftp, index_path) is not None:
+                sftp.remove(index_path)
+            sftp.rename(temp_index_path, index_path)
+
+    def read_remote_file(
+        self, path: str, chunk_size: int = 64 * 1024
+    ) -> Iterator[bytes]:
+        """
+        Read file in binary chunks.
+        """
+        with self.__session() as sftp, sftp.open(path, mode="rb") as f:
+            f.prefetch()
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    def create_lock(self, path: str, content: str) -> bool:
+        """
+        Create lock file {path} with {content} unless it exists.
+
+        Returns:
+          bool: True if the lock was created.
+        """
+        with self.__session() as sftp:
+            try:
+                # exclusive creation fails if the lock exists
+                with sftp.open(path, mode="wx") as f:
+                    f.write(content.encode("utf-8"))
+                return True
+            except OSError:
+                if self.__stat(sftp, path, follow_symlinks=False) is None:
+                    raise
+                return False
+
+    def read_lock(self, path: str) -> Optional[str]:
+        """
+        Return content of lock file {path} or None if it does not exist.
+        """
+        with self.__session() as sftp:
+            try:
+                with sftp.open(path, mode="r") as f:
+                    return f.read().decode("utf-8")
+            except FileNotFoundError:
+                return None
+
+    def renew_lock(self, path: str, previous: str, content: str) -> bool:
+        """
+        Replace lock file {path} with {content} if it still has {previous},
+        see `LocalTransmitter`.
+
+        Returns:
+          bool: True if the lock was renewed.
+        """
+        temp_path = f"{path}.{uuid.uuid4().hex}"
+        with self.__session() as sftp:
+            with sftp.open(temp_path, mode="w") as f:
+                f.write(content.encode("utf-8"))
+        try:
+            if not self.remove_lock(path, previous):
+                return False
+            with self.__session() as sftp:
+                try:
+                    # rename fails if another run took the lock while it was missing
+                    sftp.rename(temp_path, path)
+                except OSError:
+                    return False
+            return True
+        finally:
+            with self.__session() as sftp:
+                if self.__stat(sftp, temp_path, follow_symlinks=False) is not None:
+                    sftp.remove(temp_path)
+
+    def remove_lock(self, path: str, content: str) -> bool:
+        """
+        Remove lock file {path} if it still has {content}, see `LocalTransmitter`.
+
+        Returns:
+          bool: True if the lock was removed.
+        """
+        temp_path = f"{path}.{uuid.uuid4().hex}"
+        with self.__session() as sftp:
+            try:
+                # rename fails if the target exists, so it never replaces a lock
+                sftp.rename(path, temp_path)
+            except OSError:
+                if self.__stat(sftp, path, follow_symlinks=False) is not None:
+                    raise
+                return False
+            try:
+                with sftp.open(temp_path, mode="r") as f:
+                    if f.read().decode("utf-8") == content:
+                        return True
+                try:
+                    # lock of another owner is put back, unless a new one exists
+                    sftp.rename(temp_path, path)
+                except OSError:
+                    pass
+                return False
+            finally:
+                if self.__stat(sftp, temp_path, follow_symlinks=False) is not None:
+                    sftp.remove(temp_path)
+
+    def restore(self, remote_path: str, files_from: str, target_dir: str) -> int:
+        """
+        Restore files listed in {files_from} from {remote_path} to {target_dir}.
+
+        Returns:
+          int: number of bytes downloaded.
+        """
+        with open(files_from, mode="rb") as f:
+            paths = [os.fsdecode(x) for x in f.read().split(b"\0") if x]
+
+        downloaded = 0
+        with self.__session() as sftp:
+            for path in paths:
+                source = os.path.join(remote_path, path)
+                target = os.path.join(target_dir, path)
+                attributes = sftp.lstat(source)
+                if stat.S_ISDIR(attributes.st_mode):
+                    # metadata of directories is restored after their contents
+                    os.makedirs(target, exist_ok=True)
+                    continue
+                if os.path.lexists(target):
+                    target_st = os.lstat(target)
+                    # restored by a previous run, times are set after the contents
+                    if (
+                        target_st.st_size == attributes.st_size
+                        and int(target_st.st_mtime) == attributes.st_mtime
+                    ):
+                        continue
+                    os.remove(target)
+
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                if stat.S_ISLNK(attributes.st_mode):
+                    os.symlink(sftp.readlink(source), target)
+                    continue
+
+                with sftp.open(source, mode="rb") as src, open(target, "wb") as dst:
+                    src.prefetch(attributes.st_size)
+                    for chunk in iter(lambda: src.read(READ_SIZE), b""):
+                        dst.write(chunk)
+                os.chmod(target, stat.S_IMODE(attributes.st_mode))
+                os.utime(target, (attributes.st_atime, attributes.st_mtime))
+                downloaded += attributes.st_size
+
+        return downloaded
+
+    def __transmit_file(
+        self, path: str, st: os.stat_result, target: str, unchanged: Optional[str]
+    ) -> None:
+        with self.__session() as sftp:
+            if unchanged is not None and self.__link_file(sftp, unchanged, target, st):
+                return
+
+            try:
+                src = open(path, mode="rb")
+            except FileNotFoundError:
+                log.warning("source item vanished before it was uploaded: %s", path)
+                return
+
+            with src, sftp.open(target, mode="wb") as dst:
+                # do not wait for every write to be acknowledged,
+                # errors are reported when file is closed
+                dst.set_pipelined(True)
+                for chunk in iter(lambda: src.read(READ_SIZE), b""):
+                    dst.write(chunk)
+            self.__copy_metadata(sftp, target, st)
+
+    def __link_file(
+        self, sftp: SFTPClient, unchanged: str, target: str, st: os.stat_result
+    ) -> bool:
+        """
+        Link or copy {unchanged} file to {target} on the server.
+
+        Returns:
+          bool: False if server cannot do it and file has to be uploaded.
+        """
+        for extension in (HARDLINK_EXTENSION, COPY_DATA_EXTENSION):
+            if extension in self.__unsupported_extensions:
+                continue
+
+            try:
+                if extension == HARDLINK_EXTENSION:
+                    # paramiko has no API for extensions, but sends them as is
+                    sftp._request(CMD_EXTENDED, extension, unchanged, target)
+                else:
+                    with sftp.open(unchanged, mode="rb") as src, sftp.open(
+                        target, mode="wb"
+                    ) as dst:
+                        # offsets and zero length to copy until the end of file
+                        sftp._request(
+                            CMD_EXTENDED,
+                            extension,
+                            src.handle,
+                            int64(0),
+                            int64(0),
+                            dst.handle,
+                            int64(0),
+                        )
+                    self.__copy_metadata(sftp, target, st)
+                return True
+            except IOError as e:
+                if e.errno is None and "unsupported" in str(e).lower():
+                    log.debug("%s is not supported by the server", extension)
+                    self.__unsupported_extensions.add(extension)
+                else:
+                    log.debug("cannot %s %s: %s", extension, unchanged, e)
+
+        return False
+
+    def __copy_metadata(self, sftp: SFTPClient, target: str, st: os.stat_result):
+        sftp.chmod(target, stat.S_IMODE(st.st_mode))
+        sftp.utime(target, (st.st_atime, st.st_mtime))
+
+    def __is_unchanged(
+        self, attributes: Optional[SFTPAttributes], st: os.stat_result
+    ) -> bool:
+        # SFTP reports times in whole seconds
+        return (
+            attributes is not None
+            and attributes.st_size == st.st_size
+            and attributes.st_mtime == int(st.st_mtime)
+            and attributes.st_mode == st.st_mode
+        )
+
+    def __list_tree(self, path: str) -> Dict[str, SFTPAttributes]:
+        """
+        List all items under {path} with one request per directory.
+        """
+        tree = {}
+        with self.__session() as sftp:
+            if self.__stat(sftp, path) is None:
+                return tree
+
+            dirs = [""]
+            while dirs:
+                relative_dir = dirs.pop()
+                for attributes in sftp.listdir_attr(os.path.join(path, relative_dir)):
+                    relative_path = os.path.join(relative_dir, attributes.filename)
+                    tree[relative_path] = attributes
+                    if stat.S_ISDIR(attributes.st_mode):
+                        dirs.append(relative_path)
+        return tree
+
+    def __get_index_entries(self, backup_dir_path: str) -> Iterator[FileIndexEntry]:
+        tree = self.__list_tree(backup_dir_path)
+        links = [x for x, a in tree.items() if stat.S_ISLNK(a.st_mode)]
+        targets = {}
+        if links:
+            with self.__session() as sftp:
+                for path in links:
+                    targets[path] = sftp.readlink(os.path.join(backup_dir_path, path))
+
+        for path, attributes in tree.items():
+            is_file = stat.S_ISREG(attributes.st_mode)
+            if stat.S_ISDIR(attributes.st_mode):
+                entry_type = "d"
+            elif path in targets:
+                entry_type = "l"
+            elif is_file:
+                entry_type = "f"
+            else:
+                continue
+            # SFTP does not report inodes, hard linked files have the same
+            # size and time, which also makes other files unchanged
+            contents_id = hashlib.blake2b(
+                f"{path}\0{attributes.st_size}\0{attributes.st_mtime}".encode(),
+                digest_size=8,
+            ).hexdigest()
+            yield FileIndexEntry(
+                path=path,
+                size=attributes.st_size if is_file else 0,
+                mtime=attributes.st_mtime,
+                inode=int(contents_id[:15], 16),
+                hash=None,
+                type=entry_type,
+                mode=stat.S_IMODE(attributes.st_mode),
+                target=targets.get(path),
+            )
+
+    def __remove(self, sftp: SFTPClient, path: str) -> None:
+        attributes = self.__stat(sftp, path, follow_symlinks=False)
+        if attributes is None:
+            return
+
+        if stat.S_ISDIR(attributes.st_mode):
+            for child in sftp.listdir_attr(path):
+                self.__remove(sftp, os.path.join(path, child.filename))
+            sftp.rmdir(path)
+        else:
+            sftp.remove(path)
+
+    def __makedirs(self, sftp: SFTPClient, path: str) -> None:
+        path = path.rstrip("/")
+        if not path or self.__stat(sftp, path) is not None:
+            return
+        self.__makedirs(sftp, os.path.dirname(path))
+        sftp.mkdir(path)
+
+    def __stat(
+        self, sftp: SFTPClient, path: str, follow_symlinks: bool = True
+    ) -> Optional[SFTPAttributes]:
+        try:
+            return sftp.stat(path) if follow_symlinks else sftp.lstat(path)
+        except FileNotFoundError:
+            return None
+
+    @contextlib.contextmanager
+    def __session(self) -> Iterator[SFTPClient]:
+        """
+        Borrow an idle SFTP session or open a new connection.
+        """
+        ssh, sftp = None, None
+        while ssh is None:
+            try:
+                ssh, sftp = self.__sessions.get_nowait()
+            except queue.Empty:
+                ssh, sftp = self.__connect()
+                break
+            if not ssh.get_transport() or not ssh.get_transport().is_active():
+                ssh.close()
+                ssh = None
+
+        try:
+            yield sftp
+        finally:
+            self.__sessions.put((ssh, sftp))
+
+    def __connect(self) -> Tuple[SSHClient, SFTPClient]:
+        ssh = SSHClient()
+        ssh.load_system_host_keys()
+        ssh.set_missing_host_key_policy(AutoAddPolicy())
+        ssh.connect(
+            hostname=self.__server.hostname,
+            port=self.__server.port,
+            username=self.__server.username,
+            key_filename=self.__server.key_path,
+            look_for_keys=self.__server.key_path is None,
+        )
+        if self.__keepalive:
+            ssh.get_transport().set_keepalive(self.__keepalive)
+        # large window lets data flow without waiting for window adjustments
+        sftp = SFTPClient.from_transport(
+            ssh.get_transport(), window_size=self.__server.window_size
+        )
+        return ssh, sftp
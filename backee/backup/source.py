@@ -0,0 +1,175 @@
+import os
+import re
+import stat
+import fnmatch
+import logging
+
+from typing import Dict, FrozenSet, Iterator, List, Optional, Set, Tuple, Pattern
+
+from backee.model.items import FilesBackupItem
+
+
+log = logging.getLogger(__name__)
+
+WILDCARD_CHECK = re.compile("([*?[])")
+
+
+def walk_sources(
+    item: FilesBackupItem, includes: Optional[Tuple[str]] = None
+) -> Iterator[Tuple[str, os.stat_result]]:
+    """
+    Walk all files, directories and symlinks of the item the same way
+    `rsync --relative` would send them: parent directories of includes go first,
+    directories go before their contents and excludes are skipped.
+    {includes} expanded by `expand_paths` before are walked instead of
+    expanding includes of {item} again.
+
+    Yields:
+      (path, lstat result) tuples with absolute paths.
+    """
+    excludes = tuple(compile_pattern(x) for x in item.excludes)
+    seen = set()
+    walked = set()
+
+    if includes is None:
+        includes = expand_paths(item.includes, {}, "file backup item")
+    for include in includes:
+        for parent in __get_parents(include):
+            if parent not in seen:
+                seen.add(parent)
+                yield parent, os.lstat(parent)
+
+        yield from __walk(include, excludes, seen, walked)
+
+
+def expand_paths(
+    paths: Tuple[str], scans: Dict[str, FrozenSet[str]], kind: str
+) -> Tuple[str]:
+    """
+    Expand wildcards in {paths} and drop paths that do not exist. Every
+    directory matched by wildcards is listed at most once and listings are
+    kept in {scans}.
+    """
+    result = []
+    for path in paths:
+        expanded = __expand(os.path.abspath(path), scans)
+        if not expanded:
+            log.error("%s does not exist: %s", kind, path)
+        result.extend(expanded)
+    return tuple(result)
+
+
+def compile_pattern(pattern: str) -> Pattern:
+    """
+    Compile rsync-like exclude pattern, where `*` does not match `/`, but `**` does.
+    Patterns without a leading slash match at any depth.
+    """
+    regex = ""
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**", i):
+            regex += ".*"
+            i += 2
+            continue
+        c = pattern[i]
+        if c == "*":
+            regex += "[^/]*"
+        elif c == "?":
+            regex += "[^/]"
+        elif c == "[":
+            end = pattern.find("]", i + 1)
+            if end < 0:
+                regex += re.escape(c)
+            else:
+                regex += pattern[i : end + 1]
+                i = end
+        else:
+            regex += re.escape(c)
+        i += 1
+
+    anchor = "^" if pattern.startswith("/") else "(^|.*/)"
+    return re.compile(anchor + regex.rstrip("/") + "$")
+
+
+def escape_wildcards(path: str) -> str:
+    """
+    Escape {path} to be matched literally as a part of a pattern with wildcards.
+    """
+    return re.sub(r"([*?[\\])", r"\\\1", path)
+
+
+def is_excluded(path: str, excludes: Tuple[Pattern]) -> bool:
+    return any(x.match(path) for x in excludes)
+
+
+def __get_parents(path: str) -> Tuple[str]:
+    parents = []
+    parent = os.path.dirname(path)
+    while parent and parent != os.path.dirname(parent):
+        parents.append(parent)
+        parent = os.path.dirname(parent)
+    return tuple(reversed(parents))
+
+
+def __walk(
+    path: str, excludes: Tuple[Pattern], seen: Set[str], walked: Set[str]
+) -> Iterator[Tuple[str, os.stat_result]]:
+    if path in walked or is_excluded(path, excludes):
+        return
+    walked.add(path)
+
+    try:
+        st = os.lstat(path)
+    except FileNotFoundError:
+        log.warning("source item vanished: %s", path)
+        return
+    # directory could be already sent as a parent of another include
+    if path not in seen:
+        seen.add(path)
+        yield path, st
+
+    if not stat.S_ISDIR(st.st_mode):
+        return
+
+    try:
+        with os.scandir(path) as it:
+            children = sorted(x.path for x in it)
+    except OSError as e:
+        log.error("cannot read directory %s: %s", path, e)
+        return
+
+    for child in children:
+        yield from __walk(child, excludes, seen, walked)
+
+
+def __expand(path: str, scans: Dict[str, FrozenSet[str]]) -> List[str]:
+    candidates = ["/"]
+    for part in path.split("/")[1:]:
+        if not part:
+            continue
+        if WILDCARD_CHECK.search(part) is None:
+            # a stat is cheaper than listing a large parent, and works below
+            # directories, which can be entered but not listed
+            candidates = [
+                os.path.join(x, part)
+                for x in candidates
+                if os.path.lexists(os.path.join(x, part))
+            ]
+        else:
+            candidates = [
+                os.path.join(x, name)
+                for x in candidates
+                for name in sorted(fnmatch.filter(__scan(x, scans), part))
+                # like glob, wildcards do not match hidden files
+                if not name.startswith(".") or part.startswith(".")
+            ]
+    return candidates
+
+
+def __scan(directory: str, scans: Dict[str, FrozenSet[str]]) -> FrozenSet[str]:
+    if directory not in scans:
+        try:
+            scans[directory] = frozenset(os.listdir(directory))
+        except OSError:
+            scans[directory] = frozenset()
+    return scans[directory]
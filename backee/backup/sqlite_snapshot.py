@@ -0,0 +1,134 @@
+import os
+import stat
+import shutil
+import sqlite3
+import hashlib
+import logging
+import urllib.parse
+
+from typing import Iterable, Tuple
+
+from backee.model.items import FilesBackupItem
+from backee.backup import cache
+
+
+log = logging.getLogger(__name__)
+
+SQLITE_HEADER = b"SQLite format 3\0"
+# files next to a database, which are part of its state
+SIDE_FILE_SUFFIXES = ("-wal", "-shm", "-journal")
+# pages copied at once, writers are blocked only during a step
+PAGES_PER_STEP = 1024
+# seconds between steps, when writers may proceed
+STEP_SLEEP = 0.01
+
+
+def is_database(path: str) -> bool:
+    """
+    Check whether {path} is a regular file starting with the SQLite header.
+    """
+    try:
+        if not stat.S_ISREG(os.lstat(path).st_mode):
+            return False
+        with open(path, "rb") as f:
+            return f.read(len(SQLITE_HEADER)) == SQLITE_HEADER
+    except OSError:
+        return False
+
+
+def get_staging_dir(item: FilesBackupItem) -> str:
+    """
+    Return local directory, where database snapshots of {item} are kept between
+    runs, so unchanged databases are not copied again.
+    """
+    key = repr((item.includes, item.excludes)).encode()
+    return cache.get_cache_dir("sqlite", hashlib.sha256(key).hexdigest()[:16])
+
+
+def snapshot_databases(databases: Iterable[str], tree: str) -> Tuple[str]:
+    """
+    Copy {databases} into {tree} mirroring their absolute paths by the online
+    backup API. Databases, which cannot be read, are skipped.
+
+    Returns:
+      Tuple[str]: databases with a consistent copy in {tree}.
+    """
+    snapshots = []
+    for path in databases:
+        try:
+            __snapshot(path, tree + path)
+            __copy_parent_stats(path, tree)
+            snapshots.append(path)
+        except (OSError, sqlite3.Error) as e:
+            log.warning("cannot snapshot database %s, sending it as is: %s", path, e)
+
+    __remove_stale(tree, set(snapshots))
+    log.info("%i sqlite databases snapshotted", len(snapshots))
+    return tuple(snapshots)
+
+
+def __snapshot(path: str, snapshot: str) -> None:
+    """
+    Copy database {path} to {snapshot}, unless it has not changed since the last
+    copy. Snapshot modification time is the latest change of the database and
+    its write-ahead log, so unchanged snapshots look the same to rsync.
+    """
+    st = os.stat(path)
+    mtime_ns = max(
+        [st.st_mtime_ns]
+        + [
+            os.stat(path + x).st_mtime_ns
+            for x in SIDE_FILE_SUFFIXES
+            if os.path.exists(path + x)
+        ]
+    )
+    try:
+        if os.stat(snapshot).st_mtime_ns == mtime_ns:
+            log.debug("database not changed: %s", path)
+            return
+    except OSError:
+        pass
+
+    os.makedirs(os.path.dirname(snapshot), exist_ok=True)
+    temp_snapshot = snapshot + ".tmp"
+    if os.path.exists(temp_snapshot):
+        os.remove(temp_snapshot)
+
+    log.debug("snapshot database %s", path)
+    source = sqlite3.connect(f"file:{urllib.parse.quote(path)}?mode=ro", uri=True)
+    try:
+        target = sqlite3.connect(temp_snapshot)
+        try:
+            source.backup(target, pages=PAGES_PER_STEP, sleep=STEP_SLEEP)
+        finally:
+            target.close()
+    finally:
+        source.close()
+
+    os.chmod(temp_snapshot, stat.S_IMODE(st.st_mode))
+    os.utime(temp_snapshot, ns=(st.st_atime_ns, mtime_ns))
+    os.replace(temp_snapshot, snapshot)
+
+
+def __copy_parent_stats(path: str, tree: str) -> None:
+    """
+    Copy attributes of parents of {path} to their mirrors in {tree},
+    which are sent as implied directories.
+    """
+    directory = os.path.dirname(path)
+    while directory != "/":
+        shutil.copystat(directory, tree + directory)
+        directory = os.path.dirname(directory)
+
+
+def __remove_stale(tree: str, snapshots: set) -> None:
+    """
+    Remove snapshots of databases, which are not backed up anymore.
+    """
+    for directory, _, files in os.walk(tree, topdown=False):
+        for name in files:
+            path = os.path.join(directory, name)
+            if path[len(tree) :] not in snapshots:
+                os.remove(path)
+        if directory != tree and not os.listdir(directory):
+            os.rmdir(directory)
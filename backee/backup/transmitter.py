@@ -2,14 +2,26 @@ import logging
 import subprocess
 import re
 import os
+import time
+import socket
+import shlex
+import uuid
+import threading
+import functools
 
-from typing import Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+
+from typing import Callable, Iterator, List, Optional, Tuple
 
 from paramiko import SSHClient, AutoAddPolicy
 
 from backee.model.servers import SshBackupServer
+from backee.model.transport_profile import TransportProfile
 from backee.model.items import FilesBackupItem
-from backee.backup import constants
+from backee.model.process_result import ProcessResult
+from backee.model.thread_filter import get_worker_name
+from backee.backup import constants, compression, bandwidth, process, filters
+from backee.backup.deadline import DeadlineExceeded, expire
 
 
 log = logging.getLogger(__name__)
@@ -25,11 +37,18 @@ class SshTransmitter(Transmitter):
         server: SshBackupServer,
         ssh_client: SSHClient = None,
         deps: Tuple[str] = ("rsync",),
+        keepalive: int = 0,
+        control_dir: Optional[str] = None,
     ):
         self.__server = server
-
-        self.__wildcard_check = re.compile("([*?[])")
-
+        # idle connections are kept open by keepalives every N seconds
+        self.__keepalive = keepalive
+        # rsync runs share ssh master connections with sockets in the directory
+        self.__control_dir = control_dir
+        # several items may be backed up to the server at once
+        self.__connect_lock = threading.Lock()
+
+        self.__executables = {}
         self.__check_deps(deps)
 
         if ssh_client is None:
@@ -142,58 +161,387 @@ class SshTransmitter(Transmitter):
         if result != "0":
             raise OSError(f"Cannot rename directory {prev_name} to {new_name}")
 
-    def __path_exists(self, path: str, excludes: bool) -> bool:
-        if self.__wildcard_check.search(path) is not None:
-            log.debug("skipping existence check for path with wildcards: %s", path)
-            return True
-        elif not os.path.exists(path):
-            if excludes:
-                log.error("excludes item does not exist: %s", path)
-            else:
-                log.error("file backup item does not exist: %s", path)
-            return False
-
-        return True
-
     def transmit(
-        self, links_dir_path: str, item: FilesBackupItem, remote_path: str
+        self,
+        links_dir_path: str,
+        item: FilesBackupItem,
+        remote_path: str,
+        deadline: Optional[float] = None,
+        on_lost: Optional[Callable[[Callable[[], None]], Callable[[], None]]] = None,
     ) -> None:
         """
-        Transmit {item} to {remove_path}
+        Transmit {item} to {remove_path}. Transfers still running at {deadline},
+        a time in seconds since the epoch, are stopped and partially
+        transferred files are kept for the next run. Transfers are stopped
+        as well by callbacks registered with {on_lost}, when the lease
+        of the item directory is lost.
+
+        Raises:
+          DeadlineExceeded: if transfers were stopped at {deadline}.
+          OSError: if transfers were stopped as the lease was lost.
         """
         link_options = self.__get_link_dir_options(links_dir_path)
 
-        rsync_cmd = self.__get_rsync_command(
-            item, remote_path, f"--progress --verbose --human-readable {link_options}"
+        profile, skip_compress = compression.plan_compression(
+            item,
+            self.__server.transport,
+            compression.load_link_throughput(self.__server.hostname),
         )
+        transfer_options = self.__get_transfer_options(profile, skip_compress)
+        options = [
+            "--progress",
+            "--verbose",
+            # byte counts of stats are parsed, so they are not --human-readable
+            "--stats",
+            "--partial",
+        ] + link_options
+
+        large_files = None
+        if item.large_file_size > 0:
+            large_files = filters.get_filters(item).get_large_files(
+                item.large_file_size
+            )
+
+        if large_files is None:
+            streams = [(transfer_options, None)]
+        else:
+            # small files are not worth computing deltas, large ones are
+            # usually changed in a few blocks and may be sparse like VM images
+            large_files_from, large_filter = large_files
+            transfer_options = [x for x in transfer_options if x != "--whole-file"]
+            streams = [
+                (
+                    transfer_options
+                    + ["--whole-file", f"--filter=merge {large_filter}"],
+                    None,
+                ),
+                (
+                    transfer_options + ["--no-whole-file", "--sparse"],
+                    ["--from0", f"--files-from={large_files_from}"],
+                ),
+            ]
+
+        sent = 0
+        sent_lock = threading.Lock()
+
+        def run_stream(
+            stream_options: List[str], sources: List[str], source_root: str = "/"
+        ) -> bool:
+            def parse_line(line: str) -> None:
+                nonlocal sent
+                line_start = "Total bytes sent: "
+                if line.startswith(line_start):
+                    with sent_lock:
+                        sent += int(re.sub("[^0-9]", "", line[len(line_start) :]))
+
+            return self.__run_rsync(
+                lambda limit_options: self.__get_rsync_command(
+                    item,
+                    remote_path,
+                    options + limit_options,
+                    stream_options,
+                    sources,
+                    source_root,
+                ),
+                remote_path,
+                parse_line,
+                deadline,
+                on_lost,
+            )
 
-        with subprocess.Popen(
-            rsync_cmd,
-            shell=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            bufsize=1,
-            universal_newlines=True,
-        ) as rsync_proc:
-            for line in rsync_proc.stdout:
-                log.debug(line.rstrip())
+        started = time.monotonic()
+        with ThreadPoolExecutor(
+            max_workers=len(streams), thread_name_prefix=get_worker_name("rsync")
+        ) as executor:
+            futures = [executor.submit(run_stream, *x) for x in streams]
+            limited = any([x.result() for x in futures])
+
+        compiled = filters.get_filters(item)
+        packs = compiled.get_packs()
+        if packs is not None:
+            # packed directories exist in the snapshot by now and are kept as they are
+            tree, archives, _ = packs
+            limited |= run_stream(
+                [x for x in transfer_options if x != "--whole-file"] + ["--whole-file"],
+                ["--from0", f"--files-from={archives}", "--no-implied-dirs"],
+                os.path.join(tree, ""),
+            )
+        snapshots = compiled.get_sqlite_snapshots()
+        if snapshots is not None:
+            # copies keep the page layout, so changed pages are sent as deltas
+            tree, databases, _, _ = snapshots
+            limited |= run_stream(
+                [x for x in transfer_options if x != "--whole-file"]
+                + ["--no-whole-file"],
+                ["--from0", f"--files-from={databases}"],
+                os.path.join(tree, ""),
+            )
 
-            self.__verify_exit_code(rsync_proc, remote_path)
+        # limited transfers say nothing about the link
+        if not limited:
+            compression.record_link_throughput(
+                self.__server.hostname, sent, time.monotonic() - started
+            )
 
-    def __get_link_dir_options(self, links_dir_path: str) -> str:
+    def replicate(
+        self,
+        snapshot_path: str,
+        replica: SshBackupServer,
+        remote_path: str,
+        links_dir_path: Optional[str],
+    ) -> None:
+        """
+        Copy {snapshot_path} to {remote_path} on {replica} by rsync running on
+        this server, root of this server logs in to {replica} by its own key.
+        Unchanged files are hard linked to {links_dir_path} on {replica}.
+
+        Raises:
+          OSError: if rsync failed.
+        """
+        rsh = ["ssh", "-p", str(replica.port), "-o", "StrictHostKeyChecking=no"]
+        command = [
+            "sudo",
+            "rsync",
+            "--archive",
+            "--hard-links",
+            "--numeric-ids",
+            "--partial",
+            f"--rsh={shlex.join(rsh)}",
+            "--rsync-path=sudo rsync",
+        ]
+        if links_dir_path is not None:
+            command.append(f"--link-dest={links_dir_path}")
+        destination = replica.hostname
+        if replica.username:
+            destination = f"{replica.username}@{destination}"
+        command += [
+            os.path.join(snapshot_path, ""),
+            f"{destination}:{os.path.join(remote_path, '')}",
+        ]
+
+        log.debug("replicate %s to %s", snapshot_path, replica.name)
+        # errors of rsync are reported with its exit code
+        output = self.__execute_ssh_command(
+            shlex.join(command) + " 2>&1; echo $?"
+        ).split("\n")
+        exit_code = output[-1]
+        if exit_code != str(constants.RSYNC_STATUS_SUCCESS):
+            raise OSError(
+                f"cannot replicate {snapshot_path} to {replica.name}, "
+                f"rsync exit code {exit_code}: "
+                + "\n".join(output[-process.TAIL_LINES : -1])
+            )
+
+    def restore(self, remote_path: str, files_from: str, target_dir: str) -> int:
+        """
+        Restore files listed in {files_from} from {remote_path} to {target_dir}.
+
+        Returns:
+          int: number of bytes transferred.
+        """
+        transfer_size = 0
+
+        def parse_line(line: str) -> None:
+            nonlocal transfer_size
+            line_start = "Total transferred file size: "
+            if line.startswith(line_start):
+                transfer_size += int(
+                    re.sub("[^0-9]", "", line.split(":")[1].split()[0])
+                )
+
+        self.__run_rsync(
+            lambda limit_options: [
+                self.__get_executable("rsync"),
+                "--archive",
+                "--hard-links",
+                "--numeric-ids",
+                "--super",
+                *self.__get_transfer_options(),
+                *limit_options,
+                *self.__get_rsync_ssh_options(),
+                "--rsync-path=sudo rsync",
+                "--partial",
+                "--stats",
+                "--from0",
+                f"--files-from={files_from}",
+                f"{self.__server.username}@{self.__server.hostname}:{remote_path}",
+                os.path.join(target_dir, ""),
+            ],
+            target_dir,
+            parse_line,
+        )
+
+        return transfer_size
+
+    def __run_rsync(
+        self,
+        get_command: Callable[[List[str]], List[str]],
+        target_path: str,
+        parse_line: Callable[[str], None],
+        deadline: Optional[float] = None,
+        on_lost: Optional[Callable[[Callable[[], None]], Callable[[], None]]] = None,
+    ) -> bool:
+        """
+        Run rsync command returned by {get_command} for bandwidth limit options.
+
+        rsync cannot change its limit while running, so it is terminated and
+        started again whenever the bandwidth schedule or the number of concurrent
+        transfers to the server changes the limit noticeably. Files already
+        transferred are skipped and partially transferred ones are resumed.
+
+        Returns:
+          bool: True if the bandwidth was limited.
+
+        Raises:
+          DeadlineExceeded: if rsync was terminated at {deadline}.
+          OSError: if rsync was terminated as the lease was lost.
+        """
+        limiter = bandwidth.get_limiter(self.__server)
+        limited = False
+        with limiter.transfer():
+            while True:
+                limit = limiter.get_limit()
+                if limit is None:
+                    limit_options = []
+                else:
+                    limited = True
+                    limit_options = [f"--bwlimit={max(1, limit // 1024)}"]
+                    log.info("limit bandwidth to %i KiB/s", max(1, limit // 1024))
+
+                if deadline is not None and time.time() >= deadline:
+                    raise DeadlineExceeded(f"deadline passed before {target_path}")
+
+                changed = threading.Event()
+                finished = threading.Event()
+                expired = threading.Event()
+                lost = threading.Event()
+                watchers = []
+                timers = []
+                unregisters = []
+
+                def watch(rsync_proc: subprocess.Popen) -> None:
+                    watcher = threading.Thread(
+                        target=limiter.watch,
+                        args=(rsync_proc, limit, changed, finished),
+                        name=get_worker_name("watcher"),
+                        daemon=True,
+                    )
+                    watcher.start()
+                    watchers.append(watcher)
+                    if deadline is not None:
+                        timer = threading.Timer(
+                            deadline - time.time(),
+                            expire,
+                            args=(rsync_proc, expired),
+                        )
+                        timer.daemon = True
+                        timer.start()
+                        timers.append(timer)
+                    if on_lost is not None:
+                        unregisters.append(
+                            on_lost(functools.partial(expire, rsync_proc, lost))
+                        )
+
+                def on_line(line: str) -> None:
+                    log.debug(line)
+                    parse_line(line)
+
+                result = process.run(
+                    get_command(limit_options), on_line=on_line, on_start=watch
+                )
+                for timer in timers:
+                    timer.cancel()
+                for unregister in unregisters:
+                    unregister()
+                limiter.finish(finished)
+                for watcher in watchers:
+                    watcher.join()
+                if lost.is_set():
+                    raise OSError(f"lease lost, transfer to {target_path} stopped")
+                if expired.is_set():
+                    raise DeadlineExceeded(f"transfer to {target_path} stopped")
+                if changed.is_set():
+                    log.info("bandwidth limit changed, restart transfer")
+                    continue
+
+                self.__verify_exit_code(result, target_path)
+                return limited
+
+    def benchmark(
+        self, profile: TransportProfile, files_from: str, remote_path: str
+    ) -> float:
+        """
+        Upload files listed in {files_from} to {remote_path} using {profile}.
+
+        Returns:
+          float: elapsed seconds, {remote_path} is removed afterwards.
+        """
+        rsync_cmd = [
+            self.__get_executable("rsync"),
+            "--archive",
+            *self.__get_transfer_options(profile),
+            *self.__get_rsync_ssh_options(profile),
+            "--rsync-path=sudo rsync",
+            "--from0",
+            f"--files-from={files_from}",
+            "/",
+            f"{self.__server.username}@{self.__server.hostname}:{remote_path}",
+        ]
+
+        try:
+            result = process.run(rsync_cmd, on_line=log.debug)
+            self.__verify_exit_code(result, remote_path)
+            return result.elapsed
+        finally:
+            self.remove_remote_dirs((remote_path,))
+
+    def __get_link_dir_options(self, links_dir_path: str) -> List[str]:
         if self.is_remote_dir_exist(links_dir_path):
             log.debug("links dir found")
-            return "--link-dest=" + links_dir_path
+            return ["--link-dest=" + links_dir_path]
         else:
             log.debug("links dir not found")
-            return ""
+            return []
 
-    def __get_rsync_ssh_options(self) -> str:
-        options = f"ssh -p {self.__server.port}"
+    def __get_rsync_ssh_options(self, profile: TransportProfile = None) -> List[str]:
+        profile = profile or self.__server.transport
+        options = ["ssh", "-p", str(self.__server.port)]
         if self.__server.key_path:
-            options += f" -i '{self.__server.key_path}'"
-        options += " -o StrictHostKeyChecking=no"
-        return f'--rsh="{options}"'
+            options += ["-i", self.__server.key_path]
+        options += ["-o", "StrictHostKeyChecking=no"]
+        if profile.ciphers:
+            options += ["-c", profile.ciphers]
+        if profile.macs:
+            options += ["-m", profile.macs]
+        if self.__keepalive:
+            options += ["-o", f"ServerAliveInterval={self.__keepalive}"]
+        if self.__control_dir:
+            # handshakes are paid once, later runs reuse the master connection
+            options += [
+                "-o",
+                "ControlMaster=auto",
+                "-o",
+                f"ControlPath={os.path.join(self.__control_dir, '%C')}",
+                "-o",
+                f"ControlPersist={max(self.__keepalive * 3, 60)}",
+            ]
+        # rsync splits the remote shell command itself and respects quotes
+        return [f"--rsh={shlex.join(options)}"]
+
+    def __get_transfer_options(
+        self, profile: TransportProfile = None, skip_compress: Tuple[str] = ()
+    ) -> List[str]:
+        profile = profile or self.__server.transport
+        options = []
+        if profile.compression:
+            options.append("--compress")
+            if profile.compression_level is not None:
+                options.append(f"--compress-level={profile.compression_level}")
+            if skip_compress:
+                options.append(f"--skip-compress={'/'.join(skip_compress)}")
+        if profile.whole_file:
+            options.append("--whole-file")
+        return options
 
     def get_backup_names_sorted(self, server_root_dir_path: str) -> Tuple[str]:
         find_dirs = f"sudo find {server_root_dir_path} -mindepth 1 -maxdepth 1 -type d | sort -t- -k1"
@@ -208,35 +556,34 @@ class SshTransmitter(Transmitter):
         rsync_cmd = self.__get_rsync_command(
             item,
             remote_path,
-            "--verbose --hard-links --progress --itemize-changes --dry-run",
+            [
+                "--verbose",
+                "--hard-links",
+                "--progress",
+                "--itemize-changes",
+                "--dry-run",
+            ],
         )
 
-        no_errors = True
-        with subprocess.Popen(
-            rsync_cmd,
-            shell=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            bufsize=1,
-            universal_newlines=True,
-        ) as rsync_proc:
-            error_pattern = "^[<>]"
-            warn_pattern = "^\."
-            # skip warning for directories if their timestamp changed since backup
-            false_positive = (".d..t",)
-            for line in rsync_proc.stdout:
-                fmt_line = line.rstrip()
-                if (
-                    re.findall(warn_pattern, fmt_line)
-                    or re.findall(error_pattern, fmt_line)
-                ) and not fmt_line.startswith(false_positive):
-                    no_errors = False
-                    log.debug("%s is different", fmt_line)
-                    break
-
-            self.__verify_exit_code(rsync_proc, remote_path)
-
-        return no_errors
+        error_pattern = "^[<>]"
+        warn_pattern = "^\."
+        # skip warning for directories if their timestamp changed since backup
+        false_positive = (".d..t",)
+
+        def is_different(line: str) -> bool:
+            if (
+                re.findall(warn_pattern, line) or re.findall(error_pattern, line)
+            ) and not line.startswith(false_positive):
+                log.debug("%s is different", line)
+                return True
+            return False
+
+        # rsync is terminated on the first difference
+        result = process.run(rsync_cmd, on_line=is_different)
+        if not result.stopped:
+            self.__verify_exit_code(result, remote_path)
+
+        return not result.stopped
 
     def get_transfer_file_size(
         self, links_dir_path: str, item: FilesBackupItem, remote_path: str
@@ -247,49 +594,38 @@ class SshTransmitter(Transmitter):
         link_options = self.__get_link_dir_options(links_dir_path)
 
         rsync_cmd = self.__get_rsync_command(
-            item, remote_path, f"--stats --dry-run {link_options}"
+            item, remote_path, ["--stats", "--dry-run"] + link_options
         )
 
         transfer_size = 0
-        with subprocess.Popen(
-            rsync_cmd,
-            shell=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            bufsize=1,
-            universal_newlines=True,
-        ) as rsync_proc:
-            line_start = "Total transferred file size: "
-            for line in rsync_proc.stdout:
-                fmt_line = line.rstrip()
-                log.debug(fmt_line)
-                if line_start in fmt_line:
-                    transfer_size = int(re.search("\d+", fmt_line).group())
-                    log.debug("transfer size is %i bytes", transfer_size)
-                    break
 
-            self.__verify_exit_code(rsync_proc, remote_path)
+        def parse_line(line: str) -> None:
+            nonlocal transfer_size
+            log.debug(line)
+            if "Total transferred file size: " in line:
+                transfer_size = int(re.search("\d+", line).group())
+                log.debug("transfer size is %i bytes", transfer_size)
+
+        result = process.run(rsync_cmd, on_line=parse_line)
+        self.__verify_exit_code(result, remote_path)
 
         return transfer_size
 
-    def __verify_exit_code(
-        self, rsync_proc: subprocess.Popen, remote_path: str
-    ) -> None:
+    def __verify_exit_code(self, result: ProcessResult, remote_path: str) -> None:
         """
         Verify rsync exit code and raises exception if process finished with an error
 
         Raises:
             OSError: if exit code is not RSYNC_STATUS_SOURCE_VANISHED or RSYNC_STATUS_SUCCESS
         """
-        exit_code = rsync_proc.wait()
+        exit_code = result.exit_code
+        stderr = "\n".join(result.stderr)
         if exit_code == constants.RSYNC_STATUS_SOURCE_VANISHED:
-            stderr = "\n".join(map(lambda s: s.rstrip(), rsync_proc.stderr.readlines()))
             log.warning(
                 "source item vanished before rsync was able to copy it over: %s",
                 stderr,
             )
         elif exit_code != constants.RSYNC_STATUS_SUCCESS:
-            stderr = "\n".join(map(lambda s: s.rstrip(), rsync_proc.stderr.readlines()))
             log.error(
                 "rsync finished with non-zero exit code %i and stderr: %s",
                 exit_code,
@@ -297,6 +633,129 @@ class SshTransmitter(Transmitter):
             )
             raise OSError(f"Cannot transfer to {remote_path}")
 
+    def create_index(self, backup_dir_path: str, index_path: str) -> None:
+        """
+        Create sorted and compressed index of all files in the backup
+        and store it as {index_path} beside the backup directory.
+        """
+        log.debug("create index %s", index_path)
+
+        if self.__server.index_hashes:
+            # find flushes its output before executing a command,
+            # so the hash lands between size/mtime/inode and the type
+            print_file = (
+                "-printf '%P\\t%s\\t%T@\\t%i\\t' "
+                '-exec sh -c \'sha256sum < "$1" | cut -d" " -f1 | tr -d "\\n"\' _ {} \\; '
+                "-printf '\\tf\\t%m\\t\\0'"
+            )
+        else:
+            print_file = "-printf '%P\\t%s\\t%T@\\t%i\\t\\tf\\t%m\\t\\0'"
+        print_dir = "-printf '%P\\t0\\t%T@\\t%i\\t\\td\\t%m\\t\\0'"
+        # targets may contain any character, so they are hex encoded
+        print_link = (
+            "-printf '%P\\t0\\t%T@\\t%i\\t\\tl\\t%m\\t' "
+            '-exec sh -c \'readlink -n "$1" | od -An -vtx1 | tr -d " \\n"\' _ {} \\; '
+            "-printf '\\0'"
+        )
+
+        temp_index_path = index_path + ".tmp"
+        result = self.__execute_ssh_command(
+            f"sudo find '{backup_dir_path}' -mindepth 1 "
+            f"\\( -type f {print_file} \\) -o \\( -type d {print_dir} \\) "
+            f"-o \\( -type l {print_link} \\) "
+            f"| LC_ALL=C sort -z | gzip -c | sudo tee '{temp_index_path}' > /dev/null "
+            f"&& sudo mv '{temp_index_path}' '{index_path}'; echo $?"
+        )
+        if result != "0":
+            raise OSError(f"cannot create index {index_path}")
+
+    def read_remote_file(
+        self, path: str, chunk_size: int = 64 * 1024
+    ) -> Iterator[bytes]:
+        """
+        Read remote file in binary chunks.
+        """
+        self.__ensure_connection()
+
+        _, stdout, stderr = self.ssh.exec_command(f"sudo cat '{path}'")
+        while True:
+            chunk = stdout.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+        stderr = "\n".join(map(lambda s: s.rstrip(), stderr.readlines()))
+        if stderr:
+            raise OSError(f"stderr is not empty: '{stderr}'")
+
+    def create_lock(self, path: str, content: str) -> bool:
+        """
+        Create lock file {path} with {content} unless it exists.
+
+        Returns:
+          bool: True if the lock was created.
+        """
+        # link fails if the lock exists, so only one of concurrent runs creates it
+        temp_path = shlex.quote(f"{path}.{uuid.uuid4().hex}")
+        result = self.__execute_ssh_command(
+            f"printf %s {shlex.quote(content)} | sudo tee {temp_path} > /dev/null"
+            f" && sudo ln {temp_path} {shlex.quote(path)} 2> /dev/null;"
+            f" status=$?; sudo rm -f {temp_path}; echo $status"
+        )
+        return result == "0"
+
+    def read_lock(self, path: str) -> Optional[str]:
+        """
+        Return content of lock file {path} or None if it does not exist.
+        """
+        result = self.__execute_ssh_command(
+            f"sudo cat {shlex.quote(path)} 2> /dev/null || true"
+        )
+        return result or None
+
+    def renew_lock(self, path: str, previous: str, content: str) -> bool:
+        """
+        Replace lock file {path} with {content} if it still has {previous}.
+        The new lock is written aside and linked in only after the old one
+        was moved aside with {previous}, see `remove_lock`.
+
+        Returns:
+          bool: True if the lock was renewed.
+        """
+        new_path = shlex.quote(f"{path}.{uuid.uuid4().hex}")
+        temp_path = shlex.quote(f"{path}.{uuid.uuid4().hex}")
+        quoted_path = shlex.quote(path)
+        result = self.__execute_ssh_command(
+            f"if printf %s {shlex.quote(content)} | sudo tee {new_path} > /dev/null;"
+            f" then if sudo mv -T {quoted_path} {temp_path} 2> /dev/null; then"
+            f' if [ "$(sudo cat {temp_path})" = {shlex.quote(previous)} ]; then'
+            f" sudo ln {new_path} {quoted_path} 2> /dev/null && status=0 || status=1;"
+            f" else sudo ln {temp_path} {quoted_path} 2> /dev/null; status=1; fi;"
+            f" sudo rm -f {temp_path}; else status=1; fi; else status=2; fi;"
+            f" sudo rm -f {new_path}; echo $status"
+        )
+        if result == "2":
+            raise OSError(f"cannot write lock {path}")
+        return result == "0"
+
+    def remove_lock(self, path: str, content: str) -> bool:
+        """
+        Remove lock file {path} if it still has {content}. The lock is moved
+        aside first, so a lock created by another run meanwhile is kept.
+
+        Returns:
+          bool: True if the lock was removed.
+        """
+        temp_path = shlex.quote(f"{path}.{uuid.uuid4().hex}")
+        path = shlex.quote(path)
+        result = self.__execute_ssh_command(
+            f"if sudo mv -T {path} {temp_path} 2> /dev/null; then"
+            f' if [ "$(sudo cat {temp_path})" = {shlex.quote(content)} ]; then'
+            f" status=0; else sudo ln {temp_path} {path} 2> /dev/null; status=1; fi;"
+            f" sudo rm -f {temp_path}; else status=1; fi; echo $status"
+        )
+        return result == "0"
+
     def get_disk_space_available(self, remote_path: str) -> int:
         """
         Return available disk space in bytes.
@@ -334,50 +793,86 @@ class SshTransmitter(Transmitter):
         )
 
     def __ensure_connection(self) -> None:
-        if not self.__is_connected():
+        with self.__connect_lock:
+            if self.__is_connected():
+                return
             self.ssh.connect(
                 hostname=self.__server.hostname,
                 port=self.__server.port,
                 username=self.__server.username,
                 key_filename=self.__server.key_path,
                 look_for_keys=self.__server.key_path is None,
+                sock=self.__create_socket(),
             )
+            if self.__keepalive:
+                self.ssh.get_transport().set_keepalive(self.__keepalive)
+
+    def __create_socket(self) -> Optional[socket.socket]:
+        """
+        Create socket with buffer sizes of the transport profile, they have to be
+        set before connecting, otherwise TCP window scaling is already negotiated.
+        """
+        size = self.__server.transport.socket_buffer_size
+        if size is None:
+            return None
+
+        family, socket_type, proto, _, address = socket.getaddrinfo(
+            self.__server.hostname, self.__server.port, type=socket.SOCK_STREAM
+        )[0]
+        sock = socket.socket(family, socket_type, proto)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, size)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, size)
+        sock.connect(address)
+        return sock
 
     def __check_deps(self, deps: Tuple[str]) -> None:
         """
         Check that deps, passed as arguments are available and raise an excpetion if not.
         """
         for dep in deps:
-            cmd = f"hash {dep}"
-            with subprocess.Popen(
-                cmd,
-                shell=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                bufsize=1,
-                universal_newlines=True,
-            ) as proc:
-                exit_code = proc.wait()
-                if exit_code != 0:
-                    raise OSError(f"{dep} is not installed, but required")
+            self.__executables[dep] = process.find_executable(dep)
+
+    def __get_executable(self, name: str) -> str:
+        # unchecked dependencies are looked up in PATH when spawned
+        return self.__executables.get(name, name)
 
     def __get_rsync_command(
         self,
         item: FilesBackupItem,
         remote_path: str,
-        additional_opts: str,
-    ) -> str:
-        ssh_optons = self.__get_rsync_ssh_options()
-        excludes = " ".join(
-            f'--exclude "{s}"' for s in item.excludes if self.__path_exists(s, True)
-        )
-        includes = " ".join(
-            f'"{s}"' for s in item.includes if self.__path_exists(s, False)
-        )
-
-        return (
-            f"rsync --archive --compress --relative {ssh_optons} "
-            "--super --numeric-ids --rsync-path='sudo rsync' "
-            f"{additional_opts} {excludes} {includes} "
-            f"{self.__server.username}@{self.__server.hostname}:{remote_path}"
-        )
+        additional_opts: List[str],
+        transfer_options: List[str] = None,
+        sources: List[str] = None,
+        source_root: str = "/",
+    ) -> List[str]:
+        """
+        Build rsync command sending {sources} options relative to {source_root},
+        all includes of {item} except packed files and snapshotted databases
+        by default.
+        """
+        if transfer_options is None:
+            transfer_options = self.__get_transfer_options()
+        if sources is None:
+            compiled = filters.get_filters(item)
+            sources = compiled.get_rsync_options()
+            packs = compiled.get_packs()
+            if packs is not None:
+                sources.append(f"--filter=merge {packs[2]}")
+            snapshots = compiled.get_sqlite_snapshots()
+            if snapshots is not None:
+                sources.append(f"--filter=merge {snapshots[2]}")
+
+        return [
+            self.__get_executable("rsync"),
+            "--archive",
+            *transfer_options,
+            "--relative",
+            *self.__get_rsync_ssh_options(),
+            "--super",
+            "--numeric-ids",
+            "--rsync-path=sudo rsync",
+            *additional_opts,
+            *sources,
+            source_root,
+            f"{self.__server.username}@{self.__server.hostname}:{remote_path}",
+        ]
@@ -0,0 +1,135 @@
+import os
+import stat
+import uuid
+import logging
+import tempfile
+import dataclasses
+
+from typing import BinaryIO, List, Optional, Tuple
+
+from backee.model.items import FilesBackupItem
+from backee.model.servers import SshBackupServer
+from backee.model.transport_profile import TransportProfile
+from backee.backup.restore import format_throughput
+from backee.backup.source import walk_sources
+
+
+log = logging.getLogger(__name__)
+
+# tried in addition to ciphers of the current profile
+CIPHERS = (
+    "aes128-gcm@openssh.com",
+    "chacha20-poly1305@openssh.com",
+    "aes128-ctr",
+)
+COMPRESSION_LEVELS = (1, 6)
+# on faster links sending whole files is cheaper than computing deltas,
+# which reads changed files on both sides
+WHOLE_FILE_MIN_THROUGHPUT = 50 * 1024 * 1024
+
+
+def tune(
+    transmitter, server: SshBackupServer, item: FilesBackupItem, sample_size: int
+) -> Tuple[TransportProfile, Tuple[Tuple[TransportProfile, Optional[float]]]]:
+    """
+    Upload a sample of {item} files to {server} with alternative transport
+    profiles and suggest the fastest one.
+
+    Ciphers are compared without compression first, then compression levels
+    are compared using the fastest cipher.
+
+    Returns:
+      (suggested profile, ((profile, bytes per second or None if failed), ...))
+    """
+    results = []
+    with tempfile.NamedTemporaryFile(prefix="backee-tune-") as files_from:
+        size = __write_sample_list(item, sample_size, files_from)
+        if size == 0:
+            raise ValueError(f"{item.name} has no files to sample")
+
+        def measure(profile: TransportProfile) -> None:
+            results.append(
+                (
+                    profile,
+                    __measure(transmitter, server, profile, files_from.name, size),
+                )
+            )
+
+        current = server.transport
+        measure(current)
+
+        uncompressed = dataclasses.replace(
+            current, compression=False, compression_level=None, whole_file=True
+        )
+        for ciphers in dict.fromkeys((current.ciphers,) + CIPHERS):
+            measure(dataclasses.replace(uncompressed, ciphers=ciphers))
+
+        fastest, _ = __get_fastest(results[1:])
+        for level in COMPRESSION_LEVELS:
+            measure(
+                dataclasses.replace(fastest, compression=True, compression_level=level)
+            )
+
+    fastest, throughput = __get_fastest(results)
+    suggested = dataclasses.replace(
+        fastest, whole_file=throughput >= WHOLE_FILE_MIN_THROUGHPUT
+    )
+    return suggested, tuple(results)
+
+
+def describe_profile(profile: TransportProfile) -> str:
+    if not profile.compression:
+        compression = "no compression"
+    elif profile.compression_level is None:
+        compression = "default compression"
+    else:
+        compression = f"compression level {profile.compression_level}"
+    return f"{profile.ciphers or 'default ciphers'}, {compression}"
+
+
+def __measure(
+    transmitter,
+    server: SshBackupServer,
+    profile: TransportProfile,
+    files_from: str,
+    size: int,
+) -> Optional[float]:
+    remote_path = os.path.join(server.location, f".backee-tune-{uuid.uuid4().hex}")
+    try:
+        elapsed = transmitter.benchmark(profile, files_from, remote_path)
+    except OSError:
+        # e.g. cipher is not supported by the server
+        log.warning("%s failed", describe_profile(profile), exc_info=True)
+        return None
+
+    log.info("%s: %s", describe_profile(profile), format_throughput(size, elapsed))
+    return size / max(elapsed, 0.001)
+
+
+def __get_fastest(
+    results: List[Tuple[TransportProfile, Optional[float]]]
+) -> Tuple[TransportProfile, float]:
+    measured = [x for x in results if x[1] is not None]
+    if not measured:
+        raise OSError("all transport alternatives failed")
+    return max(measured, key=lambda x: x[1])
+
+
+def __write_sample_list(
+    item: FilesBackupItem, sample_size: int, files_from: BinaryIO
+) -> int:
+    """
+    Write null separated list of {item} files up to {sample_size} bytes.
+
+    Returns:
+      int: size of listed files.
+    """
+    size = 0
+    for path, st in walk_sources(item):
+        if size >= sample_size:
+            break
+        if stat.S_ISREG(st.st_mode):
+            files_from.write(os.fsencode(path) + b"\0")
+            size += st.st_size
+    files_from.flush()
+    return size
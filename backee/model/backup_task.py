@@ -0,0 +1,12 @@
+from dataclasses import dataclass
+
+from backee.model.items import FilesBackupItem
+from backee.model.servers import BackupServer
+
+
+@dataclass
+class BackupTask(object):
+    server: BackupServer
+    item: FilesBackupItem
+    # seconds the backup is expected to take
+    expected: float
@@ -0,0 +1,15 @@
+import datetime
+
+from dataclasses import dataclass
+from typing import Tuple
+
+
+@dataclass
+class BandwidthWindow(object):
+    start: datetime.time
+    # window ends the next day if end is not after start
+    end: datetime.time
+    # bytes per second shared by all transfers to the server
+    limit: int
+    # weekdays of the window start, Monday is 0
+    days: Tuple[int] = tuple(range(7))
@@ -0,0 +1,28 @@
+from dataclasses import dataclass
+from typing import Tuple
+
+
+# already compressed or encrypted formats, rsync's own list
+# is replaced by --skip-compress, so it is included as well
+DEFAULT_SKIP_COMPRESS = (
+    "3g2 3gp 7z aac ace age apk avi avif bz2 deb dmg ear enc f4v flac flv gpg gz "
+    "heic heif iso jar jpeg jpg jxl lrz lz lz4 lzma lzo m1a m1v m2a m2ts m2v m4a "
+    "m4b m4p m4r m4v mka mkv mov mp1 mp2 mp3 mp4 mpa mpeg mpg mpv mts odb odf odg "
+    "odi odm odp ods odt oga ogg ogm ogv ogx opus otg oth otp ots ott oxt png qt "
+    "rar rpm rz rzip spx squashfs sxc sxd sxg sxm sxw sz tbz tbz2 tgz tlz ts txz "
+    "tzo vob war webm webp whl xz z zip zst"
+).split()
+
+
+@dataclass
+class CompressionPolicy(object):
+    # file suffixes sent without compression
+    skip_compress: Tuple[str] = tuple(DEFAULT_SKIP_COMPRESS)
+    # sample files with other suffixes and skip compressing suffixes,
+    # whose samples do not compress
+    detect_incompressible: bool = False
+    # bytes read from every sampled file
+    sample_size: int = 64 * 1024
+    # pick compression level from link throughput and compression speed,
+    # unless the transport profile sets a level
+    auto_level: bool = True
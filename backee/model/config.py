@@ -1,11 +1,13 @@
 import logging
+import datetime
 from dataclasses import dataclass
 
-from typing import Tuple
+from typing import Optional, Tuple
 
 from backee.model.servers import BackupServer
 from backee.model.items import BackupItem
 from backee.model.rotation_strategy import RotationStrategy
+from backee.model.schedule import Schedule
 
 
 @dataclass
@@ -14,3 +16,11 @@ class Config(object):
     loggers: Tuple[logging.Handler]
     backup_servers: Tuple[BackupServer]
     backup_items: Tuple[BackupItem]
+    # used by the daemon only
+    schedules: Tuple[Schedule] = ()
+    # threads backing up items, enough to keep all servers busy if None
+    workers: Optional[int] = None
+    # backups running on a server at once
+    items_per_server: int = 1
+    # backups have to finish by this time of day
+    window_end: Optional[datetime.time] = None
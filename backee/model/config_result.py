@@ -0,0 +1,11 @@
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass
+class ConfigResult(object):
+    name: str
+    # seconds the config was running
+    elapsed: float
+    # None if every item was backed up to every server
+    error: Optional[str] = None
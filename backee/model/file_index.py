@@ -0,0 +1,17 @@
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass
+class FileIndexEntry(object):
+    path: str
+    size: int
+    mtime: float
+    inode: int
+    hash: Optional[str]
+    # "f" for files, "d" for directories and "l" for symlinks
+    type: str = "f"
+    # permission bits
+    mode: int = 0o644
+    # target of symlinks
+    target: Optional[str] = None
@@ -1,8 +1,10 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Tuple, Dict, Optional
 from abc import ABC, abstractmethod
 
+from backee.model.compression import CompressionPolicy
 from backee.model.db_connectors import DbConnector
+from backee.model.packing import PackingPolicy
 from backee.model.rotation_strategy import RotationStrategy
 
 
@@ -20,12 +22,31 @@ class BackupItem(ABC):
 class FilesBackupItem(BackupItem):
     includes: Tuple[str]
     excludes: Tuple[str]
+    compression: CompressionPolicy = field(default_factory=CompressionPolicy)
+    # files of at least this size are sent by a separate delta transfer stream,
+    # 0 sends all files in one stream
+    large_file_size: int = 64 * 1024 * 1024
+    packing: PackingPolicy = field(default_factory=PackingPolicy)
+    # SQLite databases matched by includes are sent as online backup copies
+    sqlite_snapshots: bool = True
+    # items with higher priority are backed up first
+    priority: int = 0
+    # run backing up the item, caches of its sources are kept for the run only
+    run: Optional[str] = field(default=None, compare=False, repr=False)
 
     @property
     def name(self):
         return "files"
 
 
+# database dumps staged locally, which are sent like files
+@dataclass
+class DumpsBackupItem(FilesBackupItem):
+    @property
+    def name(self):
+        return "databases"
+
+
 @dataclass
 class DatabaseBackupItem(BackupItem):
     connector: DbConnector
@@ -0,0 +1,10 @@
+from dataclasses import dataclass
+from typing import Tuple
+
+
+@dataclass
+class PackingPolicy(object):
+    # include paths, in which directories of small files are packed
+    paths: Tuple[str] = ()
+    # directories are packed only if all their files are smaller
+    max_file_size: int = 4 * 1024
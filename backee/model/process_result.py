@@ -0,0 +1,18 @@
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+
+@dataclass
+class ProcessResult(object):
+    exit_code: int
+    # last lines of the output
+    stdout: Tuple[str]
+    stderr: Tuple[str]
+    elapsed: float
+    # process was terminated, because output handler asked to stop
+    stopped: bool = False
+    # resource usage is not available if the process was reaped elsewhere
+    user_time: Optional[float] = None
+    system_time: Optional[float] = None
+    # bytes
+    max_rss: Optional[int] = None
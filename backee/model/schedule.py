@@ -0,0 +1,25 @@
+from dataclasses import dataclass
+from typing import FrozenSet, Tuple
+
+
+@dataclass
+class CronExpression(object):
+    expression: str
+    minutes: FrozenSet[int]
+    hours: FrozenSet[int]
+    days: FrozenSet[int]
+    months: FrozenSet[int]
+    # Monday is 0 like in `datetime.weekday`
+    weekdays: FrozenSet[int]
+    # like cron, a day matches either field if both are restricted
+    days_restricted: bool = False
+    weekdays_restricted: bool = False
+
+
+@dataclass
+class Schedule(object):
+    name: str
+    cron: CronExpression
+    # names of servers and items to back up, empty means all of them
+    servers: Tuple[str] = ()
+    items: Tuple[str] = ()
@@ -1,7 +1,9 @@
-from dataclasses import dataclass
-from typing import Optional
+from dataclasses import dataclass, field
+from typing import Optional, Tuple
 
+from backee.model.bandwidth import BandwidthWindow
 from backee.model.rotation_strategy import RotationStrategy
+from backee.model.transport_profile import TransportProfile
 
 
 @dataclass
@@ -17,3 +19,49 @@ class SshBackupServer(BackupServer):
     port: int
     username: str
     key_path: Optional[str]
+    index_hashes: bool = False
+    transport: TransportProfile = field(default_factory=TransportProfile)
+    bandwidth_schedule: Tuple[BandwidthWindow] = ()
+    # name of the ssh server, which sends its snapshots here instead of the source
+    replicate_from: Optional[str] = None
+
+
+@dataclass
+class SftpBackupServer(BackupServer):
+    location: str
+    hostname: str
+    port: int
+    username: str
+    key_path: Optional[str]
+    channels: int = 4
+    window_size: int = 32 * 1024 * 1024
+
+
+@dataclass
+class LocalBackupServer(BackupServer):
+    location: str
+    workers: int = 4
+    index_hashes: bool = False
+
+
+@dataclass
+class RepositoryBackupServer(BackupServer):
+    location: str
+    workers: int = 4
+    min_chunk_size: int = 256 * 1024
+    avg_chunk_size: int = 1024 * 1024
+    max_chunk_size: int = 4 * 1024 * 1024
+    pack_size: int = 16 * 1024 * 1024
+    compression_level: int = 3
+
+
+@dataclass
+class S3BackupServer(BackupServer):
+    location: str
+    endpoint: str
+    bucket: str
+    access_key: str
+    secret_key: str
+    region: str = "us-east-1"
+    part_size: int = 16 * 1024 * 1024
+    concurrency: int = 8
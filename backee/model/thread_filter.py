@@ -0,0 +1,29 @@
+import threading
+
+# separates name of the thread, that started a worker, from name of the worker
+WORKER_SEPARATOR = "/"
+
+
+def get_worker_name(name: str) -> str:
+    """
+    Return name for worker thread or thread pool {name} started by the current
+    thread, so log records of the worker are attributed to the current thread.
+    """
+    return threading.current_thread().name + WORKER_SEPARATOR + name
+
+
+class ThreadFilter(object):
+    def __init__(self, thread_name):
+        self.__thread_name = thread_name
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, ThreadFilter)
+            and self.__thread_name == other.__thread_name
+        )
+
+    def filter(self, record):
+        # workers started by the thread, directly or by other workers
+        return record.threadName == self.__thread_name or record.threadName.startswith(
+            self.__thread_name + WORKER_SEPARATOR
+        )
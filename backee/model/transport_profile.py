@@ -0,0 +1,12 @@
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass
+class TransportProfile(object):
+    ciphers: Optional[str] = None
+    macs: Optional[str] = None
+    compression: bool = True
+    compression_level: Optional[int] = None
+    whole_file: bool = False
+    socket_buffer_size: Optional[int] = None
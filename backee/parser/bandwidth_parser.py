@@ -0,0 +1,61 @@
+import datetime
+
+from typing import Any, Dict, List, Tuple, Union
+
+from backee.model.bandwidth import BandwidthWindow
+from backee.parser.size_parser import parse_size
+
+
+supported_days = {
+    "mon": 0,
+    "tue": 1,
+    "wed": 2,
+    "thu": 3,
+    "fri": 4,
+    "sat": 5,
+    "sun": 6,
+}
+
+
+def parse_time(value: Union[int, str]) -> datetime.time:
+    """
+    Parse time of day like 18:00.
+    """
+    # YAML 1.1 reads unquoted times like 18:00 as sexagesimal numbers,
+    # which are minutes since midnight
+    if isinstance(value, int):
+        hours, minutes = divmod(value, 60)
+        return datetime.time(hours % 24, minutes)
+    return datetime.time.fromisoformat(value)
+
+
+def __parse_days(days: List[str]) -> Tuple[int]:
+    result = []
+    for day in days:
+        day = day[:3].lower()
+        if day not in supported_days:
+            raise KeyError(f"Unknown day: '{day}'")
+        result.append(supported_days[day])
+    return tuple(sorted(set(result)))
+
+
+def parse_bandwidth_schedule(windows: List[Dict[str, Any]]) -> Tuple[BandwidthWindow]:
+    """
+    Parse list of time windows with bandwidth limits.
+    """
+    result = []
+    for window in windows:
+        limit = parse_size(window["limit"], default=None)
+        if limit <= 0:
+            raise ValueError(f"bandwidth limit must be positive: {window['limit']}")
+        result.append(
+            BandwidthWindow(
+                start=parse_time(window["from"]),
+                end=parse_time(window["to"]),
+                limit=limit,
+                days=__parse_days(window["days"])
+                if "days" in window
+                else tuple(range(7)),
+            )
+        )
+    return tuple(result)
@@ -1,14 +1,18 @@
 import os
 import yaml
 
-from typing import Dict, Any
+from typing import Dict, Any, Tuple
 
 from backee.parser.loggers_parser import parse_loggers
 from backee.parser.servers_parser import parse_servers
 from backee.parser.items_parser import parse_items
 from backee.parser.rotation_strategy_parser import parse_rotation_strategy
+from backee.parser.schedule_parser import parse_schedules
+from backee.parser.bandwidth_parser import parse_time
 
 from backee.model.config import Config
+from backee.model.schedule import Schedule
+from backee.model.servers import BackupServer, SshBackupServer
 
 
 def parse_config(filename: str) -> Config:
@@ -31,16 +35,44 @@ def parse_contents(contents: str) -> Config:
         data=yml_config.get("rotation_strategy")
     )
 
+    window_end = yml_config["settings"].get("window_end")
+
+    servers = parse_servers(
+        servers=yml_config.get("servers"), default_rs=rotation_strategy
+    )
+    schedules = parse_schedules(schedules=yml_config.get("schedule"))
+    __check_schedules(schedules, servers)
+
     return Config(
         name=name,
         loggers=parse_loggers(loggers=yml_config.get("loggers")),
-        backup_servers=parse_servers(
-            servers=yml_config.get("servers"), default_rs=rotation_strategy
-        ),
+        backup_servers=servers,
         backup_items=parse_items(items=yml_config.get("backup_items")),
+        schedules=schedules,
+        workers=yml_config["settings"].get("workers"),
+        items_per_server=yml_config["settings"].get("items_per_server", 1),
+        window_end=None if window_end is None else parse_time(window_end),
     )
 
 
+def __check_schedules(schedules: Tuple[Schedule], servers: Tuple[BackupServer]) -> None:
+    """
+    Reject schedules selecting replicas only, they are never backed up
+    directly, but get snapshots of the servers they replicate from.
+    """
+    replicas = {
+        x.name
+        for x in servers
+        if isinstance(x, SshBackupServer) and x.replicate_from is not None
+    }
+    for schedule in schedules:
+        if schedule.servers and set(schedule.servers) <= replicas:
+            raise ValueError(
+                f"schedule '{schedule.name}' selects replicas only, "
+                "select the servers they replicate from"
+            )
+
+
 def __replace_global_patters(
     config: Dict[str, Any], patterns: Dict[str, str]
 ) -> Dict[str, Any]:
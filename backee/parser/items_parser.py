@@ -11,8 +11,11 @@ from backee.model.items import (
     DockerDataVolumesBackupItem,
 )
 from backee.model.rotation_strategy import RotationStrategy
+from backee.model.compression import CompressionPolicy
+from backee.model.packing import PackingPolicy
 
 from backee.parser.rotation_strategy_parser import parse_rotation_strategy
+from backee.parser.size_parser import parse_size
 
 
 log = logging.getLogger(__name__)
@@ -34,6 +37,34 @@ def __parse_files(item: Dict[str, Any]) -> FilesBackupItem:
         rotation_strategy=parse_rotation_strategy(item["rotation_strategy"])
         if "rotation_strategy" in item
         else None,
+        compression=__parse_compression(item.get("compression", {})),
+        large_file_size=parse_size(
+            item.get("large_file_size"), default=64 * 1024 * 1024
+        ),
+        packing=__parse_packing(item.get("packing", {})),
+        sqlite_snapshots=item.get("sqlite_snapshots", True),
+        priority=int(item.get("priority", 0)),
+    )
+
+
+def __parse_compression(item: Dict[str, Any]) -> CompressionPolicy:
+    policy = CompressionPolicy()
+    skip_compress = tuple(item.get("skip_compress", policy.skip_compress))
+    skip_compress += tuple(item.get("skip_compress_extra", ()))
+    return CompressionPolicy(
+        skip_compress=skip_compress,
+        detect_incompressible=item.get(
+            "detect_incompressible", policy.detect_incompressible
+        ),
+        sample_size=parse_size(item.get("sample_size"), default=policy.sample_size),
+        auto_level=item.get("auto_level", policy.auto_level),
+    )
+
+
+def __parse_packing(item: Dict[str, Any]) -> PackingPolicy:
+    return PackingPolicy(
+        paths=tuple(os.path.expanduser(x) for x in item.get("paths", ())),
+        max_file_size=parse_size(item.get("max_file_size"), default=4 * 1024),
     )
 
 
@@ -2,10 +2,11 @@ import os
 import logging
 from logging import handlers
 
-from typing import Optional, Union, Tuple, Dict, Any
+from typing import Tuple, Dict, Any
 
 from backee.model.web_handler import WebHandler
 from backee.model.max_level_filter import MaxLevelFilter
+from backee.parser.size_parser import parse_size
 
 
 def __get_log_level(log_level_string: str) -> int:
@@ -35,7 +36,7 @@ def __parse_file_logger(logger: Dict[str, Any]) -> logging.Handler:
     max_log_level = logging.CRITICAL if max_log_level is None else max_log_level
 
     log_file_path = logger["file"]
-    max_size = __parse_file_size(logger.get("max_size"))
+    max_size = parse_size(logger.get("max_size"), default=1 * 1024 * 1024)
     backup_count = logger.get("backup_count", 0)
     formatter = logger.get(
         "format",
@@ -57,33 +58,6 @@ def __parse_file_logger(logger: Dict[str, Any]) -> logging.Handler:
     return filelog
 
 
-def __parse_file_size(file_size: Optional[Union[int, str]]) -> int:
-    """
-    Parse file size, that can be just integer for bytes, or have suffixes
-    like b, k, m, g.
-    """
-    if file_size is None:
-        return 1 * 1024 * 1024
-
-    if isinstance(file_size, int):
-        return file_size
-
-    suffixes = {"b": 1, "k": 2**10, "m": 2**20, "g": 2**30}
-
-    # get numbers in from
-    num = ""
-    multiplier = 1
-    for s in file_size:
-        if s.isdigit():
-            num += s
-        elif s in suffixes and len(num) > 0:
-            multiplier = suffixes[s]
-        else:
-            raise ValueError(f"file size {file_size} not supported")
-
-    return int(num) * multiplier
-
-
 def __parse_web_logger(logger: Dict[str, Any]) -> logging.Handler:
     min_log_level = __get_log_level(logger.get("min_level"))
     min_log_level = logging.DEBUG if min_log_level is None else min_log_level
@@ -116,6 +90,6 @@ def __parse_logger(loggers: Dict[str, Any]) -> logging.Handler:
 
 def parse_loggers(loggers: Tuple[Dict[str, Any]]) -> Tuple[logging.Handler]:
     if loggers is None:
-        return ((),)
+        return ()
 
     return tuple(__parse_logger(x) for x in loggers)
@@ -0,0 +1,88 @@
+from typing import Any, Dict, List, FrozenSet, Tuple
+
+from backee.model.schedule import CronExpression, Schedule
+
+
+supported_macros = {
+    "@yearly": "0 0 1 1 *",
+    "@annually": "0 0 1 1 *",
+    "@monthly": "0 0 1 * *",
+    "@weekly": "0 0 * * 0",
+    "@daily": "0 0 * * *",
+    "@midnight": "0 0 * * *",
+    "@hourly": "0 * * * *",
+}
+
+
+def __parse_field(value: str, first: int, last: int) -> Tuple[FrozenSet[int], bool]:
+    """
+    Parse comma separated values, ranges and steps of a cron field.
+
+    Returns:
+      (matching values, whether the field is restricted)
+    """
+    result = set()
+    for part in value.split(","):
+        values, _, step = part.partition("/")
+        step = int(step) if step else 1
+        if step <= 0:
+            raise ValueError(f"cron step must be positive: '{part}'")
+
+        if values == "*":
+            start, end = first, last
+        elif "-" in values:
+            start, end = (int(x) for x in values.split("-", 1))
+        else:
+            start = int(values)
+            end = last if "/" in part else start
+        if not first <= start <= end <= last:
+            raise ValueError(f"cron field out of range {first}-{last}: '{part}'")
+        result.update(range(start, end + 1, step))
+    return frozenset(result), value != "*"
+
+
+def parse_cron(expression: str) -> CronExpression:
+    """
+    Parse cron expression with minute, hour, day of month, month
+    and day of week fields or one of @hourly, @daily, ... macros.
+    """
+    fields = supported_macros.get(expression.strip(), expression).split()
+    if len(fields) != 5:
+        raise ValueError(f"cron expression must have 5 fields: '{expression}'")
+
+    days, days_restricted = __parse_field(fields[2], 1, 31)
+    # Sunday is either 0 or 7
+    weekdays, weekdays_restricted = __parse_field(fields[4], 0, 7)
+    return CronExpression(
+        expression=expression,
+        minutes=__parse_field(fields[0], 0, 59)[0],
+        hours=__parse_field(fields[1], 0, 23)[0],
+        days=days,
+        months=__parse_field(fields[3], 1, 12)[0],
+        weekdays=frozenset((x - 1) % 7 for x in weekdays),
+        days_restricted=days_restricted,
+        weekdays_restricted=weekdays_restricted,
+    )
+
+
+def parse_schedules(schedules: List[Dict[str, Any]]) -> Tuple[Schedule]:
+    """
+    Parse list of cron schedules of the daemon.
+    """
+    result = []
+    for schedule in schedules or ():
+        cron = parse_cron(str(schedule["cron"]))
+        result.append(
+            Schedule(
+                name=schedule.get("name", cron.expression),
+                cron=cron,
+                servers=tuple(schedule.get("servers", ())),
+                items=tuple(schedule.get("items", ())),
+            )
+        )
+
+    names = [x.name for x in result]
+    for name in names:
+        if names.count(name) > 1:
+            raise ValueError(f"schedule names must be unique: '{name}'")
+    return tuple(result)
@@ -1,9 +1,19 @@
 from typing import Tuple, Dict, Any
 
-from backee.model.servers import BackupServer, SshBackupServer
+from backee.model.servers import (
+    BackupServer,
+    SshBackupServer,
+    SftpBackupServer,
+    LocalBackupServer,
+    RepositoryBackupServer,
+    S3BackupServer,
+)
 from backee.model.rotation_strategy import RotationStrategy
 
+from backee.parser.bandwidth_parser import parse_bandwidth_schedule
 from backee.parser.rotation_strategy_parser import parse_rotation_strategy
+from backee.parser.size_parser import parse_size
+from backee.parser.transport_profile_parser import parse_transport_profile
 
 
 def __parse_ssh_server(
@@ -16,6 +26,74 @@ def __parse_ssh_server(
         port=server["connection"].get("port", 22),
         username=server["connection"].get("username", None),
         key_path=server["connection"].get("key", None),
+        index_hashes=server.get("index_hashes", False),
+        transport=parse_transport_profile(server.get("transport", "default")),
+        bandwidth_schedule=parse_bandwidth_schedule(
+            server.get("bandwidth_schedule", ())
+        ),
+        replicate_from=server.get("replicate_from"),
+        rotation_strategy=rotation_strategy,
+    )
+
+
+def __parse_sftp_server(
+    server: Dict[str, Any], rotation_strategy: RotationStrategy
+) -> BackupServer:
+    return SftpBackupServer(
+        name=server["name"],
+        location=server["location"],
+        hostname=server["connection"]["host"],
+        port=server["connection"].get("port", 22),
+        username=server["connection"].get("username", None),
+        key_path=server["connection"].get("key", None),
+        channels=server.get("channels", 4),
+        window_size=parse_size(server.get("window_size"), default=32 * 1024 * 1024),
+        rotation_strategy=rotation_strategy,
+    )
+
+
+def __parse_local_server(
+    server: Dict[str, Any], rotation_strategy: RotationStrategy
+) -> BackupServer:
+    return LocalBackupServer(
+        name=server["name"],
+        location=server["location"],
+        workers=server.get("workers", 4),
+        index_hashes=server.get("index_hashes", False),
+        rotation_strategy=rotation_strategy,
+    )
+
+
+def __parse_repository_server(
+    server: Dict[str, Any], rotation_strategy: RotationStrategy
+) -> BackupServer:
+    chunks = server.get("chunks", {})
+    return RepositoryBackupServer(
+        name=server["name"],
+        location=server["location"],
+        workers=server.get("workers", 4),
+        min_chunk_size=parse_size(chunks.get("min_size"), default=256 * 1024),
+        avg_chunk_size=parse_size(chunks.get("avg_size"), default=1024 * 1024),
+        max_chunk_size=parse_size(chunks.get("max_size"), default=4 * 1024 * 1024),
+        pack_size=parse_size(server.get("pack_size"), default=16 * 1024 * 1024),
+        compression_level=server.get("compression_level", 3),
+        rotation_strategy=rotation_strategy,
+    )
+
+
+def __parse_s3_server(
+    server: Dict[str, Any], rotation_strategy: RotationStrategy
+) -> BackupServer:
+    return S3BackupServer(
+        name=server["name"],
+        location=server["location"],
+        endpoint=server["connection"]["endpoint"],
+        bucket=server["connection"]["bucket"],
+        region=server["connection"].get("region", "us-east-1"),
+        access_key=server["connection"]["access_key"],
+        secret_key=server["connection"]["secret_key"],
+        part_size=parse_size(server.get("part_size"), default=16 * 1024 * 1024),
+        concurrency=server.get("concurrency", 8),
         rotation_strategy=rotation_strategy,
     )
 
@@ -23,7 +101,13 @@ def __parse_ssh_server(
 def __parse_server(
     server: Dict[str, Any], default_rs: RotationStrategy
 ) -> BackupServer:
-    supported_servers = {"ssh": __parse_ssh_server}
+    supported_servers = {
+        "ssh": __parse_ssh_server,
+        "sftp": __parse_sftp_server,
+        "local": __parse_local_server,
+        "repository": __parse_repository_server,
+        "s3": __parse_s3_server,
+    }
 
     server_type = server["type"]
     if server_type not in supported_servers:
@@ -44,4 +128,22 @@ def parse_servers(
     if servers is None:
         return ((),)
 
-    return tuple(__parse_server(x, default_rs) for x in servers)
+    parsed = tuple(__parse_server(x, default_rs) for x in servers)
+    __check_replicas(parsed)
+    return parsed
+
+
+def __check_replicas(servers: Tuple[BackupServer]) -> None:
+    primaries = {
+        x.name
+        for x in servers
+        if isinstance(x, SshBackupServer) and x.replicate_from is None
+    }
+    for server in servers:
+        if not isinstance(server, SshBackupServer) or server.replicate_from is None:
+            continue
+        if server.replicate_from not in primaries:
+            raise KeyError(
+                f"{server.name} replicates from unknown ssh server: "
+                f"'{server.replicate_from}'"
+            )
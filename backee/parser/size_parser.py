@@ -0,0 +1,28 @@
+from typing import Optional, Union
+
+
+def parse_size(size: Optional[Union[int, str]], default: int) -> int:
+    """
+    Parse size, that can be just integer for bytes, or have suffixes
+    like b, k, m, g.
+    """
+    if size is None:
+        return default
+
+    if isinstance(size, int):
+        return size
+
+    suffixes = {"b": 1, "k": 2**10, "m": 2**20, "g": 2**30}
+
+    # get numbers in from
+    num = ""
+    multiplier = 1
+    for s in size:
+        if s.isdigit():
+            num += s
+        elif s in suffixes and len(num) > 0:
+            multiplier = suffixes[s]
+        else:
+            raise ValueError(f"size {size} not supported")
+
+    return int(num) * multiplier
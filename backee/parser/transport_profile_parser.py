@@ -0,0 +1,50 @@
+import dataclasses
+
+from typing import Any, Dict, Union
+
+from backee.model.transport_profile import TransportProfile
+from backee.parser.size_parser import parse_size
+
+
+supported_presets = {
+    "default": TransportProfile(),
+    # fast link, CPU is the bottleneck: AES-GCM is hardware accelerated
+    # and needs no separate MAC, compression and delta transfer only cost time
+    "lan": TransportProfile(
+        ciphers="aes128-gcm@openssh.com,chacha20-poly1305@openssh.com",
+        compression=False,
+        whole_file=True,
+    ),
+    # slow link with long round trips: cheap compression and large buffers
+    "wan": TransportProfile(
+        ciphers="chacha20-poly1305@openssh.com,aes128-gcm@openssh.com",
+        compression=True,
+        compression_level=1,
+        socket_buffer_size=4 * 1024 * 1024,
+    ),
+}
+
+
+def parse_transport_profile(data: Union[str, Dict[str, Any]]) -> TransportProfile:
+    """
+    Parse transport profile given as a preset name or as a dictionary
+    with optional preset and values overwriting it.
+    """
+    if isinstance(data, str):
+        data = {"preset": data}
+
+    preset = data.get("preset", "default")
+    if preset not in supported_presets:
+        raise KeyError(f"Unknown transport preset: '{preset}'")
+
+    profile = supported_presets[preset]
+    values = {
+        k: data[k]
+        for k in ("ciphers", "macs", "compression", "compression_level", "whole_file")
+        if k in data
+    }
+    if "socket_buffer_size" in data:
+        values["socket_buffer_size"] = parse_size(
+            data["socket_buffer_size"], default=None
+        )
+    return dataclasses.replace(profile, **values)
@@ -1,5 +1,9 @@
+import os
+import time
 import unittest
+import threading
 from unittest import mock
+from concurrent.futures import Future
 from datetime import datetime, date
 from dateutil.relativedelta import relativedelta
 
@@ -7,6 +11,8 @@ from backee.backup import backup
 from backee.backup.transmitter import SshTransmitter, Transmitter
 from backee.model.rotation_strategy import RotationStrategy
 from backee.model.items import FilesBackupItem
+from backee.model.servers import LocalBackupServer, SshBackupServer
+from backee.model.backup_task import BackupTask
 
 
 class BackupTestCase(unittest.TestCase):
@@ -322,5 +328,294 @@ class BackupTestCase(unittest.TestCase):
         )
 
 
+class BackupSchedulingTestCase(unittest.TestCase):
+    """
+    Tests for scheduling of items and servers in `backee/backup/backup.py`.
+    """
+
+    def setUp(self):
+        self.servers = tuple(
+            LocalBackupServer(name=x, rotation_strategy=None, location="/backups")
+            for x in ("a", "b")
+        )
+
+    @mock.patch("backee.backup.durations.load_duration")
+    def test_longest_backups_planned_first(self, load_duration):
+        load_duration.side_effect = lambda _, s, __: {"a": 1, "b": 10}[s]
+        items = (self.__create_item(), self.__create_item(priority=1))
+
+        tasks = backup._plan_tasks("test", items, self.servers, {})
+
+        self.assertEqual(
+            [("b", 1), ("a", 1), ("b", 0), ("a", 0)],
+            [(x.server.name, x.item.priority) for x in tasks],
+        )
+
+    def test_expected_makespan(self):
+        tasks = [
+            self.__create_task("a", 10),
+            self.__create_task("a", 4),
+            self.__create_task("b", 3),
+            self.__create_task("b", 3),
+        ]
+
+        # one backup per server, b waits for nothing
+        self.assertEqual(14, backup._get_expected_makespan(tasks, 4, 1))
+        # a runs both of its backups at once
+        self.assertEqual(10, backup._get_expected_makespan(tasks, 4, 2))
+        # a single worker runs everything in turn
+        self.assertEqual(20, backup._get_expected_makespan(tasks, 1, 2))
+
+    def test_servers_not_overloaded(self):
+        tasks = [self.__create_task("a", 3 - i) for i in range(3)]
+        tasks.append(self.__create_task("b", 0))
+        lock = threading.Lock()
+        running = []
+        started = []
+        peak = 0
+
+        def run(task: BackupTask) -> bool:
+            nonlocal peak
+            with lock:
+                started.append(task)
+                running.append(task.server.name)
+                peak = max(peak, running.count("a"))
+            time.sleep(0.05)
+            with lock:
+                running.remove(task.server.name)
+            return True
+
+        self.assertEqual([], backup._run_tasks(tasks, 3, 1, run))
+
+        self.assertEqual(1, peak, msg="server got several backups at once")
+        # b is started, while the first backup of a runs
+        self.assertEqual([tasks[0], tasks[3], tasks[1], tasks[2]], started)
+
+    def test_no_backups_started_after_failure(self):
+        tasks = [self.__create_task("a", 3 - i) for i in range(3)]
+        started = []
+
+        def run(task: BackupTask) -> None:
+            started.append(task)
+            raise OSError("failed")
+
+        with self.assertRaises(OSError):
+            backup._run_tasks(tasks, 2, 1, run)
+        self.assertEqual([tasks[0]], started)
+
+    def test_backups_not_fitting_deferred(self):
+        urgent = self.__create_task("a", 100, priority=1)
+        short = self.__create_task("a", 10)
+        long = self.__create_task("b", 100)
+        started = []
+
+        def run(task: BackupTask) -> bool:
+            started.append(task)
+            return task is not urgent
+
+        deferred = backup._run_tasks(
+            [urgent, long, short], 1, 1, run, deadline_time=1050, clock=lambda: 1000
+        )
+
+        # urgent backups run anyway and are stopped at the deadline
+        self.assertEqual([urgent, short], started)
+        self.assertCountEqual([urgent, long], deferred)
+
+    def test_nothing_started_after_deadline(self):
+        tasks = [self.__create_task("a", 0, priority=1)]
+
+        deferred = backup._run_tasks(
+            tasks, 1, 1, None, deadline_time=1000, clock=lambda: 1000
+        )
+
+        self.assertEqual(tasks, deferred)
+
+    @mock.patch("backee.backup.backup.LOCK_POLL_INTERVAL", 0.01)
+    def test_servers_used_by_other_runs_waited_for(self):
+        locks = {x.name: threading.Lock() for x in self.servers}
+        # a is used by another run, which finishes while b is backed up
+        locks["a"].acquire()
+        tasks = [self.__create_task("a", 2), self.__create_task("b", 1)]
+        started = []
+        unlocked = []
+
+        def run(task: BackupTask) -> bool:
+            started.append(task)
+            self.assertTrue(locks[task.server.name].locked())
+            if task.server.name == "b":
+                locks["a"].release()
+            return True
+
+        def unlock(server) -> None:
+            unlocked.append(server.name)
+            locks[server.name].release()
+
+        deferred = backup._run_tasks(
+            tasks,
+            1,
+            1,
+            run,
+            try_lock=lambda x: locks[x.name].acquire(blocking=False),
+            unlock=unlock,
+        )
+
+        self.assertEqual([], deferred)
+        self.assertEqual([tasks[1], tasks[0]], started)
+        self.assertEqual(["b", "a"], unlocked)
+        self.assertFalse(any(x.locked() for x in locks.values()))
+
+    def test_latest_checkpoint_found(self):
+        transmitter = mock.Mock()
+        transmitter.get_backup_names_sorted.return_value = (
+            "/files/backup_2024-03-01-02-00",
+            "/files/backup_2024-03-02-02-00-task-incomplete",
+            "/files/backup_2024-03-03-02-00-task-incomplete",
+        )
+
+        self.assertEqual(
+            "/files/backup_2024-03-03-02-00-task-incomplete",
+            backup._find_checkpoint(transmitter, "/files/", "-task-incomplete"),
+        )
+
+        transmitter.get_backup_names_sorted.return_value = ("",)
+        self.assertIsNone(
+            backup._find_checkpoint(transmitter, "/files/", "-task-incomplete")
+        )
+
+    def test_checkpoint_of_other_task_removed(self):
+        item = self.__create_item()
+        other = self.__create_item()
+        other.excludes = ("/tmp",)
+        self.assertNotEqual(
+            backup._get_temp_dir_suffix(item), backup._get_temp_dir_suffix(other)
+        )
+
+        checkpoint = "/files/backup_2024-03-02-02-00" + backup._get_temp_dir_suffix(
+            other
+        )
+        transmitter = mock.Mock()
+        transmitter.get_backup_names_sorted.return_value = (
+            "/files/backup_2024-03-01-02-00",
+            checkpoint,
+        )
+
+        self.assertIsNone(
+            backup._find_checkpoint(
+                transmitter, "/files/", backup._get_temp_dir_suffix(item)
+            )
+        )
+        transmitter.remove_remote_dirs.assert_called_once_with((checkpoint,))
+
+    @mock.patch.dict("os.environ", {"XDG_CACHE_HOME": "/nonexistent"})
+    @mock.patch("backee.backup.durations.record_duration", mock.Mock())
+    @mock.patch("backee.backup.backup._create_index", mock.Mock())
+    @mock.patch("backee.backup.lease.Lease", mock.MagicMock())
+    def test_verification_overlaps_next_transfer(self):
+        transferred = threading.Event()
+        transmitters = {}
+        for server in self.servers:
+            transmitter = mock.Mock()
+            transmitter.get_backup_names_sorted.return_value = ()
+            transmitter.get_transfer_file_size.return_value = 0
+            transmitter.get_disk_space_available.return_value = 1
+            transmitters[server.name] = transmitter
+        locks = {x.name: threading.Lock() for x in self.servers}
+        # a single worker transfers to b, while a is being verified
+        transmitters["a"].verify_backup.side_effect = lambda *_: (
+            locks["a"].locked() and transferred.wait(5)
+        )
+        transmitters["b"].transmit.side_effect = lambda *_: transferred.set()
+        transmitters["b"].verify_backup.return_value = False
+
+        with self.assertLogs("backee.backup.backup") as logs:
+            backup.backup(
+                "test",
+                (self.__create_item(),),
+                self.servers,
+                get_transmitter=lambda x: transmitters[x.name],
+                workers=1,
+                get_server_lock=lambda x: locks[x.name],
+            )
+
+        self.assertTrue(transferred.is_set())
+        self.assertFalse(any(x.locked() for x in locks.values()))
+        results = [x for x in logs.output if "finished" in x or "differ" in x]
+        self.assertIn("files to a finished", results[0])
+        self.assertIn("files to b items differ", results[1])
+
+    @mock.patch.dict("os.environ", {"XDG_CACHE_HOME": "/nonexistent"})
+    @mock.patch("backee.backup.durations.record_duration", mock.Mock())
+    @mock.patch("backee.backup.backup._create_index", mock.Mock())
+    @mock.patch("backee.backup.lease.Lease", mock.MagicMock())
+    def test_snapshot_replicated_by_primary(self):
+        primary, replica = (
+            SshBackupServer(
+                name=x,
+                rotation_strategy=RotationStrategy(0, 0, 0),
+                location=f"/{x}",
+                hostname=x,
+                port=22,
+                username=None,
+                key_path=None,
+                replicate_from=None if x == "primary" else "primary",
+            )
+            for x in ("primary", "replica")
+        )
+        transmitters = {}
+        for server in (primary, replica):
+            transmitter = mock.Mock()
+            transmitter.get_backup_names_sorted.return_value = ()
+            transmitter.get_transfer_file_size.return_value = 0
+            transmitter.get_disk_space_available.return_value = 1
+            transmitters[server.name] = transmitter
+        transmitters["replica"].is_remote_dir_exist.return_value = False
+
+        backup.backup(
+            "test",
+            (self.__create_item(),),
+            (primary, replica),
+            get_transmitter=lambda x: transmitters[x.name],
+        )
+
+        transmitters["replica"].transmit.assert_not_called()
+        snapshot = transmitters["primary"].rename_dir.call_args[0][1]
+        name = os.path.basename(snapshot.rstrip("/"))
+        transmitters["primary"].replicate.assert_called_once_with(
+            snapshot, replica, f"/replica/files/{name}-incomplete/", None
+        )
+        transmitters["replica"].rename_dir.assert_called_once_with(
+            f"/replica/files/{name}-incomplete/", f"/replica/files/{name}/"
+        )
+        transmitters["replica"].recreate_links_dir.assert_called_once_with(
+            f"/replica/files/{name}/", "/replica/files/current"
+        )
+
+    def test_first_background_error_raised(self):
+        tasks = [self.__create_task("a", 2), self.__create_task("b", 1)]
+        failed = Future()
+        failed.set_exception(OSError("rotation failed"))
+        verified = Future()
+        verified.set_result(True)
+
+        with self.assertRaises(OSError), self.assertLogs(
+            "backee.backup.backup"
+        ) as logs:
+            backup._report_finished(tasks, [(tasks[1], verified), (tasks[0], failed)])
+
+        self.assertIn("files to a failed", logs.output[0])
+        self.assertIn("files to b finished", logs.output[1])
+
+    def __create_item(self, priority: int = 0) -> FilesBackupItem:
+        return FilesBackupItem(
+            rotation_strategy=None, includes=("/a",), excludes=(), priority=priority
+        )
+
+    def __create_task(
+        self, server_name: str, expected: float, priority: int = 0
+    ) -> BackupTask:
+        server = next(x for x in self.servers if x.name == server_name)
+        return BackupTask(server, self.__create_item(priority), expected)
+
+
 if __name__ == "__main__":
     unittest.main()
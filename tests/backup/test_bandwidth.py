@@ -0,0 +1,113 @@
+import time
+import datetime
+import threading
+import subprocess
+import unittest
+
+from backee.backup import bandwidth
+from backee.model.bandwidth import BandwidthWindow
+
+
+class BandwidthTestCase(unittest.TestCase):
+    """
+    Tests for `backee/backup/bandwidth.py`.
+    """
+
+    def setUp(self):
+        self.schedule = (
+            BandwidthWindow(
+                start=datetime.time(8),
+                end=datetime.time(18),
+                limit=1000,
+                days=(0, 1, 2, 3, 4),
+            ),
+            BandwidthWindow(start=datetime.time(22), end=datetime.time(6), limit=50),
+        )
+
+    def test_scheduled_limit(self):
+        def limit(day: int, hour: int):
+            # 2024-01-01 is Monday
+            now = datetime.datetime(2024, 1, day, hour, 30)
+            return bandwidth.get_scheduled_limit(self.schedule, now)
+
+        self.assertEqual(1000, limit(1, 8))
+        self.assertEqual(1000, limit(5, 17))
+        self.assertIsNone(limit(6, 12))
+        self.assertIsNone(limit(1, 18))
+        self.assertEqual(50, limit(1, 23))
+        self.assertEqual(50, limit(2, 5))
+        self.assertIsNone(limit(2, 6))
+
+    def test_limit_shared_by_transfers(self):
+        now = datetime.datetime(2024, 1, 1, 12)
+        limiter = bandwidth.BandwidthLimiter(self.schedule, clock=lambda: now)
+
+        with limiter.transfer():
+            self.assertEqual(1000, limiter.get_limit())
+            with limiter.transfer():
+                self.assertEqual(500, limiter.get_limit())
+                self.assertTrue(limiter.wait_for_change(1000, timeout=0))
+                self.assertFalse(limiter.wait_for_change(500, timeout=0))
+                # small changes do not restart transfers
+                self.assertFalse(limiter.wait_for_change(450, timeout=0))
+
+        now = datetime.datetime(2024, 1, 1, 19)
+        with limiter.transfer():
+            self.assertIsNone(limiter.get_limit())
+
+    def test_transfer_terminated_on_change(self):
+        now = datetime.datetime(2024, 1, 1, 12)
+        limiter = bandwidth.BandwidthLimiter(self.schedule, clock=lambda: now)
+
+        with limiter.transfer():
+            with subprocess.Popen(["sleep", "60"]) as proc:
+                changed = threading.Event()
+                watcher = threading.Thread(
+                    target=limiter.watch,
+                    args=(proc, 1000, changed, threading.Event()),
+                )
+                watcher.start()
+
+                # another transfer halves the limit
+                with limiter.transfer():
+                    watcher.join(timeout=10)
+
+                self.assertTrue(changed.is_set())
+                self.assertIsNotNone(proc.wait(timeout=10))
+
+    def test_finished_transfer_not_terminated(self):
+        limiter = bandwidth.BandwidthLimiter(self.schedule)
+        changed = threading.Event()
+
+        with subprocess.Popen(["true"]) as proc:
+            proc.wait()
+            limiter.watch(
+                proc, limiter.get_limit(), changed, threading.Event(), poll_interval=0
+            )
+
+        self.assertFalse(changed.is_set())
+        self.assertEqual(0, proc.returncode)
+
+    def test_watcher_woken_when_transfer_finishes(self):
+        limiter = bandwidth.BandwidthLimiter(self.schedule)
+        changed = threading.Event()
+        finished = threading.Event()
+
+        with subprocess.Popen(["true"]) as proc:
+            watcher = threading.Thread(
+                target=limiter.watch,
+                args=(proc, limiter.get_limit(), changed, finished),
+            )
+            watcher.start()
+            proc.wait()
+            started = time.monotonic()
+            limiter.finish(finished)
+            watcher.join(timeout=10)
+
+        self.assertFalse(watcher.is_alive())
+        self.assertLess(time.monotonic() - started, bandwidth.POLL_INTERVAL)
+        self.assertFalse(changed.is_set())
+
+
+if __name__ == "__main__":
+    unittest.main()
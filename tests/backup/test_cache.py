@@ -0,0 +1,50 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from backee.backup import cache
+
+
+class CacheTestCase(unittest.TestCase):
+    """
+    Tests for `backee/backup/cache.py`.
+    """
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+
+    @mock.patch.dict("os.environ", {})
+    def test_cache_dir(self):
+        os.environ["XDG_CACHE_HOME"] = self.root
+        self.assertEqual(
+            os.path.join(self.root, "backee", "a", "b"), cache.get_cache_dir("a", "b")
+        )
+
+        del os.environ["XDG_CACHE_HOME"]
+        self.assertEqual(
+            os.path.join(os.path.expanduser("~"), ".cache", "backee"),
+            cache.get_cache_dir(),
+        )
+
+    def test_history_trimmed(self):
+        path = os.path.join(self.root, "history", "host")
+        self.assertEqual([], cache.read_history(path))
+
+        for value in (1, 2, 3.5):
+            cache.record_history(path, value, 2)
+
+        self.assertEqual([2, 3.5], cache.read_history(path))
+
+    def test_broken_history_ignored(self):
+        path = os.path.join(self.root, "host")
+        for data in ("broken", "{}", '["x"]', "1"):
+            with open(path, "w") as f:
+                f.write(data)
+            self.assertEqual([], cache.read_history(path))
+
+
+if __name__ == "__main__":
+    unittest.main()
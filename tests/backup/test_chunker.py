@@ -0,0 +1,51 @@
+import io
+import random
+import unittest
+
+from backee.backup.chunker import Chunker
+
+
+class ChunkerTestCase(unittest.TestCase):
+    """
+    Tests for `backee/backup/chunker.py`.
+    """
+
+    def setUp(self):
+        self.data = (
+            random.Random(1).getrandbits(8 * 2**20).to_bytes(2**20, "little")
+        )
+        self.chunker = Chunker(
+            min_size=4 * 1024, avg_size=16 * 1024, max_size=64 * 1024
+        )
+
+    def test_chunk_sizes(self):
+        chunks = list(self.chunker.chunks(io.BytesIO(self.data), read_size=1000))
+
+        self.assertEqual(self.data, b"".join(chunks))
+        self.assertTrue(all(4 * 1024 <= len(x) <= 64 * 1024 for x in chunks[:-1]))
+        self.assertLess(len(chunks), len(self.data) // (4 * 1024))
+        self.assertGreater(len(chunks), len(self.data) // (64 * 1024))
+
+    def test_boundaries_resynchronize_after_insert(self):
+        """
+        Only chunks around inserted data change.
+        """
+        chunks = list(self.chunker.chunks(io.BytesIO(self.data)))
+        changed = self.data[:300000] + b"inserted" + self.data[300000:]
+        changed_chunks = list(self.chunker.chunks(io.BytesIO(changed)))
+
+        self.assertLessEqual(len(set(changed_chunks) - set(chunks)), 2)
+
+    def test_low_entropy_data_cut_at_max_size(self):
+        chunks = list(self.chunker.chunks(io.BytesIO(bytes(200 * 1024))))
+
+        self.assertEqual([64 * 1024] * 3 + [8 * 1024], [len(x) for x in chunks])
+        self.assertEqual([], list(self.chunker.chunks(io.BytesIO(b""))))
+
+    def test_invalid_sizes(self):
+        with self.assertRaises(ValueError):
+            Chunker(min_size=16, avg_size=8, max_size=32)
+
+
+if __name__ == "__main__":
+    unittest.main()
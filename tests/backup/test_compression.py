@@ -0,0 +1,122 @@
+import os
+import random
+import tempfile
+import unittest
+from unittest import mock
+
+from backee.backup import compression
+from backee.model.compression import CompressionPolicy
+from backee.model.items import FilesBackupItem
+from backee.model.transport_profile import TransportProfile
+
+
+class CompressionTestCase(unittest.TestCase):
+    """
+    Tests for `backee/backup/compression.py`.
+    """
+
+    def setUp(self):
+        self.__temp_dir = tempfile.TemporaryDirectory()
+        self.root = self.__temp_dir.name
+        noise = random.Random(1).getrandbits(8 * 100000).to_bytes(100000, "little")
+        self.__write("photo.jpg", noise)
+        self.__write("archive.bin", noise)
+        self.__write("other.bin", noise[::-1])
+        self.__write("notes.txt", b"backee backs up files\n" * 5000)
+
+    def tearDown(self):
+        self.__temp_dir.cleanup()
+
+    def test_incompressible_suffixes_detected(self):
+        item = self.__create_item(
+            CompressionPolicy(skip_compress=("JPG",), detect_incompressible=True)
+        )
+
+        profile, skip_compress = compression.plan_compression(
+            item, TransportProfile(), None
+        )
+
+        self.assertEqual(TransportProfile(), profile)
+        self.assertEqual(("jpg", "bin"), skip_compress)
+
+    def test_sampling_stops_after_visited_entries(self):
+        item = self.__create_item(CompressionPolicy(detect_incompressible=True))
+
+        # only the included directory is visited, no file is sampled
+        with mock.patch.object(compression, "MAX_VISITED_ENTRIES", 1):
+            _, skip_compress = compression.plan_compression(
+                item, TransportProfile(), None
+            )
+
+        self.assertEqual(CompressionPolicy().skip_compress, skip_compress)
+
+    def test_nothing_skipped_without_compression(self):
+        item = self.__create_item(CompressionPolicy(detect_incompressible=True))
+        profile = TransportProfile(compression=False)
+
+        self.assertEqual(
+            (profile, ()), compression.plan_compression(item, profile, 1024)
+        )
+
+    def test_level_picked_from_link_throughput(self):
+        item = self.__create_item(CompressionPolicy())
+
+        # compression is always slower than a 100 GiB/s link
+        profile, _ = compression.plan_compression(
+            item, TransportProfile(), 100 * 2**30
+        )
+        self.assertEqual(
+            TransportProfile(compression=False, compression_level=None), profile
+        )
+
+        # and worth its cost on a 1 KiB/s one
+        profile, _ = compression.plan_compression(item, TransportProfile(), 1024)
+        self.assertTrue(profile.compression)
+        self.assertIn(profile.compression_level, compression.COMPRESSION_LEVELS)
+
+        # explicit level is kept
+        profile = TransportProfile(compression_level=4)
+        self.assertEqual(
+            profile, compression.plan_compression(item, profile, 100 * 2**30)[0]
+        )
+
+    def test_pick_compression_level(self):
+        measurements = ((1, 100.0, 0.5), (9, 10.0, 0.3))
+
+        self.assertIsNone(compression.pick_compression_level(200, measurements))
+        self.assertEqual(1, compression.pick_compression_level(60, measurements))
+        self.assertEqual(9, compression.pick_compression_level(2, measurements))
+
+    @mock.patch.dict("os.environ", {})
+    def test_link_throughput_history(self):
+        os.environ["XDG_CACHE_HOME"] = os.path.join(self.root, "cache")
+        size = compression.MIN_RECORDED_TRANSFER
+
+        self.assertIsNone(compression.load_link_throughput("host"))
+        compression.record_link_throughput("host", size - 1, 0.001)
+        self.assertIsNone(compression.load_link_throughput("host"))
+
+        compression.record_link_throughput("host", size, 1)
+        compression.record_link_throughput("host", size * 2, 1)
+        compression.record_link_throughput("host", size, 2)
+        self.assertEqual(size * 2, compression.load_link_throughput("host"))
+
+        for _ in range(compression.HISTORY_LENGTH):
+            compression.record_link_throughput("host", size, 1)
+        self.assertEqual(size, compression.load_link_throughput("host"))
+
+    def __create_item(self, policy: CompressionPolicy) -> FilesBackupItem:
+        return FilesBackupItem(
+            includes=(self.root,),
+            excludes=(),
+            rotation_strategy=None,
+            compression=policy,
+        )
+
+    def __write(self, path: str, data: bytes) -> None:
+        with open(os.path.join(self.root, path), "wb") as f:
+            f.write(data)
+
+
+if __name__ == "__main__":
+    unittest.main()
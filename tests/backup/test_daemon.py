@@ -0,0 +1,142 @@
+import os
+import time
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from backee.backup import daemon
+
+
+CONFIG = """
+settings:
+  name: test
+
+servers:
+  - name: server 1
+    type: local
+    location: {location}
+  - name: server 2
+    type: local
+    location: {location}
+
+backup_items:
+  files:
+    includes:
+      - {location}
+
+rotation_strategy:
+  daily: 1
+  monthly: 0
+  yearly: 0
+
+schedule:
+  - name: first
+    cron: "0 3 * * *"
+    servers: [server 1]
+  - name: second
+    cron: "0 4 * * *"
+    servers: [server 2]
+  - name: both
+    cron: "0 5 * * *"
+"""
+
+
+class DaemonTestCase(unittest.TestCase):
+    """
+    Tests for `backee/backup/daemon.py`.
+    """
+
+    def setUp(self):
+        self.__temp_dir = tempfile.TemporaryDirectory()
+        self.config_path = os.path.join(self.__temp_dir.name, "config.yml")
+        self.socket_path = os.path.join(self.__temp_dir.name, "backee.sock")
+        self.__write_config(CONFIG)
+
+        self.calls = []
+        self.release = {x: threading.Event() for x in ("server 1", "server 2")}
+        self.daemon = daemon.Daemon(
+            self.config_path, self.socket_path, run_backup=self.__run_backup
+        )
+        self.thread = threading.Thread(target=self.daemon.serve)
+        self.thread.start()
+        while not os.path.exists(self.socket_path):
+            time.sleep(0.01)
+
+    def tearDown(self):
+        for event in self.release.values():
+            event.set()
+        self.daemon.stop()
+        self.thread.join(timeout=10)
+        self.__temp_dir.cleanup()
+
+    def test_runs_triggered_by_socket(self):
+        self.assertEqual("started first", self.__send("run first"))
+        self.assertIn("running\tfirst", self.__send("status"))
+        self.assertEqual("already running first", self.__send("run first"))
+        self.release["server 1"].set()
+        self.__wait_for(lambda: "running" not in self.__send("status"))
+
+        self.assertEqual("started manual", self.__send("run"))
+        self.release["server 2"].set()
+        self.__wait_for(lambda: "running" not in self.__send("status"))
+        self.assertEqual(["server 1", "server 1", "server 2"], self.calls)
+
+        self.assertEqual(
+            "error: Unknown schedule: 'missing'", self.__send("run missing")
+        )
+        self.assertTrue(self.__send("unknown").startswith("error:"))
+
+    def test_independent_schedules_overlap(self):
+        self.__send("run first")
+        self.__send("run second")
+        self.__wait_for(lambda: len(self.calls) == 2)
+
+        # server 1 is busy, so the run waits for it
+        self.__send("run both")
+        time.sleep(0.1)
+        self.assertEqual(["server 1", "server 2"], sorted(self.calls))
+
+        self.release["server 1"].set()
+        self.release["server 2"].set()
+        self.__wait_for(lambda: "running" not in self.__send("status"))
+        self.assertEqual(4, len(self.calls))
+
+    def test_config_reloaded(self):
+        self.__write_config(CONFIG.replace("name: second", "name: renamed"))
+        self.assertEqual("reloading", self.__send("reload"))
+        self.__wait_for(lambda: "renamed" in self.__send("status"))
+
+        # invalid config is ignored
+        self.__write_config("settings: {}")
+        with self.assertLogs(daemon.log, "ERROR"):
+            self.daemon.reload()
+        self.assertEqual("started renamed", self.__send("run renamed"))
+
+    def __run_backup(
+        self, name, items, servers, get_transmitter, get_server_lock, **kwargs
+    ):
+        self.assertEqual("test", name)
+        self.assertEqual(("files",), tuple(x.name for x in items))
+        self.assertIsNotNone(get_transmitter)
+        for server in servers:
+            with get_server_lock(server):
+                self.calls.append(server.name)
+                self.release[server.name].wait(timeout=10)
+
+    def __send(self, command: str) -> str:
+        return daemon.send_command(command, self.socket_path)
+
+    def __wait_for(self, condition) -> None:
+        deadline = time.monotonic() + 10
+        while not condition():
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+
+    def __write_config(self, contents: str) -> None:
+        with open(self.config_path, "w") as f:
+            f.write(contents.replace("{location}", self.__temp_dir.name))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,199 @@
+import os
+import gzip
+import shutil
+import tempfile
+import unittest
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from backee.backup import database_dump
+from backee.model.db_connectors import DbConnector, DockerConnector, RemoteConnector
+from backee.model.items import DumpsBackupItem, FilesBackupItem, MysqlBackupItem
+from backee.model.rotation_strategy import RotationStrategy
+
+
+class DatabaseDumpTestCase(unittest.TestCase):
+    """
+    Tests for `backee/backup/database_dump.py`.
+    """
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        patcher = mock.patch.dict("os.environ", {"XDG_CACHE_HOME": self.root})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @mock.patch("backee.backup.process.find_executable", lambda x: f"/bin/{x}")
+    def test_dump_commands(self):
+        local = self.__create_item("db", DbConnector(port=3306))
+        self.assertEqual(
+            [
+                "/bin/mysqldump",
+                "--host=127.0.0.1",
+                "--protocol=tcp",
+                "--single-transaction",
+                "--quick",
+                "--routines",
+                "--events",
+                "--order-by-primary",
+                "--skip-dump-date",
+                "--user=user",
+                "--port=3306",
+                "db",
+            ],
+            database_dump.get_dump_command(local),
+        )
+
+        remote = self.__create_item("db", RemoteConnector(port=3307, hostname="h"))
+        self.assertIn("--host=h", database_dump.get_dump_command(remote))
+
+        docker = self.__create_item("db", DockerConnector(port=3306, container="c"))
+        command = database_dump.get_dump_command(docker)
+        self.assertEqual(
+            ["/bin/docker", "exec", "--env", "MYSQL_PWD", "c", "mysqldump"],
+            command[:6],
+        )
+        # password is never on the command line
+        self.assertNotIn("secret", " ".join(command))
+
+    @mock.patch("backee.backup.database_dump.get_dump_command")
+    def test_databases_staged(self, get_dump_command):
+        get_dump_command.side_effect = lambda x: ["printf", f"dump of {x.database}"]
+        files = FilesBackupItem(rotation_strategy=None, includes=("/a",), excludes=())
+        rs = RotationStrategy(daily=1, monthly=0, yearly=0)
+        items = (
+            files,
+            self.__create_item("a", DbConnector(port=3306)),
+            self.__create_item("b", DbConnector(port=3306), rs),
+        )
+
+        staged = database_dump.stage(items)
+        self.assertEqual(2, get_dump_command.call_count)
+
+        self.assertIs(files, staged[0])
+        dumps = staged[1]
+        self.assertIsInstance(dumps, DumpsBackupItem)
+        self.assertEqual("databases", dumps.name)
+        self.assertEqual(rs, dumps.rotation_strategy)
+        with gzip.open(os.path.join(dumps.includes[1], "b", "header.sql.gz")) as f:
+            self.assertEqual(b"dump of b", f.read())
+
+        # staged items are not dumped again, every run stages its own dumps
+        self.assertEqual(staged, database_dump.stage(staged))
+        self.assertEqual(2, get_dump_command.call_count)
+        database_dump.stage(items)
+        self.assertEqual(4, get_dump_command.call_count)
+
+    @mock.patch("backee.backup.database_dump.dump")
+    def test_databases_dumped_concurrently(self, dump):
+        # both dumps have to be running at once to pass the barrier
+        barrier = threading.Barrier(2, timeout=10)
+        dump.side_effect = lambda *_: barrier.wait()
+        items = (
+            self.__create_item("a", DbConnector(port=3306)),
+            self.__create_item("b", DbConnector(port=3307)),
+        )
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            staged = list(executor.map(lambda x: database_dump.stage((x,)), items))
+
+        self.assertEqual(2, dump.call_count)
+        self.assertEqual([1, 1], [len(x) for x in staged])
+
+    @mock.patch("backee.backup.database_dump.get_dump_command")
+    def test_failed_dump_skipped(self, get_dump_command):
+        get_dump_command.return_value = ["sh", "-c", "echo denied >&2; exit 2"]
+        item = self.__create_item("a", DbConnector(port=3306))
+        path = os.path.join(database_dump.get_staging_dir(item), "a")
+
+        with self.assertLogs(database_dump.log, "ERROR") as logs:
+            self.assertEqual((), database_dump.stage((item,)))
+        self.assertIn("denied", "\n".join(logs.output))
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(os.path.exists(path + ".incoming"))
+
+    @mock.patch("backee.backup.database_dump.get_dump_command")
+    def test_dump_split_by_table(self, get_dump_command):
+        item = self.__create_item("db", DbConnector(port=3306))
+        path = os.path.join(self.root, "db")
+        dump_file = os.path.join(self.root, "dump.sql")
+        get_dump_command.return_value = ["cat", dump_file]
+
+        with open(dump_file, "wb") as f:
+            f.write(self.__create_dump(users="(1,'a')", posts="(1,'p')", logs="(1)"))
+        database_dump.dump(item, path)
+        expected = [
+            "header",
+            "table-users",
+            "table-posts",
+            "table-logs",
+            "routines-db",
+            "footer",
+        ]
+        with open(os.path.join(path, database_dump.RESTORE_ORDER)) as f:
+            self.assertEqual(expected, f.read().split())
+        with gzip.open(os.path.join(path, "table-users.sql.gz")) as f:
+            self.assertIn(b"INSERT INTO `users` VALUES (1,'a');", f.read())
+        # restoring the sections in order gives the whole dump
+        content = b""
+        for name in expected:
+            with gzip.open(os.path.join(path, name + ".sql.gz")) as f:
+                content += f.read()
+        with open(dump_file, "rb") as f:
+            self.assertEqual(f.read(), content)
+
+        for name in os.listdir(path):
+            os.utime(os.path.join(path, name), (1, 1))
+        users = os.stat(os.path.join(path, "table-users.sql.gz"))
+
+        with open(dump_file, "wb") as f:
+            f.write(self.__create_dump(users="(1,'a')", posts="(1,'q')"))
+        database_dump.dump(item, path)
+
+        # unchanged table is kept for rsync to hard link it
+        new_users = os.stat(os.path.join(path, "table-users.sql.gz"))
+        self.assertEqual(
+            (users.st_ino, users.st_mtime), (new_users.st_ino, new_users.st_mtime)
+        )
+        self.assertNotEqual(
+            1, os.stat(os.path.join(path, "table-posts.sql.gz")).st_mtime
+        )
+        self.assertFalse(os.path.exists(os.path.join(path, "table-logs.sql.gz")))
+        self.assertEqual(
+            {x + ".sql.gz" for x in expected if x != "table-logs"}
+            | {database_dump.RESTORE_ORDER},
+            set(os.listdir(path)),
+        )
+
+    def __create_dump(self, **tables: str) -> bytes:
+        result = b"-- MySQL dump 10.13\n--\n-- Host: 127.0.0.1    Database: db\n"
+        for name, rows in tables.items():
+            result += (
+                f"--\n-- Table structure for table `{name}`\n--\n\n"
+                f"CREATE TABLE `{name}` (`id` int);\n\n"
+                f"--\n-- Dumping data for table `{name}`\n--\n\n"
+                f"INSERT INTO `{name}` VALUES {rows};\n"
+            ).encode()
+        return result + (
+            b"--\n-- Dumping routines for database 'db'\n--\n"
+            b"/*!40103 SET TIME_ZONE=@OLD_TIME_ZONE */;\n\n"
+            b"/*!40101 SET SQL_MODE=@OLD_SQL_MODE */;\n"
+        )
+
+    def __create_item(
+        self, database: str, connector: DbConnector, rs: RotationStrategy = None
+    ) -> MysqlBackupItem:
+        return MysqlBackupItem(
+            rotation_strategy=rs,
+            connector=connector,
+            username="user",
+            password="secret",
+            database=database,
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
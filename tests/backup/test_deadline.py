@@ -0,0 +1,52 @@
+import datetime
+import threading
+import subprocess
+import unittest
+
+from backee.backup import deadline
+
+
+class DeadlineTestCase(unittest.TestCase):
+    """
+    Tests for `backee/backup/deadline.py`.
+    """
+
+    def test_deadline_today(self):
+        self.assertEqual(
+            datetime.datetime(2024, 3, 1, 6, 0),
+            deadline.get_deadline(
+                datetime.time(6, 0), datetime.datetime(2024, 3, 1, 1, 30)
+            ),
+        )
+
+    def test_deadline_tomorrow(self):
+        self.assertEqual(
+            datetime.datetime(2024, 3, 2, 6, 0),
+            deadline.get_deadline(
+                datetime.time(6, 0), datetime.datetime(2024, 3, 1, 22, 0)
+            ),
+        )
+        self.assertEqual(
+            datetime.datetime(2024, 3, 2, 6, 0),
+            deadline.get_deadline(
+                datetime.time(6, 0), datetime.datetime(2024, 3, 1, 6, 0)
+            ),
+        )
+
+    def test_running_process_expired(self):
+        expired = threading.Event()
+        with subprocess.Popen(["sleep", "10"]) as proc:
+            deadline.expire(proc, expired)
+            proc.wait()
+        self.assertTrue(expired.is_set())
+
+    def test_finished_process_not_expired(self):
+        expired = threading.Event()
+        with subprocess.Popen(["true"]) as proc:
+            proc.wait()
+            deadline.expire(proc, expired)
+        self.assertFalse(expired.is_set())
+
+
+if __name__ == "__main__":
+    unittest.main()
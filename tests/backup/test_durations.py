@@ -0,0 +1,44 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from backee.backup import durations
+
+
+class DurationsTestCase(unittest.TestCase):
+    """
+    Tests for `backee/backup/durations.py`.
+    """
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+
+    @mock.patch.dict("os.environ", {})
+    def test_recent_durations_averaged(self):
+        os.environ["XDG_CACHE_HOME"] = self.root
+        self.assertIsNone(durations.load_duration("test", "server", "files"))
+
+        for elapsed in (100, 1, 2, 3, 4, 5):
+            durations.record_duration("test", "server", "files", elapsed)
+
+        self.assertEqual(3, durations.load_duration("test", "server", "files"))
+        self.assertIsNone(durations.load_duration("test", "other", "files"))
+
+    @mock.patch.dict("os.environ", {})
+    def test_broken_history_ignored(self):
+        os.environ["XDG_CACHE_HOME"] = self.root
+        path = durations.get_history_path("test", "server", "files")
+        os.makedirs(os.path.dirname(path))
+        with open(path, "w") as f:
+            f.write("broken")
+
+        self.assertIsNone(durations.load_duration("test", "server", "files"))
+        durations.record_duration("test", "server", "files", 7)
+        self.assertEqual(7, durations.load_duration("test", "server", "files"))
+
+
+if __name__ == "__main__":
+    unittest.main()
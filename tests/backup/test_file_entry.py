@@ -0,0 +1,45 @@
+import os
+import tempfile
+import unittest
+
+from backee.backup import file_entry
+
+
+class FileEntryTestCase(unittest.TestCase):
+    """
+    Tests for `backee/backup/file_entry.py`.
+    """
+
+    def test_find_unchanged(self):
+        with tempfile.TemporaryDirectory() as root:
+            path = os.path.join(root, "file")
+            with open(path, "w") as f:
+                f.write("data")
+            st = os.lstat(path)
+            entry = file_entry.create_entry(path, st)
+            entries = {entry["path"]: entry}
+
+            self.assertEqual("f", entry["type"])
+            self.assertIs(entry, file_entry.find_unchanged(entries, path, st))
+
+            os.utime(path, ns=(0, 0))
+            self.assertIsNone(file_entry.find_unchanged(entries, path, os.lstat(path)))
+
+    def test_apply_metadata(self):
+        with tempfile.TemporaryDirectory() as root:
+            path = os.path.join(root, "file")
+            with open(path, "w"):
+                pass
+            entry = file_entry.create_entry(path, os.lstat(path))
+            entry["mode"] = 0o100600
+            entry["mtime_ns"] = 10**18
+
+            file_entry.apply_metadata(path, entry, can_chown=False)
+
+            st = os.lstat(path)
+            self.assertEqual(0o100600, st.st_mode)
+            self.assertEqual(10**18, st.st_mtime_ns)
+
+
+if __name__ == "__main__":
+    unittest.main()
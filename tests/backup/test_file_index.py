@@ -0,0 +1,189 @@
+import os
+import gzip
+import tempfile
+import unittest
+from unittest.mock import Mock
+
+from backee.backup import file_index
+from backee.model.file_index import FileIndexEntry
+
+
+class FileIndexTestCase(unittest.TestCase):
+    """
+    Tests for `backee/backup/file_index.py`.
+    """
+
+    def setUp(self):
+        self.__temp_dir = tempfile.TemporaryDirectory()
+        self.mirror_dir = self.__temp_dir.name
+
+    def tearDown(self):
+        self.__temp_dir.cleanup()
+
+    def test_lookup(self):
+        """
+        Exact paths are found with binary search, missing ones are not.
+        """
+        entries = [
+            self.__entry(f"dir{i:03d}/file{j}", size=i * 10 + j)
+            for i in range(100)
+            for j in range(3)
+        ]
+        self.__write_index("backup_1", entries)
+
+        with file_index.FileIndex(self.__path("backup_1")) as index:
+            for entry in entries:
+                self.assertEqual(entry, index.lookup(entry.path))
+            self.assertEqual(entries[0], index.lookup("/" + entries[0].path))
+            self.assertIsNone(index.lookup("dir050"))
+            self.assertIsNone(index.lookup("zzz"))
+            self.assertIsNone(index.lookup(""))
+
+    def test_lookup_path_with_tab(self):
+        entry = self.__entry("a\tb", size=1)
+        self.__write_index("backup_1", [self.__entry("a", size=2), entry])
+
+        with file_index.FileIndex(self.__path("backup_1")) as index:
+            self.assertEqual(entry, index.lookup("a\tb"))
+
+    def test_directories_and_symlinks_stored(self):
+        directory = FileIndexEntry(
+            path="a", size=0, mtime=1.5, inode=1, hash=None, type="d", mode=0o700
+        )
+        link = FileIndexEntry(
+            path="a\tb",
+            size=0,
+            mtime=1.5,
+            inode=2,
+            hash=None,
+            type="l",
+            mode=0o777,
+            target="../c\td",
+        )
+        self.__write_index("backup_1", [link, directory])
+
+        with file_index.FileIndex(self.__path("backup_1")) as index:
+            self.assertEqual([directory, link], list(index))
+            self.assertEqual(link, index.lookup("a\tb"))
+
+        # indexes written before types were added have files only
+        entry = file_index.parse_record(b"a\tb\t1\t1.5\t2\t")
+        self.assertEqual(self.__entry("a\tb", size=1, inode=2), entry)
+
+    def test_empty_index(self):
+        self.__write_index("backup_1", [])
+
+        with file_index.FileIndex(self.__path("backup_1")) as index:
+            self.assertIsNone(index.lookup("a"))
+            self.assertEqual([], list(index))
+
+    def test_iter_prefix(self):
+        entries = [
+            self.__entry("a/b/c"),
+            self.__entry("a/b/d"),
+            self.__entry("a/bc"),
+            self.__entry("a/b"),
+            self.__entry("a/b-old/x"),
+            self.__entry("a/b.txt"),
+            self.__entry("b"),
+        ]
+        self.__write_index("backup_1", entries)
+
+        with file_index.FileIndex(self.__path("backup_1")) as index:
+            self.assertEqual(
+                ["a/b", "a/b/c", "a/b/d"],
+                [x.path for x in index.iter_prefix("/a/b/")],
+            )
+            # siblings sorted between the directory and its entries
+            self.assertEqual(
+                ["a/b", "a/b/c", "a/b/d"],
+                [x.path for x in index.iter_prefix("/a/b")],
+            )
+            self.assertEqual(["b"], [x.path for x in index.iter_prefix("b")])
+            self.assertEqual(len(entries), len(list(index.iter_prefix("/"))))
+
+    def test_diff_indexes(self):
+        old = [
+            self.__entry("removed", inode=1),
+            self.__entry("same", inode=2),
+            self.__entry("changed", inode=3, size=1),
+            self.__entry("copied", inode=4),
+        ]
+        new = [
+            self.__entry("added", inode=5),
+            self.__entry("same", inode=2),
+            self.__entry("changed", inode=6, size=2),
+            self.__entry("copied", inode=7),
+        ]
+        self.__write_index("backup_1", old)
+        self.__write_index("backup_2", new)
+
+        with file_index.FileIndex(
+            self.__path("backup_1")
+        ) as index_a, file_index.FileIndex(self.__path("backup_2")) as index_b:
+            changes = [
+                (change, (n or o).path)
+                for change, o, n in file_index.diff_indexes(index_a, index_b)
+            ]
+
+        self.assertEqual([("+", "added"), ("M", "changed"), ("-", "removed")], changes)
+
+    def test_find_versions(self):
+        self.__write_index("backup_1", [self.__entry("a", inode=1)])
+        self.__write_index("backup_2", [self.__entry("a", inode=1)])
+        self.__write_index("backup_3", [self.__entry("a", inode=2, size=5)])
+        self.__write_index("backup_4", [self.__entry("b", inode=3)])
+        self.__write_index("backup_5", [self.__entry("a", inode=2, size=5)])
+
+        versions = file_index.find_versions(self.mirror_dir, "/a")
+
+        self.assertEqual(
+            [("backup_1", "backup_2", 1), ("backup_3", "backup_5", 2)],
+            [(first, last, entry.inode) for first, last, entry in versions],
+        )
+
+    def test_mirror_index(self):
+        with tempfile.TemporaryFile() as f:
+            file_index.write_index([self.__entry("b"), self.__entry("a")], f)
+            f.seek(0)
+            compressed = gzip.compress(f.read())
+
+        transmitter = Mock()
+        transmitter.read_remote_file.return_value = iter(
+            [compressed[:10], compressed[10:]]
+        )
+        local_path = file_index.get_mirror_path(
+            os.path.join(self.mirror_dir, "mirror"), "/root/backup_1/"
+        )
+
+        file_index.mirror_index(transmitter, "/root/backup_1.index.gz", local_path)
+
+        self.assertEqual(
+            ("backup_1",),
+            file_index.get_mirrored_backup_names(
+                os.path.join(self.mirror_dir, "mirror")
+            ),
+        )
+        with file_index.FileIndex(local_path) as index:
+            self.assertEqual(["a", "b"], [x.path for x in index])
+
+        file_index.prune_mirror(
+            os.path.join(self.mirror_dir, "mirror"), ("/root/backup_1",)
+        )
+        self.assertFalse(os.path.exists(local_path))
+
+    def __entry(
+        self, path: str, size: int = 0, inode: int = 0, mtime: float = 1.5
+    ) -> FileIndexEntry:
+        return FileIndexEntry(path=path, size=size, mtime=mtime, inode=inode, hash=None)
+
+    def __path(self, backup_name: str) -> str:
+        return file_index.get_mirror_path(self.mirror_dir, backup_name)
+
+    def __write_index(self, backup_name: str, entries) -> None:
+        with open(self.__path(backup_name), mode="wb") as f:
+            file_index.write_index(entries, f)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+import os
+import stat
+import tempfile
+import unittest
+from unittest import mock
+
+from backee.backup import filters
+from backee.model.items import FilesBackupItem
+
+
+class FiltersTestCase(unittest.TestCase):
+    """
+    Tests for `backee/backup/filters.py`.
+    """
+
+    def setUp(self):
+        self.__temp_dir = tempfile.TemporaryDirectory()
+        self.root = self.__temp_dir.name
+        for path in ("a/1.db", "a/2.db", "a/3.log", "a/.hidden.db", "b/c"):
+            os.makedirs(os.path.dirname(os.path.join(self.root, path)), exist_ok=True)
+            with open(os.path.join(self.root, path), "w"):
+                pass
+
+    def tearDown(self):
+        filters.clear_filters()
+        self.__temp_dir.cleanup()
+
+    def test_filter_files_written_once(self):
+        item = FilesBackupItem(
+            includes=(
+                os.path.join(self.root, "a", "*.db"),
+                os.path.join(self.root, "b"),
+            ),
+            excludes=("*.log", os.path.join(self.root, "b", "c"), "/missing"),
+            rotation_strategy=None,
+        )
+
+        compiled = filters.get_filters(item)
+
+        self.assertIs(compiled, filters.get_filters(item))
+        with open(compiled.files_from, "rb") as f:
+            self.assertEqual(
+                [os.path.join(self.root, x) for x in ("a/1.db", "a/2.db", "b")],
+                [os.fsdecode(x) for x in f.read().split(b"\0")[:-1]],
+            )
+        with open(compiled.filter, "rb") as f:
+            self.assertEqual(
+                b"- *.log\0- " + os.fsencode(os.path.join(self.root, "b", "c")) + b"\0",
+                f.read(),
+            )
+        self.assertIn(
+            f"--files-from={compiled.files_from}", compiled.get_rsync_options()
+        )
+
+        filters.clear_filters()
+        self.assertFalse(os.path.exists(compiled.files_from))
+        self.assertIsNot(compiled, filters.get_filters(item))
+
+    def test_rsync_sends_scanned_sources(self):
+        item = FilesBackupItem(
+            includes=(os.path.join(self.root, "a"),),
+            excludes=("*.log",),
+            rotation_strategy=None,
+        )
+
+        with filters.session() as run:
+            (bound,) = filters.bind((item,), run)
+            compiled = filters.get_filters(bound)
+            with mock.patch(
+                "backee.backup.filters.walk_sources", wraps=filters.walk_sources
+            ) as walk:
+                options = compiled.get_rsync_options()
+                self.assertEqual(options, compiled.get_rsync_options())
+                compiled.get_large_files(0)
+            self.assertEqual(1, walk.call_count)
+
+            # rsync gets every scanned entry and does not walk sources itself
+            self.assertNotIn("--recursive", options)
+            (files_from,) = [x for x in options if x.startswith("--files-from=")]
+            with open(files_from.split("=", 1)[1], "rb") as f:
+                listed = [os.fsdecode(x) for x in f.read().split(b"\0") if x]
+            self.assertEqual([x for x, _ in compiled.get_sources()], listed)
+            self.assertNotIn(os.path.join(self.root, "a", "3.log"), listed)
+
+        self.assertIn("--recursive", filters.get_filters(item).get_rsync_options())
+
+    def test_sources_scanned_once_per_run(self):
+        item = FilesBackupItem(
+            includes=(os.path.join(self.root, "a"),),
+            excludes=("*.log",),
+            rotation_strategy=None,
+        )
+
+        with mock.patch(
+            "backee.backup.filters.walk_sources", wraps=filters.walk_sources
+        ) as walk:
+            with filters.session() as run:
+                (bound,) = filters.bind((item,), run)
+                compiled = filters.get_filters(bound)
+                sources = compiled.get_sources()
+                self.assertIs(sources, compiled.get_sources())
+                compiled.get_large_files(0)
+                self.assertEqual(1, walk.call_count)
+
+                # an overlapping run sees changes on disk
+                with open(os.path.join(self.root, "a", "4.db"), "w"):
+                    pass
+                with filters.session() as other_run:
+                    (other,) = filters.bind((item,), other_run)
+                    self.assertEqual((bound,), filters.bind((bound,), other_run))
+                    self.assertIsNot(compiled, filters.get_filters(other))
+                    self.assertEqual(
+                        len(sources) + 1,
+                        len(filters.get_filters(other).get_sources()),
+                    )
+                self.assertEqual(2, walk.call_count)
+                self.assertIs(compiled, filters.get_filters(bound))
+            self.assertFalse(os.path.exists(compiled.files_from))
+
+            # outside of runs changes on disk are seen at once
+            compiled = filters.get_filters(item)
+            compiled.get_sources()
+            compiled.get_sources()
+            self.assertEqual(4, walk.call_count)
+
+        self.assertCountEqual(
+            [os.path.join(self.root, "a", x) for x in ("1.db", "2.db", ".hidden.db")],
+            [x for x, st in sources if stat.S_ISREG(st.st_mode)],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,165 @@
+import os
+import time
+import threading
+import tempfile
+import unittest
+from unittest import mock
+
+from backee.backup import backup, lease
+from backee.backup.local_transmitter import LocalTransmitter
+from backee.model.items import FilesBackupItem
+from backee.model.servers import LocalBackupServer
+from backee.model.rotation_strategy import RotationStrategy
+
+
+class LeaseTestCase(unittest.TestCase):
+    """
+    Tests for `backee/backup/lease.py`.
+    """
+
+    def setUp(self):
+        self.__temp_dir = tempfile.TemporaryDirectory()
+        self.root = self.__temp_dir.name
+        self.item_root = os.path.join(self.root, "backups", "files")
+        os.makedirs(self.item_root)
+        self.lock_path = os.path.join(self.item_root, lease.LOCK_NAME)
+
+        self.server = LocalBackupServer(
+            name="local",
+            rotation_strategy=RotationStrategy(daily=1, monthly=0, yearly=0),
+            location=os.path.join(self.root, "backups"),
+        )
+        self.transmitter = LocalTransmitter(self.server)
+
+    def tearDown(self):
+        self.__temp_dir.cleanup()
+
+    def test_conflicting_lease_fails_fast(self):
+        with lease.Lease(self.transmitter, self.item_root):
+            owner, expires = lease.parse_lock(
+                self.transmitter.read_lock(self.lock_path)
+            )
+            self.assertIn(str(os.getpid()), owner)
+
+            with self.assertRaisesRegex(OSError, "is locked by"):
+                lease.Lease(self.transmitter, self.item_root).acquire()
+
+        self.assertIsNone(self.transmitter.read_lock(self.lock_path))
+        self.assertEqual(["files"], os.listdir(os.path.dirname(self.item_root)))
+        # released lease is taken again
+        with lease.Lease(self.transmitter, self.item_root):
+            pass
+
+    def test_expired_lease_taken_over(self):
+        now = 1000000
+        crashed = lease.Lease(self.transmitter, self.item_root, clock=lambda: now)
+        crashed.acquire()
+
+        now += lease.LEASE_TTL + 1
+        with self.assertLogs(lease.log, "WARNING"):
+            with lease.Lease(self.transmitter, self.item_root, clock=lambda: now):
+                owner, expires = lease.parse_lock(
+                    self.transmitter.read_lock(self.lock_path)
+                )
+                self.assertEqual(now + lease.LEASE_TTL, expires)
+
+        # lease taken over is not removed by its former owner
+        self.transmitter.create_lock(self.lock_path, "other 0")
+        crashed.release()
+        self.assertEqual("other 0", self.transmitter.read_lock(self.lock_path))
+
+    def test_expired_lease_taken_over_once(self):
+        now = 1000000
+        crashed = lease.Lease(self.transmitter, self.item_root, clock=lambda: now)
+        crashed.acquire()
+        now += lease.LEASE_TTL + 1
+        first = lease.Lease(self.transmitter, self.item_root, clock=lambda: now)
+
+        class Interleaved(LocalTransmitter):
+            def remove_lock(self, path: str, content: str) -> bool:
+                # both runs read the expired lock, the first one takes it over
+                # before the second one removes it
+                if not first_acquired:
+                    first_acquired.append(True)
+                    first.acquire()
+                return super().remove_lock(path, content)
+
+        first_acquired = []
+        second = lease.Lease(
+            Interleaved(self.server), self.item_root, clock=lambda: now
+        )
+        with self.assertLogs(lease.log, "WARNING"):
+            with self.assertRaisesRegex(OSError, "is locked by"):
+                second.acquire()
+
+        owner, _ = lease.parse_lock(self.transmitter.read_lock(self.lock_path))
+        self.assertIn(str(os.getpid()), owner)
+        self.assertEqual([lease.LOCK_NAME], os.listdir(self.item_root))
+        first.release()
+        self.assertIsNone(self.transmitter.read_lock(self.lock_path))
+
+    def test_lease_renewed(self):
+        now = 1000000
+        with lease.Lease(self.transmitter, self.item_root, ttl=1, clock=lambda: now):
+            now += 100
+            for _ in range(100):
+                _, expires = lease.parse_lock(
+                    self.transmitter.read_lock(self.lock_path)
+                )
+                if expires > now:
+                    break
+                time.sleep(0.05)
+
+            with self.assertRaisesRegex(OSError, "is locked by"):
+                lease.Lease(
+                    self.transmitter, self.item_root, clock=lambda: now
+                ).acquire()
+
+    def test_lock_renewed_only_by_holder(self):
+        self.transmitter.create_lock(self.lock_path, "first 1")
+
+        self.assertFalse(
+            self.transmitter.renew_lock(self.lock_path, "other 1", "other 2")
+        )
+        self.assertEqual("first 1", self.transmitter.read_lock(self.lock_path))
+        self.assertTrue(
+            self.transmitter.renew_lock(self.lock_path, "first 1", "first 2")
+        )
+        self.assertEqual("first 2", self.transmitter.read_lock(self.lock_path))
+        self.assertEqual([lease.LOCK_NAME], os.listdir(self.item_root))
+
+    def test_lease_taken_over_is_lost(self):
+        now = 1000000
+        lost = threading.Event()
+        with self.assertLogs(lease.log, "ERROR"):
+            with lease.Lease(
+                self.transmitter, self.item_root, ttl=0.3, clock=lambda: now
+            ) as held:
+                held.on_lost(lost.set)
+                os.remove(self.lock_path)
+                self.transmitter.create_lock(self.lock_path, "other 0")
+
+                self.assertTrue(lost.wait(10))
+                with self.assertRaisesRegex(OSError, "was lost"):
+                    held.check()
+
+        # lock of the new owner is kept
+        self.assertEqual("other 0", self.transmitter.read_lock(self.lock_path))
+
+    @mock.patch.dict("os.environ", {})
+    def test_backup_of_locked_item_fails(self):
+        os.environ["XDG_CACHE_HOME"] = os.path.join(self.root, "cache")
+        source = os.path.join(self.root, "source")
+        os.makedirs(source)
+        item = FilesBackupItem(includes=(source,), excludes=(), rotation_strategy=None)
+
+        with lease.Lease(self.transmitter, self.item_root):
+            with self.assertRaisesRegex(OSError, "is locked by"):
+                backup.backup("test", (item,), (self.server,))
+
+        backup.backup("test", (item,), (self.server,))
+        self.assertFalse(os.path.exists(self.lock_path))
+
+
+if __name__ == "__main__":
+    unittest.main()
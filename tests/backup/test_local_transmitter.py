@@ -0,0 +1,130 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from backee.backup import backup, file_index
+from backee.backup.local_transmitter import LocalTransmitter
+from backee.model.items import FilesBackupItem
+from backee.model.servers import LocalBackupServer
+from backee.model.rotation_strategy import RotationStrategy
+
+
+class LocalTransmitterTestCase(unittest.TestCase):
+    """
+    Tests for `backee/backup/local_transmitter.py`.
+    """
+
+    def setUp(self):
+        self.__temp_dir = tempfile.TemporaryDirectory()
+        self.root = self.__temp_dir.name
+        self.source = os.path.join(self.root, "source")
+        self.location = os.path.join(self.root, "backups")
+        os.makedirs(os.path.join(self.source, "dir", "excluded"))
+        self.__write("dir/a.txt", b"a" * 1000)
+        self.__write("dir/b.log", b"b")
+        self.__write("dir/excluded/c.txt", b"c")
+        os.symlink("a.txt", os.path.join(self.source, "dir", "link"))
+
+        self.server = LocalBackupServer(
+            name="local",
+            rotation_strategy=RotationStrategy(daily=1, monthly=0, yearly=0),
+            location=self.location,
+        )
+        self.item = FilesBackupItem(
+            includes=(os.path.join(self.source, "dir"),),
+            excludes=(os.path.join(self.source, "dir", "excluded"), "*.log"),
+            rotation_strategy=None,
+        )
+
+    def tearDown(self):
+        self.__temp_dir.cleanup()
+
+    def test_changed_files_copied(self):
+        transmitter = LocalTransmitter(self.server)
+        first = os.path.join(self.location, "backup_1")
+        second = os.path.join(self.location, "backup_2")
+        links = os.path.join(self.location, "current")
+
+        transmitter.transmit(links, self.item, first)
+        transmitter.recreate_links_dir(first, links)
+        self.__write("dir/a.txt", b"changed")
+        self.__write("dir/new.txt", b"new")
+        self.__write("dir/b.log", b"b")
+        transmitter.transmit(links, self.item, second)
+
+        def backed_up(snapshot: str, name: str) -> str:
+            return os.path.join(snapshot, self.source.lstrip("/"), "dir", name)
+
+        self.assertEqual(b"changed", self.__read(backed_up(second, "a.txt")))
+        self.assertEqual(b"a" * 1000, self.__read(backed_up(first, "a.txt")))
+        self.assertEqual("a.txt", os.readlink(backed_up(second, "link")))
+        self.assertEqual(
+            os.stat(backed_up(first, "link"), follow_symlinks=False).st_mtime_ns,
+            os.stat(
+                os.path.join(self.source, "dir", "link"), follow_symlinks=False
+            ).st_mtime_ns,
+        )
+        self.assertFalse(os.path.lexists(backed_up(second, "b.log")))
+        self.assertFalse(os.path.lexists(backed_up(second, "excluded")))
+        self.assertNotEqual(
+            os.stat(backed_up(first, "a.txt")).st_ino,
+            os.stat(backed_up(second, "a.txt")).st_ino,
+        )
+        self.assertTrue(transmitter.verify_backup(self.item, second))
+        self.assertFalse(transmitter.verify_backup(self.item, first))
+        self.assertEqual(
+            len(b"changed") + len(b"new"),
+            transmitter.get_transfer_file_size(links, self.item, second),
+        )
+        self.assertEqual(0, transmitter.get_transfer_file_size(second, self.item, ""))
+
+    def test_unchanged_file_linked(self):
+        transmitter = LocalTransmitter(self.server)
+        first = os.path.join(self.location, "backup_1")
+        second = os.path.join(self.location, "backup_2")
+        links = os.path.join(self.location, "current")
+
+        transmitter.transmit(links, self.item, first)
+        transmitter.recreate_links_dir(first, links)
+        transmitter.transmit(links, self.item, second)
+
+        path = os.path.join(self.source.lstrip("/"), "dir", "a.txt")
+        self.assertEqual(
+            os.stat(os.path.join(first, path)).st_ino,
+            os.stat(os.path.join(second, path)).st_ino,
+        )
+        self.assertEqual(
+            os.stat(os.path.join(self.source, "dir")).st_mtime_ns,
+            os.stat(os.path.join(second, self.source.lstrip("/"), "dir")).st_mtime_ns,
+        )
+
+    @mock.patch.dict("os.environ", {})
+    def test_backup(self):
+        os.environ["XDG_CACHE_HOME"] = os.path.join(self.root, "cache")
+
+        backup.backup("test", (self.item,), (self.server,))
+
+        item_dir = os.path.join(self.location, self.item.name)
+        backups = [x for x in os.listdir(item_dir) if x.startswith("backup_")]
+        self.assertEqual(2, len(backups))
+        self.assertTrue(os.path.islink(os.path.join(item_dir, "current")))
+        self.assertIn(backups[0].replace(".index.gz", "") + ".index.gz", backups)
+
+        mirror_dir = file_index.get_mirror_dir("test", self.server.name, "files")
+        path = os.path.join(self.source, "dir", "a.txt")
+        versions = file_index.find_versions(mirror_dir, path)
+        self.assertEqual(1, len(versions))
+        self.assertEqual(1000, versions[0][2].size)
+
+    def __write(self, path: str, data: bytes) -> None:
+        with open(os.path.join(self.source, path), "wb") as f:
+            f.write(data)
+
+    def __read(self, path: str) -> bytes:
+        with open(path, "rb") as f:
+            return f.read()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,169 @@
+import time
+import logging
+import threading
+import unittest
+
+from concurrent.futures import ThreadPoolExecutor
+
+from backee.backup import orchestrator
+from backee.backup.connections import ConnectionPool, get_host
+from backee.model.config import Config
+from backee.model.items import FilesBackupItem
+from backee.model.servers import LocalBackupServer, SshBackupServer
+from backee.model.rotation_strategy import RotationStrategy
+from backee.model.thread_filter import get_worker_name
+
+
+class OrchestratorTestCase(unittest.TestCase):
+    """
+    Tests for `backee/backup/orchestrator.py`.
+    """
+
+    def setUp(self):
+        self.running = {}
+        self.max_running = {}
+        self.lock = threading.Lock()
+
+    def test_configs_limited_per_server(self):
+        configs = tuple(
+            self.__create_config(f"config {i}", ("shared", f"own {i}"))
+            for i in range(6)
+        )
+
+        results = orchestrator.Orchestrator(
+            jobs=6, per_server=2, run_backup=self.__run_backup
+        ).run(configs)
+
+        self.assertEqual([x.name for x in configs], [x.name for x in results])
+        self.assertTrue(all(x.error is None for x in results))
+        self.assertEqual(2, self.max_running["/shared"])
+        self.assertEqual(1, self.max_running["/own 0"])
+
+    def test_failed_config_reported(self):
+        configs = (
+            self.__create_config("good", ("a",)),
+            self.__create_config("bad", ("fail", "a")),
+        )
+        lock_names = []
+
+        with self.assertLogs(orchestrator.log) as logs:
+            results = orchestrator.Orchestrator(
+                run_backup=self.__run_backup, lock=lock_names.append
+            ).run(configs)
+
+        self.assertIsNone(results[0].error)
+        self.assertEqual("cannot back up", results[1].error)
+        self.assertEqual(["bad", "good"], sorted(lock_names))
+        # remaining servers of the failed config are skipped
+        self.assertEqual(1, self.max_running["/a"])
+        self.assertTrue(any("bad: failed" in x for x in logs.output))
+
+    def test_config_loggers_get_own_messages(self):
+        handlers = {}
+
+        def create_config(name: str) -> Config:
+            handler = _RecordingHandler()
+            handlers[name] = handler
+            config = self.__create_config(name, ("a",))
+            config.loggers = (handler,)
+            return config
+
+        def run_backup(name, items, servers, get_transmitter, **kwargs):
+            logging.getLogger("backee.test").warning("message of %s", name)
+            # records of workers go to the config, which started them
+            with ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix=get_worker_name("upload")
+            ) as executor:
+                executor.submit(
+                    logging.getLogger("backee.test").warning, "upload of %s", name
+                ).result()
+
+        try:
+            orchestrator.Orchestrator(run_backup=run_backup).run(
+                (create_config("first"), create_config("second"))
+            )
+        finally:
+            for handler in handlers.values():
+                logging.getLogger().removeHandler(handler)
+
+        self.assertEqual(
+            ["message of first", "upload of first"], handlers["first"].messages
+        )
+        self.assertEqual(
+            ["message of second", "upload of second"], handlers["second"].messages
+        )
+
+    def test_ssh_clients_shared_by_host(self):
+        pool = ConnectionPool()
+        first = self.__create_ssh_server("first", "host")
+        second = self.__create_ssh_server("second", "host")
+        other = self.__create_ssh_server("other", "other host")
+
+        self.assertIs(pool.get_client(first), pool.get_client(second))
+        self.assertIsNot(pool.get_client(first), pool.get_client(other))
+        self.assertEqual("host", get_host(first))
+        pool.close()
+
+    def __run_backup(
+        self, name, items, servers, get_transmitter, get_server_lock, **kwargs
+    ):
+        for server in servers:
+            with get_server_lock(server):
+                self.__back_up(server)
+
+    def __back_up(self, server) -> None:
+        host = get_host(server)
+        with self.lock:
+            self.running[host] = self.running.get(host, 0) + 1
+            self.max_running[host] = max(
+                self.max_running.get(host, 0), self.running[host]
+            )
+        try:
+            time.sleep(0.05)
+            if server.location == "/fail":
+                raise OSError("cannot back up")
+        finally:
+            with self.lock:
+                self.running[host] -= 1
+
+    def __create_config(self, name: str, locations) -> Config:
+        return Config(
+            name=name,
+            loggers=(),
+            backup_servers=tuple(
+                LocalBackupServer(
+                    name=x,
+                    rotation_strategy=RotationStrategy(1, 0, 0),
+                    location=f"/{x}",
+                )
+                for x in locations
+            ),
+            backup_items=(
+                FilesBackupItem(includes=("/",), excludes=(), rotation_strategy=None),
+            ),
+        )
+
+    def __create_ssh_server(self, name: str, hostname: str) -> SshBackupServer:
+        return SshBackupServer(
+            name=name,
+            rotation_strategy=RotationStrategy(1, 0, 0),
+            location="/backups",
+            hostname=hostname,
+            port=22,
+            username="user",
+            key_path=None,
+        )
+
+
+class _RecordingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.DEBUG)
+        self.messages = []
+
+    def emit(self, record):
+        if record.name == "backee.test":
+            self.messages.append(record.getMessage())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,125 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from backee.backup import packing
+from backee.model.items import FilesBackupItem
+from backee.model.packing import PackingPolicy
+
+
+class PackingTestCase(unittest.TestCase):
+    """
+    Tests for `backee/backup/packing.py`.
+    """
+
+    def setUp(self):
+        self.__temp_dir = tempfile.TemporaryDirectory()
+        self.root = self.__temp_dir.name
+        self.source = os.path.join(self.root, "source")
+        self.mail = os.path.join(self.source, "mail")
+        for path, size in (
+            ("mail/cur/1", 10),
+            ("mail/cur/2", 20),
+            ("mail/new/1", 30),
+            ("mail/new/big", 5000),
+            ("mail/a", 1),
+            ("mail/b", 2),
+            ("other/1", 1),
+            ("other/2", 1),
+        ):
+            self.__write(path, size)
+        os.symlink("a", os.path.join(self.mail, "cur", "link"))
+        os.makedirs(os.path.join(self.mail, "tmp"))
+        os.chmod(os.path.join(self.mail, "cur", "1"), 0o600)
+        os.utime(os.path.join(self.mail, "a"), (1000000000, 1000000000))
+
+        self.item = FilesBackupItem(
+            includes=(self.source,),
+            excludes=(),
+            rotation_strategy=None,
+            packing=PackingPolicy(paths=(self.mail,), max_file_size=4096),
+        )
+        self.__patch = mock.patch.dict(
+            "os.environ", {"XDG_CACHE_HOME": os.path.join(self.root, "cache")}
+        )
+        self.__patch.start()
+
+    def tearDown(self):
+        self.__patch.stop()
+        self.__temp_dir.cleanup()
+
+    def test_small_file_directories_packed(self):
+        tree, archives, pack_filter = packing.pack(self.item)
+
+        # cur has a symlink, new has a big file, tmp is empty
+        self.assertEqual(
+            [self.mail],
+            [
+                directory[len(tree) :]
+                for directory, _, files in os.walk(tree)
+                if packing.PACK_NAME in files
+            ],
+        )
+        with open(archives, "rb") as f:
+            self.assertEqual(
+                os.fsencode(os.path.join(self.mail.lstrip("/"), packing.PACK_NAME))
+                + b"\0",
+                f.read(),
+            )
+        with open(pack_filter, "rb") as f:
+            mail = os.fsencode(self.mail)
+            self.assertEqual(b"+ " + mail + b"/*/\0- " + mail + b"/*\0", f.read())
+
+    def test_unchanged_archive_kept(self):
+        tree, _, _ = packing.pack(self.item)
+        archive = os.path.join(tree + self.mail, packing.PACK_NAME)
+        st = os.stat(archive)
+
+        packing.pack(self.item)
+        self.assertEqual(st.st_ino, os.stat(archive).st_ino)
+        self.assertEqual(st.st_mtime_ns, os.stat(archive).st_mtime_ns)
+
+        self.__write("mail/b", 3)
+        packing.pack(self.item)
+        self.assertNotEqual(st.st_ino, os.stat(archive).st_ino)
+
+        # directory does not qualify anymore
+        self.__write("mail/b", 5000)
+        self.assertIsNone(packing.pack(self.item))
+        self.assertEqual([], os.listdir(tree))
+
+    def test_archives_unpacked(self):
+        tree, _, _ = packing.pack(self.item)
+        target = os.path.join(self.root, "target")
+        shutil.copytree(tree + self.mail, target)
+        archive = os.path.join(target, packing.PACK_NAME)
+
+        self.assertEqual(1, packing.unpack_archives((archive, archive)))
+
+        self.assertEqual(["a", "b"], sorted(os.listdir(target)))
+        with open(os.path.join(target, "b"), "rb") as f:
+            self.assertEqual(b"\0\0", f.read())
+        self.assertEqual(1000000000, os.stat(os.path.join(target, "a")).st_mtime)
+
+    def test_paths_outside_includes_ignored(self):
+        item = FilesBackupItem(
+            includes=(os.path.join(self.source, "other"),),
+            excludes=(),
+            rotation_strategy=None,
+            packing=PackingPolicy(paths=(self.mail,)),
+        )
+
+        with self.assertLogs(packing.log, "WARNING"):
+            self.assertIsNone(packing.pack(item))
+
+    def __write(self, path: str, size: int) -> None:
+        path = os.path.join(self.source, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(b"\0" * size)
+
+
+if __name__ == "__main__":
+    unittest.main()
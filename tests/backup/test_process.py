@@ -0,0 +1,88 @@
+import os
+import sys
+import signal
+import unittest
+
+from backee.backup import process
+
+
+class ProcessTestCase(unittest.TestCase):
+    """
+    Tests for `backee/backup/process.py`.
+    """
+
+    def test_full_pipes_drained(self):
+        # more than a pipe buffer of errors is written before stdout
+        script = (
+            "import sys\n"
+            "for i in range(20000): print('error', i, file=sys.stderr)\n"
+            "for i in range(20000): print('line', i)\n"
+            "sys.exit(3)\n"
+        )
+        lines = []
+
+        result = process.run((sys.executable, "-c", script), on_line=lines.append)
+
+        self.assertEqual(3, result.exit_code)
+        self.assertEqual(20000, len(lines))
+        self.assertEqual("line 19999", lines[-1])
+        self.assertEqual(process.TAIL_LINES, len(result.stdout))
+        self.assertEqual(process.TAIL_LINES, len(result.stderr))
+        self.assertEqual("error 19999", result.stderr[-1])
+        self.assertFalse(result.stopped)
+
+    def test_resource_usage_reported(self):
+        result = process.run(
+            (sys.executable, "-c", "x = bytearray(64 * 2**20); sum(range(10**6))")
+        )
+
+        self.assertEqual(0, result.exit_code)
+        self.assertGreater(result.user_time + result.system_time, 0)
+        self.assertGreater(result.max_rss, 64 * 2**20)
+
+    def test_exit_code_of_reaped_child(self):
+        result = process.run((sys.executable, "-c", "import sys; sys.exit(7)"))
+        self.assertEqual(7, result.exit_code)
+        # resource usage is reported only if the child was reaped by wait4
+        self.assertIsNotNone(result.user_time)
+
+        result = process.run(
+            (sys.executable, "-c", "import os, signal; os.kill(os.getpid(), 9)")
+        )
+        self.assertEqual(-signal.SIGKILL, result.exit_code)
+        self.assertIsNotNone(result.user_time)
+
+    def test_shell_command(self):
+        result = process.run("echo a; echo b >&2; exit 1")
+
+        self.assertEqual(1, result.exit_code)
+        self.assertEqual(("a",), result.stdout)
+        self.assertEqual(("b",), result.stderr)
+
+    def test_stopped_by_line_handler(self):
+        result = process.run(
+            (sys.executable, "-u", "-c", "import time\nprint('go')\ntime.sleep(60)"),
+            on_line=lambda line: line == "go",
+        )
+
+        self.assertTrue(result.stopped)
+        self.assertLess(result.elapsed, 30)
+
+    def test_executable_found_once(self):
+        process.find_executable.cache_clear()
+
+        path = process.find_executable("sh")
+        self.assertTrue(os.path.isabs(path))
+        self.assertEqual(path, process.find_executable("sh"))
+        self.assertEqual(1, process.find_executable.cache_info().misses)
+
+        with self.assertRaises(OSError):
+            process.find_executable("backee-missing-dependency")
+
+    def test_timeout(self):
+        with self.assertRaises(TimeoutError):
+            process.run(("sleep", "60"), timeout=0.2)
+
+
+if __name__ == "__main__":
+    unittest.main()
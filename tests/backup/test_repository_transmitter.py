@@ -0,0 +1,165 @@
+import os
+import glob
+import random
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from backee.backup import backup, restore
+from backee.backup.repository import Repository
+from backee.backup.repository_transmitter import (
+    RepositoryTransmitter,
+    REPOSITORY_DIR_NAME,
+)
+from backee.model.items import FilesBackupItem
+from backee.model.servers import RepositoryBackupServer
+from backee.model.rotation_strategy import RotationStrategy
+
+
+class RepositoryTransmitterTestCase(unittest.TestCase):
+    """
+    Tests for `backee/backup/repository_transmitter.py`.
+    """
+
+    def setUp(self):
+        self.__temp_dir = tempfile.TemporaryDirectory()
+        self.root = self.__temp_dir.name
+        self.source = os.path.join(self.root, "source")
+        self.location = os.path.join(self.root, "repository")
+        os.makedirs(self.source)
+        self.data = (
+            random.Random(1).getrandbits(8 * 2**20).to_bytes(2**20, "little")
+        )
+        self.__write("big.img", self.data)
+        self.__write("small.txt", b"small")
+
+        self.server = RepositoryBackupServer(
+            name="repository",
+            rotation_strategy=RotationStrategy(daily=1, monthly=0, yearly=0),
+            location=self.location,
+            min_chunk_size=4 * 1024,
+            avg_chunk_size=16 * 1024,
+            max_chunk_size=64 * 1024,
+            pack_size=256 * 1024,
+        )
+        self.item = FilesBackupItem(
+            includes=(self.source,), excludes=(), rotation_strategy=None
+        )
+        self.item_root = os.path.join(self.location, self.item.name)
+        self.links = os.path.join(self.item_root, "current")
+
+    def tearDown(self):
+        self.__temp_dir.cleanup()
+
+    def test_only_changed_bytes_stored(self):
+        transmitter = RepositoryTransmitter(self.server)
+        first = os.path.join(self.item_root, "backup_1")
+        second = os.path.join(self.item_root, "backup_2")
+
+        transmitter.transmit(self.links, self.item, first)
+        transmitter.recreate_links_dir(first, self.links)
+        size_after_first = self.__get_packs_size()
+
+        self.__write("big.img", self.data[:500000] + b"changed" + self.data[500000:])
+        self.assertEqual(
+            len(self.data) + len(b"changed"),
+            transmitter.get_transfer_file_size(self.links, self.item, second),
+        )
+        transmitter.transmit(self.links, self.item, second)
+
+        self.assertLess(self.__get_packs_size() - size_after_first, 200 * 1024)
+        self.assertTrue(transmitter.verify_backup(self.item, second))
+        self.assertFalse(transmitter.verify_backup(self.item, first))
+
+    def test_restore_after_rotation(self):
+        transmitter = RepositoryTransmitter(self.server)
+        first = os.path.join(self.item_root, "backup_1")
+        second = os.path.join(self.item_root, "backup_2")
+        transmitter.transmit(self.links, self.item, first)
+        transmitter.recreate_links_dir(first, self.links)
+        self.__write("big.img", self.data[::-1])
+        transmitter.transmit(self.links, self.item, second)
+        size_before_rotation = self.__get_packs_size()
+
+        transmitter.remove_remote_dirs((first,))
+
+        # chunks only used by the removed snapshot are gone
+        self.assertLess(self.__get_packs_size(), size_before_rotation * 0.75)
+
+        mirror_dir = os.path.join(self.root, "mirror")
+        transmitter.create_index(second, second + ".index.gz")
+        target = os.path.join(self.root, "target")
+        restore.restore(
+            transmitter=RepositoryTransmitter(self.server),
+            server=self.server,
+            mirror_dir=mirror_dir,
+            item_name=self.item.name,
+            backup_name="backup_2",
+            target_dir=target,
+            paths=(),
+            streams=2,
+        )
+
+        restored = os.path.join(target, self.source.lstrip("/"))
+        with open(os.path.join(restored, "big.img"), "rb") as f:
+            self.assertEqual(self.data[::-1], f.read())
+        self.assertEqual(
+            os.stat(os.path.join(self.source, "small.txt")).st_mtime_ns,
+            os.stat(os.path.join(restored, "small.txt")).st_mtime_ns,
+        )
+
+    def test_garbage_collection_waits_for_stored_chunks(self):
+        path = os.path.join(self.location, REPOSITORY_DIR_NAME)
+        writer = Repository(path, pack_size=2**20, compression_level=1)
+        collector = Repository(path, pack_size=2**20, compression_level=1)
+        collected = threading.Event()
+
+        def collect():
+            with collector.locked(exclusive=True):
+                collector.collect_garbage(set(), 0.5)
+            collected.set()
+
+        with writer.locked():
+            writer.store_chunk(b"chunk")
+            writer.flush()
+            thread = threading.Thread(target=collect)
+            thread.start()
+            # the chunk is not referenced by a tree yet, but it is not removed
+            self.assertFalse(collected.wait(0.5))
+            self.assertEqual(
+                b"chunk", writer.read_chunk(Repository.get_chunk_id(b"chunk"))
+            )
+        thread.join()
+
+        # chunk was removed after all, writer reloads indexes and stores it again
+        with writer.locked():
+            self.assertEqual(
+                (Repository.get_chunk_id(b"chunk"), True), writer.store_chunk(b"chunk")
+            )
+
+    @mock.patch.dict("os.environ", {})
+    def test_backup(self):
+        os.environ["XDG_CACHE_HOME"] = os.path.join(self.root, "cache")
+
+        backup.backup("test", (self.item,), (self.server,))
+
+        snapshots = glob.glob(os.path.join(self.item_root, "backup_*", "tree.gz"))
+        self.assertEqual(1, len(snapshots))
+        self.assertTrue(os.path.islink(self.links))
+
+    def __get_packs_size(self) -> int:
+        return sum(
+            os.path.getsize(x)
+            for x in glob.glob(
+                os.path.join(self.location, REPOSITORY_DIR_NAME, "packs", "*", "*")
+            )
+        )
+
+    def __write(self, path: str, data: bytes) -> None:
+        with open(os.path.join(self.source, path), "wb") as f:
+            f.write(data)
+
+
+if __name__ == "__main__":
+    unittest.main()
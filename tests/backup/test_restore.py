@@ -0,0 +1,155 @@
+import os
+import stat
+import tempfile
+import unittest
+from unittest.mock import Mock
+
+from backee.backup import file_index, restore
+from backee.backup.local_transmitter import LocalTransmitter
+from backee.model.file_index import FileIndexEntry
+from backee.model.servers import LocalBackupServer, SshBackupServer
+from backee.model.rotation_strategy import RotationStrategy
+
+
+class RestoreTestCase(unittest.TestCase):
+    """
+    Tests for `backee/backup/restore.py`.
+    """
+
+    def test_streams_balanced(self):
+        """
+        Big directories are split into subtrees and streams get similar sizes.
+        """
+        entries = [
+            self.__entry(f"big/sub{i}/file{j}", size=100, inode=i * 10 + j)
+            for i in range(8)
+            for j in range(10)
+        ] + [self.__entry(f"small/file{i}", size=10, inode=1000 + i) for i in range(4)]
+
+        streams = restore.split_streams(entries, 4)
+
+        self.assertEqual(4, len(streams))
+        self.assertCountEqual(entries, [x for s in streams for x in s])
+        sizes = [sum(x.size for x in s) for s in streams]
+        self.assertLessEqual(max(sizes) - min(sizes), 1000)
+
+    def test_hard_links_in_same_stream(self):
+        entries = [
+            self.__entry("a/file", size=100, inode=1),
+            self.__entry("b/file", size=100, inode=2),
+            self.__entry("c/file", size=100, inode=3),
+            self.__entry("d/link", size=100, inode=1),
+        ]
+
+        streams = restore.split_streams(entries, 4)
+
+        linked = [s for s in streams if entries[0] in s]
+        self.assertEqual(1, len(linked))
+        self.assertIn(entries[3], linked[0])
+
+    def test_no_more_streams_than_files(self):
+        streams = restore.split_streams([self.__entry("a", size=1, inode=1)], 8)
+
+        self.assertEqual(1, len(streams))
+        self.assertEqual((), restore.split_streams([], 8))
+
+    def test_finished_streams_skipped_on_resume(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            mirror_dir = os.path.join(temp_dir, "mirror")
+            target_dir = os.path.join(temp_dir, "target")
+            os.makedirs(mirror_dir)
+            with open(file_index.get_mirror_path(mirror_dir, "backup_1"), "wb") as f:
+                file_index.write_index(
+                    [
+                        self.__entry("a/file", size=10, inode=1),
+                        self.__entry("b/file", size=10, inode=2),
+                        self.__entry("c/file", size=10, inode=3),
+                    ],
+                    f,
+                )
+
+            transmitter = Mock()
+            transmitter.restore.side_effect = [10, OSError("connection lost")]
+            with self.assertRaises(OSError):
+                self.__restore(transmitter, mirror_dir, target_dir, streams=2)
+
+            transmitter.restore.side_effect = None
+            transmitter.restore.return_value = 10
+            transmitter.restore.reset_mock()
+            self.__restore(transmitter, mirror_dir, target_dir, streams=8)
+
+            # only the failed stream is restored again with the original plan
+            self.assertEqual(1, transmitter.restore.call_count)
+            self.assertEqual(
+                "/location/files/backup_1/", transmitter.restore.call_args[0][0]
+            )
+            self.assertFalse(
+                os.path.exists(os.path.join(target_dir, restore.STATE_DIR_NAME))
+            )
+
+    def test_directories_and_symlinks_restored(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            server = LocalBackupServer(
+                name="local",
+                rotation_strategy=RotationStrategy(0, 0, 0),
+                location=os.path.join(temp_dir, "backups"),
+            )
+            snapshot = os.path.join(server.location, "files", "backup_1")
+            os.makedirs(os.path.join(snapshot, "dir"))
+            os.makedirs(os.path.join(snapshot, "empty"))
+            with open(os.path.join(snapshot, "dir", "file"), "w") as f:
+                f.write("data")
+            os.symlink("dir/file", os.path.join(snapshot, "link"))
+            os.chmod(os.path.join(snapshot, "dir"), 0o750)
+            os.chmod(os.path.join(snapshot, "empty"), 0o700)
+            os.utime(os.path.join(snapshot, "dir"), (1e9, 1e9))
+            transmitter = LocalTransmitter(server)
+            transmitter.create_index(
+                snapshot, file_index.get_remote_index_path(snapshot)
+            )
+
+            target_dir = os.path.join(temp_dir, "target")
+            restore.restore(
+                transmitter=transmitter,
+                server=server,
+                mirror_dir=os.path.join(temp_dir, "mirror"),
+                item_name="files",
+                backup_name="backup_1",
+                target_dir=target_dir,
+                paths=(),
+                streams=4,
+            )
+
+            self.assertEqual("dir/file", os.readlink(os.path.join(target_dir, "link")))
+            st = os.stat(os.path.join(target_dir, "dir"))
+            self.assertEqual(0o750, stat.S_IMODE(st.st_mode))
+            self.assertEqual(1e9, st.st_mtime)
+            st = os.stat(os.path.join(target_dir, "empty"))
+            self.assertEqual(0o700, stat.S_IMODE(st.st_mode))
+
+    def __restore(self, transmitter, mirror_dir, target_dir, streams):
+        restore.restore(
+            transmitter=transmitter,
+            server=SshBackupServer(
+                name="name",
+                rotation_strategy=RotationStrategy(0, 0, 0),
+                location="/location",
+                hostname="hostname",
+                port=22,
+                username="username",
+                key_path=None,
+            ),
+            mirror_dir=mirror_dir,
+            item_name="files",
+            backup_name="backup_1",
+            target_dir=target_dir,
+            paths=(),
+            streams=streams,
+        )
+
+    def __entry(self, path: str, size: int, inode: int) -> FileIndexEntry:
+        return FileIndexEntry(path=path, size=size, mtime=1.0, inode=inode, hash=None)
+
+
+if __name__ == "__main__":
+    unittest.main()
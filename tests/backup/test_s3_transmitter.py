@@ -0,0 +1,207 @@
+import os
+import random
+import tempfile
+import unittest
+from unittest import mock
+
+from tests.util.s3_stand_in import S3StandIn
+
+from backee.backup import backup, restore
+from backee.backup.s3_transmitter import S3Transmitter
+from backee.model.items import FilesBackupItem
+from backee.model.servers import S3BackupServer
+from backee.model.rotation_strategy import RotationStrategy
+
+
+class S3TransmitterTestCase(unittest.TestCase):
+    """
+    Tests for `backee/backup/s3_transmitter.py`.
+    """
+
+    def setUp(self):
+        self.__temp_dir = tempfile.TemporaryDirectory()
+        self.root = self.__temp_dir.name
+        self.source = os.path.join(self.root, "source")
+        os.makedirs(self.source)
+        self.data = random.Random(1).getrandbits(8 * 300000).to_bytes(300000, "little")
+        self.__write("big.img", self.data)
+        self.__write("small.txt", b"small")
+        os.symlink("small.txt", os.path.join(self.source, "link"))
+
+        self.s3 = S3StandIn(max_keys=100)
+        self.s3.__enter__()
+        self.addCleanup(self.s3.__exit__)
+
+        self.server = S3BackupServer(
+            name="s3",
+            rotation_strategy=RotationStrategy(daily=1, monthly=0, yearly=0),
+            location="backups",
+            endpoint=self.s3.endpoint,
+            bucket="bucket",
+            access_key="access",
+            secret_key="secret",
+            part_size=64 * 1024,
+            concurrency=2,
+        )
+        self.item = FilesBackupItem(
+            includes=(self.source,), excludes=(), rotation_strategy=None
+        )
+        self.item_root = f"backups/{self.item.name}/"
+        self.links = self.item_root + "current"
+        self.source_key = self.source.lstrip("/")
+
+    def tearDown(self):
+        self.__temp_dir.cleanup()
+
+    def test_unchanged_objects_referenced(self):
+        transmitter = S3Transmitter(self.server)
+        self.__transmit(transmitter, "backup_1")
+
+        # 300000 bytes in 64k parts
+        self.assertEqual(5, self.s3.requests["upload_part"])
+        self.assertEqual(
+            self.data,
+            self.s3.objects[f"backups/files/backup_1/files/{self.source_key}/big.img"],
+        )
+
+        self.__write("small.txt", b"changed")
+        self.s3.requests.clear()
+        self.assertEqual(
+            len(b"changed"),
+            transmitter.get_transfer_file_size(
+                self.links, self.item, self.item_root + "backup_2-incomplete/"
+            ),
+        )
+        self.__transmit(transmitter, "backup_2")
+
+        # the changed file, manifest and links are stored, the manifest
+        # is the only copied object
+        self.assertEqual(0, self.s3.requests["upload_part"])
+        self.assertEqual(1, self.s3.requests["copy"])
+        self.assertEqual(3, self.s3.requests["put"])
+        self.assertNotIn(
+            f"backups/files/backup_2/files/{self.source_key}/big.img", self.s3.objects
+        )
+        self.assertTrue(
+            transmitter.verify_backup(self.item, self.item_root + "backup_2")
+        )
+        self.assertEqual(
+            (self.item_root + "backup_1", self.item_root + "backup_2"),
+            transmitter.get_backup_names_sorted(self.item_root),
+        )
+
+    def test_referenced_objects_kept_by_rotation(self):
+        transmitter = S3Transmitter(self.server)
+        self.__transmit(transmitter, "backup_1")
+        self.__write("small.txt", b"changed")
+        self.__transmit(transmitter, "backup_2")
+
+        transmitter.remove_remote_dirs((self.item_root + "backup_1",))
+
+        big = f"{self.source_key}/big.img"
+        self.assertIn(f"backups/files/backup_1/files/{big}", self.s3.objects)
+        self.assertNotIn(
+            f"backups/files/backup_1/files/{self.source_key}/small.txt",
+            self.s3.objects,
+        )
+        self.assertEqual(
+            (self.item_root + "backup_2",),
+            transmitter.get_backup_names_sorted(self.item_root),
+        )
+        self.assertTrue(
+            transmitter.verify_backup(self.item, self.item_root + "backup_2")
+        )
+
+        target = os.path.join(self.root, "target")
+        files_from = os.path.join(self.root, "files_from")
+        with open(files_from, "wb") as f:
+            f.write(os.fsencode(big))
+        transmitter.restore(self.item_root + "backup_2", files_from, target)
+        with open(os.path.join(target, big), "rb") as f:
+            self.assertEqual(self.data, f.read())
+
+        # retired snapshot is removed once nothing refers to it
+        self.__write("big.img", b"changed")
+        self.__transmit(transmitter, "backup_3")
+        transmitter.remove_remote_dirs((self.item_root + "backup_2",))
+
+        self.assertFalse(
+            any(x.startswith("backups/files/backup_1/") for x in self.s3.objects)
+        )
+        self.assertIn(
+            f"backups/files/backup_2/files/{self.source_key}/small.txt",
+            self.s3.objects,
+        )
+        self.assertTrue(
+            transmitter.verify_backup(self.item, self.item_root + "backup_3")
+        )
+
+    @mock.patch.dict("os.environ", {})
+    def test_backup_removes_old_snapshots_in_batches(self):
+        os.environ["XDG_CACHE_HOME"] = os.path.join(self.root, "cache")
+        old = "backups/files/backup_2000-01-01-00-00"
+        for i in range(1500):
+            self.s3.objects[f"{old}/files/file{i}"] = b""
+        self.s3.objects[f"{old}/manifest.gz"] = b""
+        self.s3.objects[f"{old}.index.gz"] = b""
+
+        backup.backup("test", (self.item,), (self.server,))
+
+        self.assertFalse(any(x.startswith(old) for x in self.s3.objects))
+        # 1501 objects of the snapshot, index, incomplete manifest
+        self.assertEqual(4, self.s3.requests["delete"])
+        # lease is deleted only if it was not taken over
+        self.assertEqual(1, self.s3.requests["delete_object"])
+        self.assertEqual(
+            1, len(S3Transmitter(self.server).get_backup_names_sorted(self.item_root))
+        )
+
+    def test_lock_renewed_only_by_holder(self):
+        transmitter = S3Transmitter(self.server)
+        path = self.item_root + ".backee-lock"
+        self.assertTrue(transmitter.create_lock(path, "first 1"))
+
+        self.assertFalse(transmitter.renew_lock(path, "other 1", "other 2"))
+        self.assertTrue(transmitter.renew_lock(path, "first 1", "first 2"))
+        self.assertEqual("first 2", transmitter.read_lock(path))
+
+    @mock.patch.dict("os.environ", {})
+    def test_restore(self):
+        os.environ["XDG_CACHE_HOME"] = os.path.join(self.root, "cache")
+        backup.backup("test", (self.item,), (self.server,))
+        transmitter = S3Transmitter(self.server)
+        (backup_path,) = transmitter.get_backup_names_sorted(self.item_root)
+
+        target = os.path.join(self.root, "target")
+        restore.restore(
+            transmitter=transmitter,
+            server=self.server,
+            mirror_dir=os.path.join(self.root, "mirror"),
+            item_name=self.item.name,
+            backup_name=os.path.basename(backup_path),
+            target_dir=target,
+            paths=(),
+            streams=2,
+        )
+
+        restored = os.path.join(target, self.source_key)
+        with open(os.path.join(restored, "big.img"), "rb") as f:
+            self.assertEqual(self.data, f.read())
+        self.assertEqual(
+            os.stat(os.path.join(self.source, "small.txt")).st_mtime_ns,
+            os.stat(os.path.join(restored, "small.txt")).st_mtime_ns,
+        )
+
+    def __transmit(self, transmitter: S3Transmitter, name: str) -> None:
+        temp = f"{self.item_root}{name}-incomplete/"
+        transmitter.transmit(self.links, self.item, temp)
+        transmitter.rename_dir(temp, f"{self.item_root}{name}/")
+        transmitter.recreate_links_dir(f"{self.item_root}{name}/", self.links)
+
+    def __write(self, path: str, data: bytes) -> None:
+        with open(os.path.join(self.source, path), "wb") as f:
+            f.write(data)
+
+
+if __name__ == "__main__":
+    unittest.main()
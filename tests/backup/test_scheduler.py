@@ -0,0 +1,36 @@
+import datetime
+import unittest
+
+from backee.backup.scheduler import get_next_run
+from backee.parser.schedule_parser import parse_cron
+
+
+class SchedulerTestCase(unittest.TestCase):
+    """
+    Tests for `backee/backup/scheduler.py`.
+    """
+
+    def test_next_run(self):
+        # 2024-01-01 is Monday
+        now = datetime.datetime(2024, 1, 1, 2, 30, 15)
+
+        def next_run(expression: str) -> datetime.datetime:
+            return get_next_run(parse_cron(expression), now)
+
+        self.assertEqual(datetime.datetime(2024, 1, 1, 2, 31), next_run("* * * * *"))
+        self.assertEqual(datetime.datetime(2024, 1, 2, 2, 30), next_run("30 2 * * *"))
+        self.assertEqual(datetime.datetime(2024, 1, 1, 2, 45), next_run("*/15 * * * *"))
+        self.assertEqual(datetime.datetime(2024, 1, 1, 3, 0), next_run("@hourly"))
+        self.assertEqual(datetime.datetime(2024, 1, 6, 0, 0), next_run("0 0 * * 6"))
+        self.assertEqual(datetime.datetime(2024, 2, 1, 0, 0), next_run("@monthly"))
+        self.assertEqual(datetime.datetime(2024, 2, 29, 1, 0), next_run("0 1 29 2 *"))
+        # either day of month or day of week matches
+        self.assertEqual(datetime.datetime(2024, 1, 3, 0, 0), next_run("0 0 15 * 3"))
+
+    def test_never_matching_cron_rejected(self):
+        with self.assertRaises(ValueError):
+            get_next_run(parse_cron("0 0 30 2 *"), datetime.datetime(2024, 1, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,145 @@
+import os
+import random
+import tempfile
+import unittest
+from unittest import mock
+
+from paramiko import RSAKey
+
+from tests.util.sftp_stand_in import SftpStandIn
+
+from backee.backup import backup, restore
+from backee.backup.sftp_transmitter import SftpTransmitter
+from backee.model.items import FilesBackupItem
+from backee.model.servers import SftpBackupServer
+from backee.model.rotation_strategy import RotationStrategy
+
+
+class SftpTransmitterTestCase(unittest.TestCase):
+    """
+    Tests for `backee/backup/sftp_transmitter.py`.
+    """
+
+    def setUp(self):
+        self.__temp_dir = tempfile.TemporaryDirectory()
+        self.root = self.__temp_dir.name
+        self.source = os.path.join(self.root, "source")
+        self.remote_root = os.path.join(self.root, "remote")
+        os.makedirs(os.path.join(self.source, "dir"))
+        os.makedirs(self.remote_root)
+        self.data = random.Random(1).getrandbits(8 * 300000).to_bytes(300000, "little")
+        self.__write("big.img", self.data)
+        self.__write("dir/small.txt", b"small")
+        os.symlink("dir/small.txt", os.path.join(self.source, "link"))
+
+        key_path = os.path.join(self.root, "id_rsa")
+        RSAKey.generate(1024).write_private_key_file(key_path)
+
+        self.sftp = SftpStandIn(self.remote_root)
+        self.sftp.__enter__()
+        self.addCleanup(self.sftp.__exit__)
+
+        self.server = SftpBackupServer(
+            name="sftp",
+            rotation_strategy=RotationStrategy(daily=1, monthly=0, yearly=0),
+            location="/backups",
+            hostname="127.0.0.1",
+            port=self.sftp.port,
+            username="backee",
+            key_path=key_path,
+            channels=2,
+        )
+        self.item = FilesBackupItem(
+            includes=(self.source,), excludes=(), rotation_strategy=None
+        )
+        self.item_root = f"/backups/{self.item.name}/"
+        self.links = self.item_root + "current"
+
+    def tearDown(self):
+        self.__temp_dir.cleanup()
+
+    def test_unchanged_files_hard_linked(self):
+        transmitter = SftpTransmitter(self.server)
+        first = self.item_root + "backup_1"
+        second = self.item_root + "backup_2"
+        transmitter.create_dir(self.item_root)
+
+        transmitter.transmit(self.links, self.item, first)
+        transmitter.recreate_links_dir(first, self.links)
+        self.__write("dir/small.txt", b"changed")
+        self.assertEqual(
+            len(b"changed"),
+            transmitter.get_transfer_file_size(self.links, self.item, second),
+        )
+        transmitter.transmit(self.links, self.item, second)
+
+        def backed_up(snapshot: str, name: str) -> str:
+            return os.path.join(
+                self.remote_root + snapshot, self.source.lstrip("/"), name
+            )
+
+        with open(backed_up(second, "big.img"), "rb") as f:
+            self.assertEqual(self.data, f.read())
+        self.assertEqual(
+            os.stat(backed_up(first, "big.img")).st_ino,
+            os.stat(backed_up(second, "big.img")).st_ino,
+        )
+        self.assertNotEqual(
+            os.stat(backed_up(first, "dir/small.txt")).st_ino,
+            os.stat(backed_up(second, "dir/small.txt")).st_ino,
+        )
+        self.assertEqual("dir/small.txt", os.readlink(backed_up(second, "link")))
+        self.assertTrue(transmitter.verify_backup(self.item, second))
+        self.assertFalse(transmitter.verify_backup(self.item, first))
+        self.assertGreater(transmitter.get_disk_space_available(first), 0)
+        # one connection per upload channel and one for directories
+        self.assertLessEqual(self.sftp.connections, self.server.channels + 1)
+
+    def test_lock_renewed_only_by_holder(self):
+        transmitter = SftpTransmitter(self.server)
+        transmitter.create_dir(self.item_root)
+        path = self.item_root + ".backee-lock"
+        self.assertTrue(transmitter.create_lock(path, "first 1"))
+
+        self.assertFalse(transmitter.renew_lock(path, "other 1", "other 2"))
+        self.assertEqual("first 1", transmitter.read_lock(path))
+        self.assertTrue(transmitter.renew_lock(path, "first 1", "first 2"))
+        self.assertEqual("first 2", transmitter.read_lock(path))
+        self.assertEqual(
+            [".backee-lock"], os.listdir(self.remote_root + self.item_root)
+        )
+
+    @mock.patch.dict("os.environ", {})
+    def test_restore(self):
+        os.environ["XDG_CACHE_HOME"] = os.path.join(self.root, "cache")
+        backup.backup("test", (self.item,), (self.server,))
+        transmitter = SftpTransmitter(self.server)
+        (backup_path,) = transmitter.get_backup_names_sorted(self.item_root)
+
+        target = os.path.join(self.root, "target")
+        restore.restore(
+            transmitter=transmitter,
+            server=self.server,
+            mirror_dir=os.path.join(self.root, "mirror"),
+            item_name=self.item.name,
+            backup_name=os.path.basename(backup_path),
+            target_dir=target,
+            paths=(),
+            streams=2,
+        )
+
+        restored = os.path.join(target, self.source.lstrip("/"))
+        with open(os.path.join(restored, "big.img"), "rb") as f:
+            self.assertEqual(self.data, f.read())
+        self.assertEqual(
+            int(os.stat(os.path.join(self.source, "dir", "small.txt")).st_mtime),
+            os.stat(os.path.join(restored, "dir", "small.txt")).st_mtime,
+        )
+
+    def __write(self, path: str, data: bytes) -> None:
+        with open(os.path.join(self.source, path), "wb") as f:
+            f.write(data)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from backee.backup import source
+from backee.model.items import FilesBackupItem
+
+
+class SourceTestCase(unittest.TestCase):
+    """
+    Tests for `backee/backup/source.py`.
+    """
+
+    def setUp(self):
+        self.__temp_dir = tempfile.TemporaryDirectory()
+        self.root = self.__temp_dir.name
+        for path in ("a/1.db", "a/2.db", "a/.hidden.db", "b/c"):
+            os.makedirs(os.path.dirname(os.path.join(self.root, path)), exist_ok=True)
+            with open(os.path.join(self.root, path), "w"):
+                pass
+
+    def tearDown(self):
+        self.__temp_dir.cleanup()
+
+    def test_exclude_patterns(self):
+        self.assertTrue(source.compile_pattern("/a/b").match("/a/b"))
+        self.assertFalse(source.compile_pattern("/a/b").match("/x/a/b"))
+        self.assertTrue(source.compile_pattern("*.log").match("/a/b/c.log"))
+        self.assertTrue(source.compile_pattern("/a/*.log").match("/a/c.log"))
+        self.assertFalse(source.compile_pattern("/a/*.log").match("/a/b/c.log"))
+        self.assertTrue(source.compile_pattern("/a/**.log").match("/a/b/c.log"))
+        self.assertTrue(source.compile_pattern("/a/b/").match("/a/b"))
+
+    def test_paths_expanded_with_cached_scans(self):
+        paths = tuple(os.path.join(self.root, x) for x in ("a/*.db", "b/c", "b/d"))
+        scans = {}
+
+        with mock.patch("os.listdir", wraps=os.listdir) as listdir:
+            with self.assertLogs(source.log, "ERROR") as logs:
+                expanded = source.expand_paths(paths, scans, "item")
+            source.expand_paths(paths, scans, "item")
+
+        self.assertEqual(
+            tuple(os.path.join(self.root, x) for x in ("a/1.db", "a/2.db", "b/c")),
+            expanded,
+        )
+        self.assertIn(paths[2], logs.output[0])
+        # every directory on the way is listed once
+        self.assertEqual(
+            len(set(x[0] for x in listdir.call_args_list)), listdir.call_count
+        )
+
+    def test_literal_paths_not_listed(self):
+        paths = (os.path.join(self.root, "b", "c"), os.path.join(self.root, "b/d"))
+
+        with mock.patch("os.listdir", side_effect=PermissionError) as listdir:
+            with self.assertLogs(source.log, "ERROR") as logs:
+                expanded = source.expand_paths(paths, {}, "item")
+
+        self.assertEqual(paths[:1], expanded)
+        self.assertEqual(1, len(logs.output))
+        self.assertFalse(listdir.called)
+
+    def test_walk_sources(self):
+        with tempfile.TemporaryDirectory() as root:
+            os.makedirs(os.path.join(root, "a", "b"))
+            for name in ("a/b/1.db", "a/b/2.log", "a/3.db"):
+                with open(os.path.join(root, name), "w"):
+                    pass
+
+            item = FilesBackupItem(
+                includes=(
+                    os.path.join(root, "a", "*", "*.db"),
+                    os.path.join(root, "a"),
+                ),
+                excludes=("*.log",),
+                rotation_strategy=None,
+            )
+            paths = [x[0] for x in source.walk_sources(item)]
+
+        relative = [os.path.relpath(x, root) for x in paths if x.startswith(root + "/")]
+        self.assertEqual(["a", "a/b", "a/b/1.db", "a/3.db"], relative)
+        # parent directories go first, like implied directories of rsync
+        self.assertEqual(root, paths[len(paths) - len(relative) - 1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+from backee.backup import backup, filters, sqlite_snapshot
+from backee.model.items import FilesBackupItem
+from backee.model.servers import LocalBackupServer
+from backee.model.rotation_strategy import RotationStrategy
+
+
+class SqliteSnapshotTestCase(unittest.TestCase):
+    """
+    Tests for `backee/backup/sqlite_snapshot.py`.
+    """
+
+    def setUp(self):
+        self.__temp_dir = tempfile.TemporaryDirectory()
+        self.root = self.__temp_dir.name
+        self.source = os.path.join(self.root, "source")
+        self.tree = os.path.join(self.root, "tree")
+        os.makedirs(self.source)
+
+        self.database = os.path.join(self.source, "app.db")
+        self.connection = sqlite3.connect(self.database)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("CREATE TABLE t (value TEXT)")
+        self.connection.executemany(
+            "INSERT INTO t VALUES (?)", ((str(x) * 100,) for x in range(1000))
+        )
+        self.connection.commit()
+        with open(os.path.join(self.source, "plain.db"), "w") as f:
+            f.write("not a database")
+
+    def tearDown(self):
+        self.connection.close()
+        self.__temp_dir.cleanup()
+
+    def test_databases_detected(self):
+        self.assertTrue(sqlite_snapshot.is_database(self.database))
+        self.assertFalse(
+            sqlite_snapshot.is_database(os.path.join(self.source, "plain.db"))
+        )
+        self.assertFalse(sqlite_snapshot.is_database(self.source))
+
+    def test_consistent_copy_taken(self):
+        self.assertEqual(
+            (self.database,),
+            sqlite_snapshot.snapshot_databases((self.database,), self.tree),
+        )
+
+        snapshot = self.tree + self.database
+        self.assertEqual(
+            os.stat(self.source).st_mtime_ns,
+            os.stat(os.path.dirname(snapshot)).st_mtime_ns,
+        )
+        # uncheckpointed changes in the write-ahead log are copied as well
+        self.assertTrue(os.path.exists(self.database + "-wal"))
+        with sqlite3.connect(snapshot) as copy:
+            self.assertEqual(1000, copy.execute("SELECT COUNT(*) FROM t").fetchone()[0])
+
+    def test_unchanged_database_not_copied(self):
+        sqlite_snapshot.snapshot_databases((self.database,), self.tree)
+        snapshot = self.tree + self.database
+        inode = os.stat(snapshot).st_ino
+
+        sqlite_snapshot.snapshot_databases((self.database,), self.tree)
+        self.assertEqual(inode, os.stat(snapshot).st_ino)
+
+        self.connection.execute("DELETE FROM t")
+        self.connection.commit()
+        os.utime(self.database + "-wal", ns=(0, os.stat(snapshot).st_mtime_ns + 1))
+        sqlite_snapshot.snapshot_databases((self.database,), self.tree)
+        self.assertNotEqual(inode, os.stat(snapshot).st_ino)
+
+        # database is not backed up anymore
+        sqlite_snapshot.snapshot_databases((), self.tree)
+        self.assertEqual([], os.listdir(self.tree))
+
+    @mock.patch.dict("os.environ", {})
+    def test_databases_excluded_from_sources(self):
+        os.environ["XDG_CACHE_HOME"] = os.path.join(self.root, "cache")
+        item = FilesBackupItem(
+            includes=(os.path.join(self.source, "*.db"),),
+            excludes=(),
+            rotation_strategy=None,
+        )
+
+        compiled = filters.get_filters(item)
+        tree, files_from, sqlite_filter, databases = compiled.get_sqlite_snapshots()
+        self.assertEqual((self.database,), databases)
+        with open(files_from, "rb") as f:
+            self.assertEqual(os.fsencode(self.database.lstrip("/")) + b"\0", f.read())
+        with open(sqlite_filter, "rb") as f:
+            self.assertIn(b"- " + os.fsencode(self.database) + b"-wal\0", f.read())
+        # only the database is larger
+        self.assertIsNone(compiled.get_large_files(1024))
+        filters.clear_filters()
+
+        item = FilesBackupItem(
+            includes=item.includes,
+            excludes=(),
+            rotation_strategy=None,
+            sqlite_snapshots=False,
+        )
+        self.assertIsNone(filters.get_filters(item).get_sqlite_snapshots())
+        filters.clear_filters()
+
+    @mock.patch.dict("os.environ", {})
+    def test_warned_about_servers_without_snapshots(self):
+        os.environ["XDG_CACHE_HOME"] = os.path.join(self.root, "cache")
+        item = FilesBackupItem(
+            includes=(os.path.join(self.source, "*.db"),),
+            excludes=(),
+            rotation_strategy=None,
+        )
+        server = LocalBackupServer(
+            name="local",
+            rotation_strategy=RotationStrategy(daily=1, monthly=0, yearly=0),
+            location=os.path.join(self.root, "backups"),
+        )
+
+        with self.assertLogs(backup.log, "WARNING") as logs:
+            backup.backup("test", (item,), (server,))
+
+        self.assertIn("1 databases are copied to local", "\n".join(logs.output))
+
+
+if __name__ == "__main__":
+    unittest.main()
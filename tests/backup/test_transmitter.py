@@ -1,3 +1,5 @@
+import os
+import tempfile
 import unittest
 import subprocess
 from io import TextIOWrapper, BytesIO
@@ -8,10 +10,11 @@ from unittest.mock import Mock
 from backee.model.items import FilesBackupItem
 from backee.model.servers import SshBackupServer
 from backee.model.rotation_strategy import RotationStrategy
+from backee.model.transport_profile import TransportProfile
 
 from backee.backup.transmitter import SshTransmitter
 
-from backee.backup import constants
+from backee.backup import constants, filters
 
 
 class SshTransmitterTestCase(unittest.TestCase):
@@ -32,7 +35,7 @@ class SshTransmitterTestCase(unittest.TestCase):
 
         subprocess.return_value = self.__get_subprocess_mock(stdout="abc")
 
-        transmitter = SshTransmitter(server)
+        transmitter = SshTransmitter(server, deps=())
         self.assertTrue(transmitter.verify_backup(item, "/remote_path"))
         self.assertTrue(subprocess.called)
 
@@ -57,7 +60,7 @@ class SshTransmitterTestCase(unittest.TestCase):
             stdout="abc",
         )
 
-        transmitter = SshTransmitter(server)
+        transmitter = SshTransmitter(server, deps=())
         self.assertTrue(transmitter.verify_backup(item, "/remote_path"))
         self.assertTrue(subprocess.called)
 
@@ -80,7 +83,7 @@ class SshTransmitterTestCase(unittest.TestCase):
             stdout=">Xcstpoguax",
         )
 
-        transmitter = SshTransmitter(server)
+        transmitter = SshTransmitter(server, deps=())
         self.assertFalse(transmitter.verify_backup(item, "/remote_path"))
         self.assertTrue(subprocess.called)
 
@@ -103,7 +106,7 @@ class SshTransmitterTestCase(unittest.TestCase):
             stdout=".Xcstpoguax",
         )
 
-        transmitter = SshTransmitter(server)
+        transmitter = SshTransmitter(server, deps=())
         self.assertFalse(transmitter.verify_backup(item, "/remote_path"))
         self.assertTrue(subprocess.called)
 
@@ -143,6 +146,277 @@ class SshTransmitterTestCase(unittest.TestCase):
         self.assertTrue(transmitter.verify_backup(item, "/remote_path"))
         self.assertTrue(subprocess.called)
 
+    @mock.patch("subprocess.Popen")
+    def test_transport_profile_applied(self, subprocess):
+        item = FilesBackupItem(includes=(("/"),), excludes=(), rotation_strategy=None)
+        server = SshBackupServer(
+            name="name",
+            rotation_strategy=RotationStrategy(0, 0, 0),
+            location="/location",
+            hostname="hostname",
+            port=22,
+            username="username",
+            key_path=None,
+            transport=TransportProfile(
+                ciphers="aes128-gcm@openssh.com", compression=False, whole_file=True
+            ),
+        )
+
+        subprocess.return_value = self.__get_subprocess_mock(stdout="")
+
+        transmitter = SshTransmitter(server, deps=())
+        transmitter.verify_backup(item, "/remote_path")
+
+        rsync_cmd = " ".join(subprocess.call_args[0][0])
+        self.assertIn("-c aes128-gcm@openssh.com", rsync_cmd)
+        self.assertIn("--whole-file", rsync_cmd)
+        self.assertNotIn("--compress", rsync_cmd)
+
+    @mock.patch("subprocess.Popen")
+    def test_rsync_spawned_without_shell(self, subprocess):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            include = os.path.join(temp_dir, 'it\'s "quoted" $HOME')
+            os.mkdir(include)
+            item = FilesBackupItem(
+                includes=(include, os.path.join(temp_dir, "*")),
+                excludes=(),
+                rotation_strategy=None,
+            )
+            server = SshBackupServer(
+                name="name",
+                rotation_strategy=RotationStrategy(0, 0, 0),
+                location="/location",
+                hostname="hostname",
+                port=22,
+                username="username",
+                key_path="/keys/my key",
+            )
+
+            subprocess.return_value = self.__get_subprocess_mock(stdout="")
+
+            transmitter = SshTransmitter(server, deps=())
+            transmitter.verify_backup(item, "/remote_path")
+
+            rsync_cmd = subprocess.call_args[0][0]
+            self.assertFalse(subprocess.call_args[1]["shell"])
+            self.assertEqual("rsync", rsync_cmd[0])
+            self.assertEqual("/", rsync_cmd[-2])
+            self.assertIn(
+                "--rsh=ssh -p 22 -i '/keys/my key' -o StrictHostKeyChecking=no",
+                rsync_cmd,
+            )
+            (files_from,) = [x for x in rsync_cmd if x.startswith("--files-from=")]
+            with open(files_from.split("=", 1)[1], "rb") as f:
+                self.assertEqual(
+                    os.fsencode(include) + b"\0" + os.fsencode(include) + b"\0",
+                    f.read(),
+                )
+            filters.clear_filters()
+
+    @mock.patch.dict("os.environ", {})
+    @mock.patch("subprocess.Popen")
+    def test_large_files_sent_by_separate_stream(self, subprocess):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            os.environ["XDG_CACHE_HOME"] = os.path.join(temp_dir, "cache")
+            source = os.path.join(temp_dir, "source")
+            os.makedirs(os.path.join(source, "dir"))
+            with open(os.path.join(source, "small.txt"), "wb") as f:
+                f.write(b"small")
+            with open(os.path.join(source, "dir", "disk[1].img"), "wb") as f:
+                f.truncate(4096)
+            item = FilesBackupItem(
+                includes=(source,),
+                excludes=(),
+                rotation_strategy=None,
+                large_file_size=4096,
+            )
+            server = SshBackupServer(
+                name="name",
+                rotation_strategy=RotationStrategy(0, 0, 0),
+                location="/location",
+                hostname="hostname",
+                port=22,
+                username="username",
+                key_path=None,
+            )
+            ssh = Mock()
+            stdout = Mock()
+            stdout.readlines.return_value = ["false"]
+            stderr = Mock()
+            stderr.readlines.return_value = []
+            ssh.exec_command.return_value = (None, stdout, stderr)
+            subprocess.side_effect = lambda *args, **kwargs: (
+                self.__get_subprocess_mock(stdout="")
+            )
+
+            transmitter = SshTransmitter(server, ssh_client=ssh, deps=())
+            transmitter.transmit("/links", item, "/remote_path")
+
+            small_cmd, large_cmd = sorted(
+                (x[0][0] for x in subprocess.call_args_list),
+                key=lambda x: "--sparse" in x,
+            )
+            self.assertIn("--whole-file", small_cmd)
+            self.assertNotIn("--sparse", small_cmd)
+            self.assertIn("--no-whole-file", large_cmd)
+            self.assertNotIn("--whole-file", large_cmd)
+            self.assertNotIn("--recursive", large_cmd)
+
+            (large_filter,) = [x for x in small_cmd if "large-filter" in x]
+            with open(large_filter.split(" ", 1)[1], "rb") as f:
+                self.assertEqual(
+                    b"- " + os.fsencode(source) + b"/dir/disk\\[1].img\0", f.read()
+                )
+            (files_from,) = [x for x in large_cmd if x.startswith("--files-from=")]
+            with open(files_from.split("=", 1)[1], "rb") as f:
+                self.assertEqual(
+                    os.fsencode(os.path.join(source, "dir", "disk[1].img")) + b"\0",
+                    f.read(),
+                )
+            filters.clear_filters()
+
+    @mock.patch.dict("os.environ", {})
+    @mock.patch("backee.backup.compression.record_link_throughput")
+    @mock.patch("subprocess.Popen")
+    def test_sent_bytes_recorded(self, subprocess, record_link_throughput):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            os.environ["XDG_CACHE_HOME"] = os.path.join(temp_dir, "cache")
+            item = FilesBackupItem(
+                includes=(temp_dir,), excludes=(), rotation_strategy=None
+            )
+            server = SshBackupServer(
+                name="name",
+                rotation_strategy=RotationStrategy(0, 0, 0),
+                location="/location",
+                hostname="hostname",
+                port=22,
+                username="username",
+                key_path=None,
+            )
+            ssh = Mock()
+            ssh.exec_command.return_value = (
+                None,
+                Mock(**{"readlines.return_value": ["false"]}),
+                Mock(**{"readlines.return_value": []}),
+            )
+            subprocess.return_value = self.__get_subprocess_mock(
+                stdout="Total bytes sent: 10,485,760\n"
+            )
+
+            SshTransmitter(server, ssh_client=ssh, deps=()).transmit(
+                "/links", item, "/remote_path"
+            )
+            filters.clear_filters()
+
+        rsync_cmd = subprocess.call_args[0][0]
+        self.assertNotIn("--human-readable", rsync_cmd)
+        self.assertEqual(
+            ("hostname", 10485760), record_link_throughput.call_args[0][:2]
+        )
+
+    @mock.patch.dict("os.environ", {})
+    @mock.patch("subprocess.Popen")
+    def test_transfer_stopped_when_lease_lost(self, subprocess):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            os.environ["XDG_CACHE_HOME"] = os.path.join(temp_dir, "cache")
+            item = FilesBackupItem(
+                includes=(temp_dir,), excludes=(), rotation_strategy=None
+            )
+            server = SshBackupServer(
+                name="name",
+                rotation_strategy=RotationStrategy(0, 0, 0),
+                location="/location",
+                hostname="hostname",
+                port=22,
+                username="username",
+                key_path=None,
+            )
+            ssh = Mock()
+            ssh.exec_command.return_value = (
+                None,
+                Mock(**{"readlines.return_value": ["false"]}),
+                Mock(**{"readlines.return_value": []}),
+            )
+            rsync = self.__get_subprocess_mock(stdout="", exit_code=-15)
+            rsync.returncode = None
+            subprocess.return_value = rsync
+            unregistered = []
+
+            def on_lost(callback):
+                # the lease is lost already, so the callback is called at once
+                callback()
+                return lambda: unregistered.append(True)
+
+            with self.assertRaisesRegex(OSError, "lease lost"):
+                SshTransmitter(server, ssh_client=ssh, deps=()).transmit(
+                    "/links", item, "/remote_path", on_lost=on_lost
+                )
+            filters.clear_filters()
+
+        rsync.terminate.assert_called()
+        self.assertTrue(unregistered)
+
+    def test_snapshot_replicated_by_server(self):
+        server = SshBackupServer(
+            name="primary",
+            rotation_strategy=RotationStrategy(0, 0, 0),
+            location="/location",
+            hostname="primary-host",
+            port=22,
+            username="username",
+            key_path=None,
+        )
+        replica = SshBackupServer(
+            name="replica",
+            rotation_strategy=RotationStrategy(0, 0, 0),
+            location="/replica",
+            hostname="replica-host",
+            port=2222,
+            username="backup",
+            key_path="/local/key",
+            replicate_from="primary",
+        )
+        ssh = Mock()
+        ssh.exec_command.return_value = (
+            Mock(),
+            Mock(**{"readlines.return_value": ["sent 10 bytes\n", "0\n"]}),
+            Mock(**{"readlines.return_value": []}),
+        )
+        transmitter = SshTransmitter(server, ssh_client=ssh, deps=())
+
+        transmitter.replicate(
+            "/location/files/backup_1", replica, "/replica/files/backup_1-tmp", None
+        )
+        command = ssh.exec_command.call_args[0][0]
+        self.assertIn("'--rsh=ssh -p 2222 -o StrictHostKeyChecking=no'", command)
+        self.assertIn(
+            "/location/files/backup_1/ backup@replica-host:/replica/files/backup_1-tmp/",
+            command,
+        )
+        # key of the source host is not used on the primary
+        self.assertNotIn("/local/key", command)
+        self.assertNotIn("--link-dest", command)
+
+        ssh.exec_command.return_value[1].readlines.return_value = [
+            "permission denied\n",
+            "12\n",
+        ]
+        with self.assertRaises(OSError) as error:
+            transmitter.replicate(
+                "/location/files/backup_1",
+                replica,
+                "/replica/files/backup_1-tmp",
+                "/replica/files/current",
+            )
+        self.assertIn("permission denied", str(error.exception))
+        self.assertIn(
+            "--link-dest=/replica/files/current", ssh.exec_command.call_args[0][0]
+        )
+
+    def test_missing_dependency(self):
+        with self.assertRaises(OSError):
+            SshTransmitter(server=Mock(), deps=("backee-missing-dependency",))
+
     def __get_subprocess_mock(
         self,
         stdout: str,
@@ -156,6 +430,8 @@ class SshTransmitterTestCase(unittest.TestCase):
             "stdout": TextIOWrapper(BytesIO(stdout.encode("utf-8")), "utf8"),
             "stderr": TextIOWrapper(BytesIO(stderr.encode("utf-8")), "utf8"),
             "wait.return_value": exit_code,
+            # not a child process, so it is waited for with wait()
+            "pid": os.getpid(),
         }
         process_mock.configure_mock(**attrs)
         return process_mock
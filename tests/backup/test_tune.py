@@ -0,0 +1,96 @@
+import os
+import tempfile
+import unittest
+
+from backee.backup import tune
+from backee.model.items import FilesBackupItem
+from backee.model.servers import SshBackupServer
+from backee.model.transport_profile import TransportProfile
+from backee.model.rotation_strategy import RotationStrategy
+
+
+class BenchmarkTransmitter(object):
+    """
+    Transmitter with upload times depending on the transport profile.
+    """
+
+    def __init__(self, scale: float = 1):
+        self.scale = scale
+        self.remote_paths = set()
+
+    def benchmark(
+        self, profile: TransportProfile, files_from: str, remote_path: str
+    ) -> float:
+        self.remote_paths.add(remote_path)
+        with open(files_from, mode="rb") as f:
+            self.files = [x for x in f.read().split(b"\0") if x]
+
+        if profile.ciphers == "aes128-ctr":
+            raise OSError("no matching cipher found")
+        elapsed = 0.04 if profile.ciphers == "chacha20-poly1305@openssh.com" else 0.08
+        if profile.compression:
+            elapsed *= {1: 0.5, 6: 0.75}.get(profile.compression_level, 2)
+        return elapsed * self.scale
+
+
+class TuneTestCase(unittest.TestCase):
+    """
+    Tests for `backee/backup/tune.py`.
+    """
+
+    def setUp(self):
+        self.__temp_dir = tempfile.TemporaryDirectory()
+        for name in ("a", "b", "c"):
+            with open(os.path.join(self.__temp_dir.name, name), "wb") as f:
+                f.write(b"\0" * 2**20)
+
+        self.server = SshBackupServer(
+            name="name",
+            rotation_strategy=RotationStrategy(0, 0, 0),
+            location="/location",
+            hostname="hostname",
+            port=22,
+            username="username",
+            key_path=None,
+            transport=TransportProfile(macs="hmac-sha2-256"),
+        )
+        self.item = FilesBackupItem(
+            includes=(self.__temp_dir.name,), excludes=(), rotation_strategy=None
+        )
+
+    def tearDown(self):
+        self.__temp_dir.cleanup()
+
+    def test_fastest_profile_suggested(self):
+        transmitter = BenchmarkTransmitter()
+
+        suggested, results = tune.tune(transmitter, self.server, self.item, 2**21)
+
+        self.assertEqual(
+            TransportProfile(
+                ciphers="chacha20-poly1305@openssh.com",
+                macs="hmac-sha2-256",
+                compression=True,
+                compression_level=1,
+                whole_file=True,
+            ),
+            suggested,
+        )
+        # current, 4 ciphers and 2 compression levels
+        self.assertEqual(7, len(results))
+        self.assertEqual(7, len(transmitter.remote_paths))
+        self.assertEqual([None], [t for p, t in results if p.ciphers == "aes128-ctr"])
+        # sampling stops once enough files are listed
+        self.assertEqual(2, len(transmitter.files))
+
+    def test_slow_link_gets_delta_transfers(self):
+        transmitter = BenchmarkTransmitter(scale=10)
+
+        suggested, _ = tune.tune(transmitter, self.server, self.item, 2**20)
+
+        # 1 MiB in 200 ms is slower than WHOLE_FILE_MIN_THROUGHPUT
+        self.assertFalse(suggested.whole_file)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,10 +1,11 @@
 import os
+import datetime
 import unittest
 from unittest import mock
 
 from tests.util.config_mixin import ConfigMixin
 
-from backee.parser.config_parser import parse_config
+from backee.parser.config_parser import parse_config, parse_contents
 
 
 class ConfigParserTestCase(ConfigMixin, unittest.TestCase):
@@ -37,6 +38,52 @@ class ConfigParserTestCase(ConfigMixin, unittest.TestCase):
             msg="password should not be replaced",
         )
 
+    def test_workers_parsed(self):
+        parsed_config = self._get_parsed_config("default_config.yml")
+        self.assertIsNone(parsed_config.workers)
+        self.assertEqual(1, parsed_config.items_per_server)
+
+        parsed_config = self._get_parsed_config("full_config.yml")
+        self.assertEqual(4, parsed_config.workers)
+        self.assertEqual(2, parsed_config.items_per_server)
+
+    def test_window_end_parsed(self):
+        parsed_config = self._get_parsed_config("default_config.yml")
+        self.assertIsNone(parsed_config.window_end)
+
+        parsed_config = self._get_parsed_config("full_config.yml")
+        self.assertEqual(datetime.time(6, 0), parsed_config.window_end)
+
+    def test_schedule_of_replicas_rejected(self):
+        contents = """
+settings:
+  name: test
+servers:
+  - name: primary
+    type: ssh
+    location: /backups
+    connection:
+      host: primary
+  - name: replica
+    type: ssh
+    location: /backups
+    connection:
+      host: replica
+    replicate_from: primary
+rotation_strategy:
+  daily: 1
+  monthly: 0
+  yearly: 0
+schedule:
+  - cron: "@hourly"
+    servers: [%s]
+"""
+        config = parse_contents(contents % "primary, replica")
+        self.assertEqual(("primary", "replica"), config.schedules[0].servers)
+
+        with self.assertRaises(ValueError):
+            parse_contents(contents % "replica")
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -12,6 +12,8 @@ from backee.model.items import (
 )
 from backee.model.db_connectors import DbConnector, RemoteConnector, DockerConnector
 from backee.model.rotation_strategy import RotationStrategy
+from backee.model.compression import CompressionPolicy, DEFAULT_SKIP_COMPRESS
+from backee.model.packing import PackingPolicy
 from backee.parser.config_parser import parse_config
 from backee.parser.items_parser import parse_items
 
@@ -179,6 +181,71 @@ class ItemsParserTestCase(ConfigMixin, unittest.TestCase):
         self.assertEqual(parsed[0].includes, tuple(["/a/b/c", "/d/e/f"]))
         self.assertEqual(parsed[0].excludes, tuple(["/a/y/z"]))
 
+    def test_compression_policy_parsed(self):
+        item = {"files": {"includes": ["/a"]}}
+        self.assertEqual(CompressionPolicy(), parse_items(item)[0].compression)
+
+        item = {
+            "files": {
+                "includes": ["/a"],
+                "compression": {
+                    "skip_compress_extra": ["raw", "nef"],
+                    "detect_incompressible": True,
+                    "sample_size": "16k",
+                    "auto_level": False,
+                },
+            }
+        }
+        self.assertEqual(
+            CompressionPolicy(
+                skip_compress=tuple(DEFAULT_SKIP_COMPRESS) + ("raw", "nef"),
+                detect_incompressible=True,
+                sample_size=16 * 1024,
+                auto_level=False,
+            ),
+            parse_items(item)[0].compression,
+        )
+
+        item = {"files": {"includes": ["/a"], "compression": {"skip_compress": []}}}
+        self.assertEqual((), parse_items(item)[0].compression.skip_compress)
+
+    def test_large_file_size_parsed(self):
+        item = {"files": {"includes": ["/a"]}}
+        self.assertEqual(64 * 1024 * 1024, parse_items(item)[0].large_file_size)
+
+        item = {"files": {"includes": ["/a"], "large_file_size": "1g"}}
+        self.assertEqual(1024 * 1024 * 1024, parse_items(item)[0].large_file_size)
+
+    @unittest.mock.patch("os.path.expanduser", lambda x: x.replace("~", "/home"))
+    def test_packing_parsed(self):
+        item = {"files": {"includes": ["/a"]}}
+        self.assertEqual(PackingPolicy(), parse_items(item)[0].packing)
+
+        item = {
+            "files": {
+                "includes": ["/a"],
+                "packing": {"paths": ["~/mail"], "max_file_size": "8k"},
+            }
+        }
+        self.assertEqual(
+            PackingPolicy(paths=("/home/mail",), max_file_size=8 * 1024),
+            parse_items(item)[0].packing,
+        )
+
+    def test_sqlite_snapshots_parsed(self):
+        item = {"files": {"includes": ["/a"]}}
+        self.assertTrue(parse_items(item)[0].sqlite_snapshots)
+
+        item = {"files": {"includes": ["/a"], "sqlite_snapshots": False}}
+        self.assertFalse(parse_items(item)[0].sqlite_snapshots)
+
+    def test_priority_parsed(self):
+        item = {"files": {"includes": ["/a"]}}
+        self.assertEqual(0, parse_items(item)[0].priority)
+
+        item = {"files": {"includes": ["/a"], "priority": 10}}
+        self.assertEqual(10, parse_items(item)[0].priority)
+
     def __create_file_item(
         self,
         includes: Tuple[str] = ((),),
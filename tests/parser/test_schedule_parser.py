@@ -0,0 +1,48 @@
+import unittest
+
+from tests.util.config_mixin import ConfigMixin
+
+from backee.parser.schedule_parser import parse_cron, parse_schedules
+
+
+class ScheduleParserTestCase(ConfigMixin, unittest.TestCase):
+    """
+    Tests for `backee/parser/schedule_parser.py`.
+    """
+
+    def test_schedules_parsed(self):
+        schedules = self._get_parsed_config("full_config.yml").schedules
+
+        self.assertEqual(("nightly", "@hourly"), tuple(x.name for x in schedules))
+        self.assertEqual(("server 1",), schedules[0].servers)
+        self.assertEqual(("files",), schedules[0].items)
+        self.assertEqual((), schedules[1].servers)
+        self.assertEqual(frozenset({30}), schedules[0].cron.minutes)
+        self.assertEqual(frozenset({0, 1, 2, 3, 4}), schedules[0].cron.weekdays)
+        self.assertEqual(frozenset(range(24)), schedules[1].cron.hours)
+
+        self.assertEqual((), self._get_parsed_config("default_config.yml").schedules)
+
+    def test_cron_fields_parsed(self):
+        cron = parse_cron("*/15 1,3-5 1-10/3 * 0,7")
+
+        self.assertEqual(frozenset({0, 15, 30, 45}), cron.minutes)
+        self.assertEqual(frozenset({1, 3, 4, 5}), cron.hours)
+        self.assertEqual(frozenset({1, 4, 7, 10}), cron.days)
+        self.assertEqual(frozenset(range(1, 13)), cron.months)
+        # Sunday
+        self.assertEqual(frozenset({6}), cron.weekdays)
+        self.assertTrue(cron.days_restricted)
+        self.assertFalse(parse_cron("0 0 * * *").days_restricted)
+
+    def test_invalid_cron_rejected(self):
+        for expression in ("* * * *", "60 * * * *", "*/0 * * * *", "5-1 * * * *"):
+            with self.assertRaises(ValueError, msg=expression):
+                parse_cron(expression)
+
+        with self.assertRaises(ValueError):
+            parse_schedules([{"cron": "@daily"}, {"cron": "@daily"}])
+
+
+if __name__ == "__main__":
+    unittest.main()
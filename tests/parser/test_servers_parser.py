@@ -1,11 +1,21 @@
+import datetime
 import unittest
 from unittest import mock
 
 from tests.util.config_mixin import ConfigMixin
 
 from backee.parser.config_parser import parse_config
-from backee.model.servers import SshBackupServer
+from backee.parser.servers_parser import parse_servers
+from backee.model.servers import (
+    SshBackupServer,
+    SftpBackupServer,
+    LocalBackupServer,
+    RepositoryBackupServer,
+    S3BackupServer,
+)
 from backee.model.rotation_strategy import RotationStrategy
+from backee.model.transport_profile import TransportProfile
+from backee.model.bandwidth import BandwidthWindow
 
 
 class LoggersParserTestCase(ConfigMixin, unittest.TestCase):
@@ -75,6 +85,158 @@ class LoggersParserTestCase(ConfigMixin, unittest.TestCase):
             msg="server with overwritten rotation strategy is not correct",
         )
 
+    def test_local_server_parsed(self):
+        """
+        Local server is parsed with its own settings.
+        """
+        expected_server = LocalBackupServer(
+            name="server 3",
+            location="/mnt/backups",
+            workers=8,
+            index_hashes=True,
+            rotation_strategy=RotationStrategy(daily=10, monthly=5, yearly=1),
+        )
+
+        parsed_config = self._get_parsed_config("full_config.yml")
+        parsed_server = parsed_config.backup_servers[2]
+
+        self.assertEqual(
+            expected_server, parsed_server, msg="local server is not correct"
+        )
+
+    def test_repository_server_parsed(self):
+        """
+        Repository server is parsed with chunk sizes.
+        """
+        expected_server = RepositoryBackupServer(
+            name="server 4",
+            location="/mnt/repository",
+            min_chunk_size=64 * 1024,
+            avg_chunk_size=256 * 1024,
+            max_chunk_size=1024 * 1024,
+            pack_size=32 * 1024 * 1024,
+            compression_level=6,
+            rotation_strategy=RotationStrategy(daily=10, monthly=5, yearly=1),
+        )
+
+        parsed_config = self._get_parsed_config("full_config.yml")
+        parsed_server = parsed_config.backup_servers[3]
+
+        self.assertEqual(
+            expected_server, parsed_server, msg="repository server is not correct"
+        )
+
+    def test_s3_server_parsed(self):
+        """
+        S3 server is parsed with default region and concurrency.
+        """
+        expected_server = S3BackupServer(
+            name="server 5",
+            location="backups",
+            endpoint="http://localhost:9000",
+            bucket="bucket",
+            access_key="access",
+            secret_key="secret",
+            part_size=8 * 1024 * 1024,
+            rotation_strategy=RotationStrategy(daily=10, monthly=5, yearly=1),
+        )
+
+        parsed_config = self._get_parsed_config("full_config.yml")
+        parsed_server = parsed_config.backup_servers[4]
+
+        self.assertEqual(expected_server, parsed_server, msg="s3 server is not correct")
+
+    def test_sftp_server_parsed(self):
+        """
+        SFTP server is parsed with default port and window size.
+        """
+        expected_server = SftpBackupServer(
+            name="server 6",
+            location="/sftp/path",
+            hostname="sftp.example.com",
+            port=22,
+            username="backup",
+            key_path=None,
+            channels=8,
+            rotation_strategy=RotationStrategy(daily=10, monthly=5, yearly=1),
+        )
+
+        parsed_config = self._get_parsed_config("full_config.yml")
+        parsed_server = parsed_config.backup_servers[5]
+
+        self.assertEqual(
+            expected_server, parsed_server, msg="sftp server is not correct"
+        )
+
+    def test_transport_profiles_parsed(self):
+        """
+        Transport profile is parsed from preset name or preset with overwrites.
+        """
+        parsed_config = self._get_parsed_config("full_config.yml")
+
+        self.assertEqual(TransportProfile(), parsed_config.backup_servers[0].transport)
+        self.assertEqual(
+            TransportProfile(
+                ciphers="chacha20-poly1305@openssh.com,aes128-gcm@openssh.com",
+                compression=True,
+                compression_level=9,
+                whole_file=True,
+                socket_buffer_size=4 * 1024 * 1024,
+            ),
+            parsed_config.backup_servers[6].transport,
+        )
+        self.assertEqual(
+            TransportProfile(
+                ciphers="aes128-gcm@openssh.com,chacha20-poly1305@openssh.com",
+                compression=False,
+                whole_file=True,
+            ),
+            parsed_config.backup_servers[7].transport,
+        )
+
+    def test_bandwidth_schedule_parsed(self):
+        parsed_config = self._get_parsed_config("full_config.yml")
+
+        self.assertEqual((), parsed_config.backup_servers[0].bandwidth_schedule)
+        self.assertEqual(
+            (
+                BandwidthWindow(
+                    start=datetime.time(8),
+                    end=datetime.time(18),
+                    limit=20 * 1024 * 1024,
+                    days=(0, 1, 2, 3, 4),
+                ),
+                BandwidthWindow(
+                    start=datetime.time(22, 30),
+                    end=datetime.time(6),
+                    limit=100 * 1024 * 1024,
+                ),
+            ),
+            parsed_config.backup_servers[6].bandwidth_schedule,
+        )
+
+    def test_replicate_from_parsed(self):
+        servers = [
+            {
+                "name": x,
+                "type": "ssh",
+                "location": "/backups",
+                "connection": {"host": x},
+            }
+            for x in ("primary", "replica")
+        ]
+        servers[1]["replicate_from"] = "primary"
+        rs = RotationStrategy(daily=1, monthly=0, yearly=0)
+
+        parsed = parse_servers(servers, rs)
+
+        self.assertIsNone(parsed[0].replicate_from)
+        self.assertEqual("primary", parsed[1].replicate_from)
+
+        servers[1]["replicate_from"] = "replica"
+        with self.assertRaises(KeyError):
+            parse_servers(servers, rs)
+
     def __create_ssh_backup_server(
         self,
         name: str,
@@ -87,7 +249,6 @@ class LoggersParserTestCase(ConfigMixin, unittest.TestCase):
             daily=1, monthly=0, yearly=0
         ),
     ) -> SshBackupServer:
-
         return SshBackupServer(
             name=name,
             location=location,
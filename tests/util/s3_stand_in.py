@@ -0,0 +1,245 @@
+import uuid
+import hashlib
+import threading
+import collections
+
+from urllib.parse import parse_qs, unquote, urlsplit
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class S3StandIn(object):
+    """
+    In-memory S3-compatible server on localhost.
+
+    Supports the subset of the API used by `backee/backup/s3_client.py`
+    and counts requests by operation, signatures are not verified.
+    """
+
+    def __init__(self, max_keys: int = 1000):
+        self.max_keys = max_keys
+        self.objects = {}
+        self.uploads = {}
+        self.requests = collections.Counter()
+        self.lock = threading.Lock()
+
+        stand_in = self
+
+        class Handler(_Handler):
+            server_state = stand_in
+
+        self.__server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.__thread = threading.Thread(target=self.__server.serve_forever)
+
+    @property
+    def endpoint(self) -> str:
+        host, port = self.__server.server_address
+        return f"http://{host}:{port}"
+
+    def __enter__(self) -> "S3StandIn":
+        self.__thread.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.__server.shutdown()
+        self.__server.server_close()
+        self.__thread.join()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_state = None
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def do_HEAD(self) -> None:
+        key, _ = self.__parse()
+        data = self.server_state.objects.get(key)
+        if data is None:
+            self.__respond(404, head_only=True)
+        else:
+            self.__respond(
+                200,
+                headers={
+                    "Content-Length": str(len(data)),
+                    "ETag": f'"{hashlib.md5(data).hexdigest()}"',
+                },
+                head_only=True,
+            )
+
+    def do_GET(self) -> None:
+        key, query = self.__parse()
+        if not key:
+            self.__count("list")
+            self.__list(query)
+            return
+
+        self.__count("get")
+        data = self.server_state.objects.get(key)
+        if data is None:
+            self.__respond(404, b"<Error><Code>NoSuchKey</Code></Error>")
+        else:
+            self.__respond(200, data)
+
+    def do_PUT(self) -> None:
+        key, query = self.__parse()
+        body = self.__read_body()
+        state = self.server_state
+        copy_source = self.headers.get("x-amz-copy-source")
+        with state.lock:
+            if copy_source is not None:
+                state.requests["copy"] += 1
+                source = unquote(copy_source).split("/", 2)[2]
+                if source not in state.objects:
+                    self.__respond(404, b"<Error><Code>NoSuchKey</Code></Error>")
+                    return
+                state.objects[key] = state.objects[source]
+                self.__respond(200, b"<CopyObjectResult></CopyObjectResult>")
+                return
+
+            etag = hashlib.md5(body).hexdigest()
+            if "uploadId" in query:
+                state.requests["upload_part"] += 1
+                parts = state.uploads[query["uploadId"]]
+                parts[int(query["partNumber"])] = body
+            elif self.headers.get("If-None-Match") == "*" and key in state.objects:
+                self.__respond(412, b"<Error><Code>PreconditionFailed</Code></Error>")
+                return
+            elif "If-Match" in self.headers and (
+                key not in state.objects
+                or self.headers["If-Match"]
+                != f'"{hashlib.md5(state.objects[key]).hexdigest()}"'
+            ):
+                self.__respond(412, b"<Error><Code>PreconditionFailed</Code></Error>")
+                return
+            else:
+                state.requests["put"] += 1
+                state.objects[key] = body
+        self.__respond(200, headers={"ETag": f'"{etag}"'})
+
+    def do_POST(self) -> None:
+        key, query = self.__parse()
+        body = self.__read_body()
+        state = self.server_state
+        with state.lock:
+            if "delete" in query:
+                state.requests["delete"] += 1
+                root = ElementTree.fromstring(body)
+                keys = [x.text for x in root.iter("Key")]
+                if len(keys) > 1000:
+                    self.__respond(400, b"<Error><Code>MalformedXML</Code></Error>")
+                    return
+                for x in keys:
+                    state.objects.pop(x, None)
+                self.__respond(200, b"<DeleteResult></DeleteResult>")
+            elif "uploads" in query:
+                state.requests["create_upload"] += 1
+                upload_id = uuid.uuid4().hex
+                state.uploads[upload_id] = {}
+                self.__respond(
+                    200,
+                    b"<InitiateMultipartUploadResult><UploadId>%s</UploadId>"
+                    b"</InitiateMultipartUploadResult>" % upload_id.encode(),
+                )
+            else:
+                state.requests["complete_upload"] += 1
+                parts = state.uploads.pop(query["uploadId"])
+                root = ElementTree.fromstring(body)
+                numbers = [int(x.text) for x in root.iter("PartNumber")]
+                state.objects[key] = b"".join(parts[x] for x in numbers)
+                self.__respond(
+                    200,
+                    b"<CompleteMultipartUploadResult></CompleteMultipartUploadResult>",
+                )
+
+    def do_DELETE(self) -> None:
+        key, query = self.__parse()
+        state = self.server_state
+        if "uploadId" not in query:
+            with state.lock:
+                data = state.objects.get(key)
+                if_match = self.headers.get("If-Match")
+                if data is None:
+                    self.__respond(404, b"<Error><Code>NoSuchKey</Code></Error>")
+                    return
+                if if_match is not None and (
+                    if_match != f'"{hashlib.md5(data).hexdigest()}"'
+                ):
+                    self.__respond(
+                        412, b"<Error><Code>PreconditionFailed</Code></Error>"
+                    )
+                    return
+                self.__count("delete_object")
+                del state.objects[key]
+            self.__respond(204)
+            return
+
+        with self.server_state.lock:
+            self.__count("abort_upload")
+            self.server_state.uploads.pop(query.get("uploadId"), None)
+        self.__respond(204)
+
+    def __list(self, query) -> None:
+        prefix = query.get("prefix", "")
+        delimiter = query.get("delimiter")
+        token = query.get("continuation-token", "")
+        with self.server_state.lock:
+            keys = sorted(x for x in self.server_state.objects if x.startswith(prefix))
+
+        entries = []
+        for key in keys:
+            if delimiter and delimiter in key[len(prefix) :]:
+                common = key[: key.index(delimiter, len(prefix)) + 1]
+                if not entries or entries[-1] != (common, None):
+                    entries.append((common, None))
+            else:
+                entries.append((key, len(self.server_state.objects[key])))
+        entries = [x for x in entries if x[0] > token]
+
+        page = entries[: self.server_state.max_keys]
+        truncated = len(entries) > len(page)
+        xml = ['<ListBucketResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">']
+        for key, size in page:
+            if size is None:
+                xml.append(
+                    f"<CommonPrefixes><Prefix>{escape(key)}</Prefix></CommonPrefixes>"
+                )
+            else:
+                xml.append(
+                    f"<Contents><Key>{escape(key)}</Key><Size>{size}</Size></Contents>"
+                )
+        xml.append(f"<IsTruncated>{str(truncated).lower()}</IsTruncated>")
+        if truncated:
+            xml.append(
+                f"<NextContinuationToken>{escape(page[-1][0])}</NextContinuationToken>"
+            )
+        xml.append("</ListBucketResult>")
+        self.__respond(200, "".join(xml).encode())
+
+    def __parse(self):
+        url = urlsplit(self.path)
+        query = {
+            k: v[0] for k, v in parse_qs(url.query, keep_blank_values=True).items()
+        }
+        parts = unquote(url.path).split("/", 2)
+        return (parts[2] if len(parts) > 2 else ""), query
+
+    def __read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def __count(self, operation: str) -> None:
+        self.server_state.requests[operation] += 1
+
+    def __respond(
+        self, status: int, body: bytes = b"", headers=None, head_only: bool = False
+    ) -> None:
+        self.send_response(status)
+        headers = dict(headers or {})
+        headers.setdefault("Content-Length", str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        if not head_only:
+            self.wfile.write(body)
@@ -0,0 +1,222 @@
+import os
+import socket
+import threading
+
+from paramiko import (
+    AUTH_SUCCESSFUL,
+    OPEN_SUCCEEDED,
+    OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED,
+    Message,
+    RSAKey,
+    SFTPAttributes,
+    SFTPHandle,
+    SFTPServer,
+    SFTPServerInterface,
+    ServerInterface,
+    Transport,
+)
+from paramiko.sftp import CMD_EXTENDED, CMD_EXTENDED_REPLY, SFTP_OK
+
+
+class SftpStandIn(object):
+    """
+    SFTP server on localhost serving {root} directory as `/`.
+
+    Any public key is accepted. Besides the standard requests,
+    `hardlink@openssh.com` and `statvfs@openssh.com` extensions are supported.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.connections = 0
+        self.__host_key = RSAKey.generate(1024)
+        self.__transports = []
+        self.__socket = socket.socket()
+        self.__socket.bind(("127.0.0.1", 0))
+        self.__socket.listen()
+        self.__thread = threading.Thread(target=self.__serve, daemon=True)
+
+    @property
+    def port(self) -> int:
+        return self.__socket.getsockname()[1]
+
+    def __enter__(self) -> "SftpStandIn":
+        self.__thread.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        # closing alone does not interrupt accept
+        self.__socket.shutdown(socket.SHUT_RDWR)
+        self.__socket.close()
+        for transport in self.__transports:
+            transport.close()
+        self.__thread.join()
+
+    def __serve(self) -> None:
+        while True:
+            try:
+                sock, _ = self.__socket.accept()
+            except OSError:
+                return
+
+            self.connections += 1
+            transport = Transport(sock)
+            transport.add_server_key(self.__host_key)
+            transport.set_subsystem_handler(
+                "sftp", _SftpServer, _SftpInterface, self.root
+            )
+            transport.start_server(server=_Server())
+            self.__transports.append(transport)
+
+
+class _Server(ServerInterface):
+    def get_allowed_auths(self, username):
+        return "publickey"
+
+    def check_auth_publickey(self, username, key):
+        return AUTH_SUCCESSFUL
+
+    def check_channel_request(self, kind, chanid):
+        if kind == "session":
+            return OPEN_SUCCEEDED
+        return OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+
+class _SftpServer(SFTPServer):
+    def _process(self, t, request_number, msg):
+        if t == CMD_EXTENDED:
+            tag = msg.get_text()
+            if tag == "hardlink@openssh.com":
+                interface = self.server
+                try:
+                    os.link(
+                        interface.get_local_path(msg.get_text()),
+                        interface.get_local_path(msg.get_text()),
+                    )
+                except OSError as e:
+                    self._send_status(request_number, self.convert_errno(e.errno))
+                    return
+                self._send_status(request_number, SFTP_OK)
+                return
+            if tag == "statvfs@openssh.com":
+                st = os.statvfs(self.server.get_local_path(msg.get_text()))
+                reply = Message()
+                reply.add_int(request_number)
+                for value in (
+                    st.f_bsize,
+                    st.f_frsize,
+                    st.f_blocks,
+                    st.f_bfree,
+                    st.f_bavail,
+                    st.f_files,
+                    st.f_ffree,
+                    st.f_favail,
+                    st.f_fsid,
+                    st.f_flag,
+                    st.f_namemax,
+                ):
+                    reply.add_int64(value)
+                self._send_packet(CMD_EXTENDED_REPLY, reply)
+                return
+            msg.rewind()
+            msg.get_int()
+        super()._process(t, request_number, msg)
+
+
+class _SftpHandle(SFTPHandle):
+    def stat(self):
+        try:
+            return SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+
+
+class _SftpInterface(SFTPServerInterface):
+    def __init__(self, server, root, *args, **kwargs):
+        super().__init__(server, *args, **kwargs)
+        self.root = root
+
+    def get_local_path(self, path):
+        return self.root + self.canonicalize(path)
+
+    def list_folder(self, path):
+        path = self.get_local_path(path)
+        try:
+            entries = []
+            for name in os.listdir(path):
+                attributes = SFTPAttributes.from_stat(
+                    os.lstat(os.path.join(path, name))
+                )
+                attributes.filename = name
+                entries.append(attributes)
+            return entries
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+
+    def stat(self, path):
+        return self.__call(
+            lambda: SFTPAttributes.from_stat(os.stat(self.get_local_path(path)))
+        )
+
+    def lstat(self, path):
+        return self.__call(
+            lambda: SFTPAttributes.from_stat(os.lstat(self.get_local_path(path)))
+        )
+
+    def open(self, path, flags, attr):
+        path = self.get_local_path(path)
+        try:
+            fd = os.open(path, flags, 0o666)
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+
+        if flags & os.O_WRONLY:
+            mode = "ab" if flags & os.O_APPEND else "wb"
+        elif flags & os.O_RDWR:
+            mode = "a+b" if flags & os.O_APPEND else "r+b"
+        else:
+            mode = "rb"
+        handle = _SftpHandle(flags)
+        handle.filename = path
+        handle.readfile = handle.writefile = os.fdopen(fd, mode)
+        return handle
+
+    def remove(self, path):
+        return self.__call(lambda: os.remove(self.get_local_path(path)))
+
+    def rename(self, oldpath, newpath):
+        return self.__call(
+            lambda: os.rename(
+                self.get_local_path(oldpath), self.get_local_path(newpath)
+            )
+        )
+
+    def mkdir(self, path, attr):
+        return self.__call(lambda: os.mkdir(self.get_local_path(path)))
+
+    def rmdir(self, path):
+        return self.__call(lambda: os.rmdir(self.get_local_path(path)))
+
+    def chattr(self, path, attr):
+        return self.__call(
+            lambda: SFTPServer.set_file_attr(self.get_local_path(path), attr)
+        )
+
+    def symlink(self, target_path, path):
+        # absolute targets stay inside the served root
+        if target_path.startswith("/"):
+            target_path = self.get_local_path(target_path)
+        return self.__call(lambda: os.symlink(target_path, self.get_local_path(path)))
+
+    def readlink(self, path):
+        target = self.__call(lambda: os.readlink(self.get_local_path(path)))
+        if isinstance(target, str) and target.startswith(self.root):
+            target = target[len(self.root) :]
+        return target
+
+    def __call(self, function):
+        try:
+            result = function()
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+        return SFTP_OK if result is None else result